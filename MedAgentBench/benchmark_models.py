@@ -6,6 +6,7 @@ Each model gets one attempt per task. Results are saved per model for comparison
 Usage:
     python benchmark_models.py --model anthropic/claude-opus-4-5-20251101
     python benchmark_models.py --all  # Run all models sequentially
+    python benchmark_models.py --all --reset-fhir --fhir-baseline now  # Delete FHIR creates between models
 """
 
 import json
@@ -43,6 +44,78 @@ def verify_fhir_server(fhir_api_base):
     return res.get('status_code', 0) == 200
 
 
+# Resource types the POST tasks write (vitals, medication orders, lab/referral orders)
+MUTABLE_RESOURCE_TYPES = ["Observation", "MedicationRequest", "ServiceRequest"]
+
+
+def snapshot_fhir_state(fhir_api_base):
+    """Capture a baseline for reset_fhir_state (the server must be pristine right now).
+
+    Uses the FHIR server's own clock (HTTP Date header) so writes are compared
+    against server-side `_lastUpdated` values without local clock skew.
+    """
+    try:
+        response = requests.get(f'{fhir_api_base}metadata', params={"_summary": "true"}, timeout=30)
+        server_date = response.headers.get("Date")
+        if server_date:
+            from email.utils import parsedate_to_datetime
+            return parsedate_to_datetime(server_date).astimezone(datetime.timezone.utc).isoformat()
+    except Exception as e:
+        log.warning(f"Could not read FHIR server clock, using local time: {e}")
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def reset_fhir_state(fhir_api_base, baseline, resource_types=None, page_size=200, batch_size=100):
+    """Roll back resources created on the FHIR server after `baseline`.
+
+    Only creates are reverted: resources of the mutable types whose first
+    version is newer than the baseline are deleted, in transaction Bundles of
+    `batch_size` deletes. A pristine resource updated after the baseline is
+    left as it is (and logged), never deleted. The benchmark's tasks only
+    create resources. HAPI keeps running, so this takes seconds instead of a
+    Java cold start.
+
+    Returns:
+        Number of resources deleted, or -1 if the server could not be reset.
+    """
+    targets = []
+    for resource_type in resource_types or MUTABLE_RESOURCE_TYPES:
+        url = f'{fhir_api_base}{resource_type}'
+        params = {"_lastUpdated": f"gt{baseline}", "_count": str(page_size), "_elements": "id,meta"}
+        try:
+            # Collect ids first; deleting while paging would shift HAPI's result pages
+            while url:
+                response = requests.get(url, params=params, headers={"Accept": "application/fhir+json"}, timeout=60)
+                response.raise_for_status()
+                bundle = response.json()
+                for entry in bundle.get("entry", []):
+                    resource = entry.get("resource", {})
+                    if resource.get("meta", {}).get("versionId", "1") != "1":
+                        log.warning(f"{resource_type}/{resource['id']} was updated after the baseline; not reverted")
+                        continue
+                    targets.append(f"{resource_type}/{resource['id']}")
+                url = next((l["url"] for l in bundle.get("link", []) if l.get("relation") == "next"), None)
+                params = None
+        except Exception as e:
+            log.error(f"FHIR reset failed for {resource_type}: {e}")
+            return -1
+
+    deleted = 0
+    for start in range(0, len(targets), batch_size):
+        batch = targets[start:start + batch_size]
+        transaction = {"resourceType": "Bundle", "type": "transaction",
+                       "entry": [{"request": {"method": "DELETE", "url": target}} for target in batch]}
+        try:
+            response = requests.post(fhir_api_base.rstrip("/"), json=transaction, timeout=120,
+                                     headers={"Content-Type": "application/fhir+json"})
+            response.raise_for_status()
+        except Exception as e:
+            log.error(f"FHIR reset failed deleting {batch[0]} and {len(batch) - 1} more: {e}")
+            return -1
+        deleted += len(batch)
+    return deleted
+
+
 # ── Constants ─────────────────────────────────────────────────────────────────
 
 DEFAULT_FHIR_API_BASE = "http://localhost:8080/fhir/"
@@ -636,6 +709,12 @@ def main():
     parser.add_argument("--delay", type=float, default=0.5, help="Delay between tasks (seconds)")
     parser.add_argument("--extra-header", action="append", default=[],
                         help="Extra HTTP headers as key=value (can repeat)")
+    parser.add_argument("--reset-fhir", action="store_true",
+                        help="Before each model, delete resources created after --fhir-baseline "
+                             "(only creates are reverted; updates to existing resources are not)")
+    parser.add_argument("--fhir-baseline", default=None,
+                        help="ISO timestamp at which the FHIR server was pristine (required with --reset-fhir); "
+                             "'now' reads the server clock, for a server that has not been written to yet")
     args = parser.parse_args()
 
     # Parse extra headers
@@ -650,6 +729,9 @@ def main():
     if not args.model and not args.all:
         parser.error("Specify --model MODEL or --all")
 
+    if args.reset_fhir and not args.fhir_baseline:
+        parser.error("--reset-fhir needs --fhir-baseline (a timestamp from a pristine server, or 'now')")
+
     if not args.api_key:
         log.error("No API key. Use --api-key or set API_KEY env var.")
         sys.exit(1)
@@ -660,6 +742,14 @@ def main():
         sys.exit(1)
     log.info("FHIR server OK")
 
+    fhir_baseline = None
+    if args.reset_fhir:
+        fhir_baseline = args.fhir_baseline
+        if fhir_baseline == "now":
+            fhir_baseline = snapshot_fhir_state(args.fhir_api_base)
+        # Reusing it keeps later runs resetting to this state rather than whatever they start from
+        log.info(f"FHIR baseline: {fhir_baseline} (pass --fhir-baseline {fhir_baseline} to later runs)")
+
     # Load data
     with open(args.data_file, "r") as f:
         test_data = json.load(f)
@@ -681,6 +771,14 @@ def main():
 
     all_results = []
     for model in models_to_run:
+        if fhir_baseline:
+            reset_start = time.time()
+            deleted = reset_fhir_state(args.fhir_api_base, fhir_baseline)
+            if deleted < 0:
+                log.error("FHIR reset failed, aborting to avoid cross-model contamination")
+                sys.exit(1)
+            log.info(f"FHIR reset: removed {deleted} resources in {time.time() - reset_start:.1f}s")
+
         stats = benchmark_model(
             model=model,
             api_key=args.api_key,
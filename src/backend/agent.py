@@ -8,13 +8,21 @@ and yields events for streaming to the frontend.
 
 import json
 import time
+import uuid
 from dataclasses import dataclass, field
-from typing import Any, AsyncGenerator, Dict, List
+from typing import Any, AsyncGenerator, Dict, List, Optional
 
+import httpx
 from openai import AsyncOpenAI
 
 from src.backend.utils.fhir_client import FHIRClient, FHIRResult
+from src.backend.utils.idempotency import action_key
+from src.backend.utils.json_stream import StreamLimits
+from src.backend.utils.pagination import PageBudget
 from src.backend.utils.parser import parse_action, ActionType
+from src.backend.utils.patient_index import PatientIndex
+from src.backend.utils.query_rewrite import QueryRewriter
+from src.backend.utils.tracing import Span, current_span, span, traceparent_headers
 
 # Maximum agent iterations before giving up
 MAX_ROUNDS = 8
@@ -28,6 +36,8 @@ class AgentEvent:
     content: str = ""  # For thinking events (Sara's response)
     tool: str = ""  # For tool_call events (GET/POST)
     result: Any = None  # Tool result or final answer
+    result_json: str = ""  # Tool result as already serialized for the prompt
+    timings: Dict[str, float] = field(default_factory=dict)  # Round phase durations (model_ms, fhir_ms, ...)
 
 
 # MedAgentBench-style prompt template
@@ -64,7 +74,19 @@ class SaraAgent:
     7. Continues until FINISH or max rounds reached
     """
 
-    def __init__(self, sara_url: str, fhir_url: str, functions: List[Dict]):
+    def __init__(
+        self,
+        sara_url: str,
+        fhir_url: str,
+        functions: List[Dict],
+        query_rewriter: Optional[QueryRewriter] = None,
+        page_budget: Optional[PageBudget] = None,
+        patient_snapshots: bool = False,
+        patient_index: Optional[PatientIndex] = None,
+        idempotent_posts: bool = False,
+        stream_limits: Optional[StreamLimits] = None,
+        fhir_http_client: Optional[httpx.AsyncClient] = None,
+    ):
         """
         Initialize the Sara agent.
 
@@ -72,10 +94,24 @@ class SaraAgent:
             sara_url: Base URL of the Sara model service (OpenAI-compatible API)
             fhir_url: Base URL of the FHIR server
             functions: List of FHIR function definitions for the prompt
+            query_rewriter: Optional rewriter adding _elements/_sort/_count to GET searches
+            page_budget: When set, merge paged search results within this budget
+            patient_snapshots: Answer patient-scoped searches from a per-patient $everything snapshot
+            patient_index: Shared warm Patient index answering Patient searches
+            idempotent_posts: Send POSTs as conditional creates keyed on run, round and body
+            stream_limits: When set, decode FHIR responses incrementally within these caps
+            fhir_http_client: Connection pool shared by the runs' FHIR clients (e.g. a batch)
         """
         self.sara_url = sara_url
         self.fhir_url = fhir_url
         self.functions = functions
+        self.query_rewriter = query_rewriter
+        self.page_budget = page_budget
+        self.patient_snapshots = patient_snapshots
+        self.patient_index = patient_index
+        self.idempotent_posts = idempotent_posts
+        self.stream_limits = stream_limits
+        self.fhir_http_client = fhir_http_client
         self._sara_client = AsyncOpenAI(
             base_url=f"{sara_url}/v1",
             api_key="not-needed"  # Sara model doesn't require auth
@@ -114,7 +150,8 @@ class SaraAgent:
             model="sara",  # Model name doesn't matter for vLLM
             messages=messages,
             temperature=0.0,
-            max_tokens=2048
+            max_tokens=2048,
+            extra_headers=traceparent_headers(),
         )
         return response.choices[0].message.content
 
@@ -129,7 +166,7 @@ class SaraAgent:
             Formatted string representation of the result
         """
         if result.success:
-            return json.dumps(result.data, indent=2)
+            return result.to_json()
         else:
             return f"Error (HTTP {result.status_code}): {result.error}"
 
@@ -157,15 +194,31 @@ class SaraAgent:
         # Build initial prompt
         initial_prompt = self._build_prompt(context, question)
         messages = [{"role": "user", "content": initial_prompt}]
+        session = uuid.uuid4().hex  # scopes idempotency keys to this run
+        # Phases are timed as children of the caller's current span; run_span itself is
+        # never made current because it stays open across yields
+        parent = current_span()
+        run_span = parent.child("agent.run") if parent is not None else Span("agent.run")
 
         # Initialize FHIR client
-        fhir_client = FHIRClient(self.fhir_url)
+        fhir_client = FHIRClient(
+            self.fhir_url,
+            rewriter=self.query_rewriter,
+            page_budget=self.page_budget,
+            patient_snapshots=self.patient_snapshots,
+            patient_index=self.patient_index,
+            stream_limits=self.stream_limits,
+            http_client=self.fhir_http_client,
+        )
 
         try:
             for round_num in range(MAX_ROUNDS):
                 # 1. Call Sara
+                timings: Dict[str, float] = {}
                 try:
-                    response = await self._call_sara(messages)
+                    with span("model.call", parent=run_span, round=round_num) as model_span:
+                        response = await self._call_sara(messages)
+                    timings["model_ms"] = model_span.duration_ms
                 except Exception as e:
                     yield AgentEvent(
                         type="error",
@@ -174,16 +227,19 @@ class SaraAgent:
                     )
                     return
 
+                # 2. Parse the action
+                with span("agent.parse", parent=run_span, round=round_num) as parse_span:
+                    action = parse_action(response)
+                timings["parse_ms"] = parse_span.duration_ms
+
                 # Yield thinking event
                 yield AgentEvent(
                     type="thinking",
                     content=response,
-                    timestamp=time.time()
+                    timestamp=time.time(),
+                    timings=dict(timings)
                 )
 
-                # 2. Parse the action
-                action = parse_action(response)
-
                 # 3. Handle FINISH action
                 if action.type == ActionType.FINISH:
                     yield AgentEvent(
@@ -204,7 +260,15 @@ class SaraAgent:
                     continue
 
                 # 5. Execute FHIR call (GET or POST)
-                fhir_result = await fhir_client.execute(action)
+                key = action_key(session, round_num, action) if self.idempotent_posts else None
+                with span("agent.tool", parent=run_span, round=round_num, action=action.type.value) as tool_span:
+                    fhir_result = await fhir_client.execute(action, idempotency_key=key)
+                timings["fhir_ms"] = tool_span.duration_ms
+
+                with span("agent.format", parent=run_span, round=round_num) as format_span:
+                    result_json = fhir_result.to_json() if fhir_result.success else ""
+                    formatted_result = self._format_fhir_result(fhir_result)
+                timings["format_ms"] = format_span.duration_ms
 
                 # Yield tool_call event
                 yield AgentEvent(
@@ -214,11 +278,12 @@ class SaraAgent:
                         "error": fhir_result.error,
                         "status_code": fhir_result.status_code
                     },
-                    timestamp=time.time()
+                    result_json=result_json,
+                    timestamp=time.time(),
+                    timings=timings
                 )
 
                 # 6. Inject result into context
-                formatted_result = self._format_fhir_result(fhir_result)
                 messages.append({"role": "assistant", "content": response})
                 messages.append({"role": "user", "content": f"Result: {formatted_result}"})
 
@@ -231,4 +296,5 @@ class SaraAgent:
 
         finally:
             # Always close the FHIR client
+            run_span.end()
             await fhir_client.close()
@@ -0,0 +1,55 @@
+# src/backend/benchmarks/json_codec_bench.py
+# CPU per agent round spent serializing one FHIR result
+# "before": json.dumps(indent=2) for the prompt plus json.dumps of the whole
+#           tool_result event for the SSE frame (the pre-codec pipeline)
+# "after":  FHIRResult.to_json() for the prompt and a compact dumps of the
+#           event for the SSE frame (orjson when installed)
+#
+# Run:
+#   python -m src.backend.benchmarks.json_codec_bench --entries 200 --rounds 50
+
+import argparse
+import json
+import time
+
+from src.backend.benchmarks.json_stream_bench import _observation
+from src.backend.utils.fhir_client import FHIRResult
+from src.backend.utils.jsoncodec import BACKEND, dumps
+
+
+def _before(data: dict) -> int:
+    prompt = f"Here is the response from the GET request:\n{json.dumps(data, indent=2)}."
+    frame = json.dumps({"id": "tc_001", "status": "success", "duration_ms": 12, "result": data})
+    return len(prompt) + len(frame)
+
+
+def _after(data: dict) -> int:
+    result = FHIRResult(success=True, status_code=200, data=data)
+    prompt = f"Here is the response from the GET request:\n{result.to_json()}."
+    frame = dumps({"id": "tc_001", "status": "success", "duration_ms": 12, "result": data})
+    return len(prompt) + len(frame)
+
+
+def _cpu_ms_per_round(fn, data: dict, rounds: int) -> float:
+    started = time.process_time()
+    for _ in range(rounds):
+        fn(data)
+    return (time.process_time() - started) / rounds * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU per round for FHIR result serialization")
+    parser.add_argument("--entries", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    data = {"resourceType": "Bundle", "type": "searchset", "total": args.entries,
+            "entry": [_observation(i) for i in range(args.entries)]}
+    before = _cpu_ms_per_round(_before, data, args.rounds)
+    after = _cpu_ms_per_round(_after, data, args.rounds)
+    print(json.dumps({"backend": BACKEND, "entries": args.entries,
+                      "before_cpu_ms": round(before, 2), "after_cpu_ms": round(after, 2)}))
+
+
+if __name__ == "__main__":
+    main()
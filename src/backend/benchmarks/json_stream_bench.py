@@ -0,0 +1,115 @@
+# src/backend/benchmarks/json_stream_bench.py
+# Peak-RSS benchmark: response.json() vs the streaming BundleDecoder
+# Serves a synthetic Observation searchset Bundle (10k entries by default) as a
+# chunked stream through an in-process httpx transport, so the body never exists
+# in memory as one piece on the server side. Each mode runs in its own
+# subprocess and reports the growth of peak RSS while decoding one response.
+#
+# Run:
+#   python -m src.backend.benchmarks.json_stream_bench --entries 10000
+
+import argparse
+import asyncio
+import json
+import resource
+import subprocess
+import sys
+import time
+from typing import AsyncIterator
+
+import httpx
+
+from src.backend.utils.json_stream import StreamLimits, read_json
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _observation(i: int) -> dict:
+    return {
+        "fullUrl": f"http://fhir.test/fhir/Observation/{i}",
+        "resource": {
+            "resourceType": "Observation",
+            "id": str(i),
+            "meta": {"versionId": "1", "lastUpdated": "2023-11-13T10:15:00.000+00:00"},
+            "text": {"status": "generated", "div": "<div xmlns=\"http://www.w3.org/1999/xhtml\">"
+                                                   + "Serum magnesium " * 8 + "</div>"},
+            "status": "final",
+            "category": [{"coding": [{"system": "http://hl7.org/fhir/observation-category",
+                                      "code": "laboratory", "display": "Laboratory"}]}],
+            "code": {"coding": [{"system": "http://loinc.org", "code": "19123-9", "display": "Magnesium"}],
+                     "text": "MG"},
+            "subject": {"reference": "Patient/S6488980"},
+            "effectiveDateTime": f"2022-{1 + i % 12:02d}-{1 + i % 28:02d}T08:00:00+00:00",
+            "valueQuantity": {"value": round(1.5 + (i % 10) / 10, 1), "unit": "mg/dL",
+                              "system": "http://unitsofmeasure.org", "code": "mg/dL"},
+        },
+        "search": {"mode": "match"},
+    }
+
+
+async def _body(entries: int) -> AsyncIterator[bytes]:
+    """Yield the Bundle in CHUNK_SIZE pieces, generating entries on the fly."""
+    head = json.dumps({"resourceType": "Bundle", "type": "searchset", "total": entries})[:-1]
+    pending = [head.encode(), b', "entry": [']
+    size = sum(len(p) for p in pending)
+    for i in range(entries):
+        piece = (b"," if i else b"") + json.dumps(_observation(i)).encode()
+        pending.append(piece)
+        size += len(piece)
+        if size >= CHUNK_SIZE:
+            yield b"".join(pending)
+            pending, size = [], 0
+    pending.append(b"]}")
+    yield b"".join(pending)
+
+
+def _client(entries: int) -> httpx.AsyncClient:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, headers={"Content-Type": "application/fhir+json"}, content=_body(entries))
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def _peak_rss_kb() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KiB on Linux
+
+
+async def _run(mode: str, entries: int) -> dict:
+    async with _client(entries) as client:
+        # Warm up imports and the transport before taking the baseline
+        async with client.stream("GET", "http://fhir.test/fhir/Observation") as response:
+            await read_json(response, StreamLimits(max_entries=1))
+        baseline = _peak_rss_kb()
+        started = time.perf_counter()
+        if mode == "full":
+            response = await client.get("http://fhir.test/fhir/Observation")
+            data = response.json()
+        else:
+            limits = StreamLimits(max_entries=entries, max_bytes=1 << 40)
+            async with client.stream("GET", "http://fhir.test/fhir/Observation") as response:
+                data, _ = await read_json(response, limits)
+        elapsed = time.perf_counter() - started
+        assert len(data["entry"]) == entries
+        return {"mode": mode, "entries": entries, "seconds": round(elapsed, 3),
+                "peak_rss_growth_mb": round((_peak_rss_kb() - baseline) / 1024, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak-RSS benchmark for FHIR JSON decoding")
+    parser.add_argument("--entries", type=int, default=10000)
+    parser.add_argument("--mode", choices=["full", "stream"], help="Run one mode in this process")
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(asyncio.run(_run(args.mode, args.entries))))
+        return
+    # Peak RSS never goes down, so every mode gets a fresh interpreter
+    for mode in ("full", "stream"):
+        out = subprocess.run([sys.executable, "-m", "src.backend.benchmarks.json_stream_bench",
+                              "--mode", mode, "--entries", str(args.entries)],
+                             check=True, capture_output=True, text=True)
+        print(out.stdout.strip())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,532 @@
+# src/backend/benchmarks/load_test.py
+# Local load test of the agent API with stub model and FHIR servers
+# Starts a stub OpenAI-compatible model server (scripted replies after a
+# configurable latency) and the in-memory FHIR server filled with synthetic
+# patients, each in its own process, runs the agent API under uvicorn in a third,
+# and drives POST /api/run with N concurrent SSE clients. Reports p50/p95/p99 per
+# phase (model, parse, fhir and format from the events' timings, plus the
+# client-side first-event and session times), sessions/s, and the CPU and RSS of
+# the agent process. Needs no GPU or network, so it runs on a laptop or in CI.
+#
+# Latencies are "fixed:MS", "uniform:LO,HI", "lognormal:MEDIAN,SIGMA" or
+# "exponential:MEAN" (milliseconds). A script is a JSON list of conversations,
+# each a list of model replies by round; "{api_base}" and "{patient}" (the last
+# MRN in the prompt) are filled in. Record one by copying the thinking contents
+# of real runs.
+#
+# Run:
+#   python -m src.backend.benchmarks.load_test --clients 16 --sessions 200
+#   python -m src.backend.benchmarks.load_test --model-latency lognormal:800,0.4 --fhir-latency uniform:5,40 --json
+#
+# One stub on its own (point a dev agent at it with SARA_URL / FHIR_URL):
+#   python -m src.backend.benchmarks.load_test --serve model --port 8001 --fhir-url http://localhost:8080/fhir
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import time
+import zlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+from src.backend.fhir_memory_server import create_app as create_fhir_app
+from src.backend.utils.fhir_store import FHIRStore
+from src.backend.utils.jsoncodec import loads
+
+try:
+    import psutil
+except ImportError:  # pragma: no cover - depends on the environment
+    psutil = None
+
+HOST = "127.0.0.1"
+PHASES = ("first_event", "model", "parse", "fhir", "format", "session")
+TIMING_PHASES = {"model_ms": "model", "parse_ms": "parse", "fhir_ms": "fhir", "format_ms": "format"}
+MRN_PATTERN = re.compile(r"\bS\d{7}\b")
+SAMPLE_SECONDS = 0.2  # agent CPU/RSS sampling interval
+
+DEFAULT_SCRIPT = [
+    [
+        "GET {api_base}/Patient?identifier={patient}",
+        "GET {api_base}/Observation?patient={patient}&code=MG",
+        "FINISH([1.9])",
+    ],
+]
+
+
+@dataclass(frozen=True)
+class Latency:
+    """A latency distribution in milliseconds."""
+    kind: str = "fixed"
+    args: Tuple[float, ...] = (0.0,)
+
+    @classmethod
+    def parse(cls, spec: str) -> "Latency":
+        """
+        Parse a "kind:args" spec.
+
+        Args:
+            spec: fixed:MS, uniform:LO,HI, lognormal:MEDIAN,SIGMA or exponential:MEAN
+
+        Raises:
+            ValueError: On an unknown kind or the wrong number of arguments
+        """
+        kind, _, rest = spec.partition(":")
+        args = tuple(float(a) for a in rest.split(",")) if rest else ()
+        arity = {"fixed": 1, "uniform": 2, "lognormal": 2, "exponential": 1}
+        if arity.get(kind) != len(args):
+            raise ValueError(f"Invalid latency spec {spec!r}")
+        return cls(kind, args)
+
+    def sample(self, rng: random.Random) -> float:
+        """One delay in seconds."""
+        if self.kind == "fixed":
+            ms = self.args[0]
+        elif self.kind == "uniform":
+            ms = rng.uniform(*self.args)
+        elif self.kind == "lognormal":
+            ms = self.args[0] * math.exp(rng.gauss(0.0, self.args[1]))
+        else:
+            ms = rng.expovariate(1.0 / self.args[0]) if self.args[0] > 0 else 0.0
+        return max(0.0, ms) / 1000
+
+
+# --- Stub servers ---
+
+def create_model_app(script: List[List[str]], api_base: str, latency: Latency, seed: int = 0):
+    """
+    OpenAI-compatible chat completions server replaying a script.
+
+    The conversation is picked by a hash of the first message and the reply by
+    the number of assistant turns so far (the last reply repeats).
+    """
+    from fastapi import FastAPI, Request
+
+    app = FastAPI(title="Sara Stub Model")
+    rng = random.Random(seed)
+    served = {"requests": 0}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok", "service": "sara-stub-model", "requests": served["requests"]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = loads(await request.body())
+        messages = body.get("messages", [])
+        prompt = messages[0].get("content", "") if messages else ""
+        conversation = script[zlib.crc32(prompt.encode("utf-8")) % len(script)]
+        round_num = sum(1 for m in messages if m.get("role") == "assistant")
+        mrns = MRN_PATTERN.findall(prompt)
+        reply = (conversation[min(round_num, len(conversation) - 1)]
+                 .replace("{api_base}", api_base)
+                 .replace("{patient}", mrns[-1] if mrns else ""))
+        await asyncio.sleep(latency.sample(rng))
+        served["requests"] += 1
+        return {
+            "id": f"chatcmpl-stub-{served['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "sara"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(reply) // 4,
+                      "total_tokens": (len(prompt) + len(reply)) // 4},
+        }
+
+    return app
+
+
+def synthetic_store(patients: int, observations: int, base_url: str) -> FHIRStore:
+    """Store with patients S0000000... and a magnesium history for each."""
+    store = FHIRStore(base_url=base_url)
+    entries: List[Dict[str, Any]] = []
+    for p in range(patients):
+        mrn = f"S{p:07d}"
+        entries.append({"resource": {
+            "resourceType": "Patient", "id": mrn,
+            "identifier": [{"system": "http://terminology.hl7.org/CodeSystem/v2-0203", "value": mrn}],
+            "name": [{"family": f"Load{p}", "given": ["Test"]}],
+            "gender": "female" if p % 2 else "male", "birthDate": f"19{40 + p % 60}-01-02",
+        }})
+        for i in range(observations):
+            entries.append({"resource": {
+                "resourceType": "Observation", "id": f"{mrn}-mg-{i}", "status": "final",
+                "category": [{"coding": [{"system": "http://hl7.org/fhir/observation-category",
+                                          "code": "laboratory"}]}],
+                "code": {"coding": [{"system": "http://loinc.org", "code": "MG", "display": "Magnesium"}],
+                         "text": "MG"},
+                "effectiveDateTime": f"2023-{1 + i % 11:02d}-{1 + i % 28:02d}T{i % 24:02d}:00:00+00:00",
+                "valueQuantity": {"value": round(1.5 + (i % 10) / 10, 1), "unit": "mg/dL"},
+                "subject": {"reference": f"Patient/{mrn}"},
+            }})
+    store.load_bundle({"resourceType": "Bundle", "type": "collection", "entry": entries})
+    return store
+
+
+def create_stub_fhir_app(store: FHIRStore, latency: Latency, seed: int = 0):
+    """The in-memory FHIR server with a delay before every request."""
+    app = create_fhir_app(store)
+    rng = random.Random(seed)
+
+    @app.middleware("http")
+    async def delay(request, call_next):
+        await asyncio.sleep(latency.sample(rng))
+        return await call_next(request)
+
+    return app
+
+
+def load_script(path: Optional[str]) -> List[List[str]]:
+    if not path:
+        return DEFAULT_SCRIPT
+    with open(path) as f:
+        script = json.load(f)
+    if not script or not all(isinstance(c, list) and c for c in script):
+        raise ValueError(f"{path}: expected a non-empty list of non-empty reply lists")
+    return script
+
+
+def serve(args: argparse.Namespace) -> None:
+    """Run one stub server in this process."""
+    import uvicorn
+
+    if args.serve == "model":
+        app = create_model_app(load_script(args.script), args.fhir_url, Latency.parse(args.model_latency), args.seed)
+    elif args.fixtures:
+        app = create_stub_fhir_app(FHIRStore.from_directory(args.fixtures, base_url=args.fhir_url),
+                                   Latency.parse(args.fhir_latency), args.seed)
+    else:
+        app = create_stub_fhir_app(synthetic_store(args.patients, args.observations, args.fhir_url),
+                                   Latency.parse(args.fhir_latency), args.seed)
+    uvicorn.run(app, host=HOST, port=args.port, log_level="warning", access_log=False)
+
+
+# --- Load driver ---
+
+@dataclass
+class SessionResult:
+    """What one client saw of one run."""
+    phases: Dict[str, List[float]] = field(default_factory=lambda: {phase: [] for phase in PHASES})
+    rounds: int = 0
+    completed: bool = False
+    error: str = ""
+
+
+def _record(result: SessionResult, event_type: Optional[str], data: Dict[str, Any]) -> None:
+    timings = data.get("timings") or {}
+    if event_type == "thinking":
+        result.rounds += 1
+        keys = ("model_ms", "parse_ms")
+    elif event_type == "tool_result":
+        keys = ("fhir_ms", "format_ms")
+    else:
+        keys = ()
+    for key in keys:
+        if key in timings:
+            result.phases[TIMING_PHASES[key]].append(timings[key])
+    if event_type == "complete":
+        result.completed = True
+    elif event_type == "error":
+        result.error = data.get("message", "error")
+
+
+async def run_session(client: httpx.AsyncClient, agent_url: str, payload: Dict[str, Any]) -> SessionResult:
+    """POST /api/run and read its SSE stream to the end."""
+    result = SessionResult()
+    started = time.perf_counter()
+    event_type: Optional[str] = None
+    try:
+        async with client.stream("POST", f"{agent_url}/api/run", json=payload,
+                                 headers={"Accept": "text/event-stream"}) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line.startswith("event:"):
+                    event_type = line[6:].strip()
+                elif line.startswith("data:"):
+                    if not result.phases["first_event"]:
+                        result.phases["first_event"].append((time.perf_counter() - started) * 1000)
+                    _record(result, event_type, loads(line[5:]))
+    except httpx.HTTPError as e:
+        result.error = f"{type(e).__name__}: {e}"
+    result.phases["session"].append((time.perf_counter() - started) * 1000)
+    if not result.completed and not result.error:
+        result.error = "stream ended without a complete event"
+    return result
+
+
+def percentiles(values: Sequence[float]) -> Dict[str, float]:
+    """Count, p50, p95, p99 and max (nearest rank) of times in milliseconds."""
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def percentile(p: float) -> float:
+        return round(ordered[max(0, math.ceil(p * len(ordered)) - 1)], 1)
+
+    return {"count": len(ordered), "p50": percentile(0.50), "p95": percentile(0.95),
+            "p99": percentile(0.99), "max": round(ordered[-1], 1)}
+
+
+def process_usage(pid: int) -> Optional[Tuple[float, int]]:
+    """CPU seconds (user + system) and RSS bytes of a process, or None if unavailable."""
+    if psutil is not None:
+        try:
+            process = psutil.Process(pid)
+            cpu = process.cpu_times()
+            return cpu.user + cpu.system, process.memory_info().rss
+        except psutil.Error:
+            return None
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    ticks = os.sysconf("SC_CLK_TCK")
+    return (int(fields[11]) + int(fields[12])) / ticks, resident_pages * os.sysconf("SC_PAGE_SIZE")
+
+
+class UsageSampler:
+    """Samples a process's CPU time and RSS while the load runs."""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.samples: List[Tuple[float, float, int]] = []  # (monotonic, cpu seconds, rss bytes)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._take()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> Dict[str, Any]:
+        """Stop sampling and summarize CPU utilisation and RSS."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._take()
+        if len(self.samples) < 2:
+            return {"available": False}
+        (t0, cpu0, rss0), (t1, cpu1, rss1) = self.samples[0], self.samples[-1]
+        mb = 1024 * 1024
+        return {
+            "available": True,
+            "cpu_seconds": round(cpu1 - cpu0, 2),
+            "cpu_percent": round(100 * (cpu1 - cpu0) / max(t1 - t0, 1e-9), 1),
+            "rss_mb_start": round(rss0 / mb, 1),
+            "rss_mb_peak": round(max(s[2] for s in self.samples) / mb, 1),
+            "rss_mb_end": round(rss1 / mb, 1),
+        }
+
+    def _take(self) -> None:
+        usage = process_usage(self.pid)
+        if usage is not None:
+            self.samples.append((time.monotonic(), *usage))
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(SAMPLE_SECONDS)
+            self._take()
+
+
+def _payloads(args: argparse.Namespace, count: int, rng: random.Random) -> List[Dict[str, Any]]:
+    if args.fixtures:
+        # Real patients: the demo tasks
+        return [{"taskId": f"task{1 + i % 10}", "prompt": ""} for i in range(count)]
+    return [{
+        "taskId": "custom",
+        "context": "It's 2023-11-13T10:15:00+00:00 now. The code for magnesium is \"MG\".",
+        "prompt": f"What's the most recent magnesium level of the patient S{rng.randrange(args.patients):07d}?",
+    } for _ in range(count)]
+
+
+async def drive(client: httpx.AsyncClient, agent_url: str, payloads: List[Dict[str, Any]],
+                clients: int) -> List[SessionResult]:
+    """Run the sessions with `clients` concurrent SSE readers."""
+    queue = list(reversed(payloads))
+    results: List[SessionResult] = []
+
+    async def worker() -> None:
+        while queue:
+            results.append(await run_session(client, agent_url, queue.pop()))
+
+    await asyncio.gather(*(worker() for _ in range(clients)))
+    return results
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+async def wait_ready(client: httpx.AsyncClient, url: str, proc: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Process serving {url} exited with code {proc.returncode}")
+        try:
+            if (await client.get(url)).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready within {timeout:.0f} s")
+
+
+def stop_processes(procs: List[subprocess.Popen]) -> None:
+    for proc in procs:
+        proc.terminate()
+    for proc in procs:
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+async def run_load(args: argparse.Namespace) -> Dict[str, Any]:
+    """Start the stubs and the agent, run the load, and build the report."""
+    model_port, fhir_port, agent_port = free_port(), free_port(), free_port()
+    model_url = f"http://{HOST}:{model_port}"
+    fhir_url = f"http://{HOST}:{fhir_port}/fhir"
+    agent_url = f"http://{HOST}:{agent_port}"
+    output = None if args.verbose else subprocess.DEVNULL
+
+    stub_args = ["--fhir-url", fhir_url, "--seed", str(args.seed),
+                 "--model-latency", args.model_latency, "--fhir-latency", args.fhir_latency,
+                 "--patients", str(args.patients), "--observations", str(args.observations)]
+    if args.script:
+        stub_args += ["--script", args.script]
+    if args.fixtures:
+        stub_args += ["--fixtures", args.fixtures]
+
+    # The agent inherits this environment (so feature flags can be compared) but talks to the stubs
+    agent_env = {**os.environ, "SARA_URL": model_url, "FHIR_URL": fhir_url}
+    agent_env.pop("SARA_API_KEY", None)
+
+    procs: List[subprocess.Popen] = []
+    rng = random.Random(args.seed)
+    try:
+        for name, port in (("model", model_port), ("fhir", fhir_port)):
+            procs.append(subprocess.Popen(
+                [sys.executable, "-m", "src.backend.benchmarks.load_test", "--serve", name,
+                 "--port", str(port), *stub_args],
+                stdout=output, stderr=output))
+        agent = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "--factory", "src.backend.sara_agent:create_api",
+             "--host", HOST, "--port", str(agent_port), "--log-level", "warning", "--no-access-log"],
+            env=agent_env, stdout=output, stderr=output)
+        procs.append(agent)
+
+        limits = httpx.Limits(max_connections=args.clients + 4, max_keepalive_connections=args.clients + 4)
+        async with httpx.AsyncClient(timeout=httpx.Timeout(300.0, connect=10.0), limits=limits) as client:
+            await wait_ready(client, f"{model_url}/health", procs[0])
+            await wait_ready(client, f"{fhir_url}/metadata", procs[1])
+            await wait_ready(client, f"{agent_url}/health", agent)
+
+            # Warm-up sessions (imports, connection pools, the patient index) are not measured
+            await drive(client, agent_url, _payloads(args, args.warmup, rng), args.clients)
+
+            sampler = UsageSampler(agent.pid)
+            sampler.start()
+            started = time.perf_counter()
+            results = await drive(client, agent_url, _payloads(args, args.sessions, rng), args.clients)
+            wall = time.perf_counter() - started
+            usage = await sampler.stop()
+    finally:
+        stop_processes(procs)
+
+    completed = [r for r in results if r.completed]
+    errors: Dict[str, int] = {}
+    for r in results:
+        if r.error:
+            errors[r.error] = errors.get(r.error, 0) + 1
+    return {
+        "clients": args.clients,
+        "sessions": len(results),
+        "completed": len(completed),
+        "failed": len(results) - len(completed),
+        "errors": errors,
+        "wall_s": round(wall, 2),
+        "sessions_per_s": round(len(completed) / wall, 2) if wall > 0 else 0.0,
+        "rounds_per_session": round(sum(r.rounds for r in results) / max(len(results), 1), 2),
+        "model_latency": args.model_latency,
+        "fhir_latency": args.fhir_latency,
+        "phases_ms": {phase: percentiles([v for r in results for v in r.phases[phase]]) for phase in PHASES},
+        "agent": usage,
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"{report['sessions']} sessions, {report['clients']} clients, {report['wall_s']} s: "
+          f"{report['sessions_per_s']} sessions/s, {report['failed']} failed, "
+          f"{report['rounds_per_session']} rounds/session")
+    for error, count in report["errors"].items():
+        print(f"  {count} x {error}")
+    print(f"{'phase (ms)':<12} {'count':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    for phase, stats in report["phases_ms"].items():
+        if stats["count"]:
+            print(f"{phase:<12} {stats['count']:>7} {stats['p50']:>9} {stats['p95']:>9} "
+                  f"{stats['p99']:>9} {stats['max']:>9}")
+    agent = report["agent"]
+    if agent.get("available"):
+        print(f"agent: {agent['cpu_percent']}% CPU ({agent['cpu_seconds']} s), RSS {agent['rss_mb_start']} -> "
+              f"{agent['rss_mb_end']} MB (peak {agent['rss_mb_peak']} MB)")
+    else:
+        print("agent: CPU/RSS unavailable (install psutil, or run on Linux)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local load test of the agent API with stub model and FHIR servers")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent SSE clients")
+    parser.add_argument("--sessions", type=int, default=100, help="Measured runs")
+    parser.add_argument("--warmup", type=int, default=8, help="Unmeasured runs before the measurement")
+    parser.add_argument("--model-latency", default="lognormal:400,0.3", help="Stub model reply latency")
+    parser.add_argument("--fhir-latency", default="uniform:2,10", help="Stub FHIR request latency")
+    parser.add_argument("--script", help="JSON list of scripted conversations (default: lookup + MG search)")
+    parser.add_argument("--patients", type=int, default=200, help="Synthetic patients")
+    parser.add_argument("--observations", type=int, default=50, help="Observations per synthetic patient")
+    parser.add_argument("--fixtures", help="Serve exported fixtures instead and run the demo tasks")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="Show the servers' logs")
+    parser.add_argument("--serve", choices=["model", "fhir"], help="Run one stub server in this process")
+    parser.add_argument("--port", type=int, help="Port for --serve")
+    parser.add_argument("--fhir-url", default=f"http://{HOST}:8080/fhir",
+                        help="FHIR base URL the stubs refer to (with --serve)")
+    args = parser.parse_args()
+
+    for spec in (args.model_latency, args.fhir_latency):
+        try:
+            Latency.parse(spec)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.serve:
+        if args.port is None:
+            parser.error("--serve needs --port")
+        serve(args)
+        return
+    if args.clients < 1 or args.sessions < 1:
+        parser.error("--clients and --sessions must be at least 1")
+
+    report = asyncio.run(run_load(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    sys.exit(1 if report["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
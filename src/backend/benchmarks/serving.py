@@ -0,0 +1,413 @@
+# src/backend/benchmarks/serving.py
+# Serving benchmark for the model server (any OpenAI-compatible endpoint)
+# Replays agent-shaped chat requests at a sweep of concurrency levels (closed
+# loop) or arrival rates (open loop, Poisson arrivals) and reports, per level,
+# TTFT, inter-token latency, end-to-end latency, requests/s and output tokens/s,
+# as JSON and optionally as plots (needs matplotlib).
+#
+# Requests ask for streaming. TTFT and inter-token latency are measured from the
+# chunks when the server streams; a server that answers with one JSON body gets
+# TTFT = end-to-end latency and no inter-token latency ("streamed": false).
+# Sara's model server does not stream; it reports each request's queue wait,
+# TTFT, prefill and decode time in a Server-Timing header instead, and each level
+# reports percentiles of those exact timings ("server").
+#
+# Workloads:
+#   default       the agent's real prompt (functions + demo tasks) over 1-3 rounds,
+#                 with GET feedback Bundles of 1-50 entries
+#   --requests    JSONL of recorded chat requests ({"messages": [...], "max_tokens": N})
+#   --lengths     JSONL of the model server's request log lines; prompts are padded to
+#                 each line's promptTokens and max_tokens is its completionTokens
+#
+# Run:
+#   python -m src.backend.benchmarks.serving --base-url http://localhost:8000 --concurrency 1,2,4,8 --out serving.json
+#   python -m src.backend.benchmarks.serving --base-url https://nadhari--sara-model-serve.modal.run --rates 0.5,1,2 --plot serving.png
+#
+# Without a GPU, --tiny starts the model server locally with its tiny random-weight
+# Gemma3 CPU backend and benchmarks that (server-code regressions, not model speed):
+#   python -m src.backend.benchmarks.serving --tiny --concurrency 1,2,4 --out tiny.json
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+import httpx
+
+from src.backend.benchmarks.load_test import HOST, free_port, percentiles, stop_processes, wait_ready
+from src.backend.utils.jsoncodec import loads
+
+CHARS_PER_TOKEN = 4  # rough size of a Gemma token in English/JSON text, for padding prompts
+FHIR_BASE = "http://localhost:8080/fhir"
+# Server-Timing metric names of the model server -> report keys
+SERVER_TIMINGS = {"queue": "queue_wait_ms", "ttft": "ttft_ms", "prefill": "prefill_ms", "decode": "decode_ms"}
+
+
+@dataclass
+class RequestResult:
+    """Timings of one chat completion request."""
+    ok: bool = False
+    streamed: bool = False
+    ttft_ms: Optional[float] = None
+    e2e_ms: float = 0.0
+    itl_ms: List[float] = field(default_factory=list)  # gaps between content chunks
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    server: Dict[str, float] = field(default_factory=dict)  # the server's own timings (Server-Timing)
+    error: str = ""
+
+
+# --- Workloads ---
+
+def _observation_bundle(entries: int, rng: random.Random) -> Dict[str, Any]:
+    return {
+        "resourceType": "Bundle", "type": "searchset", "total": entries,
+        "entry": [{
+            "fullUrl": f"{FHIR_BASE}/Observation/{i}",
+            "resource": {
+                "resourceType": "Observation", "id": str(i), "status": "final",
+                "code": {"coding": [{"system": "http://loinc.org", "code": "MG", "display": "Magnesium"}],
+                         "text": "MG"},
+                "effectiveDateTime": f"2023-11-{1 + i % 13:02d}T{i % 24:02d}:00:00+00:00",
+                "valueQuantity": {"value": round(rng.uniform(1.2, 2.4), 1), "unit": "mg/dL"},
+                "subject": {"reference": "Patient/S6315806"},
+            },
+        } for i in range(entries)],
+    }
+
+
+def agent_workload(count: int, max_tokens: int, rng: random.Random) -> List[Dict[str, Any]]:
+    """Chat requests shaped like the agent's rounds: its prompt plus 0-2 GET rounds."""
+    from src.backend.agent import MEDAGENTBENCH_PROMPT
+    from src.backend.sara_agent import FHIR_FUNCTIONS, TASKS
+
+    functions = json.dumps(FHIR_FUNCTIONS, indent=2)
+    tasks = list(TASKS.values())
+    requests = []
+    for _ in range(count):
+        task = rng.choice(tasks)
+        messages = [{"role": "user", "content": MEDAGENTBENCH_PROMPT.format(
+            api_base=FHIR_BASE, functions=functions, context=task["context"], question=task["question"])}]
+        for _ in range(rng.choice((0, 1, 1, 2))):
+            bundle = json.dumps(_observation_bundle(rng.randint(1, 50), rng), indent=2)
+            messages.append({"role": "assistant", "content": f"GET {FHIR_BASE}/Observation?patient=S6315806&code=MG"})
+            messages.append({"role": "user", "content": (
+                f"Here is the response from the GET request:\n{bundle}. Please call FINISH if you have got "
+                "answers for all the questions and finished all the requested tasks")})
+        requests.append({"messages": messages, "max_tokens": max_tokens})
+    return requests
+
+
+def recorded_workload(path: str, count: int, rng: random.Random) -> List[Dict[str, Any]]:
+    """Sample recorded chat requests."""
+    with open(path) as f:
+        recorded = [loads(line) for line in f if line.strip()]
+    if not recorded:
+        raise ValueError(f"{path}: no requests")
+    return [{"messages": r["messages"], "max_tokens": r.get("max_tokens", 256)}
+            for r in (rng.choice(recorded) for _ in range(count))]
+
+
+def length_workload(path: str, count: int, rng: random.Random) -> List[Dict[str, Any]]:
+    """Requests with the prompt and completion lengths of logged real rounds."""
+    with open(path) as f:
+        lengths = [(r["promptTokens"], r["completionTokens"])
+                   for r in (loads(line) for line in f if line.lstrip().startswith("{"))
+                   if r.get("promptTokens") and r.get("completionTokens")]
+    if not lengths:
+        raise ValueError(f"{path}: no lines with promptTokens and completionTokens")
+    filler = json.dumps(_observation_bundle(200, rng), indent=2)
+    requests = []
+    for _ in range(count):
+        prompt_tokens, completion_tokens = rng.choice(lengths)
+        chars = prompt_tokens * CHARS_PER_TOKEN
+        text = (filler * (chars // len(filler) + 1))[:chars]
+        requests.append({"messages": [{"role": "user", "content": text}], "max_tokens": completion_tokens})
+    return requests
+
+
+# --- Client ---
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    """Report-keyed durations (ms) from a Server-Timing header, e.g. "ttft;dur=812.4, decode;dur=95.1"."""
+    timings = {}
+    for metric in header.split(","):
+        name, *params = [part.strip() for part in metric.split(";")]
+        for param in params:
+            key, _, value = param.partition("=")
+            if name in SERVER_TIMINGS and key == "dur":
+                try:
+                    timings[SERVER_TIMINGS[name]] = float(value)
+                except ValueError:
+                    pass
+    return timings
+
+
+async def send(client: httpx.AsyncClient, base_url: str, request: Dict[str, Any], model: str) -> RequestResult:
+    """POST one streaming chat completion and time its chunks."""
+    result = RequestResult()
+    payload = {"model": model, "temperature": 0.0, "stream": True, "stream_options": {"include_usage": True},
+               **request}
+    started = time.perf_counter()
+    last_chunk = None
+    chunks = 0
+    try:
+        async with client.stream("POST", f"{base_url}/v1/chat/completions", json=payload) as response:
+            response.raise_for_status()
+            result.server = parse_server_timing(response.headers.get("server-timing", ""))
+            if response.headers.get("content-type", "").startswith("text/event-stream"):
+                result.streamed = True
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:") or line[5:].strip() == "[DONE]":
+                        continue
+                    data = loads(line[5:])
+                    usage = data.get("usage")
+                    if usage:
+                        result.prompt_tokens = usage.get("prompt_tokens", 0)
+                        result.completion_tokens = usage.get("completion_tokens", 0)
+                    choices = data.get("choices") or [{}]
+                    if not (choices[0].get("delta") or {}).get("content"):
+                        continue
+                    now = time.perf_counter()
+                    if last_chunk is None:
+                        result.ttft_ms = (now - started) * 1000
+                    else:
+                        result.itl_ms.append((now - last_chunk) * 1000)
+                    last_chunk = now
+                    chunks += 1
+                result.completion_tokens = result.completion_tokens or chunks
+            else:
+                usage = loads(await response.aread()).get("usage", {})
+                result.prompt_tokens = usage.get("prompt_tokens", 0)
+                result.completion_tokens = usage.get("completion_tokens", 0)
+                result.ttft_ms = (time.perf_counter() - started) * 1000
+        result.ok = True
+    except (httpx.HTTPError, ValueError) as e:
+        result.error = f"{type(e).__name__}: {e}"
+    result.e2e_ms = (time.perf_counter() - started) * 1000
+    return result
+
+
+async def run_closed(client: httpx.AsyncClient, base_url: str, model: str, requests: List[Dict[str, Any]],
+                     concurrency: int) -> List[RequestResult]:
+    """Keep `concurrency` requests in flight until the list is done."""
+    queue = list(reversed(requests))
+    results: List[RequestResult] = []
+
+    async def worker() -> None:
+        while queue:
+            results.append(await send(client, base_url, queue.pop(), model))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results
+
+
+async def run_open(client: httpx.AsyncClient, base_url: str, model: str, requests: List[Dict[str, Any]],
+                   rate: float, rng: random.Random) -> List[RequestResult]:
+    """Start requests at Poisson arrivals of `rate` per second, whatever is still in flight."""
+    tasks = []
+    for request in requests:
+        tasks.append(asyncio.create_task(send(client, base_url, request, model)))
+        await asyncio.sleep(rng.expovariate(rate))
+    return list(await asyncio.gather(*tasks))
+
+
+# --- Sweep ---
+
+def summarize(level: Dict[str, Any], results: Sequence[RequestResult], wall: float) -> Dict[str, Any]:
+    """Aggregate one sweep level."""
+    ok = [r for r in results if r.ok]
+    output_tokens = sum(r.completion_tokens for r in ok)
+    errors: Dict[str, int] = {}
+    for r in results:
+        if r.error:
+            errors[r.error] = errors.get(r.error, 0) + 1
+    return {
+        **level,
+        "requests": len(results),
+        "failed": len(results) - len(ok),
+        "errors": errors,
+        "streamed": bool(ok) and all(r.streamed for r in ok),
+        "wall_s": round(wall, 2),
+        "requests_per_s": round(len(ok) / wall, 3) if wall > 0 else 0.0,
+        "output_tokens_per_s": round(output_tokens / wall, 1) if wall > 0 else 0.0,
+        "mean_prompt_tokens": round(sum(r.prompt_tokens for r in ok) / max(len(ok), 1), 1),
+        "mean_completion_tokens": round(output_tokens / max(len(ok), 1), 1),
+        "ttft_ms": percentiles([r.ttft_ms for r in ok if r.ttft_ms is not None]),
+        "itl_ms": percentiles([gap for r in ok for gap in r.itl_ms]),
+        "e2e_ms": percentiles([r.e2e_ms for r in ok]),
+        **({"server": server_summary(ok)} if any(r.server for r in ok) else {}),
+    }
+
+
+def server_summary(results: Sequence[RequestResult]) -> Dict[str, Any]:
+    """Percentiles of the server-reported timings, and decode throughput derived from them."""
+    summary = {key: percentiles([r.server[key] for r in results if key in r.server])
+               for key in SERVER_TIMINGS.values()}
+    summary["decode_tokens_per_s"] = percentiles([
+        (r.completion_tokens - 1) / (r.server["decode_ms"] / 1000) for r in results
+        if r.completion_tokens > 1 and r.server.get("decode_ms", 0) > 0])
+    return summary
+
+
+async def run_sweep(args: argparse.Namespace, requests: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Run every concurrency level and arrival rate (against a local tiny server with --tiny)."""
+    rng = random.Random(args.seed)
+    api_key = args.api_key or os.environ.get("SARA_API_KEY", "")
+    headers = {"X-API-Key": api_key, "Authorization": f"Bearer {api_key}"} if api_key else {}
+    levels = ([{"mode": "concurrency", "concurrency": c} for c in args.concurrency]
+              + [{"mode": "rate", "rate": r} for r in args.rates])
+    max_in_flight = max(args.concurrency + [64 if args.rates else 1])
+    limits = httpx.Limits(max_connections=max_in_flight + 4, max_keepalive_connections=max_in_flight + 4)
+    report: Dict[str, Any] = {"base_url": args.base_url, "model": args.model, "workload": args.workload_name,
+                              "levels": []}
+    server = None
+    if args.tiny:
+        port = free_port()
+        args.base_url = report["base_url"] = f"http://{HOST}:{port}"
+        server = subprocess.Popen(
+            [sys.executable, "-m", "src.backend.model_server", "--backend", "tiny", "--host", HOST, "--port", str(port)],
+            stdout=subprocess.DEVNULL, stderr=None if args.verbose else subprocess.DEVNULL)
+    try:
+        async with httpx.AsyncClient(timeout=httpx.Timeout(args.timeout, connect=30.0), headers=headers,
+                                     limits=limits) as client:
+            if server is not None:
+                await wait_ready(client, f"{args.base_url}/ready", server, timeout=300.0)
+            await _sweep(client, args, requests, levels, report, rng)
+    finally:
+        if server is not None:
+            stop_processes([server])
+    return report
+
+
+async def _sweep(client: httpx.AsyncClient, args: argparse.Namespace, requests: List[Dict[str, Any]],
+                 levels: List[Dict[str, Any]], report: Dict[str, Any], rng: random.Random) -> None:
+    """Warm up, then run each level and append its summary to the report."""
+    await run_closed(client, args.base_url, args.model, requests[:args.warmup], 1)
+    for level in levels:
+        started = time.perf_counter()
+        if level["mode"] == "concurrency":
+            results = await run_closed(client, args.base_url, args.model, requests, level["concurrency"])
+        else:
+            results = await run_open(client, args.base_url, args.model, requests, level["rate"], rng)
+        summary = summarize(level, results, time.perf_counter() - started)
+        report["levels"].append(summary)
+        if not args.quiet:
+            print(_level_line(summary), file=sys.stderr)
+
+
+def _level_line(s: Dict[str, Any]) -> str:
+    label = f"c={s['concurrency']}" if s["mode"] == "concurrency" else f"rate={s['rate']}/s"
+    ttft, itl = s["ttft_ms"], s["itl_ms"]
+    line = (f"{label:<10} {s['requests_per_s']:>7} req/s {s['output_tokens_per_s']:>8} tok/s  "
+            f"TTFT p50/p95/p99 {ttft.get('p50')}/{ttft.get('p95')}/{ttft.get('p99')} ms  ")
+    server = s.get("server")
+    if not s["streamed"] and server:
+        # Client TTFT is the full response time here; show the server's own measurements
+        ttft, rate = server["ttft_ms"], server["decode_tokens_per_s"]
+        line += (f"(server {ttft.get('p50')}/{ttft.get('p95')}/{ttft.get('p99')} ms)  "
+                 f"decode p50 {rate.get('p50')} tok/s  ")
+    else:
+        line += f"ITL p50/p95 {itl.get('p50')}/{itl.get('p95')} ms  "
+    return line + f"failed {s['failed']}"
+
+
+def plot(report: Dict[str, Any], path: str) -> None:
+    """Throughput and latency curves against concurrency and arrival rate."""
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("matplotlib is not installed; skipping the plot", file=sys.stderr)
+        return
+
+    modes = [m for m in ("concurrency", "rate") if any(l["mode"] == m for l in report["levels"])]
+    fig, axes = plt.subplots(len(modes), 3, figsize=(15, 4 * len(modes)), squeeze=False)
+    for row, mode in zip(axes, modes):
+        levels = [l for l in report["levels"] if l["mode"] == mode]
+        x = [l[mode] for l in levels]
+        xlabel = "concurrency" if mode == "concurrency" else "arrival rate (req/s)"
+        row[0].plot(x, [l["output_tokens_per_s"] for l in levels], marker="o", label="output tokens/s")
+        twin = row[0].twinx()
+        twin.plot(x, [l["requests_per_s"] for l in levels], marker="s", color="tab:orange", label="requests/s")
+        row[0].set_ylabel("tokens/s")
+        twin.set_ylabel("requests/s")
+        row[0].set_title("Throughput")
+        for ax, metric, title in ((row[1], "ttft_ms", "TTFT"), (row[2], "itl_ms", "Inter-token latency")):
+            for p in ("p50", "p95", "p99"):
+                ax.plot(x, [l[metric].get(p) for l in levels], marker="o", label=p)
+            ax.set_ylabel("ms")
+            ax.set_title(title)
+            ax.legend()
+        for ax in row:
+            ax.set_xlabel(xlabel)
+            ax.grid(alpha=0.3)
+    fig.suptitle(f"{report['base_url']} ({report['workload']})")
+    fig.tight_layout()
+    fig.savefig(path, dpi=120)
+
+
+def _numbers(kind):
+    def parse(value: str):
+        return [kind(v) for v in value.split(",") if v.strip()]
+    return parse
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serving benchmark for an OpenAI-compatible chat endpoint")
+    parser.add_argument("--base-url", default="http://localhost:8000", help="Server root (without /v1)")
+    parser.add_argument("--model", default="sara")
+    parser.add_argument("--api-key", help="Defaults to $SARA_API_KEY")
+    parser.add_argument("--concurrency", type=_numbers(int), default=[], help="Closed-loop levels, e.g. 1,2,4,8")
+    parser.add_argument("--rates", type=_numbers(float), default=[], help="Open-loop arrival rates (req/s)")
+    parser.add_argument("--num-requests", type=int, default=32, help="Requests per level")
+    parser.add_argument("--warmup", type=int, default=2, help="Unmeasured requests before the sweep")
+    parser.add_argument("--max-tokens", type=int, default=128, help="max_tokens of the default workload")
+    parser.add_argument("--requests", help="JSONL of recorded chat requests")
+    parser.add_argument("--lengths", help="JSONL of model server request logs (promptTokens, completionTokens)")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--plot", help="Write throughput/latency curves to this image")
+    parser.add_argument("--quiet", action="store_true", help="No per-level progress lines")
+    parser.add_argument("--tiny", action="store_true", help="Start and benchmark a local tiny CPU model server")
+    parser.add_argument("--verbose", action="store_true", help="Show the tiny server's log")
+    args = parser.parse_args()
+
+    if not args.concurrency and not args.rates:
+        args.concurrency = [1, 2, 4, 8]
+    if any(c < 1 for c in args.concurrency) or any(r <= 0 for r in args.rates):
+        parser.error("concurrency levels must be >= 1 and rates > 0")
+    args.base_url = args.base_url.rstrip("/")
+
+    rng = random.Random(args.seed)
+    if args.requests:
+        args.workload_name = f"recorded:{os.path.basename(args.requests)}"
+        requests = recorded_workload(args.requests, args.num_requests, rng)
+    elif args.lengths:
+        args.workload_name = f"lengths:{os.path.basename(args.lengths)}"
+        requests = length_workload(args.lengths, args.num_requests, rng)
+    else:
+        args.workload_name = "agent"
+        requests = agent_workload(args.num_requests, args.max_tokens, rng)
+
+    report = asyncio.run(run_sweep(args, requests))
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.plot:
+        plot(report, args.plot)
+
+
+if __name__ == "__main__":
+    main()
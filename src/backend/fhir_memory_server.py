@@ -0,0 +1,218 @@
+# src/backend/fhir_memory_server.py
+# Lightweight in-memory FHIR R4 stand-in for the HAPI server
+# Serves the MedAgentBench patients from exported Bundles with the search
+# parameters used by FHIR_FUNCTIONS. Starts in well under a second (per-patient
+# Bundles are loaded lazily) and needs no JVM, so it suits local tests and load tests.
+#
+# Export fixtures once from a running HAPI server:
+#   python -m src.backend.fhir_memory_server export --fhir-url http://localhost:8080/fhir --out fixtures/
+#
+# Serve:
+#   python -m src.backend.fhir_memory_server serve --fixtures fixtures/ --port 8080
+
+import argparse
+import gzip
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from src.backend.utils.fhir_store import FHIRStore, PreconditionError, SearchError, TransactionError
+
+FHIR_PORT = 8080
+
+
+def operation_outcome(diagnostics: str, code: str = "processing") -> Dict[str, Any]:
+    """Build a HAPI-style OperationOutcome for error responses."""
+    return {
+        "resourceType": "OperationOutcome",
+        "issue": [{"severity": "error", "code": code, "diagnostics": diagnostics}],
+    }
+
+
+def create_app(store: FHIRStore):
+    """
+    Create the FastAPI application serving a FHIRStore under /fhir.
+
+    Args:
+        store: Populated in-memory store
+
+    Returns:
+        FastAPI application
+    """
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse
+
+    app = FastAPI(title="Sara In-Memory FHIR Server", version="1.0.0")
+
+    def fhir_response(content: Dict[str, Any], status_code: int = 200, headers: Dict[str, str] = None):
+        return JSONResponse(content, status_code=status_code, headers=headers,
+                            media_type="application/fhir+json")
+
+    def query_params(request: Request) -> Dict[str, Any]:
+        # Keep repeated parameters (e.g. date=ge...&date=le...) as lists
+        params: Dict[str, Any] = {}
+        for key, value in request.query_params.multi_items():
+            if key in params:
+                existing = params[key]
+                params[key] = existing + [value] if isinstance(existing, list) else [existing, value]
+            else:
+                params[key] = value
+        return params
+
+    @app.get("/fhir/metadata")
+    async def metadata():
+        return fhir_response({
+            "resourceType": "CapabilityStatement",
+            "status": "active",
+            "kind": "instance",
+            "fhirVersion": "4.0.1",
+            "format": ["application/fhir+json"],
+            "software": {"name": "Sara In-Memory FHIR Server"},
+        })
+
+    @app.get("/fhir/Patient/{patient_id}/$everything")
+    async def everything(patient_id: str):
+        bundle = store.everything(patient_id)
+        if bundle is None:
+            return fhir_response(operation_outcome(f"Resource Patient/{patient_id} is not known", "not-found"), 404)
+        return fhir_response(bundle)
+
+    @app.get("/fhir/{resource_type}")
+    async def search(resource_type: str, request: Request):
+        try:
+            return fhir_response(store.search(resource_type, query_params(request)))
+        except SearchError as e:
+            return fhir_response(operation_outcome(str(e)), 400)
+
+    @app.get("/fhir/{resource_type}/{resource_id}")
+    async def read(resource_type: str, resource_id: str):
+        resource = store.read(resource_type, resource_id)
+        if resource is None:
+            return fhir_response(operation_outcome(f"Resource {resource_type}/{resource_id} is not known", "not-found"), 404)
+        return fhir_response(resource)
+
+    @app.post("/fhir")
+    async def transaction(request: Request):
+        try:
+            body = await request.json()
+        except ValueError:
+            return fhir_response(operation_outcome("Failed to parse request body as JSON resource"), 400)
+        try:
+            return fhir_response(store.transaction(body))
+        except TransactionError as e:
+            return fhir_response(operation_outcome(str(e)), 400)
+
+    @app.post("/fhir/{resource_type}")
+    async def create(resource_type: str, request: Request):
+        try:
+            body = await request.json()
+        except ValueError:
+            return fhir_response(operation_outcome("Failed to parse request body as JSON resource"), 400)
+        if not isinstance(body, dict) or body.get("resourceType") != resource_type:
+            return fhir_response(operation_outcome(
+                f"Incorrect resource type found, expected \"{resource_type}\""), 400)
+        condition = request.headers.get("if-none-exist")
+        if condition:
+            # Conditional create: return the match instead of creating a duplicate
+            try:
+                existing = store.find_existing(resource_type, condition)
+            except PreconditionError as e:
+                return fhir_response(operation_outcome(str(e), "duplicate"), 412)
+            except SearchError as e:
+                return fhir_response(operation_outcome(str(e)), 400)
+            if existing is not None:
+                version = existing.get("meta", {}).get("versionId", "1")
+                location = f"{store.base_url}/{resource_type}/{existing['id']}/_history/{version}"
+                return fhir_response(existing, 200, headers={"Location": location})
+        stored = store.create(body)
+        location = f"{store.base_url}/{resource_type}/{stored['id']}/_history/1"
+        return fhir_response(stored, 201, headers={"Location": location})
+
+    return app
+
+
+def export_fixtures(fhir_url: str, out_dir: str, page_size: int = 200) -> int:
+    """
+    Export every patient from a running FHIR server into a fixture directory.
+
+    Writes Patient.json.gz with all Patients and patients/<id>.json.gz with each
+    patient's $everything Bundle (all pages merged).
+
+    Args:
+        fhir_url: FHIR base URL (e.g. "http://localhost:8080/fhir")
+        out_dir: Destination directory
+        page_size: _count used while paging
+
+    Returns:
+        Number of patients exported
+    """
+    import httpx
+
+    base = fhir_url.rstrip("/")
+    out = Path(out_dir)
+    (out / "patients").mkdir(parents=True, exist_ok=True)
+
+    with httpx.Client(timeout=300.0, headers={"Accept": "application/fhir+json"}) as client:
+        def fetch_all(url: str, params: Dict[str, str]) -> List[Dict[str, Any]]:
+            entries: List[Dict[str, Any]] = []
+            next_url, next_params = url, params
+            while next_url:
+                response = client.get(next_url, params=next_params)
+                response.raise_for_status()
+                bundle = response.json()
+                entries.extend(bundle.get("entry", []))
+                next_url = next((l["url"] for l in bundle.get("link", []) if l.get("relation") == "next"), None)
+                next_params = None
+            return entries
+
+        patients = fetch_all(f"{base}/Patient", {"_count": str(page_size)})
+        _write_bundle(out / "Patient.json.gz", patients)
+        for entry in patients:
+            patient_id = entry["resource"]["id"]
+            entries = fetch_all(f"{base}/Patient/{patient_id}/$everything", {"_count": str(page_size)})
+            _write_bundle(out / "patients" / f"{patient_id}.json.gz", entries)
+            print(f"  {patient_id}: {len(entries)} resources")
+    return len(patients)
+
+
+def _write_bundle(path: Path, entries: List[Dict[str, Any]]) -> None:
+    bundle = {"resourceType": "Bundle", "type": "collection",
+              "entry": [{"resource": e["resource"]} for e in entries if "resource" in e]}
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump(bundle, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-memory FHIR R4 stand-in server")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Serve fixtures over HTTP")
+    serve_parser.add_argument("--fixtures", required=True, help="Fixture directory written by 'export'")
+    serve_parser.add_argument("--host", default="0.0.0.0")
+    serve_parser.add_argument("--port", type=int, default=FHIR_PORT)
+    serve_parser.add_argument("--eager", action="store_true", help="Load every patient at startup")
+
+    export_parser = subparsers.add_parser("export", help="Export fixtures from a running FHIR server")
+    export_parser.add_argument("--fhir-url", default="http://localhost:8080/fhir")
+    export_parser.add_argument("--out", required=True)
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        count = export_fixtures(args.fhir_url, args.out)
+        print(f"Exported {count} patients to {args.out}")
+        return
+
+    import uvicorn
+
+    start = time.perf_counter()
+    public_host = "localhost" if args.host == "0.0.0.0" else args.host
+    store = FHIRStore.from_directory(args.fixtures, lazy=not args.eager,
+                                     base_url=f"http://{public_host}:{args.port}/fhir")
+    print(f"Loaded {store.count()} resources in {(time.perf_counter() - start) * 1000:.0f} ms")
+    uvicorn.run(create_app(store), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
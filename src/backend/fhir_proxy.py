@@ -0,0 +1,344 @@
+# src/backend/fhir_proxy.py
+# Caching reverse proxy for the HAPI FHIR server
+# HAPI recomputes every search from H2, even when nothing changed. This proxy keeps
+# GET read/search responses in memory and revalidates them cheaply:
+# - reads: conditional GET with the upstream ETag (If-None-Match -> 304)
+# - searches: a _lastUpdated=ge<fetched> _summary=count query scoped to the same
+#   resource type (and patient, when the search is patient-scoped)
+# POST/PUT/DELETE are passed through and invalidate cached entries for the written
+# resource type and patient. Responses carry an ETag so clients can revalidate too,
+# and are gzip-compressed when the client accepts it.
+#
+# Drop-in for FHIR_URL: point the agent/benchmark at <proxy>/fhir instead of HAPI.
+#
+# Serve locally in front of a running HAPI:
+#   python -m src.backend.fhir_proxy --upstream http://localhost:8080/fhir --port 8081
+
+import argparse
+import gzip
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.backend.utils.fhir_store import patient_id_of
+
+PROXY_PORT = 8081
+REVALIDATE_AFTER = 10.0  # seconds an entry is served without asking upstream
+MAX_ENTRIES = 5000
+GZIP_MIN_BYTES = 1024
+
+# Request/response headers forwarded between client and upstream
+FORWARD_REQUEST_HEADERS = ("accept", "content-type", "prefer", "if-none-exist", "if-match", "traceparent")
+FORWARD_RESPONSE_HEADERS = ("content-type", "location", "etag", "last-modified")
+
+# Search parameters that scope a search to a single patient
+PATIENT_PARAMS = ("patient", "subject")
+
+
+@dataclass
+class CacheEntry:
+    """A cached upstream GET response."""
+
+    status: int
+    body: bytes
+    content_type: str
+    resource_type: Optional[str]  # None for $everything (spans every type)
+    patient_id: Optional[str]  # None when the request is not patient-scoped
+    query: List[Tuple[str, str]]
+    is_read: bool
+    upstream_etag: Optional[str]
+    fetched_at: str  # upstream clock (Date header) when the body was produced
+    validated_at: float = field(default_factory=time.monotonic)
+    etag: str = field(init=False, default="")
+    _gzipped: Optional[bytes] = field(init=False, default=None, repr=False)
+
+    def __post_init__(self):
+        self.etag = f'"{hashlib.sha1(self.body).hexdigest()[:20]}"'
+
+    def gzipped(self) -> bytes:
+        """Compressed body, computed once per entry."""
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, compresslevel=5)
+        return self._gzipped
+
+
+class ResponseCache:
+    """
+    LRU cache of upstream responses with per-type/per-patient invalidation.
+
+    A generation counter guards against a slow GET storing a response that was
+    computed before a concurrent write invalidated it.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.generation = 0
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "revalidated": 0, "refetched": 0, "invalidated": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, entry: CacheEntry, generation: int) -> bool:
+        """Store an entry unless a write happened since its fetch started."""
+        if generation != self.generation:
+            return False
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return True
+
+    def invalidate(self, resource_type: Optional[str] = None, patient_id: Optional[str] = None) -> int:
+        """
+        Drop entries a write to resource_type for patient_id may have changed.
+
+        Args:
+            resource_type: Written resource type (None clears everything)
+            patient_id: Patient the written resource belongs to, if known
+
+        Returns:
+            Number of entries dropped
+        """
+        self.generation += 1
+        if resource_type is None:
+            dropped = len(self._entries)
+            self._entries.clear()
+        else:
+            stale = [
+                key for key, entry in self._entries.items()
+                if (entry.resource_type in (resource_type, None))
+                and (entry.patient_id is None or patient_id is None or entry.patient_id == patient_id)
+            ]
+            for key in stale:
+                del self._entries[key]
+            dropped = len(stale)
+        self.stats["invalidated"] += dropped
+        return dropped
+
+
+def _scope(path: str, query: List[Tuple[str, str]]) -> Tuple[Optional[str], Optional[str], bool]:
+    """Return (resource_type, patient_id, is_read) for a path relative to the FHIR base."""
+    parts = [p for p in path.split("/") if p]
+    if len(parts) >= 3 and parts[0] == "Patient" and parts[2] == "$everything":
+        return None, parts[1], False
+    if not parts and any(key == "_getpages" for key, _ in query):
+        # Page of an earlier search (a rewritten next link): any type, any patient
+        return None, None, False
+    resource_type = parts[0] if parts else "metadata"
+    if len(parts) == 2:
+        patient_id = parts[1] if resource_type == "Patient" else None
+        return resource_type, patient_id, True
+    patient_id = None
+    for key, value in query:
+        name = key.split(":", 1)[0]
+        if name in PATIENT_PARAMS or (resource_type == "Patient" and name == "_id"):
+            patient_id = value.rsplit("Patient/", 1)[-1]
+    return resource_type, patient_id, False
+
+
+def _upstream_clock(headers) -> str:
+    """Server time from the Date header (second precision), falling back to our clock."""
+    date = headers.get("date")
+    if date:
+        try:
+            return parsedate_to_datetime(date).isoformat()
+        except (TypeError, ValueError):
+            pass
+    return time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(time.time() - 1))
+
+
+def create_app(
+    upstream_url: str,
+    cache: Optional[ResponseCache] = None,
+    client=None,
+    revalidate_after: float = REVALIDATE_AFTER,
+):
+    """
+    Create the FastAPI application proxying /fhir/* to upstream_url.
+
+    Args:
+        upstream_url: FHIR base URL of the upstream server (e.g. "http://localhost:8080/fhir")
+        cache: Response cache (a new one is created if omitted)
+        client: httpx.AsyncClient used for upstream calls (created if omitted)
+        revalidate_after: Seconds an entry is served before it is revalidated
+
+    Returns:
+        FastAPI application
+    """
+    import httpx
+    from fastapi import FastAPI, Request, Response
+
+    upstream = upstream_url.rstrip("/")
+    cache = cache if cache is not None else ResponseCache()
+    http = client or httpx.AsyncClient(timeout=60.0)
+
+    app = FastAPI(title="Sara FHIR Caching Proxy", version="1.0.0")
+    app.state.cache = cache
+
+    def public_base(request: Request) -> str:
+        proto = request.headers.get("x-forwarded-proto", request.url.scheme)
+        host = request.headers.get("x-forwarded-host", request.headers.get("host", request.url.netloc))
+        return f"{proto}://{host}/fhir"
+
+    def forwarded_headers(request: Request) -> Dict[str, str]:
+        return {k: v for k, v in request.headers.items() if k.lower() in FORWARD_REQUEST_HEADERS}
+
+    def serve_entry(entry: CacheEntry, request: Request, cache_status: str) -> Response:
+        headers = {"ETag": entry.etag, "Cache-Control": "no-cache", "X-Cache": cache_status,
+                   "Vary": "Accept-Encoding"}
+        if entry.upstream_etag and entry.is_read:
+            headers["X-Upstream-ETag"] = entry.upstream_etag
+        if request.headers.get("if-none-match") == entry.etag:
+            return Response(status_code=304, headers=headers)
+        body = entry.body
+        if len(body) >= GZIP_MIN_BYTES and "gzip" in request.headers.get("accept-encoding", ""):
+            body = entry.gzipped()
+            headers["Content-Encoding"] = "gzip"
+        return Response(body, status_code=entry.status, headers=headers, media_type=entry.content_type)
+
+    async def fetch(path: str, request: Request, query: List[Tuple[str, str]], base: str) -> Tuple[Any, Optional[CacheEntry]]:
+        """GET from upstream; returns the response and a cache entry when it is cacheable."""
+        url = f"{upstream}/{path}" if path else upstream
+        response = await http.get(url, params=query, headers=forwarded_headers(request))
+        if response.status_code != 200:
+            return response, None
+        resource_type, patient_id, is_read = _scope(path, query)
+        entry = CacheEntry(
+            status=200,
+            # Links in search Bundles point at the upstream; rewrite them so paging goes through the proxy
+            body=response.content.replace(upstream.encode(), base.encode()),
+            content_type=response.headers.get("content-type", "application/fhir+json"),
+            resource_type=resource_type,
+            patient_id=patient_id,
+            query=query,
+            is_read=is_read,
+            upstream_etag=response.headers.get("etag"),
+            fetched_at=_upstream_clock(response.headers),
+        )
+        return response, entry
+
+    async def still_fresh(path: str, entry: CacheEntry) -> bool:
+        """Ask upstream, as cheaply as possible, whether entry is unchanged."""
+        try:
+            if entry.is_read and entry.upstream_etag:
+                response = await http.get(f"{upstream}/{path}", headers={
+                    "Accept": "application/fhir+json", "If-None-Match": entry.upstream_etag})
+                return response.status_code == 304
+            if entry.resource_type is None or entry.is_read or entry.resource_type == "metadata":
+                return False
+            params = [("_lastUpdated", f"ge{entry.fetched_at}"), ("_summary", "count")]
+            if entry.patient_id:
+                name = "_id" if entry.resource_type == "Patient" else "patient"
+                params.append((name, entry.patient_id))
+            response = await http.get(f"{upstream}/{entry.resource_type}", params=params,
+                                      headers={"Accept": "application/fhir+json"})
+            return response.status_code == 200 and response.json().get("total") == 0
+        except (httpx.HTTPError, ValueError):
+            return False
+
+    def passthrough(response) -> Response:
+        headers = {k: v for k, v in response.headers.items() if k.lower() in FORWARD_RESPONSE_HEADERS}
+        return Response(response.content, status_code=response.status_code, headers=headers)
+
+    @app.get("/proxy/stats")
+    async def stats():
+        return {"entries": len(cache), **cache.stats}
+
+    async def read(path: str, request: Request) -> Response:
+        query = sorted(request.query_params.multi_items())
+        base = public_base(request)
+        key = f"{base}|{path}?{query}"
+
+        entry = cache.get(key)
+        if entry is not None:
+            if time.monotonic() - entry.validated_at < revalidate_after:
+                cache.stats["hits"] += 1
+                return serve_entry(entry, request, "HIT")
+            if await still_fresh(path, entry):
+                cache.stats["revalidated"] += 1
+                entry.validated_at = time.monotonic()
+                return serve_entry(entry, request, "REVALIDATED")
+            cache.stats["refetched"] += 1
+        else:
+            cache.stats["misses"] += 1
+
+        generation = cache.generation
+        response, fresh = await fetch(path, request, query, base)
+        if fresh is None:
+            return passthrough(response)
+        cache.put(key, fresh, generation)
+        return serve_entry(fresh, request, "MISS")
+
+    @app.get("/fhir/{path:path}")
+    async def get(path: str, request: Request):
+        return await read(path, request)
+
+    # Paging links (?_getpages=...&_getpagesoffset=...) are on the base URL itself
+    @app.get("/fhir")
+    async def get_base(request: Request):
+        return await read("", request)
+
+    async def write(method: str, path: str, request: Request) -> Response:
+        body = await request.body()
+        response = await http.request(method, f"{upstream}/{path}", content=body,
+                                      params=request.query_params.multi_items(), headers=forwarded_headers(request))
+        parts = [p for p in path.split("/") if p]
+        if not parts:
+            # Transaction/batch Bundle posted to the base: may touch anything
+            cache.invalidate()
+        else:
+            patient_id = parts[1] if parts[0] == "Patient" and len(parts) > 1 else None
+            if patient_id is None and body:
+                try:
+                    patient_id = patient_id_of(json.loads(body))
+                except (ValueError, AttributeError):
+                    patient_id = None
+            cache.invalidate(parts[0], patient_id)
+        return passthrough(response)
+
+    @app.post("/fhir/{path:path}")
+    async def post(path: str, request: Request):
+        return await write("POST", path, request)
+
+    @app.put("/fhir/{path:path}")
+    async def put(path: str, request: Request):
+        return await write("PUT", path, request)
+
+    @app.delete("/fhir/{path:path}")
+    async def delete(path: str, request: Request):
+        return await write("DELETE", path, request)
+
+    @app.post("/fhir")
+    async def post_base(request: Request):
+        return await write("POST", "", request)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Caching reverse proxy for a FHIR server")
+    parser.add_argument("--upstream", default="http://localhost:8080/fhir")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=PROXY_PORT)
+    parser.add_argument("--revalidate-after", type=float, default=REVALIDATE_AFTER)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    uvicorn.run(create_app(args.upstream, revalidate_after=args.revalidate_after),
+                host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,8 +6,8 @@
 #   pip install modal
 #   modal setup
 #
-# Run:   modal run src/backend/fhir_server.py
-# Deploy: modal deploy src/backend/fhir_server.py
+# Run:   modal run -m src.backend.fhir_server
+# Deploy: modal deploy -m src.backend.fhir_server
 
 import modal
 from pathlib import Path
@@ -21,8 +21,14 @@ FHIR_WARM_WINDOW = 60 * MINUTES  # Keep warm for 1 hour to avoid cold starts
 app = modal.App("fhir-server")
 
 # Build image from multi-stage Dockerfile
+# Only the (stdlib-only) launcher is copied in, so unrelated source edits do not
+# rebuild the image; it is used once at build time to bake the AppCDS archive
 dockerfile_path = Path(__file__).parent / "Dockerfile.fhir"
-image = modal.Image.from_dockerfile(dockerfile_path)
+image = (
+    modal.Image.from_dockerfile(dockerfile_path)
+    .add_local_file(Path(__file__).parent / "hapi_launcher.py", "/root/hapi_launcher.py", copy=True)
+    .run_commands("cd /root && python3 hapi_launcher.py train-cds --archive /app/hapi-cds.jsa")
+)
 
 
 @app.function(
@@ -42,25 +48,46 @@ def serve():
     - 100 pre-loaded synthetic patient profiles (in H2 database)
     - Exposes /fhir/* endpoints on port 8080
     """
-    import subprocess
+    import json
+
+    from hapi_launcher import HapiLauncher
+
+    # JVM output is drained into /tmp/hapi/hapi.log; an unread pipe would block HAPI's logging
+    launcher = HapiLauncher()
+    launcher.start()
+
+    # Only report ready (by returning) once metadata answers and the agent's searches are warm
+    ready_after = launcher.wait_until_ready(timeout=4 * MINUTES)
+    warmed = launcher.warm_up()
+    print(json.dumps(launcher.startup_report(ready_after, warmed)))
+
+
+# --- Caching proxy ---
+# Drop-in for FHIR_URL: point the agent at https://<workspace>--fhir-server-proxy.modal.run/fhir
+proxy_image = (
+    modal.Image.debian_slim(python_version="3.11")
+    .pip_install("fastapi[standard]", "httpx")
+    .add_local_python_source("src")
+)
+
+
+@app.function(
+    image=proxy_image,
+    cpu=1.0,
+    memory=1024,
+    timeout=FHIR_TIMEOUT,
+    scaledown_window=FHIR_WARM_WINDOW,
+)
+@modal.concurrent(max_inputs=200)
+@modal.asgi_app()
+def proxy():
+    """Caching reverse proxy in front of serve() (see fhir_proxy.py)."""
     import os
 
-    os.chdir("/app")
-
-    # Start the HAPI FHIR server using the same command as the Docker image
-    # This uses the configs/application.yaml which points to /data/test_db
-    subprocess.Popen(
-        [
-            "java",
-            "-Xmx2g",
-            "--class-path", "/app/main.war",
-            "-Dloader.path=main.war!/WEB-INF/classes/,main.war!/WEB-INF/,/app/extra-classes",
-            "-Dspring.config.location=/configs/application.yaml",
-            "org.springframework.boot.loader.PropertiesLauncher",
-        ],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-    )
+    from src.backend.fhir_proxy import create_app
+
+    upstream = os.environ.get("FHIR_UPSTREAM_URL") or f"{serve.get_web_url()}/fhir"
+    return create_app(upstream)
 
 
 # --- Local test entrypoint ---
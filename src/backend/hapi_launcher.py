@@ -0,0 +1,305 @@
+# src/backend/hapi_launcher.py
+# Launcher for the HAPI FHIR JVM used by fhir_server.py
+# - Streams JVM stdout/stderr into a rotating log so the pipe never fills up
+# - Gates readiness on /fhir/metadata answering
+# - Warms JIT and H2 caches with the searches the agent actually makes
+# - Reuses an AppCDS archive trained at image build time to cut JVM cold start
+#
+# Standard library only: this runs inside the eclipse-temurin FHIR image.
+#
+# Train the class-data-sharing archive (done in the image build by fhir_server.py):
+#   python3 hapi_launcher.py train-cds --archive /app/hapi-cds.jsa
+
+import argparse
+import json
+import logging
+import logging.handlers
+import os
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+FHIR_BASE_URL = "http://localhost:8080/fhir"
+HAPI_LOG_PATH = "/tmp/hapi/hapi.log"
+HAPI_LOG_MAX_BYTES = 10 * 1024 * 1024
+HAPI_LOG_BACKUPS = 3
+
+HAPI_CDS_ARCHIVE = "/app/hapi-cds.jsa"
+
+# JVM tuning, overridable through the environment
+HAPI_HEAP = os.environ.get("HAPI_HEAP", "2g")
+HAPI_GC = os.environ.get("HAPI_GC", "")  # e.g. "ParallelGC", "SerialGC"; empty keeps the JVM default
+HAPI_JAVA_OPTS = os.environ.get("HAPI_JAVA_OPTS", "")
+
+# Same application arguments as the MedAgentBench Docker image; configs/application.yaml points to /data/test_db
+HAPI_APP_ARGS = [
+    "--class-path", "/app/main.war",
+    "-Dloader.path=main.war!/WEB-INF/classes/,main.war!/WEB-INF/,/app/extra-classes",
+    "-Dspring.config.location=/configs/application.yaml",
+    "org.springframework.boot.loader.PropertiesLauncher",
+]
+
+
+def java_command(
+    heap: str = HAPI_HEAP,
+    gc: str = HAPI_GC,
+    cds_archive: Optional[str] = HAPI_CDS_ARCHIVE,
+    train_cds: bool = False,
+    extra_opts: str = HAPI_JAVA_OPTS,
+) -> List[str]:
+    """
+    Build the HAPI JVM command line.
+
+    Args:
+        heap: Maximum (and initial) heap size, e.g. "2g"
+        gc: Garbage collector name without the Use prefix, e.g. "ParallelGC"
+        cds_archive: AppCDS archive to map at startup (ignored if missing)
+        train_cds: Dump a dynamic AppCDS archive to cds_archive at JVM exit instead
+        extra_opts: Additional whitespace-separated JVM options
+
+    Returns:
+        Command as a list of arguments
+    """
+    command = ["java", f"-Xmx{heap}", f"-Xms{heap}"]
+    if gc:
+        command.append(f"-XX:+Use{gc}")
+    if cds_archive and train_cds:
+        command.append(f"-XX:ArchiveClassesAtExit={cds_archive}")
+    elif cds_archive and os.path.exists(cds_archive):
+        # -Xshare:auto falls back to normal class loading if the archive does not match
+        command += [f"-XX:SharedArchiveFile={cds_archive}", "-Xshare:auto"]
+    command += extra_opts.split()
+    return command + HAPI_APP_ARGS
+
+
+# Searches issued by the agent for each MedAgentBench task family ({id} is a patient id)
+WARMUP_SEARCHES: List[Tuple[str, Dict[str, str]]] = [
+    ("Patient", {"identifier": "{id}"}),
+    ("Observation", {"patient": "{id}", "code": "MG"}),
+    ("Observation", {"patient": "{id}", "code": "GLU"}),
+    ("Observation", {"patient": "{id}", "code": "K"}),
+    ("Observation", {"patient": "{id}", "code": "A1C"}),
+    ("Observation", {"patient": "{id}", "category": "vital-signs"}),
+    ("MedicationRequest", {"patient": "{id}"}),
+    ("Condition", {"patient": "{id}", "category": "problem-list-item"}),
+    ("Procedure", {"patient": "{id}", "date": "ge2020-01-01"}),
+]
+
+
+class HapiLauncher:
+    """
+    Start and supervise the HAPI FHIR JVM.
+
+    Usage:
+        launcher = HapiLauncher()
+        launcher.start()
+        launcher.wait_until_ready()
+        launcher.warm_up()
+    """
+
+    def __init__(
+        self,
+        command: Optional[List[str]] = None,
+        cwd: str = "/app",
+        base_url: str = FHIR_BASE_URL,
+        log_path: str = HAPI_LOG_PATH,
+        max_log_bytes: int = HAPI_LOG_MAX_BYTES,
+        log_backups: int = HAPI_LOG_BACKUPS,
+    ):
+        """
+        Initialize the launcher.
+
+        Args:
+            command: JVM command line (defaults to java_command())
+            cwd: Working directory for the JVM
+            base_url: FHIR base URL served by the JVM
+            log_path: Rotating log file receiving JVM output
+            max_log_bytes: Size at which the log rotates
+            log_backups: Number of rotated logs to keep
+        """
+        self.command = command or java_command()
+        self.cwd = cwd
+        self.base_url = base_url.rstrip("/")
+        self.log_path = log_path
+        self.max_log_bytes = max_log_bytes
+        self.log_backups = log_backups
+        self.process: Optional[subprocess.Popen] = None
+        self.started_at: Optional[float] = None
+        self._drain_thread: Optional[threading.Thread] = None
+
+    def start(self) -> subprocess.Popen:
+        """Start the JVM and a background thread draining its output into the log."""
+        os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+        self.started_at = time.monotonic()
+        self.process = subprocess.Popen(
+            self.command,
+            cwd=self.cwd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+        )
+        self._drain_thread = threading.Thread(target=self._drain, args=(self.process,), daemon=True)
+        self._drain_thread.start()
+        return self.process
+
+    def _drain(self, process: subprocess.Popen) -> None:
+        handler = logging.handlers.RotatingFileHandler(
+            self.log_path, maxBytes=self.max_log_bytes, backupCount=self.log_backups
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        try:
+            for line in iter(process.stdout.readline, b""):
+                record = logging.makeLogRecord({"msg": line.decode("utf-8", "replace").rstrip("\n")})
+                handler.handle(record)
+        finally:
+            handler.close()
+
+    def elapsed(self) -> float:
+        """Seconds since the JVM was started."""
+        return time.monotonic() - self.started_at if self.started_at else 0.0
+
+    def _get(self, path: str, params: Optional[Dict[str, str]] = None, timeout: float = 30.0) -> Tuple[int, bytes]:
+        url = f"{self.base_url}/{path}"
+        if params:
+            url = f"{url}?{urlencode(params)}"
+        request = urllib.request.Request(url, headers={"Accept": "application/fhir+json"})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def wait_until_ready(self, timeout: float = 300.0, interval: float = 1.0) -> float:
+        """
+        Block until /fhir/metadata answers 200.
+
+        Args:
+            timeout: Maximum seconds to wait
+            interval: Seconds between polls
+
+        Returns:
+            Seconds from JVM start until metadata answered
+
+        Raises:
+            RuntimeError: If the JVM exits or does not become ready in time
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process is not None and self.process.poll() is not None:
+                raise RuntimeError(
+                    f"HAPI exited with code {self.process.returncode} before becoming ready (see {self.log_path})"
+                )
+            try:
+                status, _ = self._get("metadata", timeout=interval + 5)
+                if status == 200:
+                    return self.elapsed()
+            except (urllib.error.URLError, OSError):
+                pass
+            time.sleep(interval)
+        raise RuntimeError(f"HAPI did not become ready within {timeout:.0f}s (see {self.log_path})")
+
+    def warm_up(self, patients: int = 5, rounds: int = 2) -> int:
+        """
+        Issue the agent's typical searches so JIT and H2 caches are hot.
+
+        Args:
+            patients: Number of patients to sample
+            rounds: Passes over the search list
+
+        Returns:
+            Number of warm-up requests that succeeded
+        """
+        status, body = self._get("Patient", {"_count": str(patients)}, timeout=120)
+        if status != 200:
+            return 0
+        bundle = json.loads(body)
+        sampled = [e["resource"] for e in bundle.get("entry", []) if "resource" in e]
+
+        succeeded = 0
+        for _ in range(rounds):
+            for patient in sampled:
+                searches = list(WARMUP_SEARCHES)
+                name = (patient.get("name") or [{}])[0]
+                if name.get("family") and patient.get("birthDate"):
+                    searches.append(("Patient", {"family": name["family"], "birthdate": patient["birthDate"]}))
+                for resource_type, template in searches:
+                    params = {k: v.format(id=patient["id"]) for k, v in template.items()}
+                    try:
+                        status, _ = self._get(resource_type, params, timeout=120)
+                        succeeded += status == 200
+                    except (urllib.error.URLError, OSError):
+                        continue
+        return succeeded
+
+    def stop(self, timeout: float = 30.0) -> None:
+        """Terminate the JVM, killing it if it does not exit in time."""
+        if self.process is None or self.process.poll() is not None:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+    def startup_report(self, ready_after: float, warmed: int) -> Dict[str, object]:
+        """Startup timing breakdown, emitted on boot so cold starts can be compared."""
+        uses_cds = any(arg.startswith("-XX:SharedArchiveFile=") for arg in self.command)
+        return {
+            "event": "hapi_startup",
+            "jvm_ready_s": round(ready_after, 2),
+            "warm_up_s": round(self.elapsed() - ready_after, 2),
+            "total_s": round(self.elapsed(), 2),
+            "warm_up_requests": warmed,
+            "cds_archive": uses_cds,
+        }
+
+
+def train_cds_archive(archive: str = HAPI_CDS_ARCHIVE, timeout: float = 600.0) -> float:
+    """
+    Produce an AppCDS archive by booting HAPI once and shutting it down cleanly.
+
+    The warm-up sweep runs before shutdown so the classes behind the agent's
+    searches are part of the archive, not just those needed to boot.
+
+    Args:
+        archive: Destination .jsa file
+        timeout: Maximum seconds to wait for the training boot
+
+    Returns:
+        Seconds the training boot took to become ready
+
+    Raises:
+        RuntimeError: If HAPI fails to start or the archive was not written
+    """
+    launcher = HapiLauncher(command=java_command(cds_archive=archive, train_cds=True))
+    launcher.start()
+    try:
+        ready_after = launcher.wait_until_ready(timeout=timeout)
+        launcher.warm_up(rounds=1)
+    finally:
+        # SIGTERM gives an orderly JVM exit, which is when the dynamic archive is dumped
+        launcher.stop(timeout=120)
+    if not os.path.exists(archive):
+        raise RuntimeError(f"JVM exited without writing {archive} (see {launcher.log_path})")
+    return ready_after
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HAPI FHIR launcher utilities")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    train_parser = subparsers.add_parser("train-cds", help="Build the AppCDS archive")
+    train_parser.add_argument("--archive", default=HAPI_CDS_ARCHIVE)
+    args = parser.parse_args()
+
+    if args.command == "train-cds":
+        ready_after = train_cds_archive(args.archive)
+        size_mb = os.path.getsize(args.archive) / (1024 * 1024)
+        print(f"Wrote {args.archive} ({size_mb:.0f} MB); training boot ready after {ready_after:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,451 @@
+# src/backend/model_backends.py
+# Inference backends behind the model server's OpenAI-compatible routes
+# model_server.py only calls InferenceBackend.generate(), so which engine runs
+# the model is a config change (SARA_MODEL_BACKEND), invisible to the agent:
+#   transformers  MODEL_NAME at MODEL_REVISION with Hugging Face generate() in
+#                 bfloat16 on CUDA; one sequence at a time per request thread
+#   vllm          the same weights in vLLM: paged-attention KV cache, continuous
+#                 batching across concurrent requests and prefix caching of the
+#                 shared agent prompt (needs the vllm package and a GPU)
+#   tiny          a randomly initialized two-layer Gemma3 with a small BPE
+#                 tokenizer on CPU: no download, no GPU, loads in about a second.
+#                 Outputs are gibberish, but the request path (chat template,
+#                 tokenization, generate, decoding) is the transformers one, so
+#                 serving changes can be developed and measured on a laptop.
+#   replay        replies looked up by the exact conversation in a recording
+#                 (SARA_REPLAY_FILE); deterministic and instant, for tests.
+#                 Needs neither torch nor transformers.
+# Setting SARA_MODEL_RECORD to a path appends every served conversation and
+# reply to that JSONL file, in the format the replay backend reads.
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+
+try:
+    import torch
+    from transformers import LogitsProcessor, LogitsProcessorList
+except ImportError:  # replay-only environments
+    torch = None
+    LogitsProcessor = object
+    LogitsProcessorList = None
+
+MODEL_NAME = "Nadhari/Sara-1.5-4B-it"
+MODEL_REVISION = "main"
+
+# Gemma turn markers; the tiny tokenizer's template produces the same layout as Sara's
+TINY_CHAT_TEMPLATE = (
+    "{{ bos_token }}{% for m in messages %}<start_of_turn>"
+    "{{ 'model' if m['role'] == 'assistant' else m['role'] }}\n{{ m['content'] }}<end_of_turn>\n"
+    "{% endfor %}{% if add_generation_prompt %}<start_of_turn>model\n{% endif %}"
+)
+TINY_CORPUS_TEXT = (
+    "You are an expert in using FHIR functions to assist medical professionals. You are given a question and "
+    "a set of possible functions. Based on the question, you may need to make one or more function calls to get "
+    "the information needed or to take actions. If you decide to invoke a GET function, you MUST put it in the "
+    "format of GET url?param_name1=param_value1&param_name2=param_value2. Here is the response from the GET "
+    "request. Please call FINISH if you have got answers for all the questions and finished all the requested "
+    "tasks. The patient's given name, family name, date of birth, medication request, observation, condition, "
+    "procedure, service request, vital signs, laboratory results. This web service retrieves data from a "
+    "patient's chart across all encounters, the status of the order and the date and time it was taken."
+)
+
+REPLAY_CHARS_PER_TOKEN = 4  # token counts reported by the replay backend
+REPLAY_FALLBACK = ("FINISH([])",)
+
+
+@dataclass
+class Generation:
+    """
+    One completed generation.
+
+    Timestamps are time.perf_counter() values so the server can split a request
+    into tokenization, prefill and decode.
+    """
+    text: str
+    prompt_tokens: int
+    completion_tokens: int
+    tokenized_at: float
+    first_token_at: Optional[float]
+    generated_at: float
+    finish_reason: str = "stop"
+
+
+class InferenceBackend:
+    """
+    Turns a chat conversation into a completion.
+
+    generate() is called from the server's request threads, possibly several at
+    once; implementations serialize or batch as their engine requires.
+    """
+    kind = "base"
+    name = "sara"
+
+    def generate(self, messages: List[Dict[str, str]], max_tokens: int, temperature: float,
+                 top_p: float) -> Generation:
+        """
+        Generate the assistant's next message.
+
+        Args:
+            messages: Conversation as {"role", "content"} dicts
+            max_tokens: Maximum tokens to generate
+            temperature: Sampling temperature (0 for greedy)
+            top_p: Nucleus sampling probability mass
+
+        Returns:
+            The completion with token counts and timings
+        """
+        raise NotImplementedError
+
+
+# --- transformers ---
+
+class FirstTokenTimer(LogitsProcessor):
+    """Records when the first token's logits are ready (end of prefill); leaves scores unchanged."""
+
+    def __init__(self):
+        self.first_token_at = None
+
+    def __call__(self, input_ids, scores):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        return scores
+
+
+class TransformersBackend(InferenceBackend):
+    """Hugging Face generate() on a loaded model."""
+    kind = "transformers"
+
+    def __init__(self, name: str, model, tokenizer, device: str):
+        self.name = name
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+
+    @classmethod
+    def from_pretrained(cls, model_name: str = MODEL_NAME, revision: str = MODEL_REVISION,
+                        source: Optional[str] = None, compile: bool = False) -> "TransformersBackend":
+        """
+        Load Sara onto the GPU.
+
+        Args:
+            model_name: Hugging Face repo id (also the served model name)
+            revision: Branch, tag or commit
+            source: Local snapshot directory to memory-map the weights from instead of the hub cache
+            compile: Use a static KV cache so generate() compiles the decode step with torch.compile
+        """
+        from transformers import AutoTokenizer, Gemma3ForConditionalGeneration
+
+        path, options = (source, {"local_files_only": True}) if source else (model_name, {"revision": revision})
+        print(f"Loading tokenizer: {path}")
+        tokenizer = AutoTokenizer.from_pretrained(path, **options)
+
+        print(f"Loading model: {path}")
+        model = Gemma3ForConditionalGeneration.from_pretrained(
+            path,
+            torch_dtype=torch.bfloat16,
+            device_map="cuda",
+            **options,
+        )
+        model.eval()
+        if compile:
+            model.generation_config.cache_implementation = "static"
+        print("Model loaded successfully")
+        return cls(model_name, model, tokenizer, "cuda")
+
+    @classmethod
+    def tiny(cls, seed: int = 0) -> "TransformersBackend":
+        """Randomly initialized two-layer Gemma3 (text and vision towers) on CPU."""
+        from transformers import Gemma3Config, Gemma3ForConditionalGeneration
+
+        tokenizer = tiny_tokenizer()
+        config = Gemma3Config(
+            text_config=dict(vocab_size=len(tokenizer), hidden_size=64, intermediate_size=128, num_hidden_layers=2,
+                             num_attention_heads=1, num_key_value_heads=1, head_dim=64,
+                             max_position_embeddings=32768, sliding_window=512),
+            vision_config=dict(hidden_size=32, intermediate_size=64, num_hidden_layers=1, num_attention_heads=2,
+                               image_size=28, patch_size=14),
+            mm_tokens_per_image=4,
+        )
+        torch.manual_seed(seed)
+        model = Gemma3ForConditionalGeneration(config)
+        model.eval()
+        print(f"Tiny model ready ({sum(p.numel() for p in model.parameters())} parameters, CPU)")
+        return cls("sara-tiny", model, tokenizer, "cpu")
+
+    def generate(self, messages, max_tokens, temperature, top_p):
+        input_text = self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        inputs = self.tokenizer(input_text, return_tensors="pt").to(self.device)
+        input_len = inputs["input_ids"].shape[1]
+        tokenized = time.perf_counter()
+
+        first_token = FirstTokenTimer()
+        gen_kwargs = {
+            "max_new_tokens": max_tokens,
+            "do_sample": temperature > 0,
+            "top_p": top_p,
+            "logits_processor": LogitsProcessorList([first_token]),
+        }
+        if temperature > 0:
+            gen_kwargs["temperature"] = temperature
+
+        with torch.no_grad():
+            outputs = self.model.generate(**inputs, **gen_kwargs)
+        generated = time.perf_counter()
+
+        new_tokens = outputs[0][input_len:]
+        return Generation(
+            text=self.tokenizer.decode(new_tokens, skip_special_tokens=True),
+            prompt_tokens=input_len,
+            completion_tokens=len(new_tokens),
+            tokenized_at=tokenized,
+            first_token_at=first_token.first_token_at,
+            generated_at=generated,
+            finish_reason="length" if len(new_tokens) >= max_tokens else "stop",
+        )
+
+
+def _tiny_corpus(samples: int = 300, seed: int = 0) -> Iterator[str]:
+    """Agent-like text (instructions, FHIR JSON) the tiny tokenizer's merges are learned from."""
+    rng = random.Random(seed)
+    for _ in range(samples):
+        yield TINY_CORPUS_TEXT
+        resource = {
+            "resourceType": "Observation", "id": str(rng.randint(1, 10 ** 6)), "status": "final",
+            "category": [{"coding": [{"system": "http://hl7.org/fhir/observation-category",
+                                      "code": "laboratory", "display": "Laboratory"}]}],
+            "code": {"coding": [{"system": "http://loinc.org", "code": rng.choice(["MG", "K", "GLU", "A1C", "BP"])}]},
+            "effectiveDateTime": f"20{rng.randint(10, 23)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T"
+                                 f"{rng.randint(0, 23):02d}:00:00+00:00",
+            "valueQuantity": {"value": round(rng.uniform(0, 200), 1), "unit": "mg/dL"},
+            "subject": {"reference": f"Patient/S{rng.randint(10 ** 6, 10 ** 7 - 1)}"},
+        }
+        yield json.dumps({"fullUrl": f"http://localhost:8080/fhir/Observation/{resource['id']}",
+                          "resource": resource, "search": {"mode": "match"}}, indent=2)
+
+
+def tiny_tokenizer():
+    """
+    Small BPE tokenizer with Gemma's special tokens, trained at startup without any download.
+
+    Byte-level, so any text round-trips; on agent prompts it yields roughly one
+    token per 3 characters, close enough to Sara's tokenizer that prompt lengths
+    (and so prefill cost) stay realistic.
+    """
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import PreTrainedTokenizerFast
+
+    specials = ["<pad>", "<eos>", "<bos>", "<unk>", "<start_of_turn>", "<end_of_turn>"]
+    tokenizer = Tokenizer(models.BPE(unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(vocab_size=4096, special_tokens=specials, show_progress=False,
+                                  initial_alphabet=pre_tokenizers.ByteLevel.alphabet())
+    tokenizer.train_from_iterator(_tiny_corpus(), trainer)
+    fast = PreTrainedTokenizerFast(tokenizer_object=tokenizer, bos_token="<bos>", eos_token="<eos>",
+                                   pad_token="<pad>", unk_token="<unk>")
+    fast.chat_template = TINY_CHAT_TEMPLATE
+    return fast
+
+
+# --- vLLM ---
+
+class VLLMBackend(InferenceBackend):
+    """
+    vLLM's AsyncLLMEngine on a private event loop thread.
+
+    Request threads submit to the loop and block on the result, so concurrent
+    requests share the engine's continuously batched decode steps instead of
+    each running its own generate().
+    """
+    kind = "vllm"
+
+    def __init__(self, model_name: str = MODEL_NAME, revision: str = MODEL_REVISION, source: Optional[str] = None,
+                 max_model_len: int = 32768, gpu_memory_utilization: float = 0.90):
+        try:
+            from vllm import AsyncEngineArgs, AsyncLLMEngine, SamplingParams
+        except ImportError as e:
+            raise RuntimeError("SARA_MODEL_BACKEND=vllm needs the vllm package (pip install vllm)") from e
+        from transformers import AutoTokenizer
+
+        self.name = model_name
+        self._sampling_params = SamplingParams
+        # Chat template applied here so prompt layout matches the transformers backend
+        self.tokenizer = AutoTokenizer.from_pretrained(source or model_name, revision=None if source else revision)
+
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="vllm-engine", daemon=True).start()
+        args = AsyncEngineArgs(
+            model=source or model_name,  # a local snapshot is loaded as-is, without hub lookups
+            revision=None if source else revision,
+            served_model_name=model_name,
+            dtype="bfloat16",
+            max_model_len=max_model_len,
+            gpu_memory_utilization=gpu_memory_utilization,
+            enable_prefix_caching=True,  # every agent request starts with the same instructions
+        )
+        print(f"Starting vLLM engine: {model_name} (max_model_len={max_model_len})")
+        self.engine = self._run(self._start(AsyncLLMEngine, args))
+        print("vLLM engine ready")
+
+    @staticmethod
+    async def _start(engine_cls, args):
+        # The engine binds to the loop it is created on
+        return engine_cls.from_engine_args(args)
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def generate(self, messages, max_tokens, temperature, top_p):
+        input_text = self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        prompt_ids = self.tokenizer(input_text)["input_ids"]
+        tokenized = time.perf_counter()
+        params = self._sampling_params(max_tokens=max_tokens, temperature=temperature, top_p=top_p)
+        return self._run(self._generate(prompt_ids, params, tokenized))
+
+    async def _generate(self, prompt_ids, params, tokenized):
+        first_token_at = None
+        final = None
+        async for output in self.engine.generate({"prompt_token_ids": prompt_ids}, params, uuid.uuid4().hex):
+            if first_token_at is None and output.outputs and output.outputs[0].token_ids:
+                first_token_at = time.perf_counter()
+            final = output
+        generated = time.perf_counter()
+        completion = final.outputs[0]
+        return Generation(
+            text=completion.text,
+            prompt_tokens=len(prompt_ids),
+            completion_tokens=len(completion.token_ids),
+            tokenized_at=tokenized,
+            first_token_at=first_token_at,
+            generated_at=generated,
+            finish_reason="length" if completion.finish_reason == "length" else "stop",
+        )
+
+
+# --- Replay and recording ---
+
+def conversation_key(messages: Sequence[Dict[str, str]]) -> str:
+    """Stable hash of a conversation's roles and contents."""
+    canonical = json.dumps([[m["role"], m["content"]] for m in messages], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ReplayBackend(InferenceBackend):
+    """
+    Replies from a recording, keyed by the exact conversation.
+
+    Conversations that were not recorded get the fallback reply for their turn
+    (the number of assistant messages so far), so a replayed agent run always
+    terminates.
+    """
+    kind = "replay"
+
+    def __init__(self, replies: Optional[Dict[str, str]] = None, fallback: Sequence[str] = REPLAY_FALLBACK,
+                 name: str = "sara-replay"):
+        self.replies = dict(replies or {})
+        self.fallback = list(fallback) or list(REPLAY_FALLBACK)
+        self.name = name
+
+    @classmethod
+    def from_file(cls, path: Optional[str], **kwargs) -> "ReplayBackend":
+        """Load a JSONL recording of {"messages": [...], "content": "..."} lines (None for fallback only)."""
+        replies = {}
+        if path:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        replies[conversation_key(record["messages"])] = record["content"]
+            print(f"Replay backend: {len(replies)} recorded conversations from {path}")
+        return cls(replies, **kwargs)
+
+    def generate(self, messages, max_tokens, temperature, top_p):
+        tokenized = time.perf_counter()
+        text = self.replies.get(conversation_key(messages))
+        if text is None:
+            turn = sum(1 for m in messages if m["role"] == "assistant")
+            text = self.fallback[min(turn, len(self.fallback) - 1)]
+        prompt_chars = sum(len(m["content"]) for m in messages)
+        completion_tokens = min(max_tokens, max(1, len(text) // REPLAY_CHARS_PER_TOKEN))
+        return Generation(
+            text=text,
+            prompt_tokens=max(1, prompt_chars // REPLAY_CHARS_PER_TOKEN),
+            completion_tokens=completion_tokens,
+            tokenized_at=tokenized,
+            first_token_at=tokenized,
+            generated_at=time.perf_counter(),
+        )
+
+
+class RecordingBackend(InferenceBackend):
+    """Wraps a backend and appends each conversation and reply to a JSONL file for ReplayBackend."""
+
+    def __init__(self, inner: InferenceBackend, path: str):
+        self.inner = inner
+        self.path = path
+        self.kind = inner.kind
+        self.name = inner.name
+        self._lock = threading.Lock()
+
+    def generate(self, messages, max_tokens, temperature, top_p):
+        generation = self.inner.generate(messages, max_tokens, temperature, top_p)
+        line = json.dumps({"messages": messages, "max_tokens": max_tokens, "content": generation.text},
+                          ensure_ascii=False)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+        return generation
+
+
+# --- Selection ---
+
+def _env_float(var: str, default: float) -> float:
+    value = os.environ.get(var)
+    try:
+        return float(value) if value else default
+    except ValueError:
+        return default
+
+
+def _env_flag(var: str) -> bool:
+    return (os.environ.get(var) or "").strip().lower() in ("1", "true", "on", "yes")
+
+
+# Factories take an optional local snapshot directory (ignored by backends that download nothing)
+BACKENDS: Dict[str, Callable[[Optional[str]], InferenceBackend]] = {
+    "transformers": lambda source: TransformersBackend.from_pretrained(
+        os.environ.get("MODEL_NAME", MODEL_NAME), os.environ.get("MODEL_REVISION", MODEL_REVISION),
+        source=source, compile=_env_flag("SARA_TORCH_COMPILE")),
+    "vllm": lambda source: VLLMBackend(
+        os.environ.get("MODEL_NAME", MODEL_NAME), os.environ.get("MODEL_REVISION", MODEL_REVISION), source=source,
+        max_model_len=int(_env_float("VLLM_MAX_MODEL_LEN", 32768)),
+        gpu_memory_utilization=_env_float("VLLM_GPU_MEMORY_UTILIZATION", 0.90)),
+    "tiny": lambda source: TransformersBackend.tiny(),
+    "replay": lambda source: ReplayBackend.from_file(os.environ.get("SARA_REPLAY_FILE")),
+}
+DOWNLOADING_BACKENDS = ("transformers", "vllm")  # backends that load MODEL_NAME's weights
+
+
+def backend_from_env(var: str = "SARA_MODEL_BACKEND", default: str = "transformers") -> str:
+    """Name of the inference backend to load (one of BACKENDS)."""
+    value = (os.environ.get(var) or default).strip().lower()
+    if value not in BACKENDS:
+        raise ValueError(f"{var}={value!r}: expected one of {', '.join(BACKENDS)}")
+    return value
+
+
+def load_backend(name: str, source: Optional[str] = None) -> InferenceBackend:
+    """Load a backend by name, wrapped for recording when SARA_MODEL_RECORD is set."""
+    backend = BACKENDS[name](source)
+    record_path = os.environ.get("SARA_MODEL_RECORD")
+    if record_path:
+        print(f"Recording conversations to {record_path}")
+        backend = RecordingBackend(backend, record_path)
+    return backend
@@ -0,0 +1,335 @@
+# src/backend/model_server.py
+# OpenAI-compatible FastAPI server for the Sara model
+# sara_model.py runs this module inside the Modal GPU container; it can also be
+# imported (tests, profiling) or run on any machine. The routes only talk to an
+# InferenceBackend (model_backends.py); SARA_MODEL_BACKEND picks which one:
+#   transformers  Hugging Face generate() on CUDA (production default)
+#   vllm          paged-attention engine with continuous batching (needs vllm)
+#   tiny          random-weight two-layer Gemma3 on CPU, for local serving work
+#   replay        recorded replies (SARA_REPLAY_FILE), for tests
+# main() listens at once and loads in the background (model_startup.py): /health
+# is liveness, /ready turns 200 after load and warm-up, with the phase timings.
+#
+# Run locally:
+#   SARA_MODEL_BACKEND=tiny python -m src.backend.model_server --port 8000
+#   python -m src.backend.benchmarks.serving --base-url http://localhost:8000 --concurrency 1,2,4
+
+import argparse
+import os
+import threading
+import time
+import uuid
+from typing import Literal, Optional
+
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response
+from fastapi.security import APIKeyHeader
+from pydantic import BaseModel, Field, field_validator
+
+from src.backend.model_backends import BACKENDS, InferenceBackend, backend_from_env
+from src.backend.model_startup import Startup, cold_start
+from src.backend.utils.metrics import CONTENT_TYPE, RATE_BUCKETS, Registry
+from src.backend.utils.profiling import ProfileStore, profile_block, profile_token_from_env, requested_profile
+from src.backend.utils.tracing import Tracer, tracer_from_env
+
+MODEL_PORT = 8000
+
+
+# --- Pydantic Models for Request Validation ---
+class ChatMessage(BaseModel):
+    role: Literal["system", "user", "assistant"]
+    content: str
+
+    @field_validator("content")
+    @classmethod
+    def content_not_empty(cls, v: str) -> str:
+        if not v or not v.strip():
+            raise ValueError("Message content cannot be empty")
+        return v
+
+
+class ChatRequest(BaseModel):
+    model: Optional[str] = None
+    messages: list[ChatMessage] = Field(..., min_length=1)
+    max_tokens: int = Field(default=256, ge=1, le=4096)
+    temperature: float = Field(default=0.0, ge=0.0, le=2.0)
+    top_p: float = Field(default=1.0, ge=0.0, le=1.0)
+
+    @field_validator("messages")
+    @classmethod
+    def messages_not_empty(cls, v: list[ChatMessage]) -> list[ChatMessage]:
+        if not v:
+            raise ValueError("Messages list cannot be empty")
+        return v
+
+
+# --- Application ---
+
+def create_app(backend: Optional[InferenceBackend], api_key: str = "", profile_token: Optional[str] = None,
+               startup: Optional[Startup] = None, tracer: Optional[Tracer] = None) -> FastAPI:
+    """
+    Create the FastAPI application serving an inference backend.
+
+    Args:
+        backend: Loaded backend that generates the completions (None when startup loads it)
+        api_key: Required X-API-Key / Bearer token ("" allows all requests)
+        profile_token: Token that enables per-request profiling (None disables it)
+        startup: Background load in progress; model routes return 503 until it is ready
+        tracer: Exports a model.generate span per request (None measures without exporting)
+
+    Returns:
+        FastAPI application
+    """
+    if startup is None:
+        startup = Startup.loaded(backend)
+    tracer = tracer or Tracer()
+    profiles = ProfileStore()
+
+    app = FastAPI(title="Sara Model API", version="1.0.0")
+
+    # --- Metrics (served from /metrics) ---
+    metrics = Registry()
+    queue_wait = metrics.histogram("sara_model_queue_wait_seconds", "Time from request arrival to the start of inference")
+    ttft = metrics.histogram("sara_model_ttft_seconds", "Time from request arrival to the first generated token")
+    prefill = metrics.histogram("sara_model_prefill_seconds", "Tokenization and prefill time (start of inference to first token)")
+    decode = metrics.histogram("sara_model_decode_seconds", "Generation time after the first token")
+    tokens_per_second = metrics.histogram(
+        "sara_model_decode_tokens_per_second", "Decode throughput per request", buckets=RATE_BUCKETS)
+    prompt_tokens_total = metrics.counter("sara_model_prompt_tokens_total", "Prompt tokens processed")
+    completion_tokens_total = metrics.counter("sara_model_completion_tokens_total", "Tokens generated")
+    requests_total = metrics.counter("sara_model_requests_total", "Chat completion requests", ("status",))
+    in_flight = metrics.gauge("sara_model_requests_in_flight", "Chat completion requests being served")
+
+    @app.middleware("http")
+    async def record_arrival(request: Request, call_next):
+        # Handlers run in a thread pool; the gap to handler start is queue wait
+        request.state.arrived = time.perf_counter()
+        return await call_next(request)
+
+    # API Key authentication
+    api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
+
+    def verify_api_key(request: Request, provided: str = Depends(api_key_header)):
+        """Verify API key from request headers."""
+        if not api_key:
+            # If no API key is configured, allow all requests (dev mode)
+            return True
+        # Check X-API-Key header
+        if provided == api_key:
+            return True
+        # Check Authorization header (Bearer token)
+        auth_header = request.headers.get("Authorization", "")
+        if auth_header.startswith("Bearer ") and auth_header[7:] == api_key:
+            return True
+        raise HTTPException(status_code=401, detail="Invalid or missing API key")
+
+    def ready_backend() -> InferenceBackend:
+        """The loaded backend, or 503 while the model is still starting."""
+        if startup.backend is None:
+            raise HTTPException(
+                status_code=503,
+                detail={
+                    "error": {
+                        "message": f"Model is not ready ({startup.phase})",
+                        "type": "server_error",
+                        "code": "model_starting" if startup.error is None else "model_failed",
+                    }
+                },
+                headers={"Retry-After": "5"},
+            )
+        return startup.backend
+
+    # Liveness: the process is up, even while weights load
+    @app.get("/health")
+    def health():
+        return {"status": "ok", "backend": startup.kind}
+
+    # Readiness: 200 once loaded and warmed, with the startup phase timings
+    @app.get("/ready")
+    def ready():
+        report = startup.report()
+        return JSONResponse(report, status_code=200 if startup.backend is not None else 503)
+
+    @app.get("/metrics")
+    def metrics_endpoint(auth: bool = Depends(verify_api_key)):
+        return Response(content=metrics.render(), media_type=CONTENT_TYPE)
+
+    @app.get("/v1/models")
+    def list_models(auth: bool = Depends(verify_api_key)):
+        return {
+            "object": "list",
+            "data": [{"id": ready_backend().name, "object": "model", "owned_by": "user"}],
+        }
+
+    @app.get("/v1/profiles/{profile_id}")
+    def get_profile(profile_id: str, http_request: Request, format: Optional[str] = None):
+        if requested_profile(http_request.headers, http_request.query_params, profile_token) is None:
+            raise HTTPException(status_code=401, detail="Invalid or missing profile token")
+        artifact = profiles.get(profile_id)
+        if artifact is None:
+            raise HTTPException(status_code=404, detail="Profile expired or unknown")
+        if format == "text":
+            return Response(content=artifact.summary, media_type="text/plain")
+        return Response(content=artifact.content, media_type=artifact.media_type,
+                        headers={"Content-Disposition": f'attachment; filename="{artifact.filename}"'})
+
+    @app.post("/v1/chat/completions")
+    def chat_completions(request: ChatRequest, http_request: Request, response: Response,
+                         auth: bool = Depends(verify_api_key)):
+        mode = requested_profile(http_request.headers, http_request.query_params, profile_token)
+        if mode is None:
+            return complete(request, http_request, response)
+
+        # Profiled: cProfile, or torch.profiler with X-Sara-Profile-Mode: torch
+        profile_id = profiles.reserve()
+        response.headers["X-Sara-Profile-Id"] = profile_id
+        captured = None
+        try:
+            with profile_block(mode, f"chat-{profile_id}") as captured:
+                return complete(request, http_request, response)
+        finally:
+            if captured is not None and captured.artifact is not None:
+                profiles.put(profile_id, captured.artifact)
+
+    def complete(request: ChatRequest, http_request: Request, response: Response):
+        backend = ready_backend()
+        started = time.perf_counter()
+        arrived = getattr(http_request.state, "arrived", started)
+        queue_wait.observe(started - arrived)
+        in_flight.inc()
+        status = "error"
+        # Joins the agent's trace through the traceparent header
+        generate_span = tracer.start("model.generate", traceparent=http_request.headers.get("traceparent"),
+                                     backend=backend.kind)
+        try:
+            # Convert Pydantic models to dicts for the chat template
+            messages = [{"role": msg.role, "content": msg.content} for msg in request.messages]
+            generation = backend.generate(messages, request.max_tokens, request.temperature, request.top_p)
+            generated = generation.generated_at
+            input_len = generation.prompt_tokens
+            completion_tokens = generation.completion_tokens
+
+            generate_span.set(
+                tokenizeMs=round((generation.tokenized_at - started) * 1000, 3),
+                generateMs=round((generated - generation.tokenized_at) * 1000, 3),
+                promptTokens=input_len,
+                completionTokens=completion_tokens,
+            )
+
+            first_token_at = generation.first_token_at or generated
+            decode_seconds = generated - first_token_at
+            ttft.observe(first_token_at - arrived)
+            prefill.observe(first_token_at - started)
+            decode.observe(decode_seconds)
+            if completion_tokens > 1 and decode_seconds > 0:
+                tokens_per_second.observe((completion_tokens - 1) / decode_seconds)
+            prompt_tokens_total.inc(input_len)
+            completion_tokens_total.inc(completion_tokens)
+            # Exact per-request timings (the histograms above only keep bucket counts)
+            response.headers["Server-Timing"] = ", ".join(
+                f"{name};dur={seconds * 1000:.3f}" for name, seconds in (
+                    ("queue", started - arrived), ("ttft", first_token_at - arrived),
+                    ("prefill", first_token_at - started), ("decode", decode_seconds)))
+            status = "ok"
+
+            return {
+                "id": f"chatcmpl-{uuid.uuid4().hex[:8]}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": backend.name,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": generation.text},
+                        "finish_reason": generation.finish_reason,
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": input_len,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": input_len + completion_tokens,
+                },
+            }
+
+        except RuntimeError as e:
+            generate_span.fail(e)
+            # torch.cuda.OutOfMemoryError is a RuntimeError; matched by name so torch stays optional
+            if type(e).__name__ == "OutOfMemoryError":
+                raise HTTPException(
+                    status_code=503,
+                    detail={
+                        "error": {
+                            "message": "GPU out of memory. Try reducing max_tokens or message length.",
+                            "type": "server_error",
+                            "code": "gpu_oom",
+                        }
+                    },
+                )
+            if "CUDA" in str(e) or "cuda" in str(e):
+                raise HTTPException(
+                    status_code=503,
+                    detail={
+                        "error": {
+                            "message": f"GPU error during inference: {str(e)}",
+                            "type": "server_error",
+                            "code": "gpu_error",
+                        }
+                    },
+                )
+            raise HTTPException(
+                status_code=500,
+                detail={
+                    "error": {
+                        "message": f"Runtime error during inference: {str(e)}",
+                        "type": "server_error",
+                        "code": "runtime_error",
+                    }
+                },
+            )
+        except Exception as e:
+            generate_span.fail(e)
+            raise HTTPException(
+                status_code=500,
+                detail={
+                    "error": {
+                        "message": f"Unexpected error during inference: {str(e)}",
+                        "type": "server_error",
+                        "code": "internal_error",
+                    }
+                },
+            )
+        finally:
+            requests_total.inc(status=status)
+            in_flight.dec()
+            generate_span.end()
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible server for the Sara model")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=MODEL_PORT)
+    parser.add_argument("--backend", help=f"Overrides SARA_MODEL_BACKEND ({', '.join(BACKENDS)})")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    if args.backend:
+        os.environ["SARA_MODEL_BACKEND"] = args.backend
+    try:
+        backend = backend_from_env()
+    except ValueError as e:
+        parser.error(str(e))
+    # Listen right away (/health, /ready) and load in the background; /ready turns 200 after warm-up
+    startup = Startup(backend)
+    # Requests sent with this token (X-Sara-Profile header or ?profile=) are profiled; unset disables profiling
+    app = create_app(None, api_key=os.environ.get("SARA_API_KEY", ""), profile_token=profile_token_from_env(),
+                     startup=startup, tracer=tracer_from_env())
+    threading.Thread(target=startup.run, args=(lambda s: cold_start(s, backend),), name="model-startup",
+                     daemon=True).start()
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
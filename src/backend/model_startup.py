@@ -0,0 +1,330 @@
+# src/backend/model_startup.py
+# Cold start for the model server
+# - Loads weights from a local snapshot of bfloat16 safetensors (memory-mapped by
+#   from_pretrained, no hub lookups), prepared once by sara_model.py's prepare()
+# - Points the torch.compile / Triton / vLLM caches at a persistent directory and
+#   restores saved compile artifacts, so compiled graphs are not rebuilt per container
+# - Warms the CUDA kernels with generations at the common agent prompt lengths
+# - Times each phase; model_server.py serves the breakdown from /ready
+#
+# Prepare a snapshot by hand:
+#   python -m src.backend.model_startup --snapshot-dir /tmp/sara-snapshot
+
+import argparse
+import json
+import os
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+from src.backend.model_backends import (
+    DOWNLOADING_BACKENDS,
+    MODEL_NAME,
+    MODEL_REVISION,
+    TINY_CORPUS_TEXT,
+    InferenceBackend,
+    load_backend,
+)
+from src.backend.utils.env import env_flag
+
+SNAPSHOT_MARKER = ".sara-snapshot.json"
+SNAPSHOT_PATTERNS = ["*.json", "*.safetensors", "*.model", "*.jinja", "tokenizer*"]
+COMPILE_ARTIFACTS = "torch-compile-artifacts.bin"
+WARMUP_TOKENS = (1024, 4096, 12288)  # short task, typical round, long patient history
+WARMUP_CHARS_PER_TOKEN = 4
+WARMUP_MAX_TOKENS = 16
+
+
+# --- Local snapshot ---
+
+def _weight_files(snapshot_dir: str) -> List[str]:
+    """Safetensors shards and their index in snapshot_dir."""
+    return [f for f in os.listdir(snapshot_dir) if f.endswith((".safetensors", ".safetensors.index.json"))]
+
+
+def _needs_conversion(snapshot_dir: str) -> bool:
+    """True unless every floating-point weight is already stored as bfloat16 safetensors."""
+    from safetensors import safe_open
+
+    for filename in _weight_files(snapshot_dir):
+        if not filename.endswith(".safetensors"):
+            continue
+        with safe_open(os.path.join(snapshot_dir, filename), framework="pt") as f:
+            for key in f.keys():
+                dtype = f.get_slice(key).get_dtype()
+                if dtype.startswith("F") and dtype != "BF16":
+                    return True
+    return False
+
+
+def snapshot_ready(snapshot_dir: str, model_name: str = MODEL_NAME, revision: str = MODEL_REVISION) -> bool:
+    """True if snapshot_dir holds a complete snapshot of model_name at revision."""
+    marker = os.path.join(snapshot_dir, SNAPSHOT_MARKER)
+    if not os.path.exists(marker):
+        return False
+    with open(marker, encoding="utf-8") as f:
+        recorded = json.load(f)
+    return recorded.get("model") == model_name and recorded.get("revision") == revision
+
+
+def prepare_snapshot(snapshot_dir: str, model_name: str = MODEL_NAME, revision: str = MODEL_REVISION) -> str:
+    """
+    Make a local directory of bfloat16 safetensors and tokenizer files for the model.
+
+    Downloads the repo's safetensors and config once. If the checkpoint is not
+    stored as bfloat16, the downloaded files are loaded, cast and saved back in
+    place of the original shards, so later loads memory-map the files without a
+    dtype cast. A marker file records the model and revision; a complete
+    snapshot is only checked, never downloaded again.
+
+    Args:
+        snapshot_dir: Directory to fill (created if missing)
+        model_name: Hugging Face repo id
+        revision: Branch, tag or commit
+
+    Returns:
+        snapshot_dir
+    """
+    if snapshot_ready(snapshot_dir, model_name, revision):
+        return snapshot_dir
+
+    from huggingface_hub import snapshot_download
+
+    print(f"Preparing snapshot of {model_name}@{revision} in {snapshot_dir}")
+    os.makedirs(snapshot_dir, exist_ok=True)
+    snapshot_download(model_name, revision=revision, local_dir=snapshot_dir, allow_patterns=SNAPSHOT_PATTERNS)
+    if not any(f.endswith(".safetensors") for f in _weight_files(snapshot_dir)):
+        raise FileNotFoundError(f"{model_name}@{revision} has no safetensors weights")
+    converted = _needs_conversion(snapshot_dir)
+    if converted:
+        import torch
+        from transformers import Gemma3ForConditionalGeneration
+
+        print("Converting weights to bfloat16 safetensors")
+        model = Gemma3ForConditionalGeneration.from_pretrained(snapshot_dir, torch_dtype=torch.bfloat16)
+        # save_pretrained may shard differently; stale shards or index entries would shadow the new ones
+        for filename in _weight_files(snapshot_dir):
+            os.remove(os.path.join(snapshot_dir, filename))
+        model.save_pretrained(snapshot_dir, safe_serialization=True)
+    with open(os.path.join(snapshot_dir, SNAPSHOT_MARKER), "w", encoding="utf-8") as f:
+        json.dump({"model": model_name, "revision": revision, "converted": converted, "prepared_at": time.time()}, f)
+    return snapshot_dir
+
+
+# --- Compile cache ---
+
+def restore_compile_cache(cache_dir: str) -> bool:
+    """
+    Point torch.compile, Triton and vLLM at cache_dir and load saved compile artifacts.
+
+    Must run before the model is loaded or compiled. Returns True if saved
+    artifacts were loaded (the directory caches are used either way).
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", os.path.join(cache_dir, "inductor"))
+    os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
+    os.environ.setdefault("TORCHINDUCTOR_AUTOGRAD_CACHE", "1")
+    os.environ.setdefault("TRITON_CACHE_DIR", os.path.join(cache_dir, "triton"))
+    os.environ.setdefault("VLLM_CACHE_ROOT", os.path.join(cache_dir, "vllm"))
+
+    path = os.path.join(cache_dir, COMPILE_ARTIFACTS)
+    if not os.path.exists(path):
+        return False
+    import torch
+
+    if not hasattr(torch.compiler, "load_cache_artifacts"):
+        return False
+    with open(path, "rb") as f:
+        torch.compiler.load_cache_artifacts(f.read())
+    return True
+
+
+def save_compile_cache(cache_dir: str) -> bool:
+    """Save this process's compile artifacts for the next cold start; True if any were written."""
+    try:
+        import torch
+    except ImportError:
+        return False
+    if not hasattr(torch.compiler, "save_cache_artifacts"):
+        return False
+    saved = torch.compiler.save_cache_artifacts()
+    if not saved or not saved[0]:
+        return False
+    path = os.path.join(cache_dir, COMPILE_ARTIFACTS)
+    with open(path + ".tmp", "wb") as f:
+        f.write(saved[0])
+    os.replace(path + ".tmp", path)
+    return True
+
+
+# --- Warm-up ---
+
+def warmup_messages(tokens: int) -> List[Dict[str, str]]:
+    """A single-turn conversation of roughly `tokens` prompt tokens of agent-like text."""
+    chars = tokens * WARMUP_CHARS_PER_TOKEN
+    text = (TINY_CORPUS_TEXT + "\n") * (chars // (len(TINY_CORPUS_TEXT) + 1) + 1)
+    return [{"role": "user", "content": text[:chars]}]
+
+
+def warm_up(backend: InferenceBackend, lengths: List[int]) -> List[int]:
+    """
+    Run one short greedy generation per prompt length.
+
+    Returns:
+        Prompt tokens of each warm-up request
+    """
+    prompt_tokens = []
+    for tokens in lengths:
+        generation = backend.generate(warmup_messages(tokens), WARMUP_MAX_TOKENS, 0.0, 1.0)
+        prompt_tokens.append(generation.prompt_tokens)
+    return prompt_tokens
+
+
+def warmup_tokens_from_env(var: str = "SARA_WARMUP_TOKENS", default: List[int] = list(WARMUP_TOKENS)) -> List[int]:
+    """Warm-up prompt lengths from a comma-separated list ("0"/"off" disables warm-up)."""
+    value = os.environ.get(var)
+    if value is None or not value.strip():
+        return list(default)
+    if not env_flag(var, default=True):
+        return []
+    try:
+        return [int(v) for v in value.split(",") if v.strip()]
+    except ValueError:
+        return list(default)
+
+
+# --- Startup state ---
+
+class Startup:
+    """
+    Loads and warms a backend, timing each phase for /ready.
+
+    Usage:
+        startup = Startup("transformers")
+        threading.Thread(target=startup.run, args=(load_fn,)).start()
+        startup.backend  # None until every phase has finished
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.phase = "starting"
+        self.phases: Dict[str, float] = {}
+        self.details: Dict[str, object] = {}
+        self.backend: Optional[InferenceBackend] = None
+        self.error: Optional[str] = None
+        self.started = time.perf_counter()
+        self.ready_after: Optional[float] = None
+        self._ready = threading.Event()
+
+    @classmethod
+    def loaded(cls, backend: InferenceBackend) -> "Startup":
+        """A startup that is already complete (backend built by the caller)."""
+        startup = cls(backend.kind)
+        startup.finish(backend)
+        return startup
+
+    @contextmanager
+    def timed(self, phase: str) -> Iterator[None]:
+        """Record how long the enclosed phase takes as <phase>_s."""
+        self.phase = phase
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[f"{phase}_s"] = round(time.perf_counter() - t0, 3)
+
+    def finish(self, backend: InferenceBackend) -> None:
+        self.backend = backend
+        self.phase = "ready"
+        self.ready_after = time.perf_counter() - self.started
+        self._ready.set()
+
+    def fail(self, error: BaseException) -> None:
+        self.error = f"{type(error).__name__}: {error}"
+        self.phase = "failed"
+        self._ready.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until startup finishes or fails; True if the backend is ready."""
+        self._ready.wait(timeout)
+        return self.backend is not None
+
+    def run(self, load: Callable[["Startup"], InferenceBackend]) -> None:
+        """Run load(self), which times its phases with self.timed(), and publish the result."""
+        try:
+            backend = load(self)
+        except Exception as e:
+            traceback.print_exc()
+            self.fail(e)
+            print(json.dumps(self.report()), flush=True)
+            return
+        self.finish(backend)
+        print(json.dumps(self.report()), flush=True)
+
+    def report(self) -> Dict[str, object]:
+        """Startup timing breakdown, emitted on boot and served from /ready."""
+        report: Dict[str, object] = {
+            "event": "model_startup",
+            "status": "ready" if self.backend is not None else ("failed" if self.error else "starting"),
+            "backend": self.kind,
+            "phase": self.phase,
+            **self.phases,
+            **self.details,
+        }
+        if self.ready_after is not None:
+            report["total_s"] = round(self.ready_after, 3)
+        if self.error:
+            report["error"] = self.error
+        return report
+
+
+def cold_start(startup: Startup, name: str) -> InferenceBackend:
+    """
+    Snapshot, compile cache, load and warm-up phases for backend `name`, configured from the environment.
+
+    SARA_MODEL_SNAPSHOT_DIR enables the local snapshot, SARA_COMPILE_CACHE the
+    persistent compile cache and SARA_WARMUP_TOKENS sets the warm-up prompt
+    lengths (warm-up is on by default only for backends that load Sara).
+    """
+    loads_sara = name in DOWNLOADING_BACKENDS
+    source = None
+    snapshot_dir = os.environ.get("SARA_MODEL_SNAPSHOT_DIR")
+    if snapshot_dir and loads_sara:
+        with startup.timed("snapshot"):
+            source = prepare_snapshot(snapshot_dir, os.environ.get("MODEL_NAME", MODEL_NAME),
+                                      os.environ.get("MODEL_REVISION", MODEL_REVISION))
+        startup.details["snapshot"] = source
+
+    cache_dir = os.environ.get("SARA_COMPILE_CACHE")
+    if cache_dir:
+        with startup.timed("compile_cache"):
+            startup.details["compile_cache_restored"] = restore_compile_cache(cache_dir)
+
+    with startup.timed("load"):
+        backend = load_backend(name, source)
+
+    lengths = warmup_tokens_from_env(default=list(WARMUP_TOKENS) if loads_sara else [])
+    if lengths:
+        with startup.timed("warmup"):
+            # Warm the engine itself, so warm-up requests are not recorded
+            startup.details["warmup_prompt_tokens"] = warm_up(getattr(backend, "inner", backend), lengths)
+        if cache_dir:
+            startup.details["compile_cache_saved"] = save_compile_cache(cache_dir)
+    return backend
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prepare a local bfloat16 safetensors snapshot of the Sara model")
+    parser.add_argument("--snapshot-dir", required=True)
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--revision", default=MODEL_REVISION)
+    args = parser.parse_args()
+    t0 = time.perf_counter()
+    prepare_snapshot(args.snapshot_dir, args.model, args.revision)
+    print(f"Snapshot ready in {args.snapshot_dir} ({time.perf_counter() - t0:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,9 @@
 # FastAPI endpoint for Sara Agent with SSE streaming
 # Wraps the SaraAgent and deploys to Modal as a CPU-based function
 #
-# Run:   modal run modal/sara_agent.py
-# Deploy: modal deploy modal/sara_agent.py
+# Run:   modal run -m src.backend.sara_agent
+# Deploy: modal deploy -m src.backend.sara_agent  (mounts shared helpers from src/)
+# Local:  uvicorn --factory src.backend.sara_agent:create_api  (used by benchmarks/load_test.py)
 
 import modal
 
@@ -97,31 +98,26 @@ image = (
         "pydantic>=2.0.0",
         "openai>=1.0.0",
         "httpx>=0.27.0",
+        "orjson>=3.9.0",
     )
+    .add_local_python_source("src")
 )
 
 app = modal.App("sara-agent")
 
 
-# --- Modal Function ---
-@app.function(
-    image=image,
-    cpu=AGENT_CPU,
-    memory=AGENT_MEMORY,
-    timeout=AGENT_TIMEOUT,
-    min_containers=1,  # Keep one instance warm for responsiveness
-    secrets=[modal.Secret.from_name("sara-api-key")],
-)
-@modal.concurrent(max_inputs=AGENT_CONCURRENT_INPUTS)
-@modal.asgi_app()
-def api():
-    """Serve the FastAPI application."""
+# --- FastAPI Application ---
+def create_api():
+    """Build the FastAPI application (served by api() on Modal, or by uvicorn --factory locally)."""
+    import asyncio
     import json
     import re
     import time
+    import uuid
+    from contextlib import asynccontextmanager
     from dataclasses import dataclass, field
     from enum import Enum
-    from typing import Any, AsyncGenerator, Dict, List, Optional
+    from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
     from urllib.parse import parse_qs, urlparse
 
     import httpx
@@ -131,6 +127,24 @@ def api():
     from openai import AsyncOpenAI
     from pydantic import BaseModel, Field
 
+    from src.backend.utils.batch import (MAX_BATCH_CONCURRENCY, MAX_BATCH_TASKS, batch_concurrency_from_env,
+                                         ndjson_line, run_batch)
+    from src.backend.utils.fhir_client import FHIRClient as BaseFHIRClient
+    from src.backend.utils.fhir_client import FHIRResult
+    from src.backend.utils.idempotency import action_key, idempotency_enabled
+    from src.backend.utils.jsoncodec import dumps
+    from src.backend.utils.json_stream import StreamLimits, limits_from_env
+    from src.backend.utils.metrics import CONTENT_TYPE, Registry, SpanMetrics, hit_ratio
+    from src.backend.utils.pagination import PageBudget, budget_from_env
+    from src.backend.utils.patient_index import PatientIndex, index_enabled
+    from src.backend.utils.patient_snapshot import snapshots_enabled
+    from src.backend.utils.profiling import ProfileStore, profile_token_from_env, requested_profile
+    from src.backend.utils.query_rewrite import QueryRewriter, rewriter_from_env
+    from src.backend.utils.result_store import LAZY_MIN_BYTES, ResultStore, lazy_results_enabled, summarize
+    from src.backend.utils.sessions import SessionRegistry, parse_last_event_id, session_ttl_from_env
+    from src.backend.utils.tracing import (Span, activate, current_span, inject_traceparent, span,
+                                           traceparent_headers, tracer_from_env)
+
     # =========================================================================
     # Parser (from modal/utils/parser.py)
     # =========================================================================
@@ -139,6 +153,7 @@ def api():
         """Types of actions Sara can output."""
         GET = "GET"
         POST = "POST"
+        TRANSACTION = "TRANSACTION"
         FINISH = "FINISH"
         UNKNOWN = "UNKNOWN"
 
@@ -151,6 +166,7 @@ def api():
         body: Dict[str, Any] = field(default_factory=dict)
         answer: str = ""
         raw_content: str = ""
+        entries: List["Action"] = field(default_factory=list)  # POST actions of a TRANSACTION
 
     def parse_action(content: str) -> Action:
         """Parse Sara's output and return the appropriate Action."""
@@ -167,6 +183,11 @@ def api():
         if get_action:
             return get_action
 
+        # Try to parse several POST blocks (submitted as one transaction)
+        transaction_action = _parse_transaction(content)
+        if transaction_action:
+            return transaction_action
+
         # Try to parse POST action
         post_action = _parse_post(content)
         if post_action:
@@ -253,6 +274,20 @@ def api():
         except (json.JSONDecodeError, Exception):
             return None
 
+    def _parse_transaction(content: str) -> Action | None:
+        """Parse two or more POST blocks into a TRANSACTION action (all blocks must parse)."""
+        content = content.strip()
+        starts = [m.start() for m in re.finditer(r'^POST\s+https?://\S+\s*$', content, re.MULTILINE)]
+        if len(starts) < 2 or starts[0] != 0:
+            return None
+        entries = []
+        for start, end in zip(starts, starts[1:] + [len(content)]):
+            post_action = _parse_post(content[start:end])
+            if post_action is None:
+                return None
+            entries.append(post_action)
+        return Action(type=ActionType.TRANSACTION, entries=entries)
+
     def _parse_finish(content: str) -> Action | None:
         """Parse a FINISH action from content.
 
@@ -292,96 +327,37 @@ def api():
             return Action(type=ActionType.FINISH, answer=array_content.strip())
 
     # =========================================================================
-    # FHIR Client (from modal/utils/fhir_client.py)
+    # FHIR Client (modal/utils/fhir_client.py, tuned for Modal cold starts)
     # =========================================================================
 
-    @dataclass
-    class FHIRResult:
-        """Result of a FHIR operation."""
-        success: bool
-        status_code: int
-        data: Dict[str, Any] = field(default_factory=dict)
-        error: str = ""
-
-    class FHIRClient:
-        """Async FHIR client for executing GET/POST requests with retry logic."""
+    class FHIRClient(BaseFHIRClient):
+        """utils/fhir_client.py's client with cold-start timeouts, and GETs retried with backoff."""
 
-        MAX_RETRIES = 3
+        MAX_RETRIES = 2
         RETRY_DELAY = 2.0  # seconds
-
-        def __init__(self, base_url: str):
-            self.base_url = base_url.rstrip("/")
-            # Longer timeout for Modal cold starts, with separate connect timeout
-            self._client = httpx.AsyncClient(
-                timeout=httpx.Timeout(120.0, connect=120.0),  # 2-minute timeout for cold starts
-                headers={"Accept": "application/fhir+json", "Content-Type": "application/fhir+json"},
-                follow_redirects=True
-            )
-
-        async def close(self) -> None:
-            await self._client.aclose()
-
-        async def execute(self, action: Action) -> FHIRResult:
-            if action.type == ActionType.GET:
-                return await self.get(action.endpoint, action.params)
-            elif action.type == ActionType.POST:
-                return await self.post(action.endpoint, action.body)
-            elif action.type == ActionType.FINISH:
-                return FHIRResult(success=True, status_code=200, data={"answer": action.answer})
-            else:
-                return FHIRResult(success=False, status_code=0, error=f"Unsupported action type: {action.type}")
-
-        async def _request_with_retry(self, method: str, url: str, **kwargs) -> FHIRResult:
-            """Execute HTTP request with retry logic for transient errors."""
-            import asyncio
-
-            last_error = None
-            for attempt in range(self.MAX_RETRIES):
-                try:
-                    if method == "GET":
-                        response = await self._client.get(url, **kwargs)
-                    else:
-                        response = await self._client.post(url, **kwargs)
-                    return self._process_response(response)
-                except httpx.TimeoutException as e:
-                    last_error = f"Timeout: {repr(e)}"
-                except httpx.ConnectError as e:
-                    last_error = f"Connection error: {repr(e)}"
-                except httpx.RequestError as e:
-                    last_error = f"Request error: {type(e).__name__}: {repr(e)}"
-                except Exception as e:
-                    # Catch TransferEncodingError and similar issues
-                    last_error = f"Unexpected error: {type(e).__name__}: {str(e)}"
-
-                # Retry after delay if not last attempt
-                if attempt < self.MAX_RETRIES - 1:
-                    await asyncio.sleep(self.RETRY_DELAY * (attempt + 1))
-
-            return FHIRResult(success=False, status_code=0, error=last_error or "Unknown error")
-
-        async def get(self, endpoint: str, params: Dict[str, str]) -> FHIRResult:
-            # Endpoint may already contain /fhir prefix, avoid duplication
-            if endpoint.startswith("/fhir"):
-                endpoint = endpoint[5:]  # Remove /fhir prefix since base_url already has it
-            url = f"{self.base_url}{endpoint}"
-            return await self._request_with_retry("GET", url, params=params if params else None)
-
-        async def post(self, endpoint: str, body: Dict[str, Any]) -> FHIRResult:
-            # Endpoint may already contain /fhir prefix, avoid duplication
-            if endpoint.startswith("/fhir"):
-                endpoint = endpoint[5:]  # Remove /fhir prefix since base_url already has it
-            url = f"{self.base_url}{endpoint}"
-            return await self._request_with_retry("POST", url, json=body)
-
-        def _process_response(self, response: httpx.Response) -> FHIRResult:
-            status_code = response.status_code
-            try:
-                data = response.json()
-            except Exception:
-                data = {}
-            if status_code >= 400:
-                return FHIRResult(success=False, status_code=status_code, data=data, error=f"HTTP {status_code}")
-            return FHIRResult(success=True, status_code=status_code, data=data)
+        # Keyed POSTs are safe to retry, so they can give up on a slow attempt early
+        WRITE_TIMEOUT = httpx.Timeout(20.0, connect=120.0)
+
+        def __init__(self, base_url: str, rewriter: Optional[QueryRewriter] = None,
+                     page_budget: Optional[PageBudget] = None, patient_snapshots: bool = False,
+                     patient_index: Optional[PatientIndex] = None,
+                     stream_limits: Optional[StreamLimits] = None,
+                     http_client: Optional[httpx.AsyncClient] = None):
+            # Longer timeout for Modal cold starts, with separate connect timeout; a passed-in pool is shared
+            super().__init__(base_url, rewriter=rewriter, page_budget=page_budget,
+                             patient_snapshots=patient_snapshots, patient_index=patient_index,
+                             stream_limits=stream_limits, http_client=http_client or httpx.AsyncClient(
+                                 timeout=httpx.Timeout(120.0, connect=120.0),  # 2-minute timeout for cold starts
+                                 headers={"Accept": "application/fhir+json",
+                                          "Content-Type": "application/fhir+json"},
+                                 follow_redirects=True,
+                                 event_hooks={"request": [inject_traceparent]}
+                             ))
+            self._owns_client = http_client is None
+
+        def _get_error_message(self, status_code: int, data: Dict[str, Any]) -> str:
+            # MedAgentBench's wording; _format_fhir_result appends the diagnostics
+            return f"HTTP {status_code}"
 
     # =========================================================================
     # Agent Event and Sara Agent (from modal/agent.py)
@@ -397,6 +373,9 @@ def api():
         content: str = ""
         tool: str = ""
         result: Any = None
+        result_json: str = ""  # result as serialized for the prompt (successful tool calls)
+        timings: Dict[str, float] = field(default_factory=dict)  # round phase durations (model_ms, fhir_ms, ...)
+        endpoints: List[str] = field(default_factory=list)  # FHIR paths of a transaction's POST entries
 
     # Exact prompt from benchmark_models.py - proven to work with Sara model
     MEDAGENTBENCH_PROMPT = """You are an expert in using FHIR functions to assist medical professionals. You are given a question and a set of possible functions. Based on the question, you will need to make one or more function/tool calls to achieve the purpose.
@@ -488,10 +467,24 @@ Question: {question}"""
     class SaraAgent:
         """Custom agent that handles Sara's text-based tool calling."""
 
-        def __init__(self, sara_url: str, fhir_url: str, functions: List[Dict]):
+        def __init__(self, sara_url: str, fhir_url: str, functions: List[Dict],
+                     query_rewriter: Optional[QueryRewriter] = None,
+                     page_budget: Optional[PageBudget] = None,
+                     patient_snapshots: bool = False,
+                     patient_index: Optional[PatientIndex] = None,
+                     idempotent_posts: bool = False,
+                     stream_limits: Optional[StreamLimits] = None,
+                     fhir_http_client: Optional[httpx.AsyncClient] = None):
             self.sara_url = sara_url
             self.fhir_url = fhir_url
             self.functions = functions
+            self.query_rewriter = query_rewriter
+            self.page_budget = page_budget
+            self.patient_snapshots = patient_snapshots
+            self.patient_index = patient_index
+            self.idempotent_posts = idempotent_posts
+            self.stream_limits = stream_limits
+            self.fhir_http_client = fhir_http_client
             # Get API key for authenticating with Sara model
             api_key = os.environ.get("SARA_API_KEY", "not-needed")
             self._sara_client = AsyncOpenAI(
@@ -514,7 +507,8 @@ Question: {question}"""
                 model="sara",
                 messages=messages,
                 temperature=0.0,
-                max_tokens=2048
+                max_tokens=2048,
+                extra_headers=traceparent_headers()
             )
             return response.choices[0].message.content
 
@@ -523,7 +517,7 @@ Question: {question}"""
             if action_type == ActionType.GET:
                 if result.success:
                     # Exact format from MedAgentBench __init__.py
-                    return f"Here is the response from the GET request:\n{json.dumps(result.data, indent=2)}. Please call FINISH if you have got answers for all the questions and finished all the requested tasks"
+                    return f"Here is the response from the GET request:\n{result.to_json()}. Please call FINISH if you have got answers for all the questions and finished all the requested tasks"
                 else:
                     # Exact error format
                     error_msg = result.error
@@ -534,35 +528,45 @@ Question: {question}"""
                             if diagnostics:
                                 error_msg += f" - {diagnostics}"
                     return f"Error in sending the GET request: {error_msg}"
-            elif action_type == ActionType.POST:
+            elif action_type in (ActionType.POST, ActionType.TRANSACTION):
                 if result.success:
                     # Exact format from MedAgentBench __init__.py
                     return "POST request accepted and executed successfully. Please call FINISH if you have got answers for all the questions and finished all the requested tasks"
                 else:
                     return "Invalid POST request"
             else:
-                return json.dumps(result.data, indent=2) if result.success else result.error
+                return result.to_json() if result.success else result.error
 
         async def run(self, context: str, question: str) -> AsyncGenerator[AgentEvent, None]:
             initial_prompt = self._build_prompt(context, question)
             messages = [{"role": "user", "content": initial_prompt}]
-            fhir_client = FHIRClient(self.fhir_url)
+            session = uuid.uuid4().hex  # scopes idempotency keys to this run
+            fhir_client = FHIRClient(self.fhir_url, rewriter=self.query_rewriter, page_budget=self.page_budget,
+                                     patient_snapshots=self.patient_snapshots, patient_index=self.patient_index,
+                                     stream_limits=self.stream_limits, http_client=self.fhir_http_client)
+            # Phases are children of the caller's current span; run_span stays open across yields
+            parent = current_span()
+            run_span = parent.child("agent.run") if parent is not None else Span("agent.run")
 
             try:
                 for round_num in range(MAX_ROUNDS):
+                    timings: Dict[str, float] = {}
                     try:
-                        response = await self._call_sara(messages)
+                        with span("model.call", parent=run_span, round=round_num) as model_span:
+                            response = await self._call_sara(messages)
+                        timings["model_ms"] = model_span.duration_ms
                     except Exception as e:
                         yield AgentEvent(type="error", content=f"Sara model error: {str(e)}", timestamp=time.time())
                         return
 
                     # Clean the response like benchmark_models.py does
                     cleaned = response.strip().replace("```tool_code", "").replace("```", "").strip()
-                    cleaned = extract_action(cleaned)
-
-                    yield AgentEvent(type="thinking", content=cleaned, timestamp=time.time())
+                    with span("agent.parse", parent=run_span, round=round_num) as parse_span:
+                        cleaned = extract_action(cleaned)
+                        action = parse_action(cleaned)
+                    timings["parse_ms"] = parse_span.duration_ms
 
-                    action = parse_action(cleaned)
+                    yield AgentEvent(type="thinking", content=cleaned, timestamp=time.time(), timings=dict(timings))
 
                     if action.type == ActionType.FINISH:
                         yield AgentEvent(type="complete", result=action.answer, timestamp=time.time())
@@ -576,7 +580,16 @@ Question: {question}"""
                         })
                         continue
 
-                    fhir_result = await fhir_client.execute(action)
+                    key = action_key(session, round_num, action) if self.idempotent_posts else None
+                    with span("agent.tool", parent=run_span, round=round_num, action=action.type.value) as tool_span:
+                        fhir_result = await fhir_client.execute(action, idempotency_key=key)
+                    timings["fhir_ms"] = tool_span.duration_ms
+
+                    with span("agent.format", parent=run_span, round=round_num) as format_span:
+                        result_json = fhir_result.to_json() if fhir_result.success else ""
+                        # Use exact MedAgentBench feedback format
+                        formatted_result = self._format_fhir_result(fhir_result, action.type)
+                    timings["format_ms"] = format_span.duration_ms
 
                     # Build result for the event
                     if fhir_result.success:
@@ -595,11 +608,13 @@ Question: {question}"""
                         type="tool_call",
                         tool=action.type.value,
                         result=event_result,
-                        timestamp=time.time()
+                        result_json=result_json,
+                        timestamp=time.time(),
+                        timings=timings,
+                        endpoints=["/fhir/" + entry.endpoint.rsplit("/fhir/", 1)[-1].strip("/")
+                                   for entry in action.entries],
                     )
 
-                    # Use exact MedAgentBench feedback format
-                    formatted_result = self._format_fhir_result(fhir_result, action.type)
                     messages.append({"role": "assistant", "content": cleaned})
                     messages.append({"role": "user", "content": formatted_result})
 
@@ -609,6 +624,7 @@ Question: {question}"""
                     timestamp=time.time()
                 )
             finally:
+                run_span.end()
                 await fhir_client.close()
 
     # =========================================================================
@@ -620,13 +636,69 @@ Question: {question}"""
         taskId: str = Field(..., description="Task ID from predefined tasks or 'custom'")
         prompt: str = Field(..., description="The prompt/question for the agent")
         context: Optional[str] = Field(None, description="Optional context for the task")
+        lazyResults: Optional[bool] = Field(
+            None, description="Stream tool results as summaries; fetch full payloads from /api/results/{id}")
+
+    class BatchItem(BaseModel):
+        """One task of a batch."""
+        taskId: str = Field(..., description="Task ID from predefined tasks or 'custom'")
+        prompt: Optional[str] = Field(None, description="Question; defaults to the predefined task's")
+        context: Optional[str] = Field(None, description="Context; defaults to the predefined task's")
+
+    class BatchRequest(BaseModel):
+        """Request model for running many tasks."""
+        tasks: List[BatchItem] = Field(..., description=f"At most {MAX_BATCH_TASKS} tasks")
+        concurrency: Optional[int] = Field(
+            None, description=f"Tasks run at once (default BATCH_CONCURRENCY, at most {MAX_BATCH_CONCURRENCY})")
+
+    # SSE frames are built by utils.sessions.sse_frame and logged per run session
+    SSE_HEADERS = {
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "X-Accel-Buffering": "no"
+    }
 
-    class SSEEvent:
-        """Helper class to format SSE events."""
-        @staticmethod
-        def format(event_type: str, data: dict) -> str:
-            json_data = json.dumps(data)
-            return f"event: {event_type}\ndata: {json_data}\n\n"
+    # Opt-in: _elements/_sort/_count added to GET searches (FHIR_QUERY_REWRITE=1); off matches the benchmark
+    query_rewriter = rewriter_from_env()
+    # Merge paged search results within a budget (FHIR_PAGINATE=1); off shows only the first page, as the benchmark does
+    page_budget = budget_from_env()
+    # Opt-in: one $everything fetch per patient answers that patient's later searches locally
+    patient_snapshots = snapshots_enabled()
+    # Opt-in: POSTs carry an idempotency key and are sent as conditional creates, so retries cannot duplicate orders
+    idempotent_posts = idempotency_enabled()
+    # Opt-in: decode FHIR responses entry by entry within per-response caps (FHIR_STREAM_DECODE=1); off uses
+    # response.json() and keeps every entry and narrative, as the benchmark does
+    stream_limits = limits_from_env()
+    # Lazy tool results: SSE carries a summary, the payload waits in a bounded store for GET /api/results/{id}
+    lazy_results = lazy_results_enabled()
+    result_store = ResultStore()
+    # Runs execute as background tasks logging their SSE frames, so a dropped client can resume with Last-Event-ID
+    sessions = SessionRegistry(ttl=session_ttl_from_env())
+    running_tasks = set()
+    # POST /api/batch runs this many tasks at once unless the request says otherwise
+    batch_concurrency = batch_concurrency_from_env()
+    # Every run is traced (model, parse, FHIR, format, SSE emit); SARA_TRACE_FILE exports spans as JSON lines
+    tracer = tracer_from_env()
+    # /metrics: histograms fed by finished spans, plus gauges read at scrape time
+    metrics = Registry()
+    tracer.add_exporter(SpanMetrics(metrics))
+    active_runs = metrics.gauge("sara_agent_active_runs", "Agent runs in progress (streamed and batch)")
+    metrics.gauge("sara_agent_sessions", "Run sessions kept for resumption", callback=lambda: len(sessions))
+    # Runs sent with SARA_PROFILE_TOKEN (X-Sara-Profile header or ?profile=) are profiled; unset disables the flag
+    profile_token = profile_token_from_env()
+    profiles = ProfileStore()
+    # Opt-in: warm Patient index shared by all requests, loaded at startup and refreshed via _lastUpdated
+    # (FHIR_PATIENT_INDEX=1); off sends Patient searches to the FHIR server, as the benchmark does
+    patient_index = None
+    if index_enabled():
+        patient_index = PatientIndex(
+            httpx.AsyncClient(timeout=httpx.Timeout(120.0, connect=120.0),
+                              headers={"Accept": "application/fhir+json"}, follow_redirects=True),
+            FHIR_URL,
+        )
+        metrics.gauge("sara_agent_cache_hit_ratio", "Share of lookups answered from an in-process cache", ("cache",),
+                      callback=lambda: {("patient_index",): hit_ratio(patient_index.stats["hits"],
+                                                                      patient_index.stats["fallbacks"])})
 
     # Production allowed origins
     ALLOWED_ORIGINS = [
@@ -649,10 +721,23 @@ Question: {question}"""
             return True
         return False
 
+    @asynccontextmanager
+    async def lifespan(app):
+        # The Patient index syncs in the background; its task and sync client end with the app
+        sync_task = asyncio.create_task(patient_index.run()) if patient_index is not None else None
+        try:
+            yield
+        finally:
+            if sync_task is not None:
+                sync_task.cancel()
+                await asyncio.gather(sync_task, return_exceptions=True)
+                await patient_index.client.aclose()
+
     fastapi_app = FastAPI(
         title="Sara Agent API",
         description="Clinical workflow agent API with SSE streaming",
-        version="1.0.0"
+        version="1.0.0",
+        lifespan=lifespan,
     )
 
     fastapi_app.add_middleware(
@@ -661,7 +746,8 @@ Question: {question}"""
         allow_origin_regex=ALLOWED_ORIGIN_REGEX,
         allow_credentials=True,
         allow_methods=["GET", "POST", "OPTIONS"],
-        allow_headers=["Authorization", "Content-Type", "X-API-Key"],
+        allow_headers=["Authorization", "Content-Type", "X-API-Key", "Last-Event-ID", "X-Sara-Profile"],
+        expose_headers=["X-Session-Id", "X-Sara-Profile-Id"],
     )
 
     def verify_api_key(request) -> bool:
@@ -682,7 +768,7 @@ Question: {question}"""
         return False
 
     from fastapi import Request, HTTPException
-    from fastapi.responses import Response
+    from fastapi.responses import JSONResponse, Response
 
     @fastapi_app.options("/api/run")
     async def options_run():
@@ -694,11 +780,26 @@ Question: {question}"""
         """Handle CORS preflight request for /api/tasks."""
         return Response(status_code=200)
 
+    @fastapi_app.get("/api/results/{result_id}")
+    async def get_result(result_id: str):
+        """Full payload of a tool result streamed as a summary (lazy results mode)."""
+        text = result_store.get(result_id)
+        if text is None:
+            raise HTTPException(status_code=404, detail="Result expired or unknown")
+        return Response(content=text, media_type="application/fhir+json")
+
     @fastapi_app.get("/health")
     async def health():
         """Health check endpoint (no auth required)."""
         return {"status": "ok", "service": "sara-agent"}
 
+    @fastapi_app.get("/metrics")
+    async def metrics_endpoint(request: Request):
+        """Prometheus metrics (API key required when SARA_API_KEY is set)."""
+        if not verify_api_key(request):
+            raise HTTPException(status_code=401, detail="Invalid or missing API key")
+        return Response(content=metrics.render(), media_type=CONTENT_TYPE)
+
     @fastapi_app.get("/api/tasks")
     async def list_tasks():
         """List all available demo tasks."""
@@ -709,11 +810,44 @@ Question: {question}"""
             ]
         }
 
+    def resolve_task(task_id: str, prompt: Optional[str], context: Optional[str]) -> Tuple[str, str]:
+        """Context and question of a request: a predefined task's unless overridden."""
+        if task_id in TASKS:
+            task = TASKS[task_id]
+            return context or task["context"], prompt or task["question"]
+        return context or "", prompt
+
+    def build_agent(fhir_http_client: Optional[httpx.AsyncClient] = None) -> SaraAgent:
+        """Agent configured from the environment; runs may share a FHIR connection pool."""
+        return SaraAgent(
+            sara_url=SARA_URL,
+            fhir_url=FHIR_URL,
+            functions=FHIR_FUNCTIONS,
+            query_rewriter=query_rewriter,
+            page_budget=page_budget,
+            patient_snapshots=patient_snapshots,
+            patient_index=patient_index,
+            idempotent_posts=idempotent_posts,
+            stream_limits=stream_limits,
+            fhir_http_client=fhir_http_client,
+        )
+
     @fastapi_app.post("/api/run")
-    async def run_agent(request: RunRequest):
+    async def run_agent(request: RunRequest, http_request: Request):
         """
         Run the Sara agent with SSE streaming.
 
+        The run executes as a background task writing to a session's event log and
+        this response tails it; every frame has an SSE id. After a dropped connection,
+        GET /api/sessions/{sessionId}/events with Last-Event-ID resumes the stream.
+        A lagging client gets consecutive thinking frames coalesced to the newest,
+        and an idle stream gets ": keep-alive" comments every 15 seconds.
+
+        The run is traced under the caller's traceparent, if any; thinking and
+        tool_result events carry the round's phase timings. With the profile token
+        the run executes under cProfile and X-Sara-Profile-Id names the artifact
+        served by GET /api/profiles/{id} once the run ends.
+
         Returns a Server-Sent Events stream with the following event types:
         - status: Lifecycle updates (starting, running, finished)
         - thinking: Sara's reasoning/response
@@ -722,39 +856,47 @@ Question: {question}"""
         - complete: Task completed with final answer
         - error: Error occurred
         """
-        async def event_generator():
+        lazy = lazy_results if request.lazyResults is None else request.lazyResults
+
+        session = sessions.create()
+        root_span = tracer.start("http.run", traceparent=http_request.headers.get("traceparent"),
+                                 task=request.taskId, session=session.id)
+
+        def emit(event_type: str, data: dict) -> None:
+            # Serializing (compact) and buffering the frame; the client is sent it by session.tail()
+            with span("sse.buffer", event=event_type):
+                session.append(event_type, dumps(data))
+
+        async def produce():
             tool_call_id = 0
+            rounds = 0
+            activate(root_span)  # this task's spans belong to the run's trace
+            active_runs.inc()
+            root_span.set(outcome="error")
 
             try:
-                yield SSEEvent.format("status", {
+                emit("status", {
                     "phase": "starting",
-                    "message": "Connecting to Sara model..."
+                    "message": "Connecting to Sara model...",
+                    "sessionId": session.id,
+                    "traceId": root_span.trace_id
                 })
 
-                if request.taskId in TASKS:
-                    task = TASKS[request.taskId]
-                    context = request.context or task["context"]
-                    question = request.prompt or task["question"]
-                else:
-                    context = request.context or ""
-                    question = request.prompt
-
-                agent = SaraAgent(
-                    sara_url=SARA_URL,
-                    fhir_url=FHIR_URL,
-                    functions=FHIR_FUNCTIONS
-                )
+                context, question = resolve_task(request.taskId, request.prompt, request.context)
+                agent = build_agent()
 
-                yield SSEEvent.format("status", {
+                emit("status", {
                     "phase": "running",
                     "message": "Agent is processing your request..."
                 })
 
                 async for event in agent.run(context=context, question=question):
                     if event.type == "thinking":
-                        yield SSEEvent.format("thinking", {
+                        rounds += 1
+                        emit("thinking", {
                             "content": event.content,
-                            "timestamp": event.timestamp
+                            "timestamp": event.timestamp,
+                            "timings": event.timings
                         })
 
                     elif event.type == "tool_call":
@@ -762,67 +904,216 @@ Question: {question}"""
                         tc_id = f"tc_{tool_call_id:03d}"
 
                         endpoint = ""
-                        if isinstance(event.result, dict):
+                        if event.endpoints:
+                            # Transaction: show the batched POSTs, not the response Bundle
+                            endpoint = ", ".join(event.endpoints)
+                        elif isinstance(event.result, dict):
                             resource_type = event.result.get("resourceType", "")
                             if resource_type:
                                 endpoint = f"/fhir/{resource_type}"
 
-                        yield SSEEvent.format("tool_call", {
+                        tool_call = {
                             "id": tc_id,
                             "tool": event.tool,
                             "endpoint": endpoint,
                             "status": "running"
-                        })
+                        }
+                        if event.endpoints:
+                            tool_call["entries"] = [{"method": "POST", "endpoint": e} for e in event.endpoints]
+                        emit("tool_call", tool_call)
 
-                        start_time = event.timestamp
-                        duration_ms = int((time.time() - start_time) * 1000)
+                        # Measured around the FHIR request by the agent's span
+                        duration_ms = int(event.timings.get("fhir_ms", 0))
 
                         success = True
                         if isinstance(event.result, dict):
                             success = "error" not in event.result
 
-                        yield SSEEvent.format("tool_result", {
+                        tool_result = {
                             "id": tc_id,
                             "status": "success" if success else "error",
                             "duration_ms": duration_ms,
-                            "result": event.result
-                        })
+                            "timings": event.timings,
+                        }
+                        if lazy and len(event.result_json) >= LAZY_MIN_BYTES:
+                            # Summary now, payload (compact) on demand
+                            payload = dumps(event.result)
+                            result_id = result_store.put(payload)
+                            tool_result["summary"] = summarize(event.result, len(payload.encode("utf-8")))
+                            tool_result["resultId"] = result_id
+                            tool_result["resultUrl"] = f"/api/results/{result_id}"
+                        else:
+                            tool_result["result"] = event.result
+                        emit("tool_result", tool_result)
 
                     elif event.type == "complete":
-                        yield SSEEvent.format("complete", {
+                        root_span.set(outcome="complete")
+                        emit("complete", {
                             "success": True,
                             "answer": event.result,
                             "artifacts": []
                         })
 
                     elif event.type == "error":
-                        yield SSEEvent.format("error", {
+                        emit("error", {
                             "message": event.content
                         })
 
-                yield SSEEvent.format("status", {
+                emit("status", {
                     "phase": "finished",
                     "message": "Task completed"
                 })
 
             except Exception as e:
-                yield SSEEvent.format("error", {
+                root_span.fail(e)
+                emit("error", {
                     "message": f"Agent error: {str(e)}"
                 })
+            finally:
+                root_span.set(rounds=rounds)
+                root_span.end()
+                active_runs.dec()
+                session.finish()
+
+        headers = {**SSE_HEADERS, "X-Session-Id": session.id}
+        run = produce()
+        if requested_profile(http_request.headers, http_request.query_params, profile_token):
+            profile_id = profiles.reserve()
+            headers["X-Sara-Profile-Id"] = profile_id
+            run = profiles.capture(profile_id, run, f"run-{request.taskId}-{session.id}")
+
+        # The run no longer depends on this connection: it keeps going if the client drops
+        task = asyncio.create_task(run)
+        running_tasks.add(task)
+        task.add_done_callback(running_tasks.discard)
 
         return StreamingResponse(
-            event_generator(),
+            session.tail(),
             media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "X-Accel-Buffering": "no"
-            }
+            headers=headers
         )
 
+    @fastapi_app.get("/api/profiles/{profile_id}")
+    async def get_profile(profile_id: str, request: Request, format: Optional[str] = None):
+        """
+        Download a run's profile (.prof for pstats/snakeviz; ?format=text for the top functions).
+
+        Requires the profile token, like the request that was profiled.
+        """
+        if requested_profile(request.headers, request.query_params, profile_token) is None:
+            raise HTTPException(status_code=401, detail="Invalid or missing profile token")
+        artifact = profiles.get(profile_id)
+        if artifact is None:
+            if profiles.is_pending(profile_id):
+                return JSONResponse({"status": "pending"}, status_code=202)
+            raise HTTPException(status_code=404, detail="Profile expired or unknown")
+        if format == "text":
+            return Response(content=artifact.summary, media_type="text/plain")
+        return Response(content=artifact.content, media_type=artifact.media_type,
+                        headers={"Content-Disposition": f'attachment; filename="{artifact.filename}"'})
+
+    @fastapi_app.get("/api/sessions/{session_id}/events")
+    async def resume_session(session_id: str, request: Request, lastEventId: Optional[str] = None):
+        """
+        Resume a run's SSE stream.
+
+        Replays the frames after Last-Event-ID (header, or lastEventId query parameter)
+        from the session's event log, then tails the run until it finishes. No model or
+        FHIR calls are made.
+        """
+        session = sessions.get(session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Session expired or unknown")
+        after_id = parse_last_event_id(request.headers.get("last-event-id") or lastEventId)
+        return StreamingResponse(
+            session.tail(after_id),
+            media_type="text/event-stream",
+            headers={**SSE_HEADERS, "X-Session-Id": session.id}
+        )
+
+    @fastapi_app.post("/api/batch")
+    async def batch_run(batch: BatchRequest, request: Request):
+        """
+        Run many tasks with bounded concurrency.
+
+        Streams NDJSON: one {"type": "result", "index", "taskId", "success", "answer",
+        "rounds", "toolCalls", "elapsedMs"} line per task as it completes, then one
+        {"type": "summary"} line with counts, wall time and per-task latency stats.
+        The batch shares one model client and one FHIR connection pool.
+        """
+        if not verify_api_key(request):
+            raise HTTPException(status_code=401, detail="Invalid or missing API key")
+        if not batch.tasks or len(batch.tasks) > MAX_BATCH_TASKS:
+            raise HTTPException(status_code=422, detail=f"A batch holds 1 to {MAX_BATCH_TASKS} tasks")
+        missing = [i for i, item in enumerate(batch.tasks) if item.taskId not in TASKS and not item.prompt]
+        if missing:
+            raise HTTPException(status_code=422, detail=f"Tasks {missing} need a prompt")
+        concurrency = max(1, min(batch.concurrency or batch_concurrency, MAX_BATCH_CONCURRENCY))
+
+        fhir_http = httpx.AsyncClient(
+            timeout=httpx.Timeout(120.0, connect=120.0),
+            headers={"Accept": "application/fhir+json", "Content-Type": "application/fhir+json"},
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=concurrency * 2, max_keepalive_connections=concurrency),
+            event_hooks={"request": [inject_traceparent]},
+        )
+        agent = build_agent(fhir_http_client=fhir_http)
+
+        async def run_one(item: BatchItem) -> Dict[str, Any]:
+            context, question = resolve_task(item.taskId, item.prompt, item.context)
+            # Each job runs in its own task, so its root span stays local to it
+            task_span = tracer.start("batch.task", traceparent=request.headers.get("traceparent"), task=item.taskId)
+            activate(task_span)
+            outcome = {"taskId": item.taskId, "success": False, "answer": None, "rounds": 0, "toolCalls": 0,
+                       "traceId": task_span.trace_id}
+            active_runs.inc()
+            try:
+                async for event in agent.run(context=context, question=question):
+                    if event.type == "thinking":
+                        outcome["rounds"] += 1
+                    elif event.type == "tool_call":
+                        outcome["toolCalls"] += 1
+                    elif event.type == "complete":
+                        outcome.update(success=True, answer=event.result)
+                    elif event.type == "error":
+                        outcome["error"] = event.content
+            finally:
+                task_span.set(outcome="complete" if outcome["success"] else "error", rounds=outcome["rounds"])
+                task_span.end()
+                active_runs.dec()
+            return outcome
+
+        async def stream():
+            jobs = [lambda item=item: run_one(item) for item in batch.tasks]
+            try:
+                async for record in run_batch(jobs, concurrency):
+                    if record["type"] == "result" and "taskId" not in record:
+                        record["taskId"] = batch.tasks[record["index"]].taskId
+                    yield ndjson_line(record)
+            finally:
+                await fhir_http.aclose()
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
     return fastapi_app
 
 
+# --- Modal Function ---
+@app.function(
+    image=image,
+    cpu=AGENT_CPU,
+    memory=AGENT_MEMORY,
+    timeout=AGENT_TIMEOUT,
+    min_containers=1,  # Keep one instance warm for responsiveness
+    secrets=[modal.Secret.from_name("sara-api-key")],
+)
+@modal.concurrent(max_inputs=AGENT_CONCURRENT_INPUTS)
+@modal.asgi_app()
+def api():
+    """Serve the FastAPI application."""
+    return create_api()
+
+
 # --- Local Test Entrypoint ---
 @app.local_entrypoint()
 def main():
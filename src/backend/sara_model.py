@@ -1,5 +1,5 @@
 # src/backend/sara_model.py
-# Deploy Sara-1.5-4B-it on Modal with transformers + FastAPI
+# Deploy Sara-1.5-4B-it on Modal with transformers (or vLLM) + FastAPI
 # OpenAI-compatible /v1/chat/completions endpoint
 #
 # Setup:
@@ -8,6 +8,8 @@
 #
 # Run:   modal run src/backend/sara_model.py
 # Deploy: modal deploy src/backend/sara_model.py
+# Prepare the weights snapshot (once per MODEL_REVISION, before deploying; serve() fails without it):
+#         modal run src/backend/sara_model.py::prepare
 
 import modal
 
@@ -17,8 +19,13 @@ MODEL_REVISION = "main"
 MINUTES = 60
 GPU_WARM_WINDOW = 60 * MINUTES
 REQUEST_TIMEOUT = 10 * MINUTES
+STARTUP_TIMEOUT = 5 * MINUTES
 SARA_GPU = "A100"
 SARA_CONCURRENT_INPUTS = 8
+# Inference backend (src/backend/model_backends.py): "transformers" (HF generate) or
+# "vllm" (paged attention, continuous batching); vllm is only installed when selected
+MODEL_BACKEND = "transformers"
+VLLM_PACKAGES = ["vllm==0.9.2"] if MODEL_BACKEND == "vllm" else []
 
 # --- Container image ---
 image = (
@@ -34,11 +41,17 @@ image = (
         "fastapi[standard]>=0.115.0",
         "uvicorn>=0.34.0",
         "sentencepiece>=0.2.0",
+        *VLLM_PACKAGES,
     )
     .env({"HF_XET_HIGH_PERFORMANCE": "1"})
+    .add_local_python_source("src")
 )
 
 hf_cache_vol = modal.Volume.from_name("huggingface-cache", create_if_missing=True)
+HF_CACHE_DIR = "/root/.cache/huggingface"
+# bfloat16 safetensors memory-mapped at load, and torch.compile / vLLM caches, both on the volume
+SNAPSHOT_DIR = f"{HF_CACHE_DIR}/sara-snapshots/{MODEL_NAME.replace('/', '--')}--{MODEL_REVISION}"
+COMPILE_CACHE_DIR = f"{HF_CACHE_DIR}/sara-compile-cache"
 
 app = modal.App("sara-model")
 
@@ -47,222 +60,81 @@ app = modal.App("sara-model")
     image=image,
     gpu=f"{SARA_GPU}:1",
     secrets=[modal.Secret.from_name("sara-api-key")],
-    volumes={"/root/.cache/huggingface": hf_cache_vol},
+    volumes={HF_CACHE_DIR: hf_cache_vol},
     scaledown_window=GPU_WARM_WINDOW,
     timeout=REQUEST_TIMEOUT,
 )
 @modal.concurrent(max_inputs=SARA_CONCURRENT_INPUTS)
-@modal.web_server(port=8000, startup_timeout=REQUEST_TIMEOUT)
+@modal.web_server(port=8000, startup_timeout=STARTUP_TIMEOUT)
 def serve():
+    import json
     import subprocess
     import sys
     import os
+    import time
+    import urllib.error
+    import urllib.request
 
-    # Write the FastAPI server as a standalone script
-    server_code = r'''
-import os
-import time
-import uuid
-import torch
-import uvicorn
-from fastapi import FastAPI, HTTPException, Request, Depends
-from fastapi.responses import JSONResponse
-from fastapi.security import APIKeyHeader
-from pydantic import BaseModel, Field, field_validator
-from typing import Optional, Literal
-
-MODEL_NAME = os.environ.get("MODEL_NAME", "Nadhari/Sara-1.5-4B-it")
-MODEL_REVISION = os.environ.get("MODEL_REVISION", "main")
-API_KEY = os.environ.get("SARA_API_KEY", "")
-
-app = FastAPI(title="Sara Model API", version="1.0.0")
-
-# API Key authentication
-api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
-
-def verify_api_key(request: Request, api_key: str = Depends(api_key_header)):
-    """Verify API key from request headers."""
-    if not API_KEY:
-        # If no API key is configured, allow all requests (dev mode)
-        return True
-    # Check X-API-Key header
-    if api_key == API_KEY:
-        return True
-    # Check Authorization header (Bearer token)
-    auth_header = request.headers.get("Authorization", "")
-    if auth_header.startswith("Bearer ") and auth_header[7:] == API_KEY:
-        return True
-    raise HTTPException(status_code=401, detail="Invalid or missing API key")
-
-
-# --- Pydantic Models for Request Validation ---
-class ChatMessage(BaseModel):
-    role: Literal["system", "user", "assistant"]
-    content: str
-
-    @field_validator("content")
-    @classmethod
-    def content_not_empty(cls, v: str) -> str:
-        if not v or not v.strip():
-            raise ValueError("Message content cannot be empty")
-        return v
-
-
-class ChatRequest(BaseModel):
-    model: Optional[str] = None
-    messages: list[ChatMessage] = Field(..., min_length=1)
-    max_tokens: int = Field(default=256, ge=1, le=4096)
-    temperature: float = Field(default=0.0, ge=0.0, le=2.0)
-    top_p: float = Field(default=1.0, ge=0.0, le=1.0)
-
-    @field_validator("messages")
-    @classmethod
-    def messages_not_empty(cls, v: list[ChatMessage]) -> list[ChatMessage]:
-        if not v:
-            raise ValueError("Messages list cannot be empty")
-        return v
-
-# --- Load model at startup ---
-from transformers import AutoTokenizer, Gemma3ForConditionalGeneration
-
-print(f"Loading tokenizer: {MODEL_NAME}")
-tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, revision=MODEL_REVISION)
-
-print(f"Loading model: {MODEL_NAME}")
-model = Gemma3ForConditionalGeneration.from_pretrained(
-    MODEL_NAME,
-    revision=MODEL_REVISION,
-    torch_dtype=torch.bfloat16,
-    device_map="cuda",
-)
-model.eval()
-print("Model loaded successfully")
-
+    from src.backend.model_startup import snapshot_ready
 
-@app.get("/health")
-def health():
-    return {"status": "ok"}
-
-
-@app.get("/v1/models")
-def list_models(auth: bool = Depends(verify_api_key)):
-    return {
-        "object": "list",
-        "data": [{"id": MODEL_NAME, "object": "model", "owned_by": "user"}],
-    }
-
-
-@app.post("/v1/chat/completions")
-def chat_completions(request: ChatRequest, auth: bool = Depends(verify_api_key)):
-    try:
-        # Convert Pydantic models to dicts for tokenizer
-        messages = [{"role": msg.role, "content": msg.content} for msg in request.messages]
-        max_tokens = request.max_tokens
-        temperature = request.temperature
-        top_p = request.top_p
-
-        input_text = tokenizer.apply_chat_template(
-            messages, tokenize=False, add_generation_prompt=True
-        )
-        inputs = tokenizer(input_text, return_tensors="pt").to("cuda")
-        input_len = inputs["input_ids"].shape[1]
-
-        gen_kwargs = {
-            "max_new_tokens": max_tokens,
-            "do_sample": temperature > 0,
-            "top_p": top_p,
-        }
-        if temperature > 0:
-            gen_kwargs["temperature"] = temperature
-
-        with torch.no_grad():
-            outputs = model.generate(**inputs, **gen_kwargs)
-
-        new_tokens = outputs[0][input_len:]
-        response_text = tokenizer.decode(new_tokens, skip_special_tokens=True)
-        completion_tokens = len(new_tokens)
-
-        return {
-            "id": f"chatcmpl-{uuid.uuid4().hex[:8]}",
-            "object": "chat.completion",
-            "created": int(time.time()),
-            "model": MODEL_NAME,
-            "choices": [
-                {
-                    "index": 0,
-                    "message": {"role": "assistant", "content": response_text},
-                    "finish_reason": "stop",
-                }
-            ],
-            "usage": {
-                "prompt_tokens": input_len,
-                "completion_tokens": completion_tokens,
-                "total_tokens": input_len + completion_tokens,
-            },
-        }
-
-    except torch.cuda.OutOfMemoryError:
-        raise HTTPException(
-            status_code=503,
-            detail={
-                "error": {
-                    "message": "GPU out of memory. Try reducing max_tokens or message length.",
-                    "type": "server_error",
-                    "code": "gpu_oom",
-                }
-            },
-        )
-    except RuntimeError as e:
-        if "CUDA" in str(e) or "cuda" in str(e):
-            raise HTTPException(
-                status_code=503,
-                detail={
-                    "error": {
-                        "message": f"GPU error during inference: {str(e)}",
-                        "type": "server_error",
-                        "code": "gpu_error",
-                    }
-                },
-            )
-        raise HTTPException(
-            status_code=500,
-            detail={
-                "error": {
-                    "message": f"Runtime error during inference: {str(e)}",
-                    "type": "server_error",
-                    "code": "runtime_error",
-                }
-            },
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail={
-                "error": {
-                    "message": f"Unexpected error during inference: {str(e)}",
-                    "type": "server_error",
-                    "code": "internal_error",
-                }
-            },
-        )
-
-
-if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
-'''
-
-    server_path = "/tmp/server.py"
-    with open(server_path, "w") as f:
-        f.write(server_code)
+    # Downloading and converting the weights does not fit in the startup timeout; prepare() does it once
+    if not snapshot_ready(SNAPSHOT_DIR, MODEL_NAME, MODEL_REVISION):
+        raise RuntimeError(f"No weights snapshot of {MODEL_NAME}@{MODEL_REVISION} in {SNAPSHOT_DIR}; "
+                           "run `modal run src/backend/sara_model.py::prepare` first")
 
     env = os.environ.copy()
     env["MODEL_NAME"] = MODEL_NAME
     env["MODEL_REVISION"] = MODEL_REVISION
+    # src/ is added to the image under /root
+    env["PYTHONPATH"] = os.pathsep.join(p for p in ("/root", env.get("PYTHONPATH")) if p)
     # Ensure API key is passed to the subprocess
     if "SARA_API_KEY" in os.environ:
         env["SARA_API_KEY"] = os.environ["SARA_API_KEY"]
-
-    subprocess.Popen([sys.executable, server_path], env=env)
+    env["SARA_MODEL_BACKEND"] = MODEL_BACKEND
+    env["SARA_MODEL_SNAPSHOT_DIR"] = SNAPSHOT_DIR
+    # Only the snapshot and warm-up are active on the default transformers backend: it
+    # compiles nothing unless SARA_TORCH_COMPILE is set, so the compile cache stays empty
+    env["SARA_COMPILE_CACHE"] = COMPILE_CACHE_DIR
+
+    # The FastAPI server is src/backend/model_server.py (also runs locally on CPU with the tiny backend)
+    process = subprocess.Popen([sys.executable, "-m", "src.backend.model_server", "--port", "8000"],
+                               env=env, cwd="/root")
+
+    # Only report started (by returning) once the model is loaded and warmed
+    deadline = time.monotonic() + STARTUP_TIMEOUT - 30
+    report = None
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Model server exited with code {process.returncode} during startup")
+        try:
+            with urllib.request.urlopen("http://localhost:8000/ready", timeout=5) as resp:
+                report = json.loads(resp.read())
+                break
+        except urllib.error.HTTPError as e:
+            status = json.loads(e.read() or b"{}")
+            if status.get("status") == "failed":
+                raise RuntimeError(f"Model server failed to start: {status.get('error')}")
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(1)
+    if report is None:
+        raise RuntimeError(f"Model server was not ready within {STARTUP_TIMEOUT - 30}s")
+    print(json.dumps(report))
+    # Persist the compile cache written by this cold start for the next one
+    hf_cache_vol.commit()
+
+
+@app.function(image=image, volumes={HF_CACHE_DIR: hf_cache_vol}, timeout=30 * MINUTES)
+def prepare():
+    """Download (and if needed convert) the bfloat16 safetensors snapshot that serve() loads."""
+    import time
+
+    from src.backend.model_startup import prepare_snapshot
+
+    t0 = time.perf_counter()
+    prepare_snapshot(SNAPSHOT_DIR, MODEL_NAME, MODEL_REVISION)
+    hf_cache_vol.commit()
+    print(f"Snapshot ready in {SNAPSHOT_DIR} ({time.perf_counter() - t0:.1f}s)")
 
 
 # --- Local test entrypoint ---
@@ -291,16 +163,16 @@ def main():
             for attempt in range(120):
                 try:
                     async with session.get(
-                        "/health", timeout=aiohttp.ClientTimeout(total=5)
+                        "/ready", timeout=aiohttp.ClientTimeout(total=5)
                     ) as resp:
                         if resp.status == 200:
-                            print("Server is healthy!\n")
+                            print(f"Server is ready: {json.dumps(await resp.json())}\n")
                             break
                 except Exception:
                     pass
                 await asyncio.sleep(5)
             else:
-                print("Server did not become healthy in time.")
+                print("Server did not become ready in time.")
                 return
 
             payload = {
@@ -233,6 +233,39 @@ class TestSaraAgentRun:
         assert "max" in events[-1].content.lower() or "round" in events[-1].content.lower()
 
 
+class TestSaraAgentTimings:
+    """Tests for per-phase timings on events."""
+
+    @pytest.mark.asyncio
+    async def test_events_carry_phase_timings(self):
+        """Test thinking and tool_call events report measured phase durations."""
+        from src.backend.utils.fhir_client import FHIRResult
+
+        agent = SaraAgent(
+            sara_url="http://localhost:8000",
+            fhir_url="http://localhost:8080",
+            functions=[]
+        )
+        responses = iter(["GET http://localhost:8080/fhir/Patient?name=Test", 'FINISH(["S1"])'])
+
+        async def mock_sara_response(messages):
+            return next(responses)
+
+        with patch.object(agent, '_call_sara', side_effect=mock_sara_response):
+            with patch('src.backend.agent.FHIRClient') as mock_fhir_class:
+                mock_client = AsyncMock()
+                mock_client.execute.return_value = FHIRResult(
+                    success=True, status_code=200, data={"resourceType": "Bundle", "entry": []})
+                mock_fhir_class.return_value = mock_client
+
+                events = [event async for event in agent.run(context="", question="Find patient")]
+
+        assert [e.type for e in events] == ["thinking", "tool_call", "thinking", "complete"]
+        assert set(events[0].timings) == {"model_ms", "parse_ms"}
+        assert set(events[1].timings) == {"model_ms", "parse_ms", "fhir_ms", "format_ms"}
+        assert all(value >= 0 for value in events[1].timings.values())
+
+
 class TestSaraAgentErrorHandling:
     """Tests for error handling."""
 
@@ -0,0 +1,117 @@
+"""
+Tests for the in-memory FHIR stand-in server.
+
+Exercises the HTTP surface (search, read, create, $everything, errors) through
+FastAPI's TestClient.
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.backend.fhir_memory_server import create_app
+from src.backend.utils.fhir_store import FHIRStore
+
+
+@pytest.fixture
+def client():
+    store = FHIRStore(base_url="http://testserver/fhir")
+    store.load_bundle({
+        "resourceType": "Bundle",
+        "type": "collection",
+        "entry": [
+            {"resource": {"resourceType": "Patient", "id": "S3032536", "name": [{"family": "Lee", "given": ["Ann"]}],
+                          "birthDate": "1950-01-02"}},
+            {"resource": {"resourceType": "Observation", "id": "1", "status": "final",
+                          "code": {"coding": [{"code": "MG"}]},
+                          "effectiveDateTime": "2023-11-13T01:00:00+00:00",
+                          "valueQuantity": {"value": 1.9, "unit": "mg/dL"},
+                          "subject": {"reference": "Patient/S3032536"}}},
+        ],
+    })
+    return TestClient(create_app(store))
+
+
+class TestMemoryServer:
+    """Tests for the HTTP routes."""
+
+    def test_metadata(self, client):
+        """CapabilityStatement reports FHIR R4."""
+        response = client.get("/fhir/metadata")
+        assert response.status_code == 200
+        assert response.json()["fhirVersion"] == "4.0.1"
+
+    def test_search(self, client):
+        """Searches return a searchset with the FHIR JSON content type."""
+        response = client.get("/fhir/Observation", params={"patient": "S3032536", "code": "MG"})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/fhir+json")
+        assert response.json()["total"] == 1
+
+    def test_repeated_date_params(self, client):
+        """Repeated date parameters are all applied (a range)."""
+        response = client.get(
+            "/fhir/Observation?patient=S3032536&date=ge2023-11-13&date=lt2023-11-13T00:30:00%2B00:00"
+        )
+        assert response.json()["total"] == 0
+
+    def test_unknown_param_is_400(self, client):
+        """Unsupported search parameters are rejected with an OperationOutcome."""
+        response = client.get("/fhir/Observation", params={"patient": "S3032536", "nope": "x"})
+        assert response.status_code == 400
+        assert response.json()["resourceType"] == "OperationOutcome"
+
+    def test_read_and_404(self, client):
+        """Reads return the resource, or 404 for an unknown id."""
+        assert client.get("/fhir/Patient/S3032536").json()["id"] == "S3032536"
+        assert client.get("/fhir/Patient/missing").status_code == 404
+
+    def test_create(self, client):
+        """POST creates the resource, sets Location and makes it searchable."""
+        body = {"resourceType": "ServiceRequest", "status": "active", "intent": "order",
+                "subject": {"reference": "Patient/S3032536"}}
+        response = client.post("/fhir/ServiceRequest", json=body)
+        assert response.status_code == 201
+        assert response.headers["location"].startswith("http://testserver/fhir/ServiceRequest/")
+
+        search = client.get("/fhir/ServiceRequest", params={"patient": "S3032536"})
+        assert search.json()["total"] == 1
+
+    def test_conditional_create(self, client):
+        """If-None-Exist returns the existing match instead of creating a duplicate."""
+        body = {"resourceType": "ServiceRequest", "status": "active", "intent": "order",
+                "identifier": [{"system": "urn:sara:idempotency-key", "value": "k1"}],
+                "subject": {"reference": "Patient/S3032536"}}
+        headers = {"If-None-Exist": "identifier=urn:sara:idempotency-key|k1"}
+        first = client.post("/fhir/ServiceRequest", json=body, headers=headers)
+        second = client.post("/fhir/ServiceRequest", json=body, headers=headers)
+        assert (first.status_code, second.status_code) == (201, 200)
+        assert second.json()["id"] == first.json()["id"]
+
+    def test_create_wrong_type(self, client):
+        """A body whose resourceType does not match the URL is rejected."""
+        response = client.post("/fhir/ServiceRequest", json={"resourceType": "Observation"})
+        assert response.status_code == 400
+
+    def test_transaction(self, client):
+        """Transactions apply every entry, or none when one entry is invalid."""
+        entry = {"request": {"method": "POST", "url": "ServiceRequest"},
+                 "resource": {"resourceType": "ServiceRequest", "status": "active", "intent": "order",
+                              "subject": {"reference": "Patient/S3032536"}}}
+        response = client.post("/fhir", json={"resourceType": "Bundle", "type": "transaction",
+                                              "entry": [entry, entry]})
+        assert response.status_code == 200
+        assert response.json()["type"] == "transaction-response"
+        assert client.get("/fhir/ServiceRequest", params={"patient": "S3032536"}).json()["total"] == 2
+
+        bad = dict(entry, request={"method": "PUT", "url": "ServiceRequest/1"})
+        response = client.post("/fhir", json={"resourceType": "Bundle", "type": "transaction",
+                                              "entry": [entry, bad]})
+        assert response.status_code == 400
+        assert response.json()["resourceType"] == "OperationOutcome"
+        assert client.get("/fhir/ServiceRequest", params={"patient": "S3032536"}).json()["total"] == 2
+
+    def test_everything(self, client):
+        """$everything returns the patient and their resources."""
+        response = client.get("/fhir/Patient/S3032536/$everything")
+        assert response.status_code == 200
+        assert response.json()["total"] == 2
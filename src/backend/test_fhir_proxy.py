@@ -0,0 +1,155 @@
+"""
+Tests for the caching FHIR proxy.
+
+The proxy sits in front of the in-memory FHIR server (wired through httpx's ASGI
+transport), so hits, revalidation and write invalidation are checked end to end.
+"""
+
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from src.backend.fhir_memory_server import create_app as create_fhir_app
+from src.backend.fhir_proxy import ResponseCache, create_app
+from src.backend.utils.fhir_store import FHIRStore
+
+UPSTREAM = "http://upstream/fhir"
+
+
+def _observation(obs_id, patient, value):
+    return {"resourceType": "Observation", "id": obs_id, "status": "final",
+            "code": {"coding": [{"code": "MG"}]},
+            "effectiveDateTime": "2023-11-13T01:00:00+00:00",
+            "valueQuantity": {"value": value, "unit": "mg/dL"},
+            "subject": {"reference": f"Patient/{patient}"}}
+
+
+@pytest.fixture
+def upstream_store():
+    store = FHIRStore(base_url=UPSTREAM)
+    store.load_bundle({"resourceType": "Bundle", "type": "collection", "entry": [
+        {"resource": {"resourceType": "Patient", "id": "S1", "name": [{"family": "Lee"}]}},
+        {"resource": {"resourceType": "Patient", "id": "S2", "name": [{"family": "Kim"}]}},
+        {"resource": _observation("1", "S1", 1.9)},
+        {"resource": _observation("2", "S2", 2.1)},
+    ]})
+    return store
+
+
+def _proxy(store, revalidate_after=60.0):
+    transport = httpx.ASGITransport(app=create_fhir_app(store))
+    upstream_calls = []
+
+    async def record(request):
+        upstream_calls.append(str(request.url))
+
+    client = httpx.AsyncClient(transport=transport, event_hooks={"request": [record]})
+    app = create_app(UPSTREAM, cache=ResponseCache(), client=client, revalidate_after=revalidate_after)
+    return TestClient(app), upstream_calls
+
+
+class TestFHIRProxy:
+    """Tests for caching, revalidation and invalidation."""
+
+    def test_repeated_search_is_served_from_cache(self, upstream_store):
+        """Test that the same search, in any parameter order, is served from the cache."""
+        client, calls = _proxy(upstream_store)
+        first = client.get("/fhir/Observation", params={"patient": "S1", "code": "MG"})
+        second = client.get("/fhir/Observation", params={"code": "MG", "patient": "S1"})
+        assert first.json()["total"] == 1
+        assert (first.headers["x-cache"], second.headers["x-cache"]) == ("MISS", "HIT")
+        assert len(calls) == 1
+
+    def test_links_point_at_proxy(self, upstream_store):
+        """Test that Bundle links are rewritten to point at the proxy."""
+        client, _ = _proxy(upstream_store)
+        bundle = client.get("/fhir/Patient", params={"_count": "1"}).json()
+        assert all(link["url"].startswith("http://testserver/fhir") for link in bundle["link"])
+
+    def test_client_etag_gives_304(self, upstream_store):
+        """Test that a matching If-None-Match gets an empty 304."""
+        client, _ = _proxy(upstream_store)
+        etag = client.get("/fhir/Patient/S1").headers["etag"]
+        response = client.get("/fhir/Patient/S1", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+
+    def test_post_invalidates_same_patient_only(self, upstream_store):
+        """Test that a POST invalidates only the written patient's cached searches."""
+        client, _ = _proxy(upstream_store)
+        client.get("/fhir/Observation", params={"patient": "S1"})
+        client.get("/fhir/Observation", params={"patient": "S2"})
+
+        created = client.post("/fhir/Observation", json=_observation(None, "S1", 1.2))
+        assert created.status_code == 201
+        assert "location" in created.headers
+
+        s1 = client.get("/fhir/Observation", params={"patient": "S1"})
+        s2 = client.get("/fhir/Observation", params={"patient": "S2"})
+        assert (s1.headers["x-cache"], s1.json()["total"]) == ("MISS", 2)
+        assert s2.headers["x-cache"] == "HIT"
+
+    def test_unchanged_search_revalidates_without_refetch(self, upstream_store):
+        """Test that a stale search is revalidated with a _summary=count probe."""
+        client, calls = _proxy(upstream_store, revalidate_after=0.0)
+        client.get("/fhir/Observation", params={"patient": "S1"})
+        response = client.get("/fhir/Observation", params={"patient": "S1"})
+        assert response.headers["x-cache"] == "REVALIDATED"
+        assert "_summary=count" in calls[-1]
+
+    def test_write_behind_proxy_is_detected(self, upstream_store):
+        """Test that revalidation notices a write made directly upstream."""
+        client, _ = _proxy(upstream_store, revalidate_after=0.0)
+        client.get("/fhir/Observation", params={"patient": "S1"})
+        upstream_store.create(_observation(None, "S1", 1.0))  # bypasses the proxy
+
+        response = client.get("/fhir/Observation", params={"patient": "S1"})
+        assert response.headers["x-cache"] == "MISS"
+        assert response.json()["total"] == 2
+
+    def test_gzip(self, upstream_store):
+        """Test that large responses are gzip-compressed when the client accepts it."""
+        for i in range(40):
+            upstream_store.create(_observation(None, "S1", i))
+        client, _ = _proxy(upstream_store)
+        response = client.get("/fhir/Observation", params={"patient": "S1", "_count": "50"},
+                              headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.json()["total"] == 41
+
+    def test_errors_pass_through_uncached(self, upstream_store):
+        """Test that error responses are returned as is and never cached."""
+        client, calls = _proxy(upstream_store)
+        for _ in range(2):
+            assert client.get("/fhir/Patient/missing").status_code == 404
+        assert len(calls) == 2
+
+    def test_hapi_paging_link_is_followed(self):
+        """Test that HAPI _getpages links are proxied and cached."""
+        hapi = FastAPI()
+
+        def page(offset, next_url=None):
+            links = [{"relation": "next", "url": next_url}] if next_url else []
+            return {"resourceType": "Bundle", "type": "searchset", "total": 2, "link": links,
+                    "entry": [{"resource": _observation(str(offset + 1), "S1", 1.0)}]}
+
+        @hapi.get("/fhir/Observation")
+        def search():
+            return page(0, f"{UPSTREAM}?_getpages=abc&_getpagesoffset=1&_count=1&_bundletype=searchset")
+
+        @hapi.get("/fhir")
+        def pages(request: Request):
+            assert request.query_params["_getpages"] == "abc"
+            return page(int(request.query_params["_getpagesoffset"]))
+
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=hapi))
+        proxy = TestClient(create_app(UPSTREAM, cache=ResponseCache(), client=client))
+        first = proxy.get("/fhir/Observation", params={"patient": "S1", "_count": "1"}).json()
+        next_url = first["link"][0]["url"]
+        assert next_url.startswith("http://testserver/fhir?_getpages=abc")
+
+        second = proxy.get(next_url)
+        assert second.status_code == 200
+        assert second.json()["entry"][0]["resource"]["id"] == "2"
+        assert proxy.get(next_url).headers["x-cache"] == "HIT"
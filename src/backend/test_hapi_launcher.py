@@ -0,0 +1,141 @@
+"""
+Tests for the HAPI launcher.
+
+Uses a stand-in "JVM" (a Python child process) that floods stdout before serving
+HTTP, so a launcher that does not drain the pipe would hang.
+"""
+
+import socket
+import sys
+import textwrap
+
+import pytest
+
+from src.backend.hapi_launcher import HAPI_APP_ARGS, WARMUP_SEARCHES, HapiLauncher, java_command
+
+FAKE_SERVER = textwrap.dedent("""
+    import json, sys
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    # ~1 MB of log output: far more than an OS pipe buffer holds
+    for i in range(20000):
+        print(f"INFO  o.s.b.SpringApplication - log line {i:05d} padding padding padding", flush=True)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith("/fhir/Patient?_count"):
+                body = {"resourceType": "Bundle", "entry": [
+                    {"resource": {"resourceType": "Patient", "id": "S1",
+                                  "name": [{"family": "Lee"}], "birthDate": "1950-01-01"}}]}
+            else:
+                body = {"resourceType": "Bundle", "total": 0}
+            data = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/fhir+json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            print("request", self.path, flush=True)
+
+    HTTPServer(("127.0.0.1", int(sys.argv[1])), Handler).serve_forever()
+""")
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def launcher(tmp_path):
+    port = _free_port()
+    script = tmp_path / "fake_hapi.py"
+    script.write_text(FAKE_SERVER)
+    launcher = HapiLauncher(
+        command=[sys.executable, str(script), str(port)],
+        cwd=str(tmp_path),
+        base_url=f"http://127.0.0.1:{port}/fhir",
+        log_path=str(tmp_path / "logs" / "hapi.log"),
+        max_log_bytes=256 * 1024,
+        log_backups=2,
+    )
+    yield launcher
+    launcher.stop(timeout=5)
+
+
+class TestHapiLauncher:
+    """Tests for starting, readiness and warm-up."""
+
+    def test_ready_despite_noisy_output(self, launcher, tmp_path):
+        """Test that readiness is detected while heavy output rotates the log."""
+        launcher.start()
+        elapsed = launcher.wait_until_ready(timeout=30, interval=0.1)
+        assert elapsed > 0
+
+        logs = list((tmp_path / "logs").iterdir())
+        assert (tmp_path / "logs" / "hapi.log") in logs
+        # Output exceeded max_log_bytes, so the log rotated and kept at most 2 backups
+        assert 1 < len(logs) <= 3
+
+    def test_warm_up_issues_agent_searches(self, launcher):
+        """Test that warm-up runs every agent search for each round."""
+        launcher.start()
+        launcher.wait_until_ready(timeout=30, interval=0.1)
+
+        succeeded = launcher.warm_up(patients=1, rounds=2)
+        # Every templated search plus the name/birthdate lookup, twice
+        assert succeeded == 2 * (len(WARMUP_SEARCHES) + 1)
+
+    def test_process_exit_is_reported(self, tmp_path):
+        """Test that a process exiting during startup raises with its exit code."""
+        launcher = HapiLauncher(
+            command=[sys.executable, "-c", "import sys; sys.exit(3)"],
+            cwd=str(tmp_path),
+            base_url=f"http://127.0.0.1:{_free_port()}/fhir",
+            log_path=str(tmp_path / "hapi.log"),
+        )
+        launcher.start()
+        with pytest.raises(RuntimeError, match="exited with code 3"):
+            launcher.wait_until_ready(timeout=10, interval=0.1)
+
+    def test_startup_report(self, launcher):
+        """Test that the startup report has its event name and phase timings."""
+        launcher.start()
+        ready_after = launcher.wait_until_ready(timeout=30, interval=0.1)
+        report = launcher.startup_report(ready_after, warmed=0)
+        assert report["event"] == "hapi_startup"
+        assert report["total_s"] >= report["jvm_ready_s"]
+        assert report["cds_archive"] is False
+
+
+class TestJavaCommand:
+    """Tests for JVM flag assembly."""
+
+    def test_heap_and_gc(self, tmp_path):
+        """Test that heap, GC and extra options come before the app arguments."""
+        command = java_command(heap="1g", gc="SerialGC", cds_archive=None, extra_opts="-XX:TieredStopAtLevel=1")
+        assert command[:5] == ["java", "-Xmx1g", "-Xms1g", "-XX:+UseSerialGC", "-XX:TieredStopAtLevel=1"]
+        assert command[-len(HAPI_APP_ARGS):] == HAPI_APP_ARGS
+
+    def test_missing_archive_is_skipped(self, tmp_path):
+        """Test that a missing CDS archive adds no sharing flags."""
+        command = java_command(cds_archive=str(tmp_path / "missing.jsa"))
+        assert not any(arg.startswith("-XX:SharedArchiveFile") for arg in command)
+
+    def test_existing_archive_is_used(self, tmp_path):
+        """Test that an existing CDS archive is shared with -Xshare:auto."""
+        archive = tmp_path / "hapi.jsa"
+        archive.write_bytes(b"")
+        command = java_command(cds_archive=str(archive))
+        assert f"-XX:SharedArchiveFile={archive}" in command
+        assert "-Xshare:auto" in command
+
+    def test_training_dumps_archive_at_exit(self, tmp_path):
+        """Test that training dumps the archive at exit instead of loading it."""
+        archive = tmp_path / "hapi.jsa"
+        command = java_command(cds_archive=str(archive), train_cds=True)
+        assert f"-XX:ArchiveClassesAtExit={archive}" in command
+        assert not any(arg.startswith("-XX:SharedArchiveFile") for arg in command)
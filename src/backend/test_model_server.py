@@ -0,0 +1,173 @@
+"""
+Tests for the model server module.
+
+Serves the tiny random-weight Gemma3 on CPU through FastAPI's TestClient, so the
+production request path (chat template, generate, usage, metrics, auth) runs
+without a GPU or a download; tiny tests are skipped where torch/transformers are
+not installed. Route behavior that does not depend on the model uses the replay
+backend.
+"""
+
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.backend.model_backends import (
+    RecordingBackend,
+    ReplayBackend,
+    TransformersBackend,
+    backend_from_env,
+    load_backend,
+    tiny_tokenizer,
+)
+from src.backend.model_server import create_app
+from src.backend.utils.tracing import JsonlExporter, Tracer
+
+MESSAGES = [{"role": "user", "content": "GET http://localhost:8080/fhir/Patient?identifier=S6315806"}]
+
+
+@pytest.fixture(scope="module")
+def tiny():
+    pytest.importorskip("torch")
+    pytest.importorskip("transformers")
+    return TransformersBackend.tiny()
+
+
+@pytest.fixture
+def client(tiny):
+    return TestClient(create_app(tiny))
+
+
+class TestTinyBackend:
+    """Tests for the CPU tiny model and tokenizer."""
+
+    def test_tokenizer_round_trips_chat_template(self, tiny):
+        """Test that the tiny tokenizer round-trips the chat template with real merges."""
+        tokenizer = tiny_tokenizer()
+        text = tokenizer.apply_chat_template(MESSAGES + [{"role": "assistant", "content": "FINISH([\"é\"])"}],
+                                             tokenize=False)
+        ids = tokenizer(text)["input_ids"]
+        assert ids[0] == tokenizer.bos_token_id
+        assert tokenizer.decode(ids) == text
+        assert len(ids) < len(text) / 2  # merges, not one token per byte
+
+    def test_backend_from_env(self, monkeypatch):
+        """Test that SARA_MODEL_BACKEND picks a backend and rejects unknown names."""
+        monkeypatch.delenv("SARA_MODEL_BACKEND", raising=False)
+        assert backend_from_env() == "transformers"
+        monkeypatch.setenv("SARA_MODEL_BACKEND", "Tiny")
+        assert backend_from_env() == "tiny"
+        monkeypatch.setenv("SARA_MODEL_BACKEND", "vllm")
+        assert backend_from_env() == "vllm"
+        monkeypatch.setenv("SARA_MODEL_BACKEND", "onnx")
+        with pytest.raises(ValueError):
+            backend_from_env()
+
+
+class TestRoutes:
+    """Tests for the OpenAI-compatible routes."""
+
+    def test_chat_completion(self, client):
+        """Test that a completion has the OpenAI shape and consistent usage."""
+        response = client.post("/v1/chat/completions", json={"messages": MESSAGES, "max_tokens": 8})
+        assert response.status_code == 200
+        body = response.json()
+        assert body["object"] == "chat.completion"
+        assert body["model"] == "sara-tiny"
+        assert isinstance(body["choices"][0]["message"]["content"], str)
+        usage = body["usage"]
+        assert 0 < usage["completion_tokens"] <= 8
+        assert usage["total_tokens"] == usage["prompt_tokens"] + usage["completion_tokens"]
+
+    def test_greedy_is_deterministic(self, client):
+        """Test that temperature 0 gives the same reply twice."""
+        payload = {"messages": MESSAGES, "max_tokens": 6, "temperature": 0.0}
+        first = client.post("/v1/chat/completions", json=payload).json()
+        second = client.post("/v1/chat/completions", json=payload).json()
+        assert first["choices"][0]["message"] == second["choices"][0]["message"]
+
+    def test_validation(self, client):
+        """Test that blank message content is rejected with 422."""
+        response = client.post("/v1/chat/completions", json={"messages": [{"role": "user", "content": " "}]})
+        assert response.status_code == 422
+
+    def test_metrics_count_requests(self, client):
+        """Test that served requests show up in /metrics."""
+        client.post("/v1/chat/completions", json={"messages": MESSAGES, "max_tokens": 4})
+        text = client.get("/metrics").text
+        assert 'sara_model_requests_total{status="ok"} 1' in text
+        assert "sara_model_ttft_seconds_count 1" in text
+
+    def test_server_timing_header(self, client):
+        """Test that the Server-Timing header carries the per-request phases."""
+        from src.backend.benchmarks.serving import parse_server_timing
+
+        response = client.post("/v1/chat/completions", json={"messages": MESSAGES, "max_tokens": 4})
+        timings = parse_server_timing(response.headers["server-timing"])
+        assert set(timings) == {"queue_wait_ms", "ttft_ms", "prefill_ms", "decode_ms"}
+        assert timings["ttft_ms"] >= timings["prefill_ms"] >= 0
+
+    def test_api_key(self, tiny):
+        """Test that model routes need the API key, as header or Bearer token."""
+        client = TestClient(create_app(tiny, api_key="secret"))
+        assert client.get("/health").status_code == 200
+        assert client.get("/v1/models").status_code == 401
+        assert client.get("/v1/models", headers={"X-API-Key": "secret"}).status_code == 200
+        assert client.get("/v1/models", headers={"Authorization": "Bearer secret"}).json()["data"][0]["id"] == "sara-tiny"
+
+
+class TestReplayBackend:
+    """Tests for serving recorded replies."""
+
+    def test_recorded_reply_and_fallback(self, tmp_path):
+        """Test that recorded conversations are replayed and others get the fallback."""
+        recording = tmp_path / "replies.jsonl"
+        recording.write_text(json.dumps({"messages": MESSAGES, "content": "GET http://x/Observation"}) + "\n")
+        client = TestClient(create_app(ReplayBackend.from_file(str(recording))))
+        assert client.get("/health").json() == {"status": "ok", "backend": "replay"}
+
+        body = client.post("/v1/chat/completions", json={"messages": MESSAGES}).json()
+        assert body["model"] == "sara-replay"
+        assert body["choices"][0]["message"]["content"] == "GET http://x/Observation"
+        assert body["usage"]["completion_tokens"] > 0
+
+        other = [{"role": "user", "content": "Unrecorded question"}]
+        body = client.post("/v1/chat/completions", json={"messages": other}).json()
+        assert body["choices"][0]["message"]["content"] == "FINISH([])"
+
+    def test_fallback_follows_turns(self):
+        """Test that fallback replies advance with the assistant turns."""
+        client = TestClient(create_app(ReplayBackend(fallback=["GET http://x/Patient", "FINISH([1])"])))
+        turns = [MESSAGES[0], {"role": "assistant", "content": "GET http://x/Patient"},
+                 {"role": "user", "content": "Here is the response"}]
+        first = client.post("/v1/chat/completions", json={"messages": turns[:1]}).json()
+        second = client.post("/v1/chat/completions", json={"messages": turns}).json()
+        assert first["choices"][0]["message"]["content"] == "GET http://x/Patient"
+        assert second["choices"][0]["message"]["content"] == "FINISH([1])"
+
+    def test_generate_span_joins_caller_trace(self, tmp_path):
+        """Test that each completion exports a model.generate span under the caller's traceparent."""
+        path = tmp_path / "trace.jsonl"
+        tracer = Tracer(JsonlExporter(str(path)))
+        client = TestClient(create_app(ReplayBackend(fallback=["FINISH([])"]), tracer=tracer))
+        traceparent = "00-" + "a" * 32 + "-" + "b" * 16 + "-01"
+        client.post("/v1/chat/completions", json={"messages": MESSAGES}, headers={"traceparent": traceparent})
+        client.post("/v1/chat/completions", json={"messages": MESSAGES})
+
+        joined, fresh = [json.loads(line) for line in path.read_text().splitlines()]
+        assert joined["name"] == "model.generate"
+        assert (joined["traceId"], joined["parentId"]) == ("a" * 32, "b" * 16)
+        assert joined["attributes"]["backend"] == "replay"
+        assert joined["attributes"]["completionTokens"] > 0
+        assert fresh["parentId"] is None
+
+    def test_recording_round_trips(self, tmp_path, monkeypatch):
+        """Test that recorded conversations can be replayed from SARA_REPLAY_FILE."""
+        recording = tmp_path / "recorded.jsonl"
+        recorder = RecordingBackend(ReplayBackend(fallback=["GET http://x/Patient"]), str(recording))
+        recorder.generate(MESSAGES, 16, 0.0, 1.0)
+        assert json.loads(recording.read_text())["messages"] == MESSAGES
+
+        monkeypatch.setenv("SARA_REPLAY_FILE", str(recording))
+        assert load_backend("replay").generate(MESSAGES, 16, 0.0, 1.0).text == "GET http://x/Patient"
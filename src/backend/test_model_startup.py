@@ -0,0 +1,146 @@
+"""
+Tests for the model server's cold start.
+
+Uses the replay backend, so startup phases, warm-up and the /ready gate run
+without torch, a GPU or a download.
+"""
+
+import json
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.backend.model_backends import ReplayBackend, TransformersBackend
+from src.backend.model_server import create_app
+from src.backend.model_startup import (
+    SNAPSHOT_MARKER,
+    Startup,
+    cold_start,
+    prepare_snapshot,
+    restore_compile_cache,
+    snapshot_ready,
+    warm_up,
+    warmup_messages,
+    warmup_tokens_from_env,
+)
+
+MESSAGES = [{"role": "user", "content": "What is the MRN of Peter Stafford?"}]
+CACHE_VARS = ("TORCHINDUCTOR_CACHE_DIR", "TORCHINDUCTOR_FX_GRAPH_CACHE", "TORCHINDUCTOR_AUTOGRAD_CACHE",
+              "TRITON_CACHE_DIR", "VLLM_CACHE_ROOT")
+
+
+class TestStartup:
+    """Tests for phase timing and readiness."""
+
+    def test_ready_gates_model_routes(self):
+        """Test that /ready and model routes answer 503 until the load finishes."""
+        startup = Startup("replay")
+        client = TestClient(create_app(None, startup=startup))
+        assert client.get("/health").status_code == 200
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["status"] == "starting"
+        response = client.post("/v1/chat/completions", json={"messages": MESSAGES})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "5"
+
+        def load(s):
+            with s.timed("load"):
+                return ReplayBackend()
+
+        startup.run(load)
+        report = client.get("/ready").json()
+        assert report["status"] == "ready"
+        assert report["load_s"] >= 0 and report["total_s"] >= report["load_s"]
+        assert client.post("/v1/chat/completions", json={"messages": MESSAGES}).status_code == 200
+
+    def test_failure_is_reported(self):
+        """Test that a failed load is reported by /ready and the model routes."""
+        startup = Startup("replay")
+        client = TestClient(create_app(None, startup=startup))
+
+        def load(s):
+            with s.timed("load"):
+                raise OSError("snapshot missing")
+
+        startup.run(load)
+        assert not startup.wait(0)
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["status"] == "failed"
+        assert "snapshot missing" in response.json()["error"]
+        assert client.post("/v1/chat/completions", json={"messages": MESSAGES}).json()["detail"]["error"]["code"] \
+            == "model_failed"
+
+    def test_cold_start_warms_up(self, monkeypatch, tmp_path):
+        """Test that cold_start times each phase and warms up at every length."""
+        monkeypatch.setenv("SARA_WARMUP_TOKENS", "64,256")
+        monkeypatch.setenv("SARA_COMPILE_CACHE", str(tmp_path / "cache"))
+        monkeypatch.setenv("SARA_MODEL_SNAPSHOT_DIR", str(tmp_path / "snapshot"))  # ignored: replay loads no weights
+        for var in CACHE_VARS:
+            monkeypatch.delenv(var, raising=False)
+        startup = Startup("replay")
+        startup.run(lambda s: cold_start(s, "replay"))
+        report = startup.report()
+        assert set(report) >= {"compile_cache_s", "load_s", "warmup_s", "total_s"}
+        assert "snapshot_s" not in report
+        assert report["warmup_prompt_tokens"][0] < report["warmup_prompt_tokens"][1]
+
+
+class TestHelpers:
+    """Tests for warm-up, compile cache and snapshot helpers."""
+
+    def test_warmup_messages_scale_with_tokens(self):
+        """Test that warm-up prompts grow with the requested token count."""
+        short, long = warmup_messages(100)[0]["content"], warmup_messages(1000)[0]["content"]
+        assert len(long) == 10 * len(short)
+        assert warm_up(ReplayBackend(), [100, 1000]) == [100, 1000]
+
+    def test_warmup_tokens_from_env(self, monkeypatch):
+        """Test that SARA_WARMUP_TOKENS is parsed, defaulted and switched off."""
+        monkeypatch.delenv("SARA_WARMUP_TOKENS", raising=False)
+        assert warmup_tokens_from_env(default=[5]) == [5]
+        monkeypatch.setenv("SARA_WARMUP_TOKENS", "512, 2048")
+        assert warmup_tokens_from_env() == [512, 2048]
+        monkeypatch.setenv("SARA_WARMUP_TOKENS", "off")
+        assert warmup_tokens_from_env() == []
+
+    def test_compile_cache_dirs(self, monkeypatch, tmp_path):
+        """Test that restoring the compile cache points the cache variables at it."""
+        for var in CACHE_VARS:
+            monkeypatch.delenv(var, raising=False)
+        assert restore_compile_cache(str(tmp_path)) is False  # nothing saved yet
+        assert os.environ["TORCHINDUCTOR_CACHE_DIR"] == str(tmp_path / "inductor")
+        assert os.environ["VLLM_CACHE_ROOT"] == str(tmp_path / "vllm")
+
+    def test_prepared_snapshot_is_reused(self, tmp_path):
+        """Test that a snapshot with a matching marker is reused without a download."""
+        (tmp_path / SNAPSHOT_MARKER).write_text(json.dumps({"model": "org/model", "revision": "abc"}))
+        # A matching marker means no download (huggingface_hub is never imported)
+        assert prepare_snapshot(str(tmp_path), "org/model", "abc") == str(tmp_path)
+        assert not snapshot_ready(str(tmp_path), "org/model", "def")
+
+    def test_float32_snapshot_is_converted_in_place(self, monkeypatch, tmp_path):
+        """Test that a sharded float32 download is converted to one bfloat16 file."""
+        torch = pytest.importorskip("torch")
+        from safetensors import safe_open
+
+        downloads = []
+
+        def fake_download(model_name, revision, local_dir, allow_patterns):
+            # A sharded float32 checkpoint, as a hub download of the repo would leave it
+            downloads.append(model_name)
+            model = TransformersBackend.tiny().model.to(torch.float32)
+            model.save_pretrained(local_dir, max_shard_size="100KB")
+
+        monkeypatch.setattr("huggingface_hub.snapshot_download", fake_download)
+        prepare_snapshot(str(tmp_path), "org/model", "abc")
+
+        assert downloads == ["org/model"]  # the conversion loads the download, not the hub
+        shards = sorted(p.name for p in tmp_path.glob("*.safetensors"))
+        assert shards == ["model.safetensors"]  # old shards and their index are gone
+        assert not list(tmp_path.glob("*.index.json"))
+        with safe_open(str(tmp_path / "model.safetensors"), framework="pt") as f:
+            assert {f.get_slice(k).get_dtype() for k in f.keys()} == {"BF16"}
+        assert snapshot_ready(str(tmp_path), "org/model", "abc")
@@ -0,0 +1,109 @@
+"""
+Batch Runner for Sara
+
+Runs many agent tasks with bounded concurrency and yields each result as soon as
+it completes, followed by an aggregate summary (success counts, wall time and
+per-task latency percentiles). POST /api/batch streams these records as NDJSON,
+one JSON object per line, so a client sees results while the rest still run.
+
+A semaphore bounds how many tasks talk to the model and FHIR server at once; the
+tasks of one batch share one model client and one FHIR connection pool.
+"""
+
+import asyncio
+import math
+import os
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Sequence
+
+from src.backend.utils.jsoncodec import dumps
+
+MAX_BATCH_TASKS = 100  # tasks accepted in one request
+MAX_BATCH_CONCURRENCY = 16  # upper bound on a request's concurrency
+
+
+async def run_batch(jobs: Sequence[Callable[[], Awaitable[Dict[str, Any]]]],
+                    concurrency: int = 4) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run jobs concurrently and yield their results in completion order.
+
+    Args:
+        jobs: Zero-argument coroutine functions returning a result dict with "success"
+        concurrency: Jobs running at once
+
+    Yields:
+        {"type": "result", "index", "elapsedMs", ...job result} per job, then one
+        {"type": "summary", ...} record. A job that raises yields success False
+        with its error. Pending jobs are cancelled if the consumer stops early.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    started = time.perf_counter()
+
+    async def run(index: int, job: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        async with semaphore:
+            job_started = time.perf_counter()
+            try:
+                result = await job()
+            except Exception as e:
+                result = {"success": False, "error": str(e)}
+            elapsed_ms = round((time.perf_counter() - job_started) * 1000, 1)
+            return {"type": "result", "index": index, **result, "elapsedMs": elapsed_ms}
+
+    tasks = [asyncio.ensure_future(run(i, job)) for i, job in enumerate(jobs)]
+    timings: List[float] = []
+    succeeded = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            timings.append(result["elapsedMs"])
+            succeeded += bool(result.get("success"))
+            yield result
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Let cancelled jobs unwind before the caller releases what they use (e.g. a shared HTTP pool)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    yield {
+        "type": "summary",
+        "tasks": len(tasks),
+        "succeeded": succeeded,
+        "failed": len(tasks) - succeeded,
+        "concurrency": max(1, concurrency),
+        "wallMs": round((time.perf_counter() - started) * 1000, 1),
+        "taskMs": timing_stats(timings),
+    }
+
+
+def timing_stats(timings: Sequence[float]) -> Dict[str, float]:
+    """Sum, mean, p50, p95 and max of per-task times in milliseconds (empty dict for none)."""
+    if not timings:
+        return {}
+    ordered = sorted(timings)
+
+    def percentile(p: float) -> float:
+        # Nearest rank
+        return ordered[max(0, math.ceil(p * len(ordered)) - 1)]
+
+    return {
+        "sum": round(sum(ordered), 1),
+        "mean": round(sum(ordered) / len(ordered), 1),
+        "p50": percentile(0.50),
+        "p95": percentile(0.95),
+        "max": ordered[-1],
+    }
+
+
+def ndjson_line(record: Dict[str, Any]) -> str:
+    """One NDJSON line."""
+    return dumps(record) + "\n"
+
+
+def batch_concurrency_from_env(var: str = "BATCH_CONCURRENCY", default: int = 4) -> int:
+    """Default concurrency of POST /api/batch, clamped to 1..MAX_BATCH_CONCURRENCY."""
+    value = os.environ.get(var)
+    try:
+        concurrency = int(value) if value else default
+    except ValueError:
+        concurrency = default
+    return max(1, min(MAX_BATCH_CONCURRENCY, concurrency))
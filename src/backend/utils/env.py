@@ -0,0 +1,26 @@
+"""
+Environment Switches for Sara
+
+The opt-in features are switched by environment variables that share one
+convention: unset means the feature's default, "0", "false", "off" or "no"
+(any case) turn it off, and any other value turns it on.
+"""
+
+import os
+
+FALSE_VALUES = ("0", "false", "off", "no")
+
+
+def env_flag(var: str, default: bool) -> bool:
+    """
+    Read an on/off switch from the environment.
+
+    Args:
+        var: Environment variable name
+        default: Setting used when the variable is unset
+
+    Returns:
+        Whether the switch is on
+    """
+    value = os.environ.get(var)
+    return default if value is None else value.strip().lower() not in FALSE_VALUES
@@ -5,12 +5,23 @@ Provides async HTTP operations against a FHIR R4 server.
 Used by the Sara agent orchestrator to execute actions parsed by the action parser.
 """
 
+import asyncio
+import uuid
 from dataclasses import dataclass, field
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Tuple
 
 import httpx
 
+from src.backend.utils.idempotency import idempotency_key as derive_key
+from src.backend.utils.idempotency import can_carry_key, if_none_exist, with_idempotency_key
+from src.backend.utils.json_stream import StreamLimits, read_json
+from src.backend.utils.jsoncodec import dumps, loads
+from src.backend.utils.pagination import BundlePaginator, PageBudget
 from src.backend.utils.parser import Action, ActionType
+from src.backend.utils.patient_index import PatientIndex
+from src.backend.utils.patient_snapshot import PatientSnapshots, split_fhir_path
+from src.backend.utils.query_rewrite import QueryRewriter
+from src.backend.utils.tracing import inject_traceparent, span
 
 
 @dataclass
@@ -20,6 +31,13 @@ class FHIRResult:
     status_code: int
     data: Dict[str, Any] = field(default_factory=dict)
     error: str = ""
+    _json: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+
+    def to_json(self) -> str:
+        """Pretty-printed data (the prompt format), serialized once."""
+        if self._json is None:
+            self._json = dumps(self.data, indent=True)
+        return self._json
 
 
 class FHIRClient:
@@ -36,21 +54,58 @@ class FHIRClient:
             result = await client.execute(action)
         finally:
             await client.close()
+
+    POSTs given an idempotency key are sent as conditional creates and retried
+    on transport errors. GETs are retried MAX_RETRIES times (none by default);
+    other POSTs only when the connection failed, so a retry cannot duplicate a
+    write the server may have applied. Subclasses tune the retry policy through
+    the class attributes (sara_agent.py waits out Modal cold starts this way).
     """
 
-    def __init__(self, base_url: str):
+    MAX_RETRIES = 0  # extra attempts for GETs and for POSTs that never reached the server
+    MAX_WRITE_RETRIES = 2  # extra attempts for keyed POSTs
+    RETRY_DELAY = 0.0  # seconds; retry n waits n * RETRY_DELAY
+    WRITE_TIMEOUT: Optional[httpx.Timeout] = None  # per-attempt timeout of keyed POSTs (None: the client's)
+
+    def __init__(
+        self,
+        base_url: str,
+        rewriter: Optional[QueryRewriter] = None,
+        page_budget: Optional[PageBudget] = None,
+        patient_snapshots: bool = False,
+        patient_index: Optional[PatientIndex] = None,
+        stream_limits: Optional[StreamLimits] = None,
+        http_client: Optional[httpx.AsyncClient] = None,
+    ):
         """
         Initialize the FHIR client.
 
         Args:
             base_url: Base URL of the FHIR server (e.g., "http://localhost:8080")
+            rewriter: Optional query rewriter applied to GET searches
+            page_budget: When set, follow next links and merge search pages within this budget
+            patient_snapshots: Answer patient-scoped searches from one $everything fetch per patient
+            patient_index: Shared warm Patient index answering Patient searches
+            stream_limits: When set, decode GET responses incrementally within these caps
+            http_client: Shared connection pool to use (left open by close())
         """
         # Remove trailing slash for consistent URL building
         self.base_url = base_url.rstrip("/")
-        self._client = httpx.AsyncClient(
+        self.rewriter = rewriter
+        self.page_budget = page_budget
+        self.patient_index = patient_index
+        self.stream_limits = stream_limits
+        self._owns_client = http_client is None
+        self._client = http_client or httpx.AsyncClient(
             timeout=30.0,
-            headers={"Accept": "application/fhir+json", "Content-Type": "application/fhir+json"}
+            headers={"Accept": "application/fhir+json", "Content-Type": "application/fhir+json"},
+            event_hooks={"request": [inject_traceparent]},
         )
+        self.snapshots: Optional[PatientSnapshots] = None
+        if patient_snapshots:
+            # Endpoints carry the /fhir prefix when base_url is the server root
+            fhir_base = self.base_url if self.base_url.endswith("/fhir") else f"{self.base_url}/fhir"
+            self.snapshots = PatientSnapshots(self._client, fhir_base)
 
     async def __aenter__(self) -> "FHIRClient":
         """Async context manager entry."""
@@ -61,10 +116,11 @@ class FHIRClient:
         await self.close()
 
     async def close(self) -> None:
-        """Close the HTTP client."""
-        await self._client.aclose()
+        """Close the HTTP client (unless it was passed in)."""
+        if self._owns_client:
+            await self._client.aclose()
 
-    async def execute(self, action: Action) -> FHIRResult:
+    async def execute(self, action: Action, idempotency_key: Optional[str] = None) -> FHIRResult:
         """
         Execute an action against the FHIR server.
 
@@ -72,15 +128,28 @@ class FHIRClient:
 
         Args:
             action: Parsed action from Sara's output
+            idempotency_key: Makes POST/TRANSACTION actions safe to retry (see idempotency.py)
 
         Returns:
             FHIRResult with success status, data, and any errors
         """
-        if action.type == ActionType.GET:
+        # Timed as a child of the caller's current span; requests carry its traceparent
+        with span(f"fhir.{action.type.value.lower()}", endpoint=action.endpoint) as fhir_span:
+            result = await self._execute(action, idempotency_key)
+            fhir_span.set(status_code=result.status_code, success=result.success)
+            return result
+
+    async def _execute(self, action: Action, idempotency_key: Optional[str]) -> FHIRResult:
+        # Compared by value, so sara_agent.py's inline Action types are executed too
+        kind = getattr(action.type, "value", action.type)
+        if kind == ActionType.GET.value:
             return await self.get(action.endpoint, action.params)
-        elif action.type == ActionType.POST:
-            return await self.post(action.endpoint, action.body)
-        elif action.type == ActionType.FINISH:
+        elif kind == ActionType.POST.value:
+            return await self.post(action.endpoint, action.body, idempotency_key)
+        elif kind == ActionType.TRANSACTION.value:
+            return await self.transaction([(entry.endpoint, entry.body) for entry in action.entries],
+                                          idempotency_key)
+        elif kind == ActionType.FINISH.value:
             # FINISH action doesn't make HTTP request
             return FHIRResult(
                 success=True,
@@ -107,56 +176,158 @@ class FHIRClient:
         Returns:
             FHIRResult with response data or error
         """
-        url = f"{self.base_url}{endpoint}"
-
-        try:
-            response = await self._client.get(url, params=params if params else None)
-            return self._process_response(response)
-        except httpx.ConnectError as e:
-            return FHIRResult(
-                success=False,
-                status_code=0,
-                data={},
-                error=f"Connection error: {str(e)}"
-            )
-        except httpx.RequestError as e:
-            return FHIRResult(
-                success=False,
-                status_code=0,
-                data={},
-                error=f"Request error: {str(e)}"
-            )
-
-    async def post(self, endpoint: str, body: Dict[str, Any]) -> FHIRResult:
+        fhir_base, path = split_fhir_path(self.base_url, endpoint)
+        url = f"{fhir_base}/{path}"
+        if self.rewriter is not None:
+            params = self.rewriter.rewrite(endpoint, params)
+
+        if self.patient_index is not None and path == "Patient":
+            local = self.patient_index.search(params)
+            if local is not None:
+                return FHIRResult(success=True, status_code=200, data=local)
+        if self.snapshots is not None:
+            local = await self.snapshots.search(path, params)
+            if local is not None:
+                return FHIRResult(success=True, status_code=200, data=local)
+
+        result, size = await self._request("GET", url, params=params if params else None)
+        if self.page_budget is not None and result.success:
+            paginator = BundlePaginator(self._client, self.page_budget)
+            result.data = await paginator.merge(result.data, first_size=size)
+        return result
+
+    async def post(self, endpoint: str, body: Dict[str, Any],
+                   idempotency_key: Optional[str] = None) -> FHIRResult:
         """
         Execute a POST request against the FHIR server.
 
         Args:
             endpoint: FHIR endpoint path (e.g., "/fhir/Patient")
             body: JSON body for the request
+            idempotency_key: When set, create conditionally on this key and retry timeouts
 
         Returns:
             FHIRResult with response data or error
         """
-        url = f"{self.base_url}{endpoint}"
+        fhir_base, path = split_fhir_path(self.base_url, endpoint)
+        headers = None
+        if not can_carry_key(body):
+            # Sent as is (the server rejects it); an unstamped create is not safe to retry
+            idempotency_key = None
+        if idempotency_key:
+            body = with_idempotency_key(body, idempotency_key)
+            headers = {"If-None-Exist": if_none_exist(idempotency_key)}
+
+        result, _ = await self._request("POST", f"{fhir_base}/{path}", keyed=bool(idempotency_key),
+                                        json=body, headers=headers)
+        if result.success:
+            if self.snapshots is not None:
+                self.snapshots.apply_write(result.data or body)
+            if self.patient_index is not None:
+                self.patient_index.apply_write(result.data)
+        return result
+
+    async def transaction(self, requests: List[Tuple[str, Dict[str, Any]]],
+                          idempotency_key: Optional[str] = None) -> FHIRResult:
+        """
+        Submit several creates as one FHIR transaction Bundle (all-or-nothing).
+
+        Args:
+            requests: (endpoint, body) pairs, e.g. ("/fhir/MedicationRequest", {...})
+            idempotency_key: When set, every entry is created conditionally on a key
+                derived from it and timeouts are retried
+
+        Returns:
+            FHIRResult with the transaction-response Bundle or error
+        """
+        if not requests:
+            return FHIRResult(success=False, status_code=0, data={}, error="Empty transaction")
+        fhir_base, _ = split_fhir_path(self.base_url, requests[0][0])
+        if not all(can_carry_key(body) for _, body in requests):
+            idempotency_key = None
+        entries = []
+        for i, (endpoint, body) in enumerate(requests):
+            request = {"method": "POST", "url": split_fhir_path(self.base_url, endpoint)[1]}
+            if idempotency_key:
+                entry_key = derive_key(idempotency_key, i, endpoint, body)
+                body = with_idempotency_key(body, entry_key)
+                request["ifNoneExist"] = if_none_exist(entry_key)
+            entries.append({"fullUrl": f"urn:uuid:{uuid.uuid4()}", "resource": body, "request": request})
+        bundle = {"resourceType": "Bundle", "type": "transaction", "entry": entries}
+
+        result, _ = await self._request("POST", fhir_base, keyed=bool(idempotency_key), json=bundle)
+        if result.success:
+            for _, body in requests:
+                # The response carries locations only, so snapshots of these patients are dropped
+                if self.snapshots is not None:
+                    self.snapshots.apply_write(body)
+                if self.patient_index is not None:
+                    self.patient_index.apply_write(body)
+        return result
+
+    async def _request(self, method: str, url: str, keyed: bool = False, **kwargs) -> Tuple[FHIRResult, int]:
+        """
+        Send a request, retrying transport errors the retry policy allows.
+
+        Args:
+            method: "GET" or "POST"
+            url: Full request URL
+            keyed: POST is a conditional create on an idempotency key (safe to repeat)
+            **kwargs: Passed to httpx (params, json, headers)
 
+        Returns:
+            (FHIRResult, body bytes read); transport failures give status_code 0
+        """
+        retries = self.MAX_WRITE_RETRIES if keyed else self.MAX_RETRIES
+        if keyed and self.WRITE_TIMEOUT is not None:
+            kwargs["timeout"] = self.WRITE_TIMEOUT
+        error = ""
+        for attempt in range(retries + 1):
+            if attempt:
+                await asyncio.sleep(self.RETRY_DELAY * attempt)
+            try:
+                if method == "GET" and self.stream_limits is not None:
+                    async with self._client.stream("GET", url, **kwargs) as response:
+                        return await self._process_stream(response)
+                response = await self._client.request(method, url, **kwargs)
+                return self._process_response(response), len(response.content)
+            except httpx.RequestError as e:
+                if isinstance(e, httpx.TimeoutException):
+                    error = f"Timeout: {e!r}"
+                elif isinstance(e, httpx.ConnectError):
+                    error = f"Connection error: {str(e)}"
+                else:
+                    error = f"Request error: {str(e)}"
+                # An unkeyed POST may have been applied unless the connection itself failed
+                reached_server = not isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                if method == "POST" and not keyed and reached_server:
+                    break
+            except Exception as e:
+                # Catch TransferEncodingError and similar issues
+                error = f"Unexpected error: {type(e).__name__}: {str(e)}"
+                if method == "POST" and not keyed:
+                    break
+        return FHIRResult(success=False, status_code=0, data={}, error=error), 0
+
+    async def _process_stream(self, response: httpx.Response) -> Tuple[FHIRResult, int]:
+        """
+        Process a streamed response, decoding JSON bodies incrementally.
+
+        Args:
+            response: httpx Response opened with stream()
+
+        Returns:
+            (FHIRResult, body bytes read)
+        """
+        if response.status_code >= 400 or "json" not in response.headers.get("content-type", ""):
+            await response.aread()
+            return self._process_response(response), len(response.content)
         try:
-            response = await self._client.post(url, json=body)
-            return self._process_response(response)
-        except httpx.ConnectError as e:
-            return FHIRResult(
-                success=False,
-                status_code=0,
-                data={},
-                error=f"Connection error: {str(e)}"
-            )
-        except httpx.RequestError as e:
-            return FHIRResult(
-                success=False,
-                status_code=0,
-                data={},
-                error=f"Request error: {str(e)}"
-            )
+            data, size = await read_json(response, self.stream_limits)
+        except ValueError as e:
+            return FHIRResult(success=False, status_code=response.status_code, data={},
+                              error=f"Invalid response body: {e}"), 0
+        return FHIRResult(success=True, status_code=response.status_code, data=data), size
 
     def _process_response(self, response: httpx.Response) -> FHIRResult:
         """
@@ -172,7 +343,7 @@ class FHIRClient:
 
         # Try to parse JSON response
         try:
-            data = response.json()
+            data = loads(response.content)
         except Exception:
             data = {}
 
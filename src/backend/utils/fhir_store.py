@@ -0,0 +1,838 @@
+"""
+In-memory FHIR R4 Store
+
+Indexed, in-process storage for FHIR resources with the subset of FHIR R4 search
+semantics the Sara agent uses (the SEARCH_PARAMS below, _count, _sort, _offset,
+_elements, _summary=count) plus create.
+
+Backs the lightweight stand-in FHIR server and any component that needs to answer
+agent searches locally without a round trip to HAPI.
+"""
+
+import gzip
+import json
+import unicodedata
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+from urllib.parse import parse_qs, urlencode
+
+SearchParams = Dict[str, Union[str, List[str]]]
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 200
+
+# Search parameters the store evaluates, per resource type, as the FHIR R4 base
+# SearchParameter definitions (and so HAPI) define them: name -> (type, element
+# paths). Choice elements list each variant; dotted paths walk into repeating
+# elements, and a resource matches when any of its values does. Parameters not
+# listed here are unsupported, so callers answering searches locally fall back to HAPI.
+_SUBJECT = {"patient": ("reference", ("subject",)), "subject": ("reference", ("subject",)),
+            "identifier": ("token", ("identifier",))}
+SEARCH_PARAMS: Dict[str, Dict[str, Tuple[str, Tuple[str, ...]]]] = {
+    "Patient": {
+        "identifier": ("token", ("identifier",)),
+        "gender": ("token", ("gender",)),
+        "telecom": ("token", ("telecom",)),
+        "birthdate": ("date", ("birthDate",)),
+        "family": ("string", ()),
+        "given": ("string", ()),
+        "name": ("string", ()),
+        "address": ("string", ()),
+        "address-city": ("string", ()),
+        "address-state": ("string", ()),
+        "address-postalcode": ("string", ()),
+    },
+    "Observation": {
+        **_SUBJECT,
+        "code": ("token", ("code",)),
+        "category": ("token", ("category",)),
+        "status": ("token", ("status",)),
+        "date": ("date", ("effectiveDateTime", "effectivePeriod", "effectiveInstant")),
+    },
+    "MedicationRequest": {
+        **_SUBJECT,
+        "code": ("token", ("medicationCodeableConcept",)),
+        "category": ("token", ("category",)),
+        "status": ("token", ("status",)),
+        "intent": ("token", ("intent",)),
+        "authoredon": ("date", ("authoredOn",)),
+        "date": ("date", ("dosageInstruction.timing.event",)),
+    },
+    "Procedure": {
+        **_SUBJECT,
+        "code": ("token", ("code",)),
+        "category": ("token", ("category",)),
+        "status": ("token", ("status",)),
+        "date": ("date", ("performedDateTime", "performedPeriod")),
+    },
+    "Condition": {
+        **_SUBJECT,
+        "code": ("token", ("code",)),
+        "category": ("token", ("category",)),
+        "clinical-status": ("token", ("clinicalStatus",)),
+        "verification-status": ("token", ("verificationStatus",)),
+        "onset-date": ("date", ("onsetDateTime", "onsetPeriod")),
+        "recorded-date": ("date", ("recordedDate",)),
+    },
+    "ServiceRequest": {
+        **_SUBJECT,
+        "code": ("token", ("code",)),
+        "category": ("token", ("category",)),
+        "status": ("token", ("status",)),
+        "intent": ("token", ("intent",)),
+        "authored": ("date", ("authoredOn",)),
+        "occurrence": ("date", ("occurrenceDateTime", "occurrencePeriod")),
+    },
+    "Encounter": {
+        **_SUBJECT,
+        "status": ("token", ("status",)),
+        "date": ("date", ("period",)),
+    },
+    "DiagnosticReport": {
+        **_SUBJECT,
+        "code": ("token", ("code",)),
+        "category": ("token", ("category",)),
+        "status": ("token", ("status",)),
+        "date": ("date", ("effectiveDateTime", "effectivePeriod")),
+    },
+    "MedicationAdministration": {
+        **_SUBJECT,
+        "code": ("token", ("medicationCodeableConcept",)),
+        "status": ("token", ("status",)),
+        "effective-time": ("date", ("effectiveDateTime", "effectivePeriod")),
+    },
+}
+PATIENT_NAME_PARAMS = ("family", "given", "name")  # string parameters with a prefix index on Patient
+RESULT_PARAMS = {"_count", "_sort", "_offset", "_elements", "_summary", "_format", "_pretty",
+                 "_total", "_getpagesoffset"}
+
+
+class SearchError(ValueError):
+    """Raised for search requests the store cannot evaluate (HAPI answers these with HTTP 400)."""
+
+
+class TransactionError(ValueError):
+    """Raised for transaction Bundles that cannot be applied; nothing is written."""
+
+
+class PreconditionError(ValueError):
+    """Raised when a conditional create matches several resources (HAPI answers these with HTTP 412)."""
+
+
+# =============================================================================
+# Value helpers
+# =============================================================================
+
+def patient_id_of(resource: Dict[str, Any]) -> Optional[str]:
+    """Return the patient id a resource belongs to (itself for Patient resources)."""
+    if resource.get("resourceType") == "Patient":
+        return resource.get("id")
+    for key in ("subject", "patient"):
+        reference = (resource.get(key) or {}).get("reference", "")
+        if reference.startswith("Patient/"):
+            return reference[len("Patient/"):]
+    return None
+
+
+def _normalize_reference(value: str) -> str:
+    """Strip the resource type and any base URL from a Patient reference."""
+    return value.rsplit("Patient/", 1)[-1]
+
+
+def _normalize_text(value: str) -> str:
+    """Case- and accent-insensitive form used for FHIR string search."""
+    decomposed = unicodedata.normalize("NFKD", value)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def parse_date_range(value: str) -> Tuple[datetime, datetime]:
+    """
+    Parse a FHIR date/dateTime/instant into the half-open UTC range it denotes.
+
+    Args:
+        value: e.g. "2023", "2023-11", "2023-11-13", "2023-11-13T10:15:00+00:00"
+
+    Returns:
+        (start, end) tuple of timezone-aware datetimes
+
+    Raises:
+        ValueError: If the value is not a valid FHIR date
+    """
+    value = value.strip()
+    if len(value) == 4:
+        start = datetime(int(value), 1, 1, tzinfo=timezone.utc)
+        return start, start.replace(year=start.year + 1)
+    if len(value) == 7:
+        start = datetime(int(value[:4]), int(value[5:7]), 1, tzinfo=timezone.utc)
+        end = (start + timedelta(days=32)).replace(day=1)
+        return start, end
+    if len(value) == 10:
+        start = datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+        return start, start + timedelta(days=1)
+
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    parsed = parsed.astimezone(timezone.utc)
+    time_part = value[11:].split("+")[0].split("Z")[0].split("-")[0]
+    if time_part.count(":") == 1:
+        precision = timedelta(minutes=1)
+    elif "." in time_part:
+        precision = timedelta(microseconds=1)
+    else:
+        precision = timedelta(seconds=1)
+    return parsed, parsed + precision
+
+
+def _element_values(resource: Dict[str, Any], path: str) -> List[Any]:
+    """Values at a dotted element path, flattening repeating elements along the way."""
+    values: List[Any] = [resource]
+    for part in path.split("."):
+        found = []
+        for value in values:
+            child = value.get(part) if isinstance(value, dict) else None
+            if isinstance(child, list):
+                found.extend(child)
+            elif child is not None:
+                found.append(child)
+        values = found
+    return values
+
+
+def _resource_date_ranges(resource: Dict[str, Any], elements: Iterable[str]) -> List[Tuple[datetime, datetime]]:
+    """Collect the date ranges of the given element paths (date, dateTime, instant or Period)."""
+    ranges = []
+    for value in (v for element in elements for v in _element_values(resource, element)):
+        if not value:
+            continue
+        try:
+            if isinstance(value, dict):
+                start = parse_date_range(value["start"])[0] if value.get("start") else datetime.min.replace(tzinfo=timezone.utc)
+                end = parse_date_range(value["end"])[1] if value.get("end") else datetime.max.replace(tzinfo=timezone.utc)
+                ranges.append((start, end))
+            else:
+                ranges.append(parse_date_range(value))
+        except (ValueError, KeyError):
+            continue
+    return ranges
+
+
+def _date_matches(ranges: List[Tuple[datetime, datetime]], prefix: str, target: Tuple[datetime, datetime]) -> bool:
+    """Apply a FHIR date prefix comparison; a resource with several values matches if any value does."""
+    low, high = target
+    for start, end in ranges:
+        if prefix == "eq" and start >= low and end <= high:
+            return True
+        if prefix == "ne" and not (start >= low and end <= high):
+            return True
+        if prefix in ("gt", "sa") and end > high:
+            return True
+        if prefix in ("lt", "eb") and start < low:
+            return True
+        if prefix == "ge" and end > low:
+            return True
+        if prefix == "le" and start < high:
+            return True
+    return False
+
+
+def _split_prefix(value: str) -> Tuple[str, str]:
+    """Split a FHIR comparison prefix ("ge2023-01-01" -> ("ge", "2023-01-01"))."""
+    if value[:2] in ("eq", "ne", "gt", "lt", "ge", "le", "sa", "eb") and not value[:2].isdigit():
+        return value[:2], value[2:]
+    return "eq", value
+
+
+def _token_candidates(value: Any) -> List[Tuple[Optional[str], Optional[str]]]:
+    """(system, code) pairs of a code, Coding, CodeableConcept, Identifier or ContactPoint."""
+    if isinstance(value, str):
+        return [(None, value)]
+    if not isinstance(value, dict):
+        return []
+    if "coding" in value:
+        return [(c.get("system"), c.get("code")) for c in value["coding"]]
+    if "code" in value:
+        return [(value.get("system"), value.get("code"))]
+    return [(value.get("system"), value.get("value"))]
+
+
+def _token_matches(resource: Dict[str, Any], elements: Iterable[str], value: str) -> bool:
+    """Match a token search value ("code" or "system|code", comma = OR) exactly."""
+    candidates = [c for element in elements for v in _element_values(resource, element) for c in _token_candidates(v)]
+    for alternative in value.split(","):
+        system, _, code = alternative.rpartition("|") if "|" in alternative else (None, "", alternative)
+        for cand_system, cand_code in candidates:
+            if cand_code == code and (system is None or system == (cand_system or "")):
+                return True
+    return False
+
+
+def _string_values(resource: Dict[str, Any], param: str) -> List[str]:
+    """Collect the strings a Patient string parameter searches over."""
+    names = resource.get("name", [])
+    addresses = resource.get("address", [])
+    if param == "family":
+        return [n.get("family", "") for n in names]
+    if param == "given":
+        return [g for n in names for g in n.get("given", [])]
+    if param == "name":
+        return [part for n in names
+                for part in [n.get("family", ""), n.get("text", "")] + n.get("given", [])
+                + n.get("prefix", []) + n.get("suffix", [])]
+    if param == "address":
+        return [part for a in addresses
+                for part in a.get("line", []) + [a.get("city", ""), a.get("state", ""),
+                                                 a.get("postalCode", ""), a.get("country", ""), a.get("text", "")]]
+    if param == "address-city":
+        return [a.get("city", "") for a in addresses]
+    if param == "address-state":
+        return [a.get("state", "") for a in addresses]
+    if param == "address-postalcode":
+        return [a.get("postalCode", "") for a in addresses]
+    return []
+
+
+def _string_matches(resource: Dict[str, Any], param: str, modifier: str, value: str) -> bool:
+    """FHIR string search: starts-with by default, :exact and :contains modifiers."""
+    candidates = [c for c in _string_values(resource, param) if c]
+    for alternative in value.split(","):
+        if modifier == "exact":
+            if alternative in candidates:
+                return True
+            continue
+        needle = _normalize_text(alternative)
+        for candidate in candidates:
+            haystack = _normalize_text(candidate)
+            if (modifier == "contains" and needle in haystack) or haystack.startswith(needle):
+                return True
+    return False
+
+
+def _patient_keys(resource: Dict[str, Any]) -> Set[Tuple[str, str]]:
+    """Demographic index keys of a Patient: birthdate, identifier values and normalized name prefixes."""
+    keys: Set[Tuple[str, str]] = set()
+    if resource.get("birthDate"):
+        keys.add(("birthdate", resource["birthDate"]))
+    for identifier in resource.get("identifier", []):
+        if identifier.get("value"):
+            keys.add(("identifier", identifier["value"]))
+    for param in PATIENT_NAME_PARAMS:
+        for value in _string_values(resource, param):
+            text = _normalize_text(value)
+            keys.update((param, text[:end]) for end in range(1, len(text) + 1))
+    return keys
+
+
+def _as_list(value: Union[str, List[str]]) -> List[str]:
+    return value if isinstance(value, list) else [value]
+
+
+def _first(value: Union[str, List[str]]) -> str:
+    return value[0] if isinstance(value, list) else value
+
+
+def project_elements(resource: Dict[str, Any], elements: Iterable[str]) -> Dict[str, Any]:
+    """Apply FHIR `_elements` projection (mandatory id/resourceType/meta are always kept)."""
+    keep = {"resourceType", "id", "meta"} | {e.strip() for e in elements if e.strip()}
+    return {k: v for k, v in resource.items() if k in keep}
+
+
+# =============================================================================
+# Store
+# =============================================================================
+
+class FHIRStore:
+    """
+    Indexed in-memory FHIR resource store.
+
+    Resources are indexed by type, by owning patient and by code so the searches
+    the agent issues (always patient-scoped apart from Patient lookups) touch only
+    the matching patient's records. Patients are also indexed by birthdate,
+    identifier and name prefix, so demographic lookups skip non-matching patients.
+
+    Usage:
+        store = FHIRStore.from_directory("fixtures/")
+        bundle = store.search("Observation", {"patient": "S6315806", "code": "MG"})
+    """
+
+    def __init__(
+        self,
+        base_url: str = "http://localhost:8080/fhir",
+        page_size: int = DEFAULT_PAGE_SIZE,
+        max_page_size: int = MAX_PAGE_SIZE,
+        clock: Callable[[], datetime] = lambda: datetime.now(timezone.utc),
+    ):
+        """
+        Initialize an empty store.
+
+        Args:
+            base_url: FHIR base used for fullUrl and paging links
+            page_size: Default number of entries per search page
+            max_page_size: Upper bound for the _count parameter
+            clock: Source of timestamps for meta.lastUpdated on create
+        """
+        self.base_url = base_url.rstrip("/")
+        self.page_size = page_size
+        self.max_page_size = max_page_size
+        self._clock = clock
+        self._resources: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._by_patient: Dict[Tuple[str, str], List[str]] = {}
+        self._by_code: Dict[Tuple[str, str], Set[str]] = {}
+        self._by_demographic: Dict[Tuple[str, str], Set[str]] = {}  # Patient (param, key) -> ids
+        self._patient_order: Dict[str, int] = {}
+        self._pending: Dict[str, Path] = {}
+        self._next_id = 1
+
+    # --- Loading ---------------------------------------------------------------
+
+    @classmethod
+    def from_directory(cls, path: Union[str, Path], lazy: bool = True, **kwargs) -> "FHIRStore":
+        """
+        Build a store from a fixture directory of exported Bundles.
+
+        Layout (as written by fhir_memory_server's export command):
+            Patient.json[.gz]              Bundle of every Patient
+            patients/<id>.json[.gz]        $everything Bundle for one patient
+            *.json[.gz]                    Any other Bundle, loaded eagerly
+
+        Args:
+            path: Fixture directory
+            lazy: Defer loading per-patient Bundles until the patient is touched
+
+        Returns:
+            Populated FHIRStore
+        """
+        store = cls(**kwargs)
+        root = Path(path)
+        for bundle_path in sorted(root.glob("*.json*")):
+            store.load_bundle(_read_json(bundle_path))
+        for bundle_path in sorted((root / "patients").glob("*.json*")):
+            patient_id = bundle_path.name.split(".json")[0]
+            if lazy:
+                store._pending[patient_id] = bundle_path
+            else:
+                store.load_bundle(_read_json(bundle_path))
+        return store
+
+    def load_bundle(self, bundle: Dict[str, Any]) -> int:
+        """
+        Add every resource in a Bundle to the store.
+
+        Args:
+            bundle: FHIR Bundle (any type)
+
+        Returns:
+            Number of resources loaded
+        """
+        count = 0
+        for entry in bundle.get("entry", []):
+            resource = entry.get("resource")
+            if resource and resource.get("resourceType") and resource.get("id"):
+                self._index(resource)
+                count += 1
+        return count
+
+    def _index(self, resource: Dict[str, Any]) -> None:
+        resource_type = resource["resourceType"]
+        resource_id = resource["id"]
+        by_id = self._resources.setdefault(resource_type, {})
+        previous = by_id.get(resource_id)
+        is_new = previous is None
+        by_id[resource_id] = resource
+        if resource_type == "Patient":
+            self._index_patient(resource, previous)
+        if resource_id.isdigit():
+            # Keep server-assigned ids ahead of anything loaded from fixtures
+            self._next_id = max(self._next_id, int(resource_id) + 1)
+        if not is_new:
+            return
+        patient_id = patient_id_of(resource)
+        if patient_id:
+            self._by_patient.setdefault((resource_type, patient_id), []).append(resource_id)
+        _, code_paths = SEARCH_PARAMS.get(resource_type, {}).get("code", ("token", ()))
+        for _, code in (c for path in code_paths for v in _element_values(resource, path) for c in _token_candidates(v)):
+            if code:
+                self._by_code.setdefault((resource_type, code), set()).add(resource_id)
+
+    def _index_patient(self, resource: Dict[str, Any], previous: Optional[Dict[str, Any]]) -> None:
+        resource_id = resource["id"]
+        self._patient_order.setdefault(resource_id, len(self._patient_order))
+        if previous is not None:
+            for key in _patient_keys(previous):
+                self._by_demographic.get(key, set()).discard(resource_id)
+        for key in _patient_keys(resource):
+            self._by_demographic.setdefault(key, set()).add(resource_id)
+
+    def _patient_candidate_ids(self, filters: SearchParams) -> Optional[Set[str]]:
+        """Ids that can match the indexed demographic filters (None if no filter is indexed)."""
+        candidates: Optional[Set[str]] = None
+        for key, raw_value in filters.items():
+            name, _, modifier = key.partition(":")
+            for value in _as_list(raw_value):
+                alternatives = value.split(",")
+                if name == "birthdate" and not modifier and len(alternatives) == 1:
+                    prefix, day = _split_prefix(value)
+                    if prefix != "eq" or len(day) != 10:
+                        continue
+                    keys = [("birthdate", day)]
+                elif name == "identifier" and not modifier:
+                    keys = [("identifier", alt.rpartition("|")[2]) for alt in alternatives]
+                elif name in PATIENT_NAME_PARAMS and modifier in ("", "exact"):
+                    keys = [(name, _normalize_text(alt)) for alt in alternatives]
+                else:
+                    continue
+                ids: Set[str] = set()
+                for index_key in keys:
+                    ids |= self._by_demographic.get(index_key, set())
+                candidates = ids if candidates is None else candidates & ids
+        return candidates
+
+    def _ensure_patient(self, patient_id: str) -> None:
+        path = self._pending.pop(patient_id, None)
+        if path is not None:
+            self.load_bundle(_read_json(path))
+
+    def _ensure_all(self) -> None:
+        for patient_id in list(self._pending):
+            self._ensure_patient(patient_id)
+
+    # --- CRUD ------------------------------------------------------------------
+
+    def read(self, resource_type: str, resource_id: str) -> Optional[Dict[str, Any]]:
+        """Return a resource by type and id, or None."""
+        if resource_type != "Patient" and resource_id not in self._resources.get(resource_type, {}):
+            self._ensure_all()
+        return self._resources.get(resource_type, {}).get(resource_id)
+
+    def create(self, resource: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Store a new resource, assigning an id and meta like HAPI does.
+
+        Args:
+            resource: Resource body from a POST
+
+        Returns:
+            The stored resource (with id and meta)
+        """
+        patient_id = patient_id_of(resource)
+        if patient_id:
+            self._ensure_patient(patient_id)
+        stored = dict(resource)
+        stored["id"] = str(self._next_id)
+        stored["meta"] = {"versionId": "1", "lastUpdated": self._clock().isoformat()}
+        self._index(stored)
+        return stored
+
+    def find_existing(self, resource_type: str, condition: str) -> Optional[Dict[str, Any]]:
+        """
+        Evaluate a conditional create (If-None-Exist) search.
+
+        Args:
+            resource_type: Type being created
+            condition: Search query string, e.g. "identifier=urn:sara:idempotency-key|abc"
+
+        Returns:
+            The single matching resource, or None when nothing matches
+
+        Raises:
+            SearchError: On an empty condition or unknown parameters
+            PreconditionError: If more than one resource matches
+        """
+        params = {k: v if len(v) > 1 else v[0] for k, v in parse_qs(condition).items()}
+        if not params:
+            raise SearchError("If-None-Exist must contain a search")
+        matches = self.match(resource_type, params)
+        if len(matches) > 1:
+            raise PreconditionError(
+                f"Conditional create matched {len(matches)} \"{resource_type}\" resources: {condition}")
+        return matches[0] if matches else None
+
+    def transaction(self, bundle: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Apply a transaction Bundle of POST entries all-or-nothing.
+
+        References to an entry's urn:uuid fullUrl are rewritten to the id it was
+        assigned, as HAPI does. Entries with request.ifNoneExist matching an
+        existing resource are not created again ("200 OK").
+
+        Args:
+            bundle: Bundle of type "transaction"
+
+        Returns:
+            Bundle of type "transaction-response"
+
+        Raises:
+            TransactionError: If any entry is invalid (no resource is created)
+        """
+        if bundle.get("resourceType") != "Bundle" or bundle.get("type") != "transaction":
+            raise TransactionError("Expected a Bundle of type \"transaction\"")
+        entries = bundle.get("entry", [])
+        existing: List[Optional[Dict[str, Any]]] = []
+        for i, entry in enumerate(entries):
+            resource = entry.get("resource") or {}
+            request = entry.get("request") or {}
+            if request.get("method") != "POST":
+                raise TransactionError(f"Entry {i}: only POST is supported")
+            if request.get("url", "").split("?")[0] != resource.get("resourceType"):
+                raise TransactionError(
+                    f"Entry {i}: request.url \"{request.get('url')}\" does not match resource type "
+                    f"\"{resource.get('resourceType')}\"")
+            match = None
+            if request.get("ifNoneExist"):
+                try:
+                    match = self.find_existing(resource["resourceType"], request["ifNoneExist"])
+                except (SearchError, PreconditionError) as e:
+                    raise TransactionError(f"Entry {i}: {e}") from e
+            existing.append(match)
+
+        # Validated: assign ids, then resolve urn:uuid references between entries
+        assigned: Dict[str, str] = {}
+        stored = []
+        for entry, match in zip(entries, existing):
+            created = match if match is not None else self.create(entry["resource"])
+            stored.append(created)
+            if entry.get("fullUrl", "").startswith("urn:uuid:"):
+                assigned[entry["fullUrl"]] = f"{created['resourceType']}/{created['id']}"
+        if assigned:
+            for created, match in zip(stored, existing):
+                if match is None:
+                    _replace_references(created, assigned)
+
+        return {
+            "resourceType": "Bundle",
+            "type": "transaction-response",
+            "entry": [
+                {"response": {
+                    "status": "201 Created" if match is None else "200 OK",
+                    "location": f"{r['resourceType']}/{r['id']}/_history/{r.get('meta', {}).get('versionId', '1')}",
+                    "lastModified": r.get("meta", {}).get("lastUpdated"),
+                }}
+                for r, match in zip(stored, existing)
+            ],
+        }
+
+    def count(self, resource_type: Optional[str] = None) -> int:
+        """Number of loaded resources (of one type, or in total)."""
+        if resource_type:
+            return len(self._resources.get(resource_type, {}))
+        return sum(len(v) for v in self._resources.values())
+
+    # --- Search ----------------------------------------------------------------
+
+    def search(self, resource_type: str, params: SearchParams) -> Dict[str, Any]:
+        """
+        Run a FHIR search and return a searchset Bundle.
+
+        Args:
+            resource_type: e.g. "Observation"
+            params: Query parameters; repeated parameters may be given as lists
+
+        Returns:
+            FHIR Bundle of type "searchset"
+
+        Raises:
+            SearchError: On unknown parameters or malformed values
+        """
+        matches = self.match(resource_type, params)
+        matches = self._sort(resource_type, matches, params.get("_sort"))
+
+        total = len(matches)
+        if _first(params.get("_summary", "")) == "count":
+            return self._bundle(resource_type, params, [], total, 0, 0)
+
+        count = self._int_param(params, "_count", self.page_size)
+        count = max(0, min(count, self.max_page_size))
+        offset = self._int_param(params, "_offset", self._int_param(params, "_getpagesoffset", 0))
+        page = matches[offset:offset + count]
+
+        elements = params.get("_elements")
+        if elements:
+            fields = [f for value in _as_list(elements) for f in value.split(",")]
+            page = [project_elements(r, fields) for r in page]
+        return self._bundle(resource_type, params, page, total, offset, count)
+
+    def match(self, resource_type: str, params: SearchParams) -> List[Dict[str, Any]]:
+        """
+        Return every resource of a type matching the search filters (unsorted, unpaged).
+
+        Raises:
+            SearchError: On unknown parameters or malformed values
+        """
+        filters = {k: v for k, v in params.items() if k not in RESULT_PARAMS}
+        for key in filters:
+            if not self.supports(resource_type, key):
+                raise SearchError(f"Unknown search parameter \"{key}\" for resource type \"{resource_type}\"")
+
+        candidates = self._candidates(resource_type, filters)
+        return [r for r in candidates if self._matches(resource_type, r, filters)]
+
+    def supports(self, resource_type: str, param: str) -> bool:
+        """Whether a search parameter (with optional :modifier) can be evaluated exactly as HAPI does."""
+        name, _, modifier = param.partition(":")
+        if name in RESULT_PARAMS or name in ("_id", "_lastUpdated"):
+            return not modifier
+        definition = SEARCH_PARAMS.get(resource_type, {}).get(name)
+        if definition is None:
+            return False
+        return not modifier or (definition[0] == "string" and modifier in ("exact", "contains"))
+
+    def _candidates(self, resource_type: str, filters: SearchParams) -> Iterable[Dict[str, Any]]:
+        by_id = self._resources.get(resource_type, {})
+        patient = filters.get("patient") or filters.get("subject")
+        if patient and resource_type != "Patient":
+            ids: List[str] = []
+            for value in _first(patient).split(","):
+                patient_id = _normalize_reference(value)
+                self._ensure_patient(patient_id)
+                ids.extend(self._by_patient.get((resource_type, patient_id), []))
+            by_id = self._resources.get(resource_type, {})
+            return [by_id[i] for i in ids]
+
+        if resource_type == "Patient":
+            ids = self._patient_candidate_ids(filters)
+            if ids is not None:
+                # Exact matching still runs on these; the index only skips patients that cannot match
+                return [by_id[i] for i in sorted(ids, key=self._patient_order.__getitem__) if i in by_id]
+        else:
+            self._ensure_all()
+            by_id = self._resources.get(resource_type, {})
+        code = filters.get("code")
+        if code:
+            ids_set: Set[str] = set()
+            for alternative in _first(code).split(","):
+                ids_set |= self._by_code.get((resource_type, alternative.rpartition("|")[2]), set())
+            return [by_id[i] for i in by_id if i in ids_set]
+        return list(by_id.values())
+
+    def _matches(self, resource_type: str, resource: Dict[str, Any], filters: SearchParams) -> bool:
+        for key, raw_value in filters.items():
+            name, _, modifier = key.partition(":")
+            for value in _as_list(raw_value):
+                if not self._param_matches(resource_type, resource, name, modifier, value):
+                    return False
+        return True
+
+    def _param_matches(self, resource_type: str, resource: Dict[str, Any], name: str, modifier: str, value: str) -> bool:
+        if name == "_id":
+            return resource.get("id") in value.split(",")
+        if name == "_lastUpdated":
+            kind, paths = "date", ("meta.lastUpdated",)
+        elif name in SEARCH_PARAMS.get(resource_type, {}):
+            kind, paths = SEARCH_PARAMS[resource_type][name]
+        else:
+            raise SearchError(f"Unknown search parameter \"{name}\" for resource type \"{resource_type}\"")
+        if kind == "reference":
+            wanted = {_normalize_reference(v) for v in value.split(",")}
+            return patient_id_of(resource) in wanted
+        if kind == "date":
+            prefix, date_value = _split_prefix(value)
+            try:
+                target = parse_date_range(date_value)
+            except ValueError:
+                raise SearchError(f"Invalid date/time format: \"{value}\"")
+            return _date_matches(_resource_date_ranges(resource, paths), prefix, target)
+        if kind == "string":
+            return _string_matches(resource, name, modifier, value)
+        return _token_matches(resource, paths, value)
+
+    def _sort(self, resource_type: str, resources: List[Dict[str, Any]],
+              sort: Optional[Union[str, List[str]]]) -> List[Dict[str, Any]]:
+        if not sort:
+            return resources
+        keys = [k.strip() for k in _first(sort).split(",") if k.strip()]
+        for key in reversed(keys):
+            descending = key.startswith("-")
+            name = key.lstrip("-")
+            if name == "_id":
+                paths: Optional[Tuple[str, ...]] = None
+            elif name == "_lastUpdated":
+                paths = ("meta.lastUpdated",)
+            else:
+                kind, paths = SEARCH_PARAMS.get(resource_type, {}).get(name, ("", ()))
+                if kind != "date":
+                    raise SearchError(f"Unknown sort parameter \"{name}\" for resource type \"{resource_type}\"")
+            resources = sorted(resources, key=lambda r: self._sort_key(r, paths), reverse=descending)
+        return resources
+
+    @staticmethod
+    def _sort_key(resource: Dict[str, Any], paths: Optional[Tuple[str, ...]]) -> Tuple[int, Any]:
+        if paths is None:
+            resource_id = resource.get("id", "")
+            return (0, (int(resource_id), "") if resource_id.isdigit() else (0, resource_id))
+        ranges = _resource_date_ranges(resource, paths)
+        # Resources without a value sort before dated ones (after them with "-")
+        return (1, ranges[0][0]) if ranges else (0, datetime.min.replace(tzinfo=timezone.utc))
+
+    @staticmethod
+    def _int_param(params: SearchParams, name: str, default: int) -> int:
+        if name not in params:
+            return default
+        try:
+            return int(_first(params[name]))
+        except ValueError:
+            raise SearchError(f"Invalid {name} value: \"{_first(params[name])}\"")
+
+    def _bundle(self, resource_type: str, params: SearchParams, page: List[Dict[str, Any]],
+                total: int, offset: int, count: int) -> Dict[str, Any]:
+        query = [(k, v) for k, values in params.items() if k not in ("_offset", "_getpagesoffset")
+                 for v in _as_list(values)]
+        links = [{"relation": "self", "url": f"{self.base_url}/{resource_type}?{urlencode(query)}".rstrip("?")}]
+        if count and offset + count < total:
+            next_query = [(k, v) for k, v in query if k != "_count"] + [("_count", str(count)), ("_offset", str(offset + count))]
+            links.append({"relation": "next", "url": f"{self.base_url}/{resource_type}?{urlencode(next_query)}"})
+        bundle: Dict[str, Any] = {
+            "resourceType": "Bundle",
+            "id": str(uuid.uuid4()),
+            "meta": {"lastUpdated": self._clock().isoformat()},
+            "type": "searchset",
+            "total": total,
+            "link": links,
+        }
+        if page:
+            bundle["entry"] = [
+                {
+                    "fullUrl": f"{self.base_url}/{r['resourceType']}/{r['id']}",
+                    "resource": r,
+                    "search": {"mode": "match"},
+                }
+                for r in page
+            ]
+        return bundle
+
+    def everything(self, patient_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Return a Bundle with the Patient and every resource referencing it ($everything).
+
+        Returns:
+            Bundle of type "searchset", or None if the patient does not exist
+        """
+        self._ensure_patient(patient_id)
+        patient = self._resources.get("Patient", {}).get(patient_id)
+        if patient is None:
+            return None
+        resources = [patient]
+        for (resource_type, owner), ids in self._by_patient.items():
+            if owner == patient_id and resource_type != "Patient":
+                resources.extend(self._resources[resource_type][i] for i in ids)
+        return self._bundle(f"Patient/{patient_id}/$everything", {}, resources, len(resources), 0, len(resources))
+
+
+def _replace_references(element: Any, assigned: Dict[str, str]) -> None:
+    """Rewrite {"reference": "urn:uuid:..."} values in place."""
+    if isinstance(element, dict):
+        reference = element.get("reference")
+        if isinstance(reference, str) and reference in assigned:
+            element["reference"] = assigned[reference]
+        for value in element.values():
+            _replace_references(value, assigned)
+    elif isinstance(element, list):
+        for value in element:
+            _replace_references(value, assigned)
+
+
+def _read_json(path: Path) -> Dict[str, Any]:
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
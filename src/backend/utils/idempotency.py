@@ -0,0 +1,88 @@
+"""
+Idempotent FHIR Creates for Sara
+
+A POST that times out may still have been applied, so retrying it can create a
+duplicate MedicationRequest. Each agent POST therefore carries a deterministic
+idempotency key derived from the run, the round and the request. The key is
+stamped on the resource as an identifier and sent as a FHIR conditional create
+(If-None-Exist: identifier=urn:sara:idempotency-key|<key>), so a retried POST
+returns the resource created by the first attempt instead of creating another.
+
+The identifier is stored with the resource, so keyed creates are opt-in:
+enable with FHIR_IDEMPOTENT_POSTS=1.
+"""
+
+import copy
+import hashlib
+import json
+from typing import Any, Dict, Optional
+from urllib.parse import urlencode
+
+from src.backend.utils.env import env_flag
+
+IDEMPOTENCY_SYSTEM = "urn:sara:idempotency-key"
+
+
+def idempotency_key(session: str, round_num: int, endpoint: str, body: Any) -> str:
+    """
+    Derive the idempotency key of a create.
+
+    Args:
+        session: Identifier of the agent run
+        round_num: Agent round issuing the POST
+        endpoint: FHIR endpoint path (e.g., "/fhir/MedicationRequest")
+        body: JSON body of the POST
+
+    Returns:
+        Hex digest; identical inputs always give the same key
+    """
+    canonical = json.dumps(body, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    material = "\n".join((session, str(round_num), endpoint, canonical))
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()[:32]
+
+
+def action_key(session: str, round_num: int, action: Any) -> Optional[str]:
+    """
+    Idempotency key of a parsed POST or TRANSACTION action.
+
+    Args:
+        session: Identifier of the agent run
+        round_num: Agent round that produced the action
+        action: Parsed Action (any object with type, endpoint, body and entries)
+
+    Returns:
+        Key, or None for actions that do not write
+    """
+    kind = getattr(action.type, "value", action.type)
+    if kind == "POST":
+        return idempotency_key(session, round_num, action.endpoint, action.body)
+    if kind == "TRANSACTION":
+        body = [[entry.endpoint, entry.body] for entry in action.entries]
+        return idempotency_key(session, round_num, "transaction", body)
+    return None
+
+
+def can_carry_key(body: Any) -> bool:
+    """Whether a POST body is a resource the key can be stamped on (identifier absent or a list)."""
+    return isinstance(body, dict) and isinstance(body.get("identifier", []), list)
+
+
+def with_idempotency_key(body: Dict[str, Any], key: str) -> Dict[str, Any]:
+    """Return a copy of a resource carrying the key as an identifier (bodies that cannot carry it are returned as is)."""
+    if not can_carry_key(body):
+        return body
+    stamped = copy.deepcopy(body)
+    identifiers = stamped.setdefault("identifier", [])
+    if not any(i.get("system") == IDEMPOTENCY_SYSTEM for i in identifiers if isinstance(i, dict)):
+        identifiers.append({"system": IDEMPOTENCY_SYSTEM, "value": key})
+    return stamped
+
+
+def if_none_exist(key: str) -> str:
+    """Conditional-create search matching the resource stamped with key."""
+    return urlencode({"identifier": f"{IDEMPOTENCY_SYSTEM}|{key}"})
+
+
+def idempotency_enabled(var: str = "FHIR_IDEMPOTENT_POSTS", default: bool = False) -> bool:
+    """Whether idempotent POSTs are switched on by an environment variable."""
+    return env_flag(var, default)
@@ -0,0 +1,265 @@
+"""
+Streaming FHIR JSON Decoder for Sara
+
+response.json() holds the whole body as bytes, then as text, then as objects.
+For large Observation histories that is several copies per round in an agent
+container shared by many sessions. BundleDecoder is fed the response body chunk
+by chunk instead: top-level fields are decoded as they complete, and Bundle
+entries are decoded one at a time, compacted (narrative dropped) and kept, so
+only the decoded entries and one partial entry are ever in memory.
+
+StreamLimits caps what one response may hold. A Bundle that exceeds the entry or
+byte cap is cut short, reading stops, and the Bundle is tagged SUBSETTED (the FHIR
+marker for incomplete resources). Other documents over the byte cap are rejected.
+
+Dropping narratives and cutting Bundles short change what the model sees, so
+streaming decode is opt-in for benchmark parity: enable with FHIR_STREAM_DECODE=1.
+"""
+
+import codecs
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from src.backend.utils.env import env_flag
+
+SUBSETTED_TAG = {"system": "http://terminology.hl7.org/CodeSystem/v3-ObservationValue", "code": "SUBSETTED"}
+
+# Buffer text is trimmed once this much of it has been consumed
+_TRIM_AT = 64 * 1024
+_WHITESPACE = " \t\n\r"
+# A token cut off by a chunk boundary fails to decode at most this far from the end
+# of the buffer ("\\u12", "fals", "1e+"); an error further back is malformed JSON
+_PARTIAL_TOKEN = 6
+
+
+@dataclass(frozen=True)
+class StreamLimits:
+    """Per-response caps applied while decoding."""
+    max_entries: int = 5000
+    max_bytes: int = 16 * 1024 * 1024  # body bytes read
+    max_entry_bytes: int = 1024 * 1024  # a single entry (or top-level field) still being decoded
+    drop_elements: Tuple[str, ...] = ("text",)  # removed from every entry's resource
+
+
+class _Incomplete:
+    """Marker for a value that continues in the next chunk."""
+
+
+_INCOMPLETE = _Incomplete()
+
+
+class BundleDecoder:
+    """
+    Incremental decoder for a FHIR JSON response body.
+
+    Usage:
+        decoder = BundleDecoder(StreamLimits(max_entries=1000))
+        for chunk in chunks:
+            if not decoder.feed(chunk):
+                break  # limits reached, stop reading
+        bundle = decoder.close()
+    """
+
+    def __init__(self, limits: Optional[StreamLimits] = None):
+        """
+        Initialize the decoder.
+
+        Args:
+            limits: Caps on entries and bytes (defaults to StreamLimits())
+        """
+        self.limits = limits or StreamLimits()
+        self.bytes_read = 0
+        self.truncated = False
+        self.done = False
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._state = "start"
+        self._key: Optional[str] = None
+        self._final = False
+        self._raw: Optional[List[str]] = None  # documents that are not objects are decoded whole
+        self._fields: Dict[str, Any] = {}
+        self._entries: Optional[List[Dict[str, Any]]] = None
+
+    def feed(self, chunk: bytes) -> bool:
+        """
+        Consume the next chunk of the body.
+
+        Args:
+            chunk: Raw (already content-decoded) body bytes
+
+        Returns:
+            False once no more input is needed (document complete or limits reached)
+
+        Raises:
+            ValueError: On malformed JSON or a non-Bundle body over the byte cap
+        """
+        self.bytes_read += len(chunk)
+        text = self._text.decode(chunk)
+        if self._raw is not None:
+            self._raw.append(text)
+        else:
+            self._buf += text
+            self._advance()
+        if self.bytes_read > self.limits.max_bytes and not self.done:
+            if self._state != "entries":
+                raise ValueError(f"Response exceeds {self.limits.max_bytes} bytes")
+            self.truncated = True
+        return not (self.done or self.truncated)
+
+    def close(self) -> Any:
+        """
+        Finish decoding.
+
+        Returns:
+            The decoded document; Bundles hold the kept entries
+
+        Raises:
+            ValueError: On malformed or incomplete JSON
+        """
+        tail = self._text.decode(b"", final=True)
+        self._final = True
+        if self._raw is not None:
+            return json.loads("".join(self._raw) + tail)
+        if not self.truncated:
+            self._buf += tail
+            self._advance()
+            if not self.done:
+                raise ValueError("Incomplete JSON document")
+
+        document = dict(self._fields)
+        if self._entries is not None:
+            document["entry"] = self._entries
+        if self.truncated:
+            meta = document.setdefault("meta", {})
+            meta["tag"] = meta.get("tag", []) + [SUBSETTED_TAG]
+        return document
+
+    def _advance(self) -> None:
+        """Decode every complete token in the buffer."""
+        while not (self.done or self.truncated):
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos >= len(self._buf):
+                break
+            char = self._buf[self._pos]
+            state = self._state
+
+            if state == "start":
+                if char != "{":
+                    self._raw = [self._buf[self._pos:]]
+                    self._buf, self._pos = "", 0
+                    return
+                self._pos += 1
+                self._state = "key"
+            elif state == "key":
+                if char == ",":
+                    self._pos += 1
+                elif char == "}":
+                    self._pos += 1
+                    self.done = True
+                else:
+                    key = self._decode()
+                    if key is _INCOMPLETE:
+                        break
+                    self._key = key
+                    self._state = "colon"
+            elif state == "colon":
+                if char != ":":
+                    raise ValueError(f"Expected ':' at offset {self._pos}")
+                self._pos += 1
+                self._state = "value"
+            elif state == "value":
+                if self._key == "entry" and char == "[":
+                    self._pos += 1
+                    self._entries = []
+                    self._state = "entries"
+                    continue
+                value = self._decode()
+                if value is _INCOMPLETE:
+                    break
+                self._fields[self._key] = value
+                self._state = "key"
+            elif state == "entries":
+                if char == ",":
+                    self._pos += 1
+                elif char == "]":
+                    self._pos += 1
+                    self._state = "key"
+                else:
+                    entry = self._decode()
+                    if entry is _INCOMPLETE:
+                        break
+                    self._keep(entry)
+
+        if self._pos >= _TRIM_AT or self._pos == len(self._buf):
+            self._buf, self._pos = self._buf[self._pos:], 0
+        if len(self._buf) > self.limits.max_entry_bytes and not self.truncated:
+            if self._state != "entries":
+                raise ValueError(f"A field of the response exceeds {self.limits.max_entry_bytes} bytes")
+            self.truncated = True
+
+    def _decode(self) -> Any:
+        """Decode the value at the current position, or _INCOMPLETE if it is not all here."""
+        try:
+            value, end = self._json.raw_decode(self._buf, self._pos)
+        except json.JSONDecodeError as e:
+            cut_off = e.msg.startswith("Unterminated string") or len(self._buf) - e.pos <= _PARTIAL_TOKEN
+            if self._final or not cut_off:
+                raise
+            return _INCOMPLETE
+        if end >= len(self._buf) and not self._final:
+            # A number at the end of the buffer may continue in the next chunk
+            return _INCOMPLETE
+        self._pos = end
+        return value
+
+    def _keep(self, entry: Any) -> None:
+        if len(self._entries) >= self.limits.max_entries:
+            self.truncated = True
+            return
+        resource = entry.get("resource") if isinstance(entry, dict) else None
+        if isinstance(resource, dict):
+            for name in self.limits.drop_elements:
+                resource.pop(name, None)
+        self._entries.append(entry)
+
+
+async def read_json(response: httpx.Response, limits: Optional[StreamLimits] = None) -> Tuple[Any, int]:
+    """
+    Decode a streamed httpx response with a BundleDecoder.
+
+    Args:
+        response: Response opened with client.stream(...)
+        limits: Caps on entries and bytes
+
+    Returns:
+        (decoded document, body bytes read)
+
+    Raises:
+        ValueError: On malformed JSON or a non-Bundle body over the byte cap
+    """
+    decoder = BundleDecoder(limits)
+    async for chunk in response.aiter_bytes():
+        if not decoder.feed(chunk):
+            break
+    return decoder.close(), decoder.bytes_read
+
+
+def limits_from_env(var: str = "FHIR_STREAM_DECODE", default: bool = False) -> Optional[StreamLimits]:
+    """
+    Build stream limits switched on or off by an environment variable.
+
+    Args:
+        var: Environment variable name ("1" enables streaming decode)
+        default: Setting used when the variable is unset
+
+    Returns:
+        StreamLimits, or None when responses are decoded whole
+    """
+    enabled = env_flag(var, default)
+    return StreamLimits() if enabled else None
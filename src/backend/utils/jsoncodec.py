@@ -0,0 +1,56 @@
+"""
+JSON Codec for Sara
+
+One place for JSON encoding/decoding on the agent's hot path. Uses orjson when
+it is installed (an order of magnitude faster than the json module for the
+indent=2 dumps of FHIR Bundles that go into the prompt) and falls back to the
+standard library otherwise.
+
+The pretty form is the prompt format and matches json.dumps(obj, indent=2)
+character for character, \\u escapes included, so prompts stay as MedAgentBench
+builds them. The compact form is for the event stream: no whitespace, and
+non-ASCII characters written as UTF-8.
+"""
+
+import json
+import re
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+_NON_ASCII = re.compile(r"[^\x00-\x7f]")
+
+
+def dumps(obj: Any, indent: bool = False) -> str:
+    """
+    Serialize to JSON text.
+
+    Args:
+        obj: JSON-compatible value
+        indent: Pretty-print as json.dumps(obj, indent=2) does (the prompt format);
+            otherwise compact, for the event stream
+
+    Returns:
+        JSON text
+    """
+    if orjson is not None:
+        if not indent:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+        text = orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_INDENT_2).decode("utf-8")
+        # Non-ASCII characters only occur inside strings; escape them as the json module does
+        return text if text.isascii() else _NON_ASCII.sub(lambda m: json.dumps(m.group())[1:-1], text)
+    if indent:
+        return json.dumps(obj, indent=2)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """Parse JSON text or UTF-8 bytes."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -0,0 +1,250 @@
+"""
+Prometheus-Style Metrics for Sara
+
+A small, dependency-free implementation of counters, gauges and histograms
+rendered in the Prometheus text exposition format, served from /metrics by the
+agent and model services. It only imports the standard library, so it adds no
+dependency to either container image.
+
+On the agent, SpanMetrics turns finished tracing spans into histograms (model
+call latency, FHIR latency by resource type, task duration, rounds per task), so
+what is timed for traces is also aggregated for capacity planning. Gauges can
+take a callback that is read at scrape time (active sessions, cache hit ratios).
+
+Usage:
+    registry = Registry()
+    latency = registry.histogram("sara_model_ttft_seconds", "Time to first token")
+    latency.observe(0.42)
+    text = registry.render()  # served with CONTENT_TYPE
+"""
+
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+from urllib.parse import urlparse
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds: sub-millisecond FHIR cache hits up to multi-minute cold starts
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+ROUND_BUCKETS = (1, 2, 3, 4, 5, 6, 7, 8)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 400)  # tokens/s
+
+LabelValues = Tuple[str, ...]
+GaugeCallback = Callable[[], Union[float, Dict[LabelValues, float]]]
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, set directly or read from a callback at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 callback: Optional[GaugeCallback] = None):
+        super().__init__(name, help_text, labelnames)
+        self.callback = callback
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: str) -> float:
+        return self._snapshot().get(self._key(labels), 0.0)
+
+    def _snapshot(self) -> Dict[LabelValues, float]:
+        if self.callback is None:
+            with self._lock:
+                return dict(self._values)
+        result = self.callback()
+        return result if isinstance(result, dict) else {(): float(result)}
+
+    def render(self) -> List[str]:
+        items = sorted(self._snapshot().items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+
+class Histogram(_Metric):
+    """Distribution of observations in cumulative buckets, with sum and count."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelValues, List[float]] = {}  # bucket counts..., sum, count
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels: str) -> float:
+        series = self._series.get(self._key(labels))
+        return series[-1] if series else 0.0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        lines = self.header()
+        for key, series in items:
+            for bound, count in zip(self.buckets + (math.inf,), series[:-2] + [series[-1]]):
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {_format_value(count)}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {_format_value(series[-1])}")
+        return lines
+
+
+class Registry:
+    """Named metrics rendered together."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _add(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+              callback: Optional[GaugeCallback] = None) -> Gauge:
+        return self._add(Gauge(name, help_text, labelnames, callback))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text format."""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def resource_type(endpoint: str) -> str:
+    """FHIR resource type of a request endpoint ("" for the server root, e.g. a transaction)."""
+    segments = [segment for segment in urlparse(endpoint).path.split("/") if segment]
+    if "fhir" in segments:
+        segments = segments[segments.index("fhir") + 1:]
+    return segments[0] if segments else ""
+
+
+def hit_ratio(hits: float, misses: float) -> float:
+    """Hits over all lookups (0 before the first lookup)."""
+    total = hits + misses
+    return hits / total if total else 0.0
+
+
+class SpanMetrics:
+    """
+    Span exporter aggregating agent spans into histograms.
+
+    Register it on the agent's tracer with tracer.add_exporter(SpanMetrics(registry)).
+    """
+
+    def __init__(self, registry: Registry):
+        self.model_call = registry.histogram(
+            "sara_agent_model_call_seconds", "Model call latency seen by the agent (time to full response)")
+        self.fhir = registry.histogram(
+            "sara_agent_fhir_request_seconds", "FHIR request latency by method and resource type",
+            ("method", "resource_type"))
+        self.phase = registry.histogram(
+            "sara_agent_phase_seconds", "Agent-side processing time per round", ("phase",))
+        self.task = registry.histogram(
+            "sara_agent_task_seconds", "End-to-end task duration", ("outcome",))
+        self.rounds = registry.histogram(
+            "sara_agent_rounds_per_task", "Model rounds per task", ("outcome",), buckets=ROUND_BUCKETS)
+
+    def export(self, span) -> None:
+        seconds = span.duration_ms / 1000
+        name = span.name
+        if name == "model.call":
+            self.model_call.observe(seconds)
+        elif name.startswith("fhir."):
+            self.fhir.observe(seconds, method=name[5:].upper(),
+                              resource_type=resource_type(span.attributes.get("endpoint", "")))
+        elif name in ("agent.parse", "agent.format"):
+            self.phase.observe(seconds, phase=name[6:])
+        elif "outcome" in span.attributes and "rounds" in span.attributes:
+            # Task root spans (http.run, batch.task) carry their outcome and round count
+            outcome = span.attributes["outcome"]
+            self.task.observe(seconds, outcome=outcome)
+            self.rounds.observe(span.attributes["rounds"], outcome=outcome)
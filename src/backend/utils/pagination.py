@@ -0,0 +1,197 @@
+"""
+Bounded FHIR Bundle Pagination for Sara
+
+Follows link[rel=next] on searchset Bundles and merges the pages into a single
+Bundle, so the model sees the whole result instead of spending another round
+(a full prefill) asking for the next page.
+
+When the next link uses offset paging (HAPI's _getpagesoffset, or _offset) and the
+Bundle reports a total, the remaining page URLs are computed up front and fetched
+concurrently. Otherwise pages are followed one by one. Either way the merged
+Bundle stays within a PageBudget; if it is cut short, the next link of the first
+unfetched page is kept so the model can still ask for more.
+"""
+
+import asyncio
+import math
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+import httpx
+
+from src.backend.utils.env import env_flag
+
+# Query parameters carrying the page offset in next links
+OFFSET_PARAMS = ("_getpagesoffset", "_offset")
+
+
+@dataclass(frozen=True)
+class PageBudget:
+    """Limits on how much of a search result is fetched and merged."""
+    max_pages: int = 10  # including the first page
+    max_entries: int = 500  # checked per page, so the last page may overshoot it
+    max_bytes: int = 2 * 1024 * 1024
+    concurrency: int = 4
+
+
+def next_link(bundle: Dict[str, Any]) -> Optional[str]:
+    """Return the URL of a Bundle's next page, if any."""
+    for link in bundle.get("link", []):
+        if link.get("relation") == "next":
+            return link.get("url")
+    return None
+
+
+def _offset_template(url: str) -> Optional[Tuple[str, int, int]]:
+    """
+    Parse an offset-paged next link.
+
+    Returns:
+        (offset parameter name, offset, page size) or None if the link is not offset-based
+    """
+    params = dict(parse_qsl(urlparse(url).query))
+    for name in OFFSET_PARAMS:
+        if name in params and params.get("_count", "").isdigit() and params[name].isdigit():
+            return name, int(params[name]), int(params["_count"])
+    return None
+
+
+def _with_offset(url: str, name: str, offset: int) -> str:
+    parsed = urlparse(url)
+    query = [(k, str(offset) if k == name else v) for k, v in parse_qsl(parsed.query, keep_blank_values=True)]
+    return urlunparse(parsed._replace(query=urlencode(query)))
+
+
+class BundlePaginator:
+    """
+    Fetches and merges the remaining pages of a searchset Bundle.
+
+    Usage:
+        paginator = BundlePaginator(http_client, PageBudget(max_entries=200))
+        merged = await paginator.merge(first_bundle, first_size=len(response.content))
+    """
+
+    def __init__(self, client: httpx.AsyncClient, budget: Optional[PageBudget] = None):
+        """
+        Initialize the paginator.
+
+        Args:
+            client: HTTP client used for page requests (shares headers/timeouts with the caller)
+            budget: Limits on pages, entries and bytes
+        """
+        self.client = client
+        self.budget = budget or PageBudget()
+
+    async def merge(self, bundle: Dict[str, Any], first_size: int = 0) -> Dict[str, Any]:
+        """
+        Merge the pages following bundle into one Bundle.
+
+        Args:
+            bundle: First page as returned by the server
+            first_size: Size in bytes of the first page's response body
+
+        Returns:
+            Bundle with all fetched entries; the input is returned unchanged
+            when it has no next link
+        """
+        url = next_link(bundle)
+        if bundle.get("resourceType") != "Bundle" or not url:
+            return bundle
+
+        template = _offset_template(url)
+        if template is not None and isinstance(bundle.get("total"), int):
+            pages, remaining_url = await self._fetch_concurrent(url, template, bundle, first_size)
+        else:
+            pages, remaining_url = await self._fetch_sequential(url, bundle, first_size)
+
+        merged = {k: v for k, v in bundle.items() if k not in ("entry", "link")}
+        entries: List[Dict[str, Any]] = list(bundle.get("entry", []))
+        for page in pages:
+            entries.extend(page.get("entry", []))
+        links = [l for l in bundle.get("link", []) if l.get("relation") == "self"]
+        if remaining_url:
+            links.append({"relation": "next", "url": remaining_url})
+        if links:
+            merged["link"] = links
+        merged["entry"] = entries
+        return merged
+
+    async def _get(self, url: str) -> Optional[Tuple[Dict[str, Any], int]]:
+        try:
+            response = await self.client.get(url)
+        except httpx.RequestError:
+            return None
+        if response.status_code != 200:
+            return None
+        try:
+            return response.json(), len(response.content)
+        except ValueError:
+            return None
+
+    def _room(self, entries: int, size: int, pages: int) -> bool:
+        budget = self.budget
+        return pages < budget.max_pages and entries < budget.max_entries and size < budget.max_bytes
+
+    async def _fetch_sequential(self, url: str, first: Dict[str, Any],
+                                first_size: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        pages: List[Dict[str, Any]] = []
+        entries, size = len(first.get("entry", [])), first_size
+        while url and self._room(entries, size, len(pages) + 1):
+            fetched = await self._get(url)
+            if fetched is None:
+                break
+            page, page_size = fetched
+            pages.append(page)
+            entries += len(page.get("entry", []))
+            size += page_size
+            url = next_link(page)
+        return pages, url
+
+    async def _fetch_concurrent(self, url: str, template: Tuple[str, int, int], first: Dict[str, Any],
+                                first_size: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        name, offset, count = template
+        total = first["total"]
+        budget = self.budget
+        # Plan pages from the entry budget; the byte budget is enforced once they arrive
+        already = len(first.get("entry", []))
+        wanted = min(total, budget.max_entries) - already
+        n_pages = max(0, min(math.ceil(wanted / count) if count else 0, budget.max_pages - 1))
+        offsets = [offset + i * count for i in range(n_pages)]
+
+        semaphore = asyncio.Semaphore(budget.concurrency)
+
+        async def fetch(page_offset: int):
+            async with semaphore:
+                return await self._get(_with_offset(url, name, page_offset))
+
+        results = await asyncio.gather(*(fetch(o) for o in offsets))
+
+        pages: List[Dict[str, Any]] = []
+        size = first_size
+        next_offset = offset
+        for fetched in results:
+            # Stop at the first failure or once the byte budget is spent, keeping pages in order
+            if fetched is None or size >= budget.max_bytes:
+                break
+            page, page_size = fetched
+            pages.append(page)
+            size += page_size
+            next_offset += count
+        remaining_url = _with_offset(url, name, next_offset) if next_offset < total else None
+        return pages, remaining_url
+
+
+def budget_from_env(var: str = "FHIR_PAGINATE", default: bool = False) -> Optional[PageBudget]:
+    """
+    Build a page budget switched on or off by an environment variable.
+
+    Args:
+        var: Environment variable name ("0", "false", "off" disable pagination)
+        default: Setting used when the variable is unset
+
+    Returns:
+        PageBudget, or None when pagination is disabled
+    """
+    enabled = env_flag(var, default)
+    return PageBudget() if enabled else None
@@ -4,6 +4,7 @@ Sara Action Parser
 Parses Sara's model output to determine what action to take:
 - GET: Read from FHIR server
 - POST: Write to FHIR server
+- TRANSACTION: Several POSTs in one response, submitted as one FHIR transaction
 - FINISH: Task complete with answer
 - UNKNOWN: Unrecognized output format
 """
@@ -12,7 +13,7 @@ import json
 import re
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import Any, Dict
+from typing import Any, Dict, List
 from urllib.parse import parse_qs, urlparse
 
 
@@ -20,6 +21,7 @@ class ActionType(Enum):
     """Types of actions Sara can output."""
     GET = "GET"
     POST = "POST"
+    TRANSACTION = "TRANSACTION"
     FINISH = "FINISH"
     UNKNOWN = "UNKNOWN"
 
@@ -33,6 +35,7 @@ class Action:
     body: Dict[str, Any] = field(default_factory=dict)
     answer: str = ""
     raw_content: str = ""
+    entries: List["Action"] = field(default_factory=list)  # POST actions of a TRANSACTION
 
 
 def parse_action(content: str) -> Action:
@@ -65,6 +68,11 @@ def parse_action(content: str) -> Action:
     if get_action:
         return get_action
 
+    # Try to parse several POST blocks (must start with POST)
+    transaction_action = _parse_transaction(content)
+    if transaction_action:
+        return transaction_action
+
     # Try to parse POST action (must start with POST)
     post_action = _parse_post(content)
     if post_action:
@@ -143,6 +151,33 @@ def _parse_post(content: str) -> Action | None:
         return None
 
 
+def _parse_transaction(content: str) -> Action | None:
+    """
+    Parse two or more POST blocks into a TRANSACTION action.
+
+    Format:
+        POST http://localhost:8080/fhir/MedicationRequest
+        {JSON body}
+        POST http://localhost:8080/fhir/ServiceRequest
+        {JSON body}
+
+    Every block must parse; otherwise no action is returned.
+    """
+    content = content.strip()
+    starts = [m.start() for m in re.finditer(r'^POST\s+https?://\S+\s*$', content, re.MULTILINE)]
+    if len(starts) < 2 or starts[0] != 0:
+        return None
+
+    entries = []
+    for start, end in zip(starts, starts[1:] + [len(content)]):
+        post_action = _parse_post(content[start:end])
+        if post_action is None:
+            return None
+        entries.append(post_action)
+
+    return Action(type=ActionType.TRANSACTION, entries=entries)
+
+
 def _parse_finish(content: str) -> Action | None:
     """
     Parse a FINISH action from content.
@@ -0,0 +1,170 @@
+"""
+Warm Patient Demographic Index for Sara
+
+Patient lookups (task family 1: "What's the MRN of the patient with name X and
+DOB Y?") are string searches that HAPI evaluates against H2 on every call. The
+agent service instead loads every Patient once at startup into a Patient-only
+FHIRStore and answers Patient searches from memory. The store keeps dict
+indexes from birthdate, identifier value and normalized name prefix to
+patient ids, so a lookup only runs exact matching on the patients it can
+match. Full resources are kept so answers are the same Bundles HAPI returns.
+A background loop pulls changes incrementally with _lastUpdated; writes made
+through the agent are applied (and reindexed) by apply_write.
+
+The index is opt-in (FHIR_PATIENT_INDEX=1) for benchmark parity: answers come
+from the in-memory store's search semantics rather than HAPI's.
+
+Searches the index cannot answer exactly (unsupported parameters or modifiers,
+or an index that has not synced recently) return None so the caller falls back
+to the FHIR server. Deleted Patients are not detected by _lastUpdated; the
+MedAgentBench workflows never delete them.
+"""
+
+import asyncio
+import logging
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+import httpx
+
+from src.backend.utils.env import env_flag
+from src.backend.utils.fhir_store import FHIRStore, SearchError
+from src.backend.utils.pagination import BundlePaginator, PageBudget, next_link
+
+logger = logging.getLogger(__name__)
+
+REFRESH_INTERVAL = 60.0  # seconds between incremental syncs
+MAX_STALENESS = 300.0  # stop answering if the last successful sync is older than this
+SYNC_PAGE_SIZE = 500
+SYNC_BUDGET = PageBudget(max_pages=1000, max_entries=1_000_000, max_bytes=1024 * 1024 * 1024)
+
+
+def _server_time(response: httpx.Response) -> str:
+    """Server clock from the Date header, falling back to local time minus a margin."""
+    date = response.headers.get("date")
+    if date:
+        try:
+            return parsedate_to_datetime(date).isoformat()
+        except (TypeError, ValueError):
+            pass
+    return time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(time.time() - 1))
+
+
+class PatientIndex:
+    """
+    In-memory copy of all Patient resources that answers Patient searches.
+
+    Usage:
+        index = PatientIndex(http_client, "http://localhost:8080/fhir")
+        await index.sync()  # or: asyncio.create_task(index.run())
+        bundle = index.search({"name": "Peter", "birthdate": "1932-12-29"})
+        if bundle is None:
+            ...  # not answerable locally, query the server
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        fhir_base: str,
+        refresh_interval: float = REFRESH_INTERVAL,
+        max_staleness: float = MAX_STALENESS,
+    ):
+        """
+        Initialize an empty index.
+
+        Args:
+            client: HTTP client used for sync requests
+            fhir_base: FHIR base URL (e.g. "http://localhost:8080/fhir")
+            refresh_interval: Seconds between incremental syncs in run()
+            max_staleness: Seconds after the last successful sync during which search() answers
+        """
+        self.client = client
+        self.fhir_base = fhir_base.rstrip("/")
+        self.refresh_interval = refresh_interval
+        self.max_staleness = max_staleness
+        self.store = FHIRStore(base_url=self.fhir_base)
+        self.synced_at: Optional[str] = None  # server clock of the last successful sync
+        self._synced_monotonic: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self.stats = {"syncs": 0, "hits": 0, "fallbacks": 0}
+
+    @property
+    def ready(self) -> bool:
+        """Whether the index has synced recently enough to answer searches."""
+        return (self._synced_monotonic is not None
+                and time.monotonic() - self._synced_monotonic < self.max_staleness)
+
+    async def sync(self) -> int:
+        """
+        Load all Patients on the first call, then only those updated since the last sync.
+
+        Returns:
+            Number of Patients loaded or updated
+
+        Raises:
+            httpx.HTTPError: If the server request fails
+            RuntimeError: If the result could not be fetched completely
+        """
+        async with self._lock:
+            params = {"_count": str(SYNC_PAGE_SIZE)}
+            if self.synced_at:
+                params["_lastUpdated"] = f"ge{self.synced_at}"
+            response = await self.client.get(f"{self.fhir_base}/Patient", params=params)
+            response.raise_for_status()
+            started_at = _server_time(response)
+            bundle = await BundlePaginator(self.client, SYNC_BUDGET).merge(response.json(), len(response.content))
+            if next_link(bundle):
+                raise RuntimeError("Patient sync did not fit the page budget")
+
+            loaded = self.store.load_bundle(bundle)
+            self.synced_at = started_at
+            self._synced_monotonic = time.monotonic()
+            self.stats["syncs"] += 1
+            return loaded
+
+    async def run(self) -> None:
+        """Sync forever: a full load, then incremental refreshes every refresh_interval."""
+        while True:
+            try:
+                loaded = await self.sync()
+                if loaded:
+                    logger.info("Patient index synced %d patients (%d total)", loaded, self.store.count("Patient"))
+            except (httpx.HTTPError, RuntimeError, ValueError) as e:
+                logger.warning("Patient index sync failed: %s", e)
+            await asyncio.sleep(self.refresh_interval)
+
+    def search(self, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Answer a Patient search from the index.
+
+        Args:
+            params: Query parameters
+
+        Returns:
+            searchset Bundle, or None if the search must go to the server
+        """
+        if not self.ready or not params:
+            return self._fallback()
+        if not all(self.store.supports("Patient", name) for name in params):
+            return self._fallback()
+        try:
+            bundle = self.store.search("Patient", params)
+        except SearchError:
+            return self._fallback()
+        self.stats["hits"] += 1
+        return bundle
+
+    def apply_write(self, resource: Dict[str, Any]) -> None:
+        """Reflect a Patient created or updated through the agent."""
+        if isinstance(resource, dict) and resource.get("resourceType") == "Patient" and resource.get("id"):
+            self.store.load_bundle({"resourceType": "Bundle", "entry": [{"resource": resource}]})
+
+    def _fallback(self) -> None:
+        self.stats["fallbacks"] += 1
+        return None
+
+
+def index_enabled(var: str = "FHIR_PATIENT_INDEX", default: bool = False) -> bool:
+    """Whether the Patient index is switched on by an environment variable."""
+    return env_flag(var, default)
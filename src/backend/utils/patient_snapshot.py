@@ -0,0 +1,197 @@
+"""
+Per-Patient FHIR Snapshots for Sara
+
+A MedAgentBench task usually touches one patient several times (Patient, then
+Observation, MedicationRequest, Condition...). In snapshot mode the first search
+scoped to a patient fetches Patient/{id}/$everything once, indexes it in an
+in-process FHIRStore, and answers that and every later search for the patient
+from the index with the same search semantics as the in-memory FHIR server.
+
+Searches the store cannot answer exactly (unsupported parameters, searches not
+scoped to a patient, incomplete $everything results) return None so the caller
+falls back to the upstream server. Writes are applied to the snapshot from the
+server's response, or drop it when the response does not carry the resource.
+"""
+
+import asyncio
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+from src.backend.utils.env import env_flag
+from src.backend.utils.fhir_store import FHIRStore, SearchError, patient_id_of
+from src.backend.utils.pagination import BundlePaginator, PageBudget, next_link
+
+# $everything for one MedAgentBench patient is at most a few thousand resources
+EVERYTHING_BUDGET = PageBudget(max_pages=100, max_entries=50000, max_bytes=64 * 1024 * 1024)
+EVERYTHING_PAGE_SIZE = 1000
+
+# Snapshot answers are not paged: the whole match is returned unless the model set _count
+SNAPSHOT_PAGE_SIZE = 1000
+
+# Search parameters that scope a search to one patient
+PATIENT_PARAMS = ("patient", "subject")
+
+
+def _patient_scope(path: str, params: Dict[str, Any]) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """Return (resource_type, resource_id, patient_id) for a path relative to the FHIR base."""
+    parts = [p for p in path.split("/") if p]
+    if not parts or len(parts) > 2:
+        return None, None, None
+    resource_type = parts[0]
+    if len(parts) == 2:
+        return resource_type, parts[1], parts[1] if resource_type == "Patient" else None
+    for name in PATIENT_PARAMS:
+        value = params.get(name)
+        if isinstance(value, str) and value:
+            return resource_type, None, value.rsplit("Patient/", 1)[-1]
+    if resource_type == "Patient" and isinstance(params.get("_id"), str):
+        return resource_type, None, params["_id"]
+    return resource_type, None, None
+
+
+class PatientSnapshots:
+    """
+    Lazily fetched, indexed $everything snapshots keyed by patient id.
+
+    Usage:
+        snapshots = PatientSnapshots(http_client, "http://localhost:8080/fhir")
+        bundle = await snapshots.search("Observation", {"patient": "S1", "code": "MG"})
+        if bundle is None:
+            ...  # not answerable locally, query the server
+    """
+
+    def __init__(self, client: httpx.AsyncClient, fhir_base: str, max_patients: int = 16):
+        """
+        Initialize the snapshot cache.
+
+        Args:
+            client: HTTP client used for $everything requests
+            fhir_base: FHIR base URL (e.g. "http://localhost:8080/fhir")
+            max_patients: Snapshots kept before the least recently used is dropped
+        """
+        self.client = client
+        self.fhir_base = fhir_base.rstrip("/")
+        self.max_patients = max_patients
+        self._stores: "OrderedDict[str, Optional[FHIRStore]]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.stats = {"fetches": 0, "hits": 0, "fallbacks": 0}
+
+    async def search(self, path: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Answer a read or search from the patient's snapshot.
+
+        Args:
+            path: Path relative to the FHIR base (e.g. "Observation" or "Patient/S1")
+            params: Query parameters
+
+        Returns:
+            Resource or searchset Bundle, or None if the request must go upstream
+        """
+        params = params or {}
+        resource_type, resource_id, patient_id = _patient_scope(path, params)
+        if patient_id is None or (resource_id is not None and params):
+            return self._fallback()
+
+        store = await self._snapshot(patient_id)
+        if store is None:
+            return self._fallback()
+
+        if resource_id is not None:
+            resource = store.read(resource_type, resource_id)
+            if resource is None:
+                return self._fallback()
+            self.stats["hits"] += 1
+            return resource
+        # Unsupported parameters (or modifiers) must go upstream rather than be approximated
+        if not all(store.supports(resource_type, name) for name in params):
+            return self._fallback()
+        try:
+            bundle = store.search(resource_type, params)
+        except SearchError:
+            return self._fallback()
+        self.stats["hits"] += 1
+        return bundle
+
+    def apply_write(self, resource: Dict[str, Any]) -> None:
+        """
+        Reflect a successful create/update in the affected snapshot.
+
+        Args:
+            resource: Resource as returned by the server (with id), or the request
+                body when the server returned no content
+        """
+        patient_id = patient_id_of(resource) if isinstance(resource, dict) else None
+        if patient_id is None:
+            # Cannot tell which snapshot changed
+            self._stores.clear()
+            return
+        store = self._stores.get(patient_id)
+        if store is None:
+            return
+        if resource.get("id") and resource.get("resourceType"):
+            store.load_bundle({"resourceType": "Bundle", "entry": [{"resource": resource}]})
+        else:
+            del self._stores[patient_id]
+
+    def _fallback(self) -> None:
+        self.stats["fallbacks"] += 1
+        return None
+
+    async def _snapshot(self, patient_id: str) -> Optional[FHIRStore]:
+        if patient_id in self._stores:
+            self._stores.move_to_end(patient_id)
+            return self._stores[patient_id]
+        lock = self._locks.setdefault(patient_id, asyncio.Lock())
+        async with lock:
+            if patient_id not in self._stores:
+                self._stores[patient_id] = await self._fetch(patient_id)
+                while len(self._stores) > self.max_patients:
+                    self._stores.popitem(last=False)
+        return self._stores.get(patient_id)
+
+    async def _fetch(self, patient_id: str) -> Optional[FHIRStore]:
+        """Fetch and index $everything; None if it fails or does not fit the budget."""
+        self.stats["fetches"] += 1
+        try:
+            response = await self.client.get(f"{self.fhir_base}/Patient/{patient_id}/$everything",
+                                             params={"_count": str(EVERYTHING_PAGE_SIZE)})
+        except httpx.RequestError:
+            return None
+        if response.status_code != 200:
+            return None
+        try:
+            bundle = response.json()
+        except ValueError:
+            # HTML error page or truncated body from a proxy: answer from live HAPI instead
+            return None
+        merged = await BundlePaginator(self.client, EVERYTHING_BUDGET).merge(bundle, len(response.content))
+        if next_link(merged):
+            return None
+
+        store = FHIRStore(base_url=self.fhir_base, page_size=SNAPSHOT_PAGE_SIZE, max_page_size=SNAPSHOT_PAGE_SIZE)
+        store.load_bundle(merged)
+        if store.read("Patient", patient_id) is None:
+            return None
+        return store
+
+
+def snapshots_enabled(var: str = "FHIR_PATIENT_SNAPSHOT", default: bool = False) -> bool:
+    """Whether snapshot mode is switched on by an environment variable."""
+    return env_flag(var, default)
+
+
+def split_fhir_path(base_url: str, endpoint: str) -> Tuple[str, str]:
+    """
+    Split a client base URL and endpoint into (FHIR base, path relative to it).
+
+    Handles "http://host" + "/fhir/Observation", "http://host/fhir" + "/Observation"
+    and "http://host/fhir" + "/fhir/Observation".
+    """
+    base = base_url.rstrip("/")
+    endpoint = "/" + endpoint.lstrip("/")
+    if endpoint.startswith("/fhir/"):
+        return base if base.endswith("/fhir") else f"{base}/fhir", endpoint[len("/fhir/"):]
+    return base, endpoint.lstrip("/")
+
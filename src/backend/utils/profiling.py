@@ -0,0 +1,238 @@
+"""
+On-Demand Request Profiling for Sara
+
+A request carrying the profile token (X-Sara-Profile header or ?profile= query
+parameter, matched against SARA_PROFILE_TOKEN) is run under a profiler and the
+artifact is kept for download. Without SARA_PROFILE_TOKEN the flag is ignored,
+and a request without the flag only pays for one header lookup.
+
+Agent runs are coroutines sharing an event loop with other requests, so the
+profiler is switched on only while the run's own coroutine is executing a step
+(profiled_coroutine): other requests' work never shows up in its profile.
+Synchronous work (the model server's handlers) is profiled as a block, with
+cProfile or, for X-Sara-Profile-Mode: torch, torch.profiler when it is
+installed (a Chrome trace including CUDA kernels when a GPU is present).
+
+Artifacts are kept in memory by the container that served the request, bounded
+by count, bytes and a TTL.
+"""
+
+import cProfile
+import hmac
+import io
+import marshal
+import os
+import pstats
+import secrets
+import tempfile
+import threading
+import time
+import types
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Coroutine, Iterator, Mapping, Optional, Set
+
+PROFILE_HEADER = "X-Sara-Profile"
+PROFILE_MODE_HEADER = "X-Sara-Profile-Mode"
+PROFILE_QUERY = "profile"
+SUMMARY_LINES = 40  # functions listed in the text summary
+
+# One profiled block at a time per process: from Python 3.12 cProfile hooks are
+# interpreter-wide, so a second profiler cannot be enabled while one is active
+_BLOCK_LOCK = threading.Lock()
+
+
+@dataclass
+class Artifact:
+    """A finished profile."""
+    filename: str
+    content: bytes
+    media_type: str
+    summary: str  # human-readable top functions (or a note for binary traces)
+
+
+def requested_profile(headers: Mapping[str, str], query: Mapping[str, str],
+                      token: Optional[str]) -> Optional[str]:
+    """
+    Profile mode requested by a request, if it carries the profile token.
+
+    Args:
+        headers: Request headers (case-insensitive mapping)
+        query: Query parameters
+        token: Configured SARA_PROFILE_TOKEN (None disables profiling)
+
+    Returns:
+        "cprofile" or "torch", or None when the request is not profiled
+    """
+    if not token:
+        return None
+    provided = headers.get(PROFILE_HEADER) or query.get(PROFILE_QUERY)
+    if not provided or not hmac.compare_digest(provided.encode(), token.encode()):
+        return None
+    return "torch" if (headers.get(PROFILE_MODE_HEADER) or "").lower() == "torch" else "cprofile"
+
+
+def cprofile_artifact(profiler: cProfile.Profile, name: str) -> Artifact:
+    """Package a cProfile run as a .prof file (pstats/snakeviz format) with a text summary."""
+    summary = io.StringIO()
+    stats = pstats.Stats(profiler, stream=summary)  # takes over profiler.stats
+    content = marshal.dumps(stats.stats)  # what Stats.dump_stats writes
+    stats.sort_stats("cumulative").print_stats(SUMMARY_LINES)
+    return Artifact(f"{name}.prof", content, "application/octet-stream", summary.getvalue())
+
+
+@types.coroutine
+def profiled_coroutine(coro: Coroutine, profiler: cProfile.Profile):
+    """
+    Drive a coroutine with the profiler enabled only while it runs.
+
+    Each step (from resumption to the next suspension) is profiled; time spent
+    suspended, and other tasks running meanwhile, are not.
+    """
+    value: Any = None
+    error: Optional[BaseException] = None
+    while True:
+        profiler.enable()
+        try:
+            yielded = coro.throw(error) if error is not None else coro.send(value)
+        except StopIteration as stop:
+            return stop.value
+        finally:
+            profiler.disable()
+        try:
+            value, error = (yield yielded), None
+        except BaseException as e:  # cancellation and errors go to the profiled coroutine
+            value, error = None, e
+
+
+class ProfileStore:
+    """
+    Bounded, TTL'd map from profile id to artifact.
+
+    Usage:
+        profile_id = store.reserve()                 # hand the id out right away
+        await store.capture(profile_id, run(), "run")  # artifact stored when run() ends
+        artifact = store.get(profile_id)
+    """
+
+    def __init__(self, max_items: int = 32, max_bytes: int = 256 * 1024 * 1024, ttl: float = 3600.0):
+        """
+        Initialize an empty store.
+
+        Args:
+            max_items: Artifacts kept before the oldest is dropped
+            max_bytes: Total artifact size kept before the oldest are dropped
+            ttl: Seconds an artifact stays available
+        """
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()  # id -> (artifact, expires)
+        self._pending: Set[str] = set()
+        self._bytes = 0
+
+    def reserve(self) -> str:
+        """New profile id; get() reports it pending until put()."""
+        profile_id = secrets.token_urlsafe(12)
+        self._pending.add(profile_id)
+        return profile_id
+
+    def is_pending(self, profile_id: str) -> bool:
+        return profile_id in self._pending
+
+    def put(self, profile_id: str, artifact: Artifact) -> None:
+        self._pending.discard(profile_id)
+        self._expire()
+        self._items[profile_id] = (artifact, time.monotonic() + self.ttl)
+        self._bytes += len(artifact.content)
+        while self._items and (len(self._items) > self.max_items or self._bytes > self.max_bytes):
+            self._drop(next(iter(self._items)))
+
+    def get(self, profile_id: str) -> Optional[Artifact]:
+        """Return an artifact, or None if it is pending, unknown or expired."""
+        self._expire()
+        item = self._items.get(profile_id)
+        return item[0] if item else None
+
+    async def capture(self, profile_id: str, coro: Coroutine, name: str) -> Any:
+        """Run coro under cProfile (its own steps only) and store the artifact when it ends."""
+        profiler = cProfile.Profile()
+        try:
+            return await profiled_coroutine(coro, profiler)
+        finally:
+            self.put(profile_id, cprofile_artifact(profiler, name))
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        while self._items:
+            oldest = next(iter(self._items))
+            if self._items[oldest][1] > now:
+                break
+            self._drop(oldest)
+
+    def _drop(self, profile_id: str) -> None:
+        self._bytes -= len(self._items.pop(profile_id)[0].content)
+
+
+class _Captured:
+    artifact: Optional[Artifact] = None
+
+
+@contextmanager
+def profile_block(mode: str, name: str) -> Iterator[_Captured]:
+    """
+    Profile a synchronous block; the artifact is set on the yielded holder on exit.
+
+    Args:
+        mode: "cprofile", or "torch" for torch.profiler (falls back to cProfile without torch)
+        name: Artifact file name stem
+
+    Concurrent profiled blocks run one after another.
+    """
+    captured = _Captured()
+    torch_profiler = None
+    if mode == "torch":
+        try:
+            import torch
+            from torch.profiler import ProfilerActivity, profile
+        except ImportError:
+            torch_profiler = None
+        else:
+            activities = [ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(ProfilerActivity.CUDA)
+            torch_profiler = profile(activities=activities, record_shapes=True)
+
+    with _BLOCK_LOCK:
+        if torch_profiler is not None:
+            try:
+                with torch_profiler:
+                    yield captured
+            finally:
+                captured.artifact = _torch_artifact(torch_profiler, name)
+            return
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield captured
+        finally:
+            profiler.disable()
+            captured.artifact = cprofile_artifact(profiler, name)
+
+
+def _torch_artifact(torch_profiler: Any, name: str) -> Artifact:
+    """Package a finished torch.profiler run as a Chrome trace."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "trace.json")
+        torch_profiler.export_chrome_trace(path)
+        with open(path, "rb") as f:
+            content = f.read()
+    summary = torch_profiler.key_averages().table(sort_by="self_cpu_time_total", row_limit=SUMMARY_LINES)
+    return Artifact(f"{name}.trace.json", content, "application/json", summary)
+
+
+def profile_token_from_env(var: str = "SARA_PROFILE_TOKEN") -> Optional[str]:
+    """Token that enables per-request profiling (None: profiling disabled)."""
+    return os.environ.get(var) or None
@@ -0,0 +1,140 @@
+"""
+FHIR Query Rewriter for Sara
+
+Adds server-side projection and ordering to the agent's FHIR searches.
+A model-issued GET such as Observation?patient=X&code=MG returns every element of
+every matching resource; the rewriter adds _elements, _sort and _count per
+resource type so HAPI sends only what the MedAgentBench task families read.
+Parameters the model set itself are never overridden.
+
+Enable with FHIR_QUERY_REWRITE=1; off, searches go out exactly as the benchmark sends them.
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from src.backend.utils.env import env_flag
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RewriteRule:
+    """Projection/ordering added to searches of one resource type."""
+    elements: Tuple[str, ...] = ()
+    sort: Optional[str] = None
+    count: Optional[int] = None
+
+
+# Elements each task family reads. resourceType, id and meta are always returned.
+# _count is raised above HAPI's default page size (20) so lab histories used for
+# "most recent" and averaging questions arrive in one page.
+DEFAULT_RULES: Dict[str, RewriteRule] = {
+    "Patient": RewriteRule(
+        elements=("identifier", "name", "birthDate", "gender"),
+        count=20,
+    ),
+    "Observation": RewriteRule(
+        elements=("status", "category", "code", "subject", "effectiveDateTime", "issued",
+                  "valueQuantity", "valueString", "valueCodeableConcept", "component", "interpretation"),
+        sort="-date",
+        count=200,
+    ),
+    "MedicationRequest": RewriteRule(
+        elements=("status", "intent", "category", "medicationCodeableConcept", "subject",
+                  "authoredOn", "dosageInstruction"),
+        sort="-date",
+        count=100,
+    ),
+    "Condition": RewriteRule(
+        elements=("clinicalStatus", "verificationStatus", "category", "code", "subject",
+                  "onsetDateTime", "recordedDate"),
+        count=100,
+    ),
+    "Procedure": RewriteRule(
+        elements=("status", "code", "subject", "performedDateTime", "performedPeriod"),
+        sort="-date",
+        count=100,
+    ),
+    "ServiceRequest": RewriteRule(
+        elements=("status", "intent", "code", "subject", "authoredOn", "occurrenceDateTime", "note"),
+        count=100,
+    ),
+}
+
+
+class QueryRewriter:
+    """
+    Rewrites search parameters for GET requests.
+
+    Usage:
+        rewriter = QueryRewriter()
+        params = rewriter.rewrite("/fhir/Observation", {"patient": "S1", "code": "MG"})
+        # {"patient": "S1", "code": "MG", "_elements": "...", "_sort": "-date", "_count": "200"}
+    """
+
+    def __init__(self, rules: Optional[Dict[str, RewriteRule]] = None, enabled: bool = True):
+        """
+        Initialize the rewriter.
+
+        Args:
+            rules: Per-resource-type rules (defaults to DEFAULT_RULES)
+            enabled: When False, rewrite() returns params unchanged
+        """
+        self.rules = DEFAULT_RULES if rules is None else rules
+        self.enabled = enabled
+
+    def rewrite(self, endpoint: str, params: Dict[str, str]) -> Dict[str, str]:
+        """
+        Add projection/ordering parameters to a search.
+
+        Reads (Type/id) and operations ($everything) are left alone, as are
+        searches of types without a rule.
+
+        Args:
+            endpoint: FHIR endpoint path (e.g., "/fhir/Observation")
+            params: Query parameters issued by the model
+
+        Returns:
+            New parameter dict (the input is not modified)
+        """
+        if not self.enabled:
+            return params
+        parts = [p for p in endpoint.split("/") if p]
+        if parts and parts[0] == "fhir":
+            parts = parts[1:]
+        if len(parts) != 1 or parts[0] not in self.rules:
+            return params
+
+        resource_type = parts[0]
+        rule = self.rules[resource_type]
+        rewritten = dict(params or {})
+        added = {}
+        if rule.elements and "_elements" not in rewritten and "_summary" not in rewritten:
+            added["_elements"] = ",".join(rule.elements)
+        if rule.sort and "_sort" not in rewritten:
+            added["_sort"] = rule.sort
+        if rule.count and "_count" not in rewritten:
+            added["_count"] = str(rule.count)
+        rewritten.update(added)
+
+        if added:
+            logger.debug("Rewrote %s search: added %s", resource_type,
+                         ", ".join(f"{k}={v}" for k, v in added.items()))
+        return rewritten
+
+
+def rewriter_from_env(var: str = "FHIR_QUERY_REWRITE", default: bool = False) -> QueryRewriter:
+    """
+    Build a rewriter switched on or off by an environment variable.
+
+    Args:
+        var: Environment variable name ("0", "false", "off" disable rewriting)
+        default: Setting used when the variable is unset
+
+    Returns:
+        QueryRewriter (possibly disabled)
+    """
+    enabled = env_flag(var, default)
+    return QueryRewriter(enabled=enabled)
@@ -0,0 +1,129 @@
+"""
+Short-Lived Tool Result Store for Sara
+
+In lazy-results mode the agent API streams a summary of each FHIR result
+(resource type, entry count, size, first ids) instead of the full Bundle, and
+keeps the serialized payload here under a random id so the frontend can fetch
+it from GET /api/results/{id} when the user expands the result.
+
+The store is in memory and bounded by entry count, total bytes and a TTL;
+the oldest results are dropped first. Results live in the container that ran
+the task.
+"""
+
+import secrets
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from src.backend.utils.env import env_flag
+
+SUMMARY_IDS = 10  # top-level ids listed in a summary
+LAZY_MIN_BYTES = 2048  # smaller results are always streamed inline
+
+
+@dataclass
+class _StoredResult:
+    text: str
+    size: int
+    expires: float
+
+
+class ResultStore:
+    """
+    Bounded, TTL'd map from result id to serialized JSON text.
+
+    Usage:
+        store = ResultStore()
+        result_id = store.put(result_json)
+        text = store.get(result_id)  # None once expired or evicted
+    """
+
+    def __init__(self, max_items: int = 512, max_bytes: int = 64 * 1024 * 1024, ttl: float = 600.0):
+        """
+        Initialize an empty store.
+
+        Args:
+            max_items: Results kept before the oldest is dropped
+            max_bytes: Total size of kept results before the oldest are dropped
+            ttl: Seconds a result stays available
+        """
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._items: "OrderedDict[str, _StoredResult]" = OrderedDict()
+        self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def put(self, text: str) -> str:
+        """
+        Keep a serialized result.
+
+        Args:
+            text: JSON text of the result
+
+        Returns:
+            Unguessable result id
+        """
+        self._expire()
+        result_id = secrets.token_urlsafe(16)
+        size = len(text.encode("utf-8"))
+        self._items[result_id] = _StoredResult(text, size, time.monotonic() + self.ttl)
+        self._bytes += size
+        while self._items and (len(self._items) > self.max_items or self._bytes > self.max_bytes):
+            self._drop(next(iter(self._items)))
+        return result_id
+
+    def get(self, result_id: str) -> Optional[str]:
+        """Return a result's JSON text, or None if it is unknown or expired."""
+        self._expire()
+        item = self._items.get(result_id)
+        return item.text if item else None
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        # Insertion order is expiry order (constant TTL)
+        while self._items:
+            oldest = next(iter(self._items))
+            if self._items[oldest].expires > now:
+                break
+            self._drop(oldest)
+
+    def _drop(self, result_id: str) -> None:
+        self._bytes -= self._items.pop(result_id).size
+
+
+def summarize(data: Any, size: int) -> Dict[str, Any]:
+    """
+    Describe a FHIR result without its content.
+
+    Args:
+        data: Resource or Bundle
+        size: Size in bytes of the serialized result
+
+    Returns:
+        Dict with resourceType, bytes and, for Bundles, total, entries and the first ids
+    """
+    if not isinstance(data, dict):
+        return {"bytes": size}
+    summary: Dict[str, Any] = {"resourceType": data.get("resourceType"), "bytes": size}
+    if data.get("resourceType") == "Bundle":
+        entries = data.get("entry", [])
+        summary["entries"] = len(entries)
+        if "total" in data:
+            summary["total"] = data["total"]
+        summary["ids"] = [
+            f"{e['resource'].get('resourceType')}/{e['resource'].get('id')}"
+            for e in entries[:SUMMARY_IDS] if isinstance(e.get("resource"), dict)
+        ]
+    elif data.get("id"):
+        summary["id"] = data["id"]
+    return summary
+
+
+def lazy_results_enabled(var: str = "SSE_LAZY_RESULTS", default: bool = False) -> bool:
+    """Whether tool results are streamed as summaries by default."""
+    return env_flag(var, default)
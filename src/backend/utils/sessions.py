@@ -0,0 +1,294 @@
+"""
+Resumable Agent Run Sessions for Sara
+
+Each /api/run gets a session: the agent runs as a background task and appends
+its SSE frames, numbered with SSE ids, to the session's bounded event log. The
+HTTP response just tails the log. If the browser's connection drops, the run
+keeps going, and a reconnect with Last-Event-ID replays the frames after that
+id from the log and then tails the live run, without any extra model or FHIR
+calls.
+
+The producer never waits for a reader, so agent throughput does not depend on
+the client's network speed. A reader that falls behind gets the backlog with
+runs of consecutive thinking frames coalesced to the newest one (the frontend
+only shows the latest), and an idle stream carries SSE comment heartbeats so
+proxies and browsers keep the connection open during long model calls.
+
+Logs are bounded per session and in total across sessions (oldest frames
+dropped first; over the total, finished sessions go before any running log is
+trimmed). A reader whose next frame was dropped gets a "gap" event naming the
+missing ids before the frames that are left. Sessions are kept for a TTL after
+their run finishes and live in the container that started the run.
+"""
+
+import asyncio
+import json
+import os
+import secrets
+import time
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import AsyncIterator, Callable, Deque, List, NamedTuple, Optional, Tuple
+
+HEARTBEAT_SECONDS = 15.0  # idle time before a keep-alive comment is sent
+HEARTBEAT_FRAME = ": keep-alive\n\n"
+COALESCE_TYPES = ("thinking",)  # event types where only the newest of a run matters
+MAX_EVENTS = 1000  # frames kept per session
+MAX_BYTES = 2 * 1024 * 1024  # frame bytes kept per session
+MAX_TOTAL_BYTES = 64 * 1024 * 1024  # frame bytes kept across all sessions
+
+
+def sse_frame(event_type: str, data: str, event_id: Optional[int] = None) -> str:
+    """
+    Format one Server-Sent Event.
+
+    Args:
+        event_type: SSE event name
+        data: Single-line JSON text
+        event_id: SSE id, sent back by the client as Last-Event-ID
+
+    Returns:
+        Frame text ending with a blank line
+    """
+    prefix = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{prefix}event: {event_type}\ndata: {data}\n\n"
+
+
+def gap_frame(after_id: int, next_id: int) -> str:
+    """Frame telling a reader that the frames between after_id and next_id were dropped from the log."""
+    data = json.dumps({"lastEventId": after_id, "nextEventId": next_id, "dropped": next_id - after_id - 1})
+    return sse_frame("gap", data)
+
+
+class LoggedFrame(NamedTuple):
+    """One frame of a session's event log."""
+    id: int
+    event_type: str
+    text: str
+
+
+class RunSession:
+    """
+    Bounded, append-only log of one run's SSE frames that readers can tail.
+
+    Usage:
+        session = registry.create()
+        session.append("status", '{"phase": "running"}')  # producer
+        async for frame in session.tail(after_id=0):       # consumer(s)
+            ...
+        session.finish()                                   # producer, when the run ends
+    """
+
+    def __init__(self, session_id: str, max_events: int = MAX_EVENTS, max_bytes: int = MAX_BYTES,
+                 on_append: Optional[Callable[[], None]] = None):
+        """
+        Initialize an empty session.
+
+        Args:
+            session_id: Unguessable id handed to the client
+            max_events: Frames kept before the oldest are dropped
+            max_bytes: Total frame size kept before the oldest are dropped
+            on_append: Called after every append (the registry's cross-session byte limit)
+        """
+        self.id = session_id
+        self.max_events = max_events
+        self.max_bytes = max_bytes
+        self.on_append = on_append
+        self.created_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self._events: Deque[LoggedFrame] = deque()
+        self._bytes = 0
+        self._last_id = 0
+        self._wakeup = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def last_id(self) -> int:
+        """Id of the newest frame (0 before the first)."""
+        return self._last_id
+
+    @property
+    def size(self) -> int:
+        """Bytes of frame text in the log."""
+        return self._bytes
+
+    def append(self, event_type: str, data: str) -> int:
+        """
+        Add a frame to the log and wake tailing readers.
+
+        Args:
+            event_type: SSE event name
+            data: Single-line JSON text
+
+        Returns:
+            The frame's SSE id
+        """
+        self._last_id += 1
+        frame = sse_frame(event_type, data, self._last_id)
+        self._events.append(LoggedFrame(self._last_id, event_type, frame))
+        self._bytes += len(frame)
+        while len(self._events) > self.max_events or self._bytes > self.max_bytes:
+            if not self.drop_oldest():
+                break
+        self._notify()
+        if self.on_append is not None:
+            self.on_append()
+        return self._last_id
+
+    def drop_oldest(self) -> int:
+        """Drop the oldest frame (the newest is always kept); returns the bytes freed."""
+        if len(self._events) <= 1:
+            return 0
+        freed = len(self._events.popleft().text)
+        self._bytes -= freed
+        return freed
+
+    def finish(self) -> None:
+        """Mark the run as over; readers stop once they have every frame."""
+        if self.finished_at is None:
+            self.finished_at = time.monotonic()
+            self._notify()
+
+    def events_after(self, after_id: int) -> List[LoggedFrame]:
+        """Frames with an id above after_id that are still in the log."""
+        if not self._events or after_id >= self._last_id:
+            return []
+        first_id = self._events[0].id
+        return list(islice(self._events, max(0, after_id + 1 - first_id), None))
+
+    async def tail(self, after_id: int = 0, heartbeat: Optional[float] = HEARTBEAT_SECONDS,
+                   coalesce: Tuple[str, ...] = COALESCE_TYPES) -> AsyncIterator[str]:
+        """
+        Yield the frames after after_id, then new frames until the run finishes.
+
+        Args:
+            after_id: Last SSE id the client has seen (0 for everything kept)
+            heartbeat: Seconds without frames before a keep-alive comment (None for never)
+            coalesce: Event types whose consecutive frames in a backlog collapse to the newest
+        """
+        while True:
+            wakeup = self._wakeup
+            pending = self.events_after(after_id)
+            if pending and pending[0].id > after_id + 1:
+                # Dropped from the log before this reader got them
+                yield gap_frame(after_id, pending[0].id)
+            for i, frame in enumerate(pending):
+                after_id = frame.id
+                superseded = (
+                    i + 1 < len(pending)
+                    and frame.event_type in coalesce
+                    and pending[i + 1].event_type == frame.event_type
+                )
+                if not superseded:
+                    yield frame.text
+            if pending:
+                continue
+            if self.finished:
+                return
+            try:
+                await asyncio.wait_for(wakeup.wait(), heartbeat)
+            except asyncio.TimeoutError:
+                yield HEARTBEAT_FRAME
+
+    def _notify(self) -> None:
+        self._wakeup.set()
+        self._wakeup = asyncio.Event()
+
+
+class SessionRegistry:
+    """
+    Sessions by id, dropped a TTL after their run finishes.
+
+    Usage:
+        registry = SessionRegistry()
+        session = registry.create()
+        same = registry.get(session.id)
+    """
+
+    def __init__(self, ttl: float = 900.0, max_sessions: int = 128, max_events: int = MAX_EVENTS,
+                 max_bytes: int = MAX_BYTES, max_total_bytes: int = MAX_TOTAL_BYTES):
+        """
+        Initialize an empty registry.
+
+        Args:
+            ttl: Seconds a finished session stays available for reconnects
+            max_sessions: Sessions kept before the oldest finished ones are dropped
+            max_events: Per-session frame limit
+            max_bytes: Per-session byte limit
+            max_total_bytes: Byte limit across all sessions, running ones included
+        """
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_events = max_events
+        self.max_bytes = max_bytes
+        self.max_total_bytes = max_total_bytes
+        self._sessions: "OrderedDict[str, RunSession]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def create(self) -> RunSession:
+        """Start a new session with a fresh id."""
+        self._expire()
+        session = RunSession(secrets.token_urlsafe(16), self.max_events, self.max_bytes,
+                             on_append=self._enforce_total_bytes)
+        self._sessions[session.id] = session
+        return session
+
+    def get(self, session_id: str) -> Optional[RunSession]:
+        """Return a session, or None if it is unknown or expired."""
+        self._expire()
+        return self._sessions.get(session_id)
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        for session_id, session in list(self._sessions.items()):
+            if session.finished and now - session.finished_at > self.ttl:
+                del self._sessions[session_id]
+        # Over the limit: drop the oldest finished sessions; running ones are never dropped
+        excess = len(self._sessions) - self.max_sessions
+        for session_id, session in list(self._sessions.items()):
+            if excess <= 0:
+                break
+            if session.finished:
+                del self._sessions[session_id]
+                excess -= 1
+
+
+    def _enforce_total_bytes(self) -> None:
+        total = sum(session.size for session in self._sessions.values())
+        if total <= self.max_total_bytes:
+            return
+        # Oldest finished sessions go first
+        for session_id, session in list(self._sessions.items()):
+            if total <= self.max_total_bytes:
+                return
+            if session.finished:
+                total -= session.size
+                del self._sessions[session_id]
+        # Then the oldest frames of the largest running logs
+        while total > self.max_total_bytes:
+            freed = max(self._sessions.values(), key=lambda s: s.size).drop_oldest()
+            if not freed:
+                return
+            total -= freed
+
+
+def parse_last_event_id(value: Optional[str]) -> int:
+    """Parse a Last-Event-ID header or query value (0 when absent or invalid)."""
+    try:
+        return max(0, int(value)) if value else 0
+    except ValueError:
+        return 0
+
+
+def session_ttl_from_env(var: str = "SESSION_TTL", default: float = 900.0) -> float:
+    """Seconds finished sessions stay available for reconnects."""
+    value = os.environ.get(var)
+    try:
+        return float(value) if value else default
+    except ValueError:
+        return default
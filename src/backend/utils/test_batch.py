@@ -0,0 +1,99 @@
+"""
+Tests for the batch runner.
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from src.backend.utils.batch import batch_concurrency_from_env, ndjson_line, run_batch, timing_stats
+
+
+def _job(delay, state, result=None, error=None):
+    async def job():
+        state["running"] += 1
+        state["peak"] = max(state["peak"], state["running"])
+        try:
+            await asyncio.sleep(delay)
+            if error:
+                raise RuntimeError(error)
+            return result or {"success": True}
+        finally:
+            state["running"] -= 1
+    return job
+
+
+class TestRunBatch:
+    """Tests for run_batch."""
+
+    @pytest.mark.asyncio
+    async def test_results_in_completion_order_then_summary(self):
+        """Test that results arrive as jobs finish, followed by the summary."""
+        state = {"running": 0, "peak": 0}
+        jobs = [_job(0.03, state, {"success": True, "answer": "slow"}),
+                _job(0.0, state, {"success": True, "answer": "fast"})]
+
+        records = [r async for r in run_batch(jobs, concurrency=2)]
+
+        assert [(r["index"], r["answer"]) for r in records[:2]] == [(1, "fast"), (0, "slow")]
+        summary = records[-1]
+        assert summary["type"] == "summary"
+        assert summary["tasks"] == 2 and summary["succeeded"] == 2 and summary["failed"] == 0
+        assert summary["taskMs"]["max"] >= 30
+
+    @pytest.mark.asyncio
+    async def test_concurrency_is_bounded(self):
+        """Test that no more than the given number of jobs run at once."""
+        state = {"running": 0, "peak": 0}
+        jobs = [_job(0.01, state) for _ in range(10)]
+        records = [r async for r in run_batch(jobs, concurrency=3)]
+        assert state["peak"] == 3
+        assert len(records) == 11
+
+    @pytest.mark.asyncio
+    async def test_failing_job_is_reported(self):
+        """Test that a failing job yields a failed result and is counted."""
+        state = {"running": 0, "peak": 0}
+        jobs = [_job(0, state, error="model down"), _job(0, state)]
+        records = [r async for r in run_batch(jobs)]
+        failed = [r for r in records if r["type"] == "result" and not r["success"]]
+        assert failed == [{"type": "result", "index": 0, "success": False, "error": "model down",
+                           "elapsedMs": failed[0]["elapsedMs"]}]
+        assert records[-1]["failed"] == 1
+
+    @pytest.mark.asyncio
+    async def test_stopping_early_cancels_pending_jobs(self):
+        """Test that closing the batch cancels running jobs and waits for them."""
+        state = {"running": 0, "peak": 0}
+        jobs = [_job(0, state)] + [_job(10, state) for _ in range(3)]
+        batch = run_batch(jobs, concurrency=4)
+        first = await batch.__anext__()
+        assert first["index"] == 0
+        await batch.aclose()
+        assert state["running"] == 0  # unwound before aclose() returned
+
+
+class TestHelpers:
+    """Tests for timing stats, NDJSON and configuration."""
+
+    def test_timing_stats(self):
+        """Test the sum, mean, percentiles and max of task timings."""
+        stats = timing_stats([float(i) for i in range(1, 11)])
+        assert stats == {"sum": 55.0, "mean": 5.5, "p50": 5.0, "p95": 10.0, "max": 10.0}
+        assert timing_stats([]) == {}
+
+    def test_ndjson_line(self):
+        """Test that a record is encoded as exactly one JSON line."""
+        line = ndjson_line({"type": "result", "answer": ["S1"]})
+        assert line.endswith("\n") and line.count("\n") == 1
+        assert json.loads(line) == {"type": "result", "answer": ["S1"]}
+
+    def test_concurrency_from_env(self, monkeypatch):
+        """Test that BATCH_CONCURRENCY is clamped and defaults when invalid."""
+        monkeypatch.setenv("BATCH_CONCURRENCY", "8")
+        assert batch_concurrency_from_env() == 8
+        monkeypatch.setenv("BATCH_CONCURRENCY", "500")
+        assert batch_concurrency_from_env() == 16
+        monkeypatch.setenv("BATCH_CONCURRENCY", "x")
+        assert batch_concurrency_from_env() == 4
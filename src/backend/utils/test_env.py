@@ -0,0 +1,24 @@
+"""
+Tests for environment switches.
+"""
+
+from src.backend.utils.env import env_flag
+
+
+class TestEnvFlag:
+    """Tests for env_flag."""
+
+    def test_unset_uses_default(self, monkeypatch):
+        """Test that an unset variable gives the default."""
+        monkeypatch.delenv("SARA_TEST_FLAG", raising=False)
+        assert env_flag("SARA_TEST_FLAG", True) is True
+        assert env_flag("SARA_TEST_FLAG", False) is False
+
+    def test_false_values(self, monkeypatch):
+        """Test that 0/false/off/no turn a switch off, in any case, and other values turn it on."""
+        for value in ("0", "false", " OFF ", "No"):
+            monkeypatch.setenv("SARA_TEST_FLAG", value)
+            assert env_flag("SARA_TEST_FLAG", True) is False
+        for value in ("1", "true", "yes", "on"):
+            monkeypatch.setenv("SARA_TEST_FLAG", value)
+            assert env_flag("SARA_TEST_FLAG", False) is True
@@ -4,11 +4,16 @@ Tests for the async FHIR client.
 Uses pytest-httpx for mocking HTTP requests.
 """
 
+import json
+
+import httpx
 import pytest
 from httpx import ConnectError
 
 from src.backend.utils.fhir_client import FHIRClient, FHIRResult
+from src.backend.utils.pagination import PageBudget
 from src.backend.utils.parser import Action, ActionType
+from src.backend.utils.query_rewrite import QueryRewriter, RewriteRule
 
 
 class TestFHIRResult:
@@ -140,6 +145,69 @@ class TestFHIRClientGet:
         assert "Connection" in result.error or "connect" in result.error.lower()
 
 
+    @pytest.mark.asyncio
+    async def test_get_applies_rewriter(self, httpx_mock):
+        """Test that a configured rewriter adds its parameters to searches."""
+        httpx_mock.add_response(
+            url="http://localhost:8080/fhir/Observation?patient=S1&_sort=-date&_count=50",
+            json={"resourceType": "Bundle", "total": 0}
+        )
+
+        rewriter = QueryRewriter(rules={"Observation": RewriteRule(sort="-date", count=50)})
+        client = FHIRClient("http://localhost:8080", rewriter=rewriter)
+        try:
+            result = await client.get("/fhir/Observation", {"patient": "S1"})
+        finally:
+            await client.close()
+
+        assert result.success is True
+
+
+    @pytest.mark.asyncio
+    async def test_get_merges_pages_with_budget(self, httpx_mock):
+        """Test that a page budget makes the client follow next links."""
+        httpx_mock.add_response(
+            url="http://localhost:8080/fhir/Observation?patient=S1",
+            json={"resourceType": "Bundle", "entry": [{"resource": {"id": "1"}}],
+                  "link": [{"relation": "next", "url": "http://localhost:8080/fhir?_getpages=abc"}]}
+        )
+        httpx_mock.add_response(
+            url="http://localhost:8080/fhir?_getpages=abc",
+            json={"resourceType": "Bundle", "entry": [{"resource": {"id": "2"}}]}
+        )
+
+        client = FHIRClient("http://localhost:8080", page_budget=PageBudget())
+        try:
+            result = await client.get("/fhir/Observation", {"patient": "S1"})
+        finally:
+            await client.close()
+
+        assert [e["resource"]["id"] for e in result.data["entry"]] == ["1", "2"]
+
+
+    @pytest.mark.asyncio
+    async def test_get_answers_from_patient_snapshot(self, httpx_mock):
+        """Test that snapshot mode serves repeated patient searches from one $everything."""
+        httpx_mock.add_response(
+            url="http://localhost:8080/fhir/Patient/S1/$everything?_count=1000",
+            json={"resourceType": "Bundle", "entry": [
+                {"resource": {"resourceType": "Patient", "id": "S1"}},
+                {"resource": {"resourceType": "Condition", "id": "c1", "subject": {"reference": "Patient/S1"}}},
+            ]}
+        )
+
+        client = FHIRClient("http://localhost:8080", patient_snapshots=True)
+        try:
+            conditions = await client.get("/fhir/Condition", {"patient": "S1"})
+            patient = await client.get("/fhir/Patient/S1", {})
+        finally:
+            await client.close()
+
+        assert conditions.data["total"] == 1
+        assert patient.data["id"] == "S1"
+        assert len(httpx_mock.get_requests()) == 1
+
+
 class TestFHIRClientPost:
     """Tests for POST requests."""
 
@@ -267,6 +335,38 @@ class TestFHIRClientExecute:
         assert result.status_code == 201
         assert result.data["id"] == "med-456"
 
+    @pytest.mark.asyncio
+    async def test_execute_transaction_action(self, httpx_mock):
+        """Test execute submits TRANSACTION actions as one transaction Bundle."""
+        httpx_mock.add_response(
+            url="http://localhost:8080/fhir",
+            method="POST",
+            status_code=200,
+            json={"resourceType": "Bundle", "type": "transaction-response", "entry": []}
+        )
+
+        action = Action(type=ActionType.TRANSACTION, entries=[
+            Action(type=ActionType.POST, endpoint="/fhir/MedicationRequest",
+                   body={"resourceType": "MedicationRequest", "status": "active"}),
+            Action(type=ActionType.POST, endpoint="/fhir/ServiceRequest",
+                   body={"resourceType": "ServiceRequest", "status": "active"}),
+        ])
+
+        client = FHIRClient("http://localhost:8080")
+        try:
+            result = await client.execute(action)
+        finally:
+            await client.close()
+
+        assert result.success is True
+        sent = json.loads(httpx_mock.get_request().content)
+        assert sent["type"] == "transaction"
+        assert [e["request"] for e in sent["entry"]] == [
+            {"method": "POST", "url": "MedicationRequest"},
+            {"method": "POST", "url": "ServiceRequest"},
+        ]
+        assert all(e["fullUrl"].startswith("urn:uuid:") for e in sent["entry"])
+
     @pytest.mark.asyncio
     async def test_execute_finish_action(self):
         """Test execute handles FINISH actions (no HTTP request)."""
@@ -320,6 +420,22 @@ class TestFHIRClientContextManager:
         assert result.success is True
         assert result.data["id"] == "123"
 
+    @pytest.mark.asyncio
+    async def test_shared_http_client_stays_open(self, httpx_mock):
+        """Test a passed-in connection pool is reused and not closed with the client."""
+        httpx_mock.add_response(
+            url="http://localhost:8080/fhir/Patient/123",
+            json={"resourceType": "Patient", "id": "123"},
+            is_reusable=True,
+        )
+
+        async with httpx.AsyncClient() as pool:
+            for _ in range(2):
+                async with FHIRClient("http://localhost:8080", http_client=pool) as client:
+                    result = await client.get("/fhir/Patient/123", {})
+                assert result.success is True
+            assert pool.is_closed is False
+
 
 class TestFHIRClientEdgeCases:
     """Tests for edge cases and error handling."""
@@ -375,3 +491,73 @@ class TestFHIRClientEdgeCases:
             await client.close()
 
         assert result.success is True
+
+    @pytest.mark.asyncio
+    async def test_fhir_base_url_with_prefixed_endpoint(self, httpx_mock):
+        """Test that a /fhir base URL and a /fhir/... endpoint do not double the prefix."""
+        httpx_mock.add_response(
+            url="http://localhost:8080/fhir/Patient",
+            json={"resourceType": "Bundle", "type": "searchset", "entry": []}
+        )
+
+        async with FHIRClient("http://localhost:8080/fhir") as client:
+            result = await client.get("/fhir/Patient", {})
+
+        assert result.success is True
+
+
+class RetryingClient(FHIRClient):
+    MAX_RETRIES = 1
+
+
+class TestFHIRClientRetries:
+    """Tests for the retry policy."""
+
+    @pytest.mark.asyncio
+    async def test_get_retried_after_transport_error(self, httpx_mock):
+        """Test that GETs are retried MAX_RETRIES times."""
+        httpx_mock.add_exception(httpx.ReadTimeout("slow"))
+        httpx_mock.add_response(url="http://localhost:8080/fhir/Patient/1",
+                                json={"resourceType": "Patient", "id": "1"})
+
+        async with RetryingClient("http://localhost:8080") as client:
+            result = await client.get("/fhir/Patient/1", {})
+
+        assert result.success is True
+
+    @pytest.mark.asyncio
+    async def test_unkeyed_post_not_retried_after_timeout(self, httpx_mock):
+        """Test that a POST which may have reached the server is not sent again."""
+        httpx_mock.add_exception(httpx.ReadTimeout("slow"), method="POST")
+
+        async with RetryingClient("http://localhost:8080") as client:
+            result = await client.post("/fhir/MedicationRequest", {"resourceType": "MedicationRequest"})
+
+        assert result.success is False
+        assert result.error.startswith("Timeout")
+        assert len(httpx_mock.get_requests()) == 1
+
+    @pytest.mark.asyncio
+    async def test_unkeyed_post_retried_after_connection_failure(self, httpx_mock):
+        """Test that a POST that never reached the server is retried."""
+        httpx_mock.add_exception(ConnectError("Connection refused"), method="POST")
+        httpx_mock.add_response(method="POST", status_code=201, json={"resourceType": "MedicationRequest", "id": "7"})
+
+        async with RetryingClient("http://localhost:8080") as client:
+            result = await client.post("/fhir/MedicationRequest", {"resourceType": "MedicationRequest"})
+
+        assert result.success is True
+        assert result.data["id"] == "7"
+
+    @pytest.mark.asyncio
+    async def test_unexpected_error_is_failed_result(self, httpx_mock):
+        """Test that errors outside httpx's RequestError give a failed result instead of raising."""
+        httpx_mock.add_exception(ValueError("bad chunk"), method="POST")
+
+        async with RetryingClient("http://localhost:8080") as client:
+            result = await client.post("/fhir/MedicationRequest", [{"resourceType": "MedicationRequest"}],
+                                       idempotency_key="k")
+
+        assert result.success is False
+        assert result.error == "Unexpected error: ValueError: bad chunk"
+        assert len(httpx_mock.get_requests()) == 1
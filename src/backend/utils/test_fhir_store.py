@@ -0,0 +1,334 @@
+"""
+Tests for the in-memory FHIR store.
+
+Covers the search semantics the agent relies on: patient/code/date/category
+filters, Patient demographics, _count/_sort/_offset paging, and create.
+"""
+
+import gzip
+import json
+
+import pytest
+
+from src.backend.utils.fhir_store import FHIRStore, SearchError, TransactionError, parse_date_range
+
+
+def _observation(obs_id, patient, code, when, value, category="laboratory"):
+    return {
+        "resourceType": "Observation",
+        "id": obs_id,
+        "status": "final",
+        "category": [{"coding": [{"system": "http://hl7.org/fhir/observation-category", "code": category}]}],
+        "code": {"coding": [{"system": "http://example.org", "code": code}], "text": code},
+        "effectiveDateTime": when,
+        "valueQuantity": {"value": value, "unit": "mg/dL"},
+        "subject": {"reference": f"Patient/{patient}"},
+    }
+
+
+PATIENTS = [
+    {
+        "resourceType": "Patient",
+        "id": "S6315806",
+        "identifier": [{"system": "http://hospital.smarthealthit.org", "value": "S6315806"}],
+        "name": [{"family": "Stafford", "given": ["Peter", "James"]}],
+        "birthDate": "1932-12-29",
+        "gender": "male",
+    },
+    {
+        "resourceType": "Patient",
+        "id": "S2874099",
+        "identifier": [{"system": "http://hospital.smarthealthit.org", "value": "S2874099"}],
+        "name": [{"family": "Müller", "given": ["Anna"]}],
+        "birthDate": "1970-05-01",
+        "gender": "female",
+    },
+]
+
+OBSERVATIONS = [
+    _observation("101", "S6315806", "MG", "2023-11-12T20:00:00+00:00", 1.8),
+    _observation("102", "S6315806", "MG", "2023-11-13T08:00:00+00:00", 1.4),
+    _observation("103", "S6315806", "MG", "2023-10-01T08:00:00+00:00", 2.0),
+    _observation("104", "S6315806", "K", "2023-11-13T09:00:00+00:00", 3.9),
+    _observation("105", "S6315806", "BP", "2023-11-13T09:30:00+00:00", 120, category="vital-signs"),
+    _observation("106", "S2874099", "MG", "2023-11-13T07:00:00+00:00", 2.1),
+]
+
+
+def _bundle(resources):
+    return {"resourceType": "Bundle", "type": "collection", "entry": [{"resource": r} for r in resources]}
+
+
+@pytest.fixture
+def store():
+    store = FHIRStore(base_url="http://localhost:8080/fhir")
+    store.load_bundle(_bundle(PATIENTS + OBSERVATIONS))
+    return store
+
+
+def _ids(bundle):
+    return [e["resource"]["id"] for e in bundle.get("entry", [])]
+
+
+class TestParseDateRange:
+    """Tests for FHIR date precision handling."""
+
+    def test_day_precision_covers_whole_day(self):
+        """Test that a date without a time spans the whole day."""
+        start, end = parse_date_range("2023-11-13")
+        assert start.isoformat() == "2023-11-13T00:00:00+00:00"
+        assert end.isoformat() == "2023-11-14T00:00:00+00:00"
+
+    def test_datetime_with_offset_normalized_to_utc(self):
+        """Test that a timezone offset is converted to UTC."""
+        start, _ = parse_date_range("2023-11-13T10:15:00-05:00")
+        assert start.isoformat() == "2023-11-13T15:15:00+00:00"
+
+    def test_month_precision(self):
+        """Test that a year-month spans the whole month, across a year boundary."""
+        start, end = parse_date_range("2023-12")
+        assert (start.month, end.year, end.month) == (12, 2024, 1)
+
+
+class TestSearchObservations:
+    """Tests for patient-scoped Observation searches."""
+
+    def test_patient_and_code(self, store):
+        """Test searching Observations by patient and code."""
+        bundle = store.search("Observation", {"patient": "S6315806", "code": "MG"})
+        assert bundle["resourceType"] == "Bundle"
+        assert bundle["type"] == "searchset"
+        assert bundle["total"] == 3
+        assert sorted(_ids(bundle)) == ["101", "102", "103"]
+
+    def test_patient_reference_form(self, store):
+        """Test that patient also accepts the Patient/id reference form."""
+        bundle = store.search("Observation", {"patient": "Patient/S2874099", "code": "MG"})
+        assert _ids(bundle) == ["106"]
+
+    def test_category(self, store):
+        """Test filtering Observations by category."""
+        bundle = store.search("Observation", {"patient": "S6315806", "category": "vital-signs"})
+        assert _ids(bundle) == ["105"]
+
+    def test_date_range_with_repeated_param(self, store):
+        """Test that repeated date parameters with prefixes form a range."""
+        bundle = store.search("Observation", {
+            "patient": "S6315806",
+            "code": "MG",
+            "date": ["ge2023-11-12T10:15:00+00:00", "le2023-11-13T10:15:00+00:00"],
+        })
+        assert sorted(_ids(bundle)) == ["101", "102"]
+
+    def test_date_day_equality(self, store):
+        """Test that a plain day matches every time on that day."""
+        bundle = store.search("Observation", {"patient": "S6315806", "date": "2023-11-13"})
+        assert sorted(_ids(bundle)) == ["102", "104", "105"]
+
+    def test_sort_descending_by_date(self, store):
+        """Test sorting by -date puts the newest first."""
+        bundle = store.search("Observation", {"patient": "S6315806", "code": "MG", "_sort": "-date"})
+        assert _ids(bundle) == ["102", "101", "103"]
+
+    def test_count_and_next_link(self, store):
+        """Test that _count pages results and the next link continues without overlap."""
+        bundle = store.search("Observation", {"patient": "S6315806", "_count": "2", "_sort": "date"})
+        assert bundle["total"] == 5
+        assert len(bundle["entry"]) == 2
+        next_link = [l for l in bundle["link"] if l["relation"] == "next"]
+        assert next_link and "_offset=2" in next_link[0]["url"]
+
+        second = store.search("Observation", {"patient": "S6315806", "_count": "2", "_sort": "date", "_offset": "2"})
+        assert len(second["entry"]) == 2
+        assert not set(_ids(bundle)) & set(_ids(second))
+
+    def test_summary_count(self, store):
+        """Test that _summary=count returns the total without entries."""
+        bundle = store.search("Observation", {"patient": "S6315806", "_summary": "count"})
+        assert bundle["total"] == 5
+        assert "entry" not in bundle
+
+    def test_elements_projection(self, store):
+        """Test that _elements keeps only the requested elements plus id and type."""
+        bundle = store.search("Observation", {"patient": "S2874099", "_elements": "valueQuantity"})
+        resource = bundle["entry"][0]["resource"]
+        assert set(resource) == {"resourceType", "id", "valueQuantity"}
+
+    def test_no_matches_has_no_entry(self, store):
+        """Test that an empty result has total 0 and no entry list."""
+        bundle = store.search("Observation", {"patient": "S6315806", "code": "A1C"})
+        assert bundle["total"] == 0
+        assert "entry" not in bundle
+
+    def test_unknown_parameter_raises(self, store):
+        """Test that an unsupported parameter raises SearchError."""
+        with pytest.raises(SearchError):
+            store.search("Observation", {"patient": "S6315806", "bogus": "1"})
+
+
+class TestSearchPatients:
+    """Tests for Patient demographic searches."""
+
+    def test_name_and_birthdate(self, store):
+        """Test searching Patients by name and birthdate together."""
+        bundle = store.search("Patient", {"name": "Peter", "birthdate": "1932-12-29"})
+        assert _ids(bundle) == ["S6315806"]
+
+    def test_family_is_case_and_accent_insensitive(self, store):
+        """Test that family matches regardless of case and accents."""
+        bundle = store.search("Patient", {"family": "muller"})
+        assert _ids(bundle) == ["S2874099"]
+
+    def test_string_search_is_prefix_match(self, store):
+        """Test that string parameters match prefixes, not substrings."""
+        assert _ids(store.search("Patient", {"given": "Pet"})) == ["S6315806"]
+        assert _ids(store.search("Patient", {"given": "eter"})) == []
+
+    def test_identifier_with_system(self, store):
+        """Test that identifier accepts the system|value form."""
+        bundle = store.search("Patient", {"identifier": "http://hospital.smarthealthit.org|S2874099"})
+        assert _ids(bundle) == ["S2874099"]
+
+    def test_birthdate_mismatch(self, store):
+        """Test that a different birthdate excludes an otherwise matching Patient."""
+        bundle = store.search("Patient", {"family": "Stafford", "birthdate": "1932-12-30"})
+        assert bundle["total"] == 0
+
+    def test_demographic_index_narrows_candidates(self, store):
+        """Test that the demographic index narrows candidates and :contains scans all."""
+        assert [p["id"] for p in store._candidates("Patient", {"birthdate": "1970-05-01"})] == ["S2874099"]
+        assert [p["id"] for p in store._candidates("Patient", {"name": "STAF", "identifier": "S6315806"})] \
+            == ["S6315806"]
+        assert store._candidates("Patient", {"name:contains": "tafford"}) == list(store._resources["Patient"].values())
+
+    def test_updated_patient_is_reindexed(self, store):
+        """Test that reloading a Patient replaces its old index entries."""
+        renamed = {**PATIENTS[1], "name": [{"family": "Schmidt", "given": ["Anna"]}]}
+        store.load_bundle(_bundle([renamed]))
+        assert _ids(store.search("Patient", {"family": "Schmidt"})) == ["S2874099"]
+        assert _ids(store.search("Patient", {"family": "Muller"})) == []
+
+
+class TestR4SearchParameters:
+    """Tests that searches follow the R4 SearchParameter definitions HAPI implements."""
+
+    def test_observation_date_ignores_issued(self, store):
+        """Test that Observation date searches effective[x] only."""
+        issued = {**_observation("107", "S2874099", "K", "2023-01-01", 4.0), "issued": "2023-11-20T00:00:00Z"}
+        store.load_bundle(_bundle([issued]))
+        assert _ids(store.search("Observation", {"patient": "S2874099", "date": "2023-11-20"})) == []
+        assert _ids(store.search("Observation", {"patient": "S2874099", "date": "2023-01-01"})) == ["107"]
+
+    def test_medication_request_date_is_dosage_timing(self, store):
+        """Test that MedicationRequest date searches dosage timing events and code the medication."""
+        order = {"resourceType": "MedicationRequest", "id": "201", "status": "active", "intent": "order",
+                 "subject": {"reference": "Patient/S2874099"}, "authoredOn": "2023-11-01",
+                 "medicationCodeableConcept": {"coding": [{"system": "http://www.nlm.nih.gov/research/umls/rxnorm",
+                                                           "code": "0338-1715-40"}]},
+                 "dosageInstruction": [{"timing": {"event": ["2023-11-05", "2023-11-09"]}}]}
+        store.load_bundle(_bundle([order]))
+        search = {"patient": "S2874099", "code": "0338-1715-40"}
+        assert _ids(store.search("MedicationRequest", {**search, "date": "2023-11-09"})) == ["201"]
+        assert _ids(store.search("MedicationRequest", {**search, "date": "2023-11-01"})) == []
+        assert _ids(store.search("MedicationRequest", {**search, "authoredon": "2023-11-01"})) == ["201"]
+
+    def test_parameters_not_defined_for_the_type_are_unsupported(self, store):
+        """Test that date/status are only accepted where R4 defines them."""
+        assert store.supports("Observation", "date") and store.supports("ServiceRequest", "status")
+        assert not store.supports("Condition", "date")
+        assert not store.supports("Condition", "status")
+        assert store.supports("Condition", "clinical-status")
+        assert not store.supports("ServiceRequest", "date")
+        assert not store.supports("Encounter", "category")
+        with pytest.raises(SearchError):
+            store.search("Condition", {"patient": "S6315806", "_sort": "-date"})
+
+    def test_telecom_is_exact_token(self, store):
+        """Test that telecom matches the whole value, optionally with the system."""
+        reachable = {**PATIENTS[0], "telecom": [{"system": "phone", "value": "555-0100"}]}
+        store.load_bundle(_bundle([reachable]))
+        assert _ids(store.search("Patient", {"telecom": "555-0100"})) == ["S6315806"]
+        assert _ids(store.search("Patient", {"telecom": "phone|555-0100"})) == ["S6315806"]
+        assert _ids(store.search("Patient", {"telecom": "555"})) == []
+        assert not store.supports("Patient", "telecom:contains")
+
+
+class TestCreateAndRead:
+    """Tests for create/read."""
+
+    def test_create_assigns_id_and_is_searchable(self, store):
+        """Test that create assigns an id and version and the resource is searchable."""
+        created = store.create(_observation(None, "S2874099", "BP", "2023-11-13T10:15:00+00:00", 118))
+        assert created["id"] == "107"
+        assert created["meta"]["versionId"] == "1"
+
+        bundle = store.search("Observation", {"patient": "S2874099", "code": "BP"})
+        assert _ids(bundle) == ["107"]
+        assert store.read("Observation", "107")["id"] == "107"
+
+    def test_read_missing(self, store):
+        """Test that reading an unknown id returns None."""
+        assert store.read("Patient", "nope") is None
+
+
+class TestTransaction:
+    """Tests for all-or-nothing transaction Bundles."""
+
+    def test_creates_all_and_resolves_references(self, store):
+        """Test that a transaction creates every entry and rewrites urn:uuid references."""
+        bundle = {"resourceType": "Bundle", "type": "transaction", "entry": [
+            {"fullUrl": "urn:uuid:med", "request": {"method": "POST", "url": "MedicationRequest"},
+             "resource": {"resourceType": "MedicationRequest", "status": "active", "intent": "order",
+                          "subject": {"reference": "Patient/S2874099"}}},
+            {"fullUrl": "urn:uuid:lab", "request": {"method": "POST", "url": "ServiceRequest"},
+             "resource": {"resourceType": "ServiceRequest", "status": "active", "intent": "order",
+                          "basedOn": [{"reference": "urn:uuid:med"}],
+                          "subject": {"reference": "Patient/S2874099"}}},
+        ]}
+        response = store.transaction(bundle)
+
+        assert response["type"] == "transaction-response"
+        assert [e["response"]["status"] for e in response["entry"]] == ["201 Created", "201 Created"]
+        med_id = response["entry"][0]["response"]["location"].split("/")[1]
+        lab = store.search("ServiceRequest", {"patient": "S2874099"})["entry"][0]["resource"]
+        assert lab["basedOn"] == [{"reference": f"MedicationRequest/{med_id}"}]
+
+    def test_invalid_entry_creates_nothing(self, store):
+        """Test that one invalid entry rolls back the whole transaction."""
+        before = store.count()
+        bundle = {"resourceType": "Bundle", "type": "transaction", "entry": [
+            {"request": {"method": "POST", "url": "MedicationRequest"},
+             "resource": {"resourceType": "MedicationRequest", "status": "active"}},
+            {"request": {"method": "POST", "url": "ServiceRequest"},
+             "resource": {"resourceType": "Observation"}},
+        ]}
+        with pytest.raises(TransactionError):
+            store.transaction(bundle)
+        assert store.count() == before
+
+
+class TestFixtureDirectory:
+    """Tests for loading exported fixtures."""
+
+    def test_lazy_patient_bundles(self, tmp_path):
+        """Test that per-patient fixture bundles load on first search."""
+        with gzip.open(tmp_path / "Patient.json.gz", "wt") as f:
+            json.dump(_bundle(PATIENTS), f)
+        (tmp_path / "patients").mkdir()
+        (tmp_path / "patients" / "S6315806.json").write_text(
+            json.dumps(_bundle([o for o in OBSERVATIONS if o["subject"]["reference"].endswith("S6315806")]))
+        )
+
+        store = FHIRStore.from_directory(tmp_path)
+        assert store.count() == 2  # only Patients loaded up front
+
+        bundle = store.search("Observation", {"patient": "S6315806", "code": "K"})
+        assert _ids(bundle) == ["104"]
+        assert store.count("Observation") == 5
+
+    def test_everything(self, store):
+        """Test that everything() returns the patient's compartment, or None if unknown."""
+        bundle = store.everything("S2874099")
+        types = sorted(e["resource"]["resourceType"] for e in bundle["entry"])
+        assert types == ["Observation", "Patient"]
+        assert store.everything("missing") is None
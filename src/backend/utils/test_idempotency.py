@@ -0,0 +1,158 @@
+"""
+Tests for idempotent FHIR creates.
+
+Uses the in-memory FHIR server as upstream, behind a transport that applies a
+POST and then times out, as a server answering too slowly would.
+"""
+
+import httpx
+import pytest
+
+from src.backend.fhir_memory_server import create_app
+from src.backend.utils.fhir_client import FHIRClient
+from src.backend.utils.fhir_store import FHIRStore, PreconditionError
+from src.backend.utils.idempotency import (IDEMPOTENCY_SYSTEM, action_key, idempotency_enabled, idempotency_key,
+                                           if_none_exist, with_idempotency_key)
+from src.backend.utils.parser import Action, ActionType
+
+BASE = "http://fhir.test/fhir"
+ORDER = {"resourceType": "MedicationRequest", "status": "active", "intent": "order",
+         "subject": {"reference": "Patient/S1"}}
+
+
+class TimeoutAfterApply(httpx.AsyncBaseTransport):
+    """Forwards every request but times out the first POST after the server applied it."""
+
+    def __init__(self, app):
+        self.inner = httpx.ASGITransport(app=app)
+        self.posts = 0
+
+    async def handle_async_request(self, request):
+        self.last_headers = request.headers
+        response = await self.inner.handle_async_request(request)
+        if request.method == "POST":
+            self.posts += 1
+            if self.posts == 1:
+                raise httpx.ReadTimeout("response lost", request=request)
+        return response
+
+
+@pytest.fixture
+def store():
+    store = FHIRStore(base_url=BASE)
+    store.load_bundle({"resourceType": "Bundle", "type": "collection", "entry": [
+        {"resource": {"resourceType": "Patient", "id": "S1", "name": [{"family": "Lee"}]}},
+    ]})
+    return store
+
+
+def _client(store):
+    transport = TimeoutAfterApply(create_app(store))
+    client = FHIRClient(BASE)
+    client._client = httpx.AsyncClient(transport=transport)
+    return client, transport
+
+
+class TestKeys:
+    """Tests for key derivation and stamping."""
+
+    def test_key_is_deterministic(self):
+        """Test that keys depend on run, round and body content but not key order."""
+        key = idempotency_key("run", 2, "/fhir/MedicationRequest", ORDER)
+        assert key == idempotency_key("run", 2, "/fhir/MedicationRequest", dict(reversed(ORDER.items())))
+        assert key != idempotency_key("run", 3, "/fhir/MedicationRequest", ORDER)
+        assert key != idempotency_key("other", 2, "/fhir/MedicationRequest", ORDER)
+
+    def test_action_key(self):
+        """Test that POSTs and transactions get a key and GETs do not."""
+        post = Action(type=ActionType.POST, endpoint="/fhir/MedicationRequest", body=ORDER)
+        assert action_key("run", 1, post) == idempotency_key("run", 1, "/fhir/MedicationRequest", ORDER)
+        assert action_key("run", 1, Action(type=ActionType.TRANSACTION, entries=[post, post])) is not None
+        assert action_key("run", 1, Action(type=ActionType.GET, endpoint="/fhir/Patient")) is None
+
+    def test_stamp_does_not_modify_body(self):
+        """Test that stamping copies the body and is idempotent."""
+        stamped = with_idempotency_key(ORDER, "abc")
+        assert stamped["identifier"] == [{"system": IDEMPOTENCY_SYSTEM, "value": "abc"}]
+        assert "identifier" not in ORDER
+        assert with_idempotency_key(stamped, "abc")["identifier"] == stamped["identifier"]
+
+    def test_body_that_cannot_carry_key_is_unchanged(self):
+        """Test that bodies without a list identifier are returned unchanged."""
+        for body in ({**ORDER, "identifier": {"value": "x"}}, {**ORDER, "identifier": "x"}, [ORDER]):
+            assert with_idempotency_key(body, "abc") is body
+
+    def test_opt_in(self, monkeypatch):
+        """Test that idempotent POSTs are off unless FHIR_IDEMPOTENT_POSTS is set."""
+        monkeypatch.delenv("FHIR_IDEMPOTENT_POSTS", raising=False)
+        assert idempotency_enabled() is False
+        monkeypatch.setenv("FHIR_IDEMPOTENT_POSTS", "1")
+        assert idempotency_enabled() is True
+
+
+class TestConditionalCreate:
+    """Tests for retried POSTs against the in-memory server."""
+
+    @pytest.mark.asyncio
+    async def test_keyed_post_retries_without_duplicate(self, store):
+        """Test that a keyed POST retried after a lost response creates one resource."""
+        client, transport = _client(store)
+        try:
+            result = await client.post("/MedicationRequest", ORDER, idempotency_key="k1")
+        finally:
+            await client.close()
+
+        assert result.success is True
+        assert result.status_code == 200  # the retry found the first attempt's resource
+        assert transport.posts == 2
+        assert store.count("MedicationRequest") == 1
+
+    @pytest.mark.asyncio
+    async def test_unkeyed_post_is_not_retried(self, store):
+        """Test that a POST without a key is not retried after a timeout."""
+        client, transport = _client(store)
+        try:
+            result = await client.post("/MedicationRequest", ORDER)
+        finally:
+            await client.close()
+
+        assert result.success is False
+        assert transport.posts == 1
+        assert store.count("MedicationRequest") == 1
+
+    @pytest.mark.asyncio
+    async def test_keyed_post_with_unstampable_body_is_sent_unkeyed(self, store):
+        """Test that a key is dropped, with its If-None-Exist, when the body cannot carry it."""
+        client, transport = _client(store)
+        try:
+            result = await client.post("/MedicationRequest", {**ORDER, "identifier": "x"}, idempotency_key="k3")
+        finally:
+            await client.close()
+
+        assert result.success is False  # the unkeyed POST timed out and is not retried
+        assert transport.posts == 1
+        assert "If-None-Exist" not in transport.last_headers
+
+    @pytest.mark.asyncio
+    async def test_keyed_transaction_retries_without_duplicate(self, store):
+        """Test that a keyed transaction retried after a lost response creates each resource once."""
+        client, transport = _client(store)
+        lab = {"resourceType": "ServiceRequest", "status": "active", "intent": "order",
+               "subject": {"reference": "Patient/S1"}}
+        try:
+            result = await client.transaction([("/MedicationRequest", ORDER), ("/ServiceRequest", lab)],
+                                              idempotency_key="k2")
+        finally:
+            await client.close()
+
+        assert result.success is True
+        assert [e["response"]["status"] for e in result.data["entry"]] == ["200 OK", "200 OK"]
+        assert store.count("MedicationRequest") == 1
+        assert store.count("ServiceRequest") == 1
+
+    def test_multiple_matches_is_precondition_failure(self, store):
+        """Test that two resources with the same key fail the conditional create."""
+        store.create(with_idempotency_key(ORDER, "dup"))
+        store.create(with_idempotency_key(ORDER, "dup"))
+        with pytest.raises(PreconditionError):
+            store.find_existing("MedicationRequest", if_none_exist("dup"))
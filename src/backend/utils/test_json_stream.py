@@ -0,0 +1,143 @@
+"""
+Tests for the streaming FHIR JSON decoder.
+
+Feeds the same documents in chunks of different sizes and checks the result
+matches json.loads, plus the entry/byte caps and the FHIRClient integration.
+"""
+
+import json
+
+import pytest
+
+from src.backend.utils.fhir_client import FHIRClient
+from src.backend.utils.json_stream import SUBSETTED_TAG, BundleDecoder, StreamLimits, limits_from_env
+
+
+def _bundle(n):
+    return {
+        "resourceType": "Bundle",
+        "type": "searchset",
+        "total": n,
+        "link": [{"relation": "self", "url": "http://fhir.test/fhir/Observation?patient=S1"}],
+        "entry": [
+            {"fullUrl": f"http://fhir.test/fhir/Observation/{i}",
+             "resource": {"resourceType": "Observation", "id": str(i), "status": "final",
+                          "text": {"status": "generated", "div": "<div>Magnésium</div>"},
+                          "valueQuantity": {"value": i * 0.25, "unit": "mg/dL"}},
+             "search": {"mode": "match"}}
+            for i in range(n)
+        ],
+    }
+
+
+def _decode(raw, chunk_size, limits=None):
+    decoder = BundleDecoder(limits)
+    for i in range(0, len(raw), chunk_size):
+        if not decoder.feed(raw[i:i + chunk_size]):
+            break
+    return decoder.close(), decoder
+
+
+def _without_narrative(bundle):
+    for entry in bundle["entry"]:
+        entry["resource"].pop("text")
+    return bundle
+
+
+class TestBundleDecoder:
+    """Tests for incremental decoding."""
+
+    @pytest.mark.parametrize("chunk_size", [1, 7, 4096, 1 << 20])
+    def test_matches_json_loads(self, chunk_size):
+        """Test that any chunking decodes to json.loads output minus entry narratives."""
+        raw = json.dumps(_bundle(50), indent=2).encode("utf-8")
+        decoded, decoder = _decode(raw, chunk_size)
+        assert decoded == _without_narrative(json.loads(raw))
+        assert decoder.bytes_read == len(raw)
+        assert decoder.truncated is False
+
+    def test_number_split_across_chunks(self):
+        """Test that a number split across two chunks is decoded whole."""
+        decoder = BundleDecoder()
+        decoder.feed(b'{"resourceType": "Bundle", "total": 12')
+        decoder.feed(b'34, "entry": []}')
+        assert decoder.close() == {"resourceType": "Bundle", "total": 1234, "entry": []}
+
+    def test_non_bundle_documents(self):
+        """Test that resources and arrays decode unchanged."""
+        resource = {"resourceType": "Patient", "id": "S1", "text": {"div": "<div/>"}}
+        decoded, _ = _decode(json.dumps(resource).encode(), 5)
+        assert decoded == resource  # narrative is only dropped from Bundle entries
+        decoded, _ = _decode(b"[1, 2, 3]", 2)
+        assert decoded == [1, 2, 3]
+
+    def test_entry_cap_truncates_and_tags(self):
+        """Test that the entry cap stops reading and tags the Bundle as subsetted."""
+        raw = json.dumps(_bundle(100)).encode()
+        decoded, decoder = _decode(raw, 256, StreamLimits(max_entries=10))
+        assert len(decoded["entry"]) == 10
+        assert decoded["total"] == 100
+        assert decoded["meta"]["tag"] == [SUBSETTED_TAG]
+        assert decoder.truncated is True
+        assert decoder.bytes_read < len(raw)  # stopped reading early
+
+    def test_byte_cap_truncates_bundle(self):
+        """Test that the byte cap truncates a Bundle to the entries read."""
+        raw = json.dumps(_bundle(100)).encode()
+        decoded, decoder = _decode(raw, 512, StreamLimits(max_bytes=4096))
+        assert 0 < len(decoded["entry"]) < 100
+        assert decoder.truncated is True
+
+    def test_byte_cap_rejects_other_documents(self):
+        """Test that a non-Bundle over the byte cap raises ValueError."""
+        raw = json.dumps({"resourceType": "Binary", "data": "x" * 10000}).encode()
+        with pytest.raises(ValueError):
+            _decode(raw, 1024, StreamLimits(max_bytes=4096))
+
+    def test_incomplete_document_raises(self):
+        """Test that a truncated document raises ValueError on close."""
+        raw = json.dumps(_bundle(3)).encode()
+        with pytest.raises(ValueError):
+            _decode(raw[:-5], 64)
+
+    def test_malformed_entry_raises_before_entry_cap(self):
+        """Test that a malformed entry raises at once instead of being buffered."""
+        raw = b'{"resourceType": "Bundle", "entry": [{"resource": {"id": "1" "status": "final"}},' \
+              + b'{"resource": {"id": "2"}},' * 100
+        decoder = BundleDecoder(StreamLimits(max_entry_bytes=1 << 20))
+        with pytest.raises(ValueError):
+            for i in range(0, len(raw), 32):
+                decoder.feed(raw[i:i + 32])
+        assert decoder.bytes_read < 200  # rejected on the chunk after the error, not buffered
+        assert decoder.truncated is False
+
+    def test_opt_in(self, monkeypatch):
+        """Test that streaming decode is off unless FHIR_STREAM_DECODE is set."""
+        monkeypatch.delenv("FHIR_STREAM_DECODE", raising=False)
+        assert limits_from_env() is None
+        monkeypatch.setenv("FHIR_STREAM_DECODE", "1")
+        assert limits_from_env() == StreamLimits()
+
+
+class TestFHIRClientStreaming:
+    """Tests for FHIRClient with stream_limits."""
+
+    @pytest.mark.asyncio
+    async def test_get_decodes_incrementally(self, httpx_mock):
+        """Test that FHIRClient.get applies the stream limits to the response."""
+        httpx_mock.add_response(
+            url="http://localhost:8080/fhir/Observation?patient=S1",
+            json=_bundle(30),
+            headers={"Content-Type": "application/fhir+json"},
+        )
+
+        client = FHIRClient("http://localhost:8080", stream_limits=StreamLimits(max_entries=20))
+        try:
+            result = await client.get("/fhir/Observation", {"patient": "S1"})
+        finally:
+            await client.close()
+
+        assert result.success is True
+        assert len(result.data["entry"]) == 20
+        assert "text" not in result.data["entry"][0]["resource"]
+        assert result.data["meta"]["tag"] == [SUBSETTED_TAG]
@@ -0,0 +1,62 @@
+"""
+Tests for the JSON codec.
+
+Runs against whichever backend is installed and against the json fallback.
+"""
+
+import json
+
+import pytest
+
+from src.backend.utils import jsoncodec
+from src.backend.utils.fhir_client import FHIRResult
+
+DATA = {
+    "resourceType": "Bundle",
+    "total": 2,
+    "entry": [
+        {"resource": {"resourceType": "Patient", "id": "S1", "name": [{"family": "Müller"}]}},
+        {"resource": {"resourceType": "Observation", "id": "2", "valueQuantity": {"value": 1.5},
+                      "note": [{"text": "line one\nline two"}], "component": []}},
+    ],
+}
+
+
+@pytest.fixture(params=["installed", "json"])
+def codec(request, monkeypatch):
+    if request.param == "json":
+        monkeypatch.setattr(jsoncodec, "orjson", None)
+    return jsoncodec
+
+
+class TestCodec:
+    """Tests for dumps/loads."""
+
+    def test_pretty_matches_json_module(self, codec):
+        """Test that the prompt format is json.dumps(indent=2), non-ASCII escapes included."""
+        assert codec.dumps(DATA, indent=True) == json.dumps(DATA, indent=2)
+        emoji = {"note": "\U0001F600 ok"}
+        assert codec.dumps(emoji, indent=True) == json.dumps(emoji, indent=2)
+
+    def test_compact_is_smaller_and_single_line(self, codec):
+        """Test that the event stream format has no whitespace between tokens."""
+        text = codec.dumps(DATA)
+        assert "\n" not in text
+        assert len(text) < len(json.dumps(DATA))
+        assert "Müller" in text
+
+    def test_round_trip(self, codec):
+        """Test that loads reads back dumps output from text and bytes."""
+        assert codec.loads(codec.dumps(DATA)) == DATA
+        assert codec.loads(codec.dumps(DATA).encode("utf-8")) == DATA
+
+
+class TestFHIRResultJSON:
+    """Tests for serialize-once results."""
+
+    def test_to_json_is_cached(self):
+        """Test that the pretty text is serialized once."""
+        result = FHIRResult(success=True, status_code=200, data=DATA)
+        first = result.to_json()
+        assert json.loads(first) == DATA
+        assert result.to_json() is first
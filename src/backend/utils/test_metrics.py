@@ -0,0 +1,117 @@
+"""
+Tests for the Prometheus-style metrics.
+"""
+
+import pytest
+
+from src.backend.utils.metrics import Registry, SpanMetrics, hit_ratio, resource_type
+from src.backend.utils.tracing import Tracer, activate, span
+
+
+def _samples(text):
+    """Sample lines as {name-with-labels: value}."""
+    return {line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1])
+            for line in text.splitlines() if line and not line.startswith("#")}
+
+
+class TestRegistry:
+    """Tests for metric types and the text format."""
+
+    def test_counter_and_gauge(self):
+        """Test that counters and gauges render with HELP, TYPE and labels."""
+        registry = Registry()
+        requests = registry.counter("sara_requests_total", "Requests", ("status",))
+        in_flight = registry.gauge("sara_in_flight", "In flight")
+        requests.inc(status="ok")
+        requests.inc(2, status="error")
+        in_flight.inc()
+        in_flight.inc()
+        in_flight.dec()
+
+        text = registry.render()
+        assert "# TYPE sara_requests_total counter" in text
+        assert "# HELP sara_in_flight In flight" in text
+        assert _samples(text) == {
+            'sara_requests_total{status="error"}': 2,
+            'sara_requests_total{status="ok"}': 1,
+            "sara_in_flight": 1,
+        }
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test that histogram buckets count every value at or below them."""
+        registry = Registry()
+        latency = registry.histogram("sara_latency_seconds", "Latency", buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 3.0):
+            latency.observe(value)
+
+        samples = _samples(registry.render())
+        assert samples['sara_latency_seconds_bucket{le="0.1"}'] == 1
+        assert samples['sara_latency_seconds_bucket{le="1"}'] == 3
+        assert samples['sara_latency_seconds_bucket{le="+Inf"}'] == 4
+        assert samples["sara_latency_seconds_sum"] == pytest.approx(4.05)
+        assert samples["sara_latency_seconds_count"] == 4
+
+    def test_gauge_callback_is_read_at_render(self):
+        """Test that gauge callbacks are read when the registry renders."""
+        registry = Registry()
+        running = []
+        registry.gauge("sara_active", "Active", callback=lambda: len(running))
+        registry.gauge("sara_hit_ratio", "Ratio", ("cache",), callback=lambda: {("patient_index",): 0.75})
+        running.append(1)
+        assert _samples(registry.render()) == {"sara_active": 1, 'sara_hit_ratio{cache="patient_index"}': 0.75}
+
+    def test_label_errors_and_escaping(self):
+        """Test that wrong labels and duplicate names raise and label values are escaped."""
+        registry = Registry()
+        counter = registry.counter("sara_total", "Total", ("path",))
+        with pytest.raises(ValueError):
+            counter.inc(status="ok")
+        with pytest.raises(ValueError):
+            registry.counter("sara_total", "Again")
+        counter.inc(path='a"b')
+        assert 'sara_total{path="a\\"b"} 1' in registry.render()
+
+
+class TestSpanMetrics:
+    """Tests for span-derived agent metrics."""
+
+    def test_spans_feed_histograms(self):
+        """Test that finished spans are recorded in the agent histograms."""
+        registry = Registry()
+        tracer = Tracer()
+        tracer.add_exporter(SpanMetrics(registry))
+
+        root = tracer.start("http.run")
+        activate(root)
+        with span("model.call"):
+            pass
+        with span("fhir.get", endpoint="http://fhir.test/fhir/Observation?patient=S1"):
+            pass
+        with span("agent.parse"):
+            pass
+        root.set(outcome="complete", rounds=2)
+        root.end()
+        activate(None)
+
+        samples = _samples(registry.render())
+        assert samples["sara_agent_model_call_seconds_count"] == 1
+        assert samples['sara_agent_fhir_request_seconds_count{method="GET",resource_type="Observation"}'] == 1
+        assert samples['sara_agent_phase_seconds_count{phase="parse"}'] == 1
+        assert samples['sara_agent_task_seconds_count{outcome="complete"}'] == 1
+        assert samples['sara_agent_rounds_per_task_bucket{outcome="complete",le="1"}'] == 0
+        assert samples['sara_agent_rounds_per_task_bucket{outcome="complete",le="2"}'] == 1
+
+    @pytest.mark.parametrize("endpoint,expected", [
+        ("/fhir/Patient", "Patient"),
+        ("http://fhir.test/fhir/Observation/123?_format=json", "Observation"),
+        ("http://fhir.test/fhir", ""),
+        ("MedicationRequest", "MedicationRequest"),
+    ])
+    def test_resource_type(self, endpoint, expected):
+        """Test extracting the resource type from FHIR endpoints."""
+        assert resource_type(endpoint) == expected
+
+    def test_hit_ratio(self):
+        """Test the hit ratio, including when nothing was looked up."""
+        assert hit_ratio(3, 1) == 0.75
+        assert hit_ratio(0, 0) == 0.0
@@ -0,0 +1,113 @@
+"""
+Tests for bounded Bundle pagination.
+
+Offset-paged searches are served by the in-memory FHIR server through httpx's
+ASGI transport; cursor-paged ones by a MockTransport.
+"""
+
+import httpx
+import pytest
+
+from src.backend.fhir_memory_server import create_app
+from src.backend.utils.fhir_store import FHIRStore
+from src.backend.utils.pagination import BundlePaginator, PageBudget, budget_from_env, next_link
+
+BASE = "http://fhir.test/fhir"
+
+
+def _store(n):
+    store = FHIRStore(base_url=BASE)
+    store.load_bundle({"resourceType": "Bundle", "type": "collection", "entry": [
+        {"resource": {"resourceType": "Observation", "id": str(i), "status": "final",
+                      "code": {"coding": [{"code": "GLU"}]},
+                      "effectiveDateTime": f"2023-11-{1 + i % 28:02d}T08:00:00+00:00",
+                      "subject": {"reference": "Patient/S1"}}}
+        for i in range(n)
+    ]})
+    return store
+
+
+async def _first_page(client, count=10):
+    response = await client.get(f"{BASE}/Observation", params={"patient": "S1", "_count": str(count)})
+    return response.json(), len(response.content)
+
+
+def _ids(bundle):
+    return [e["resource"]["id"] for e in bundle.get("entry", [])]
+
+
+class TestBundlePaginator:
+    """Tests for merging paged search results."""
+
+    @pytest.mark.asyncio
+    async def test_offset_pages_fetched_concurrently_and_merged(self):
+        """Test that the remaining offset pages are fetched and merged into one Bundle."""
+        requested = []
+
+        async def record(request):
+            requested.append(request.url.params.get("_offset"))
+
+        transport = httpx.ASGITransport(app=create_app(_store(35)))
+        async with httpx.AsyncClient(transport=transport, event_hooks={"request": [record]}) as client:
+            first, size = await _first_page(client)
+            merged = await BundlePaginator(client).merge(first, first_size=size)
+
+        assert merged["total"] == 35
+        assert sorted(_ids(merged), key=int) == [str(i) for i in range(35)]
+        assert next_link(merged) is None
+        assert sorted(requested[1:]) == ["10", "20", "30"]
+
+    @pytest.mark.asyncio
+    async def test_entry_budget_keeps_next_link(self):
+        """Test that stopping at the entry budget keeps a next link that resumes."""
+        transport = httpx.ASGITransport(app=create_app(_store(50)))
+        async with httpx.AsyncClient(transport=transport) as client:
+            first, size = await _first_page(client)
+            merged = await BundlePaginator(client, PageBudget(max_entries=25)).merge(first, size)
+            assert len(merged["entry"]) == 30
+
+            # The kept next link resumes where the merge stopped
+            rest = await client.get(next_link(merged))
+            assert _ids(rest.json()) == [str(i) for i in range(30, 40)]
+
+    @pytest.mark.asyncio
+    async def test_byte_budget(self):
+        """Test that the byte budget stops the merge after the first page."""
+        transport = httpx.ASGITransport(app=create_app(_store(50)))
+        async with httpx.AsyncClient(transport=transport) as client:
+            first, size = await _first_page(client)
+            merged = await BundlePaginator(client, PageBudget(max_bytes=size + 1)).merge(first, size)
+        assert len(merged["entry"]) == 20
+        assert next_link(merged) is not None
+
+    @pytest.mark.asyncio
+    async def test_cursor_pages_followed_sequentially(self):
+        """Test that opaque next links are followed one at a time up to max_pages."""
+        def handler(request):
+            cursor = int(request.url.params.get("cursor", "0"))
+            bundle = {"resourceType": "Bundle", "type": "searchset",
+                      "entry": [{"resource": {"resourceType": "Patient", "id": f"p{cursor}"}}]}
+            if cursor < 3:
+                bundle["link"] = [{"relation": "next", "url": f"{BASE}/Patient?cursor={cursor + 1}"}]
+            return httpx.Response(200, json=bundle)
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            first = (await client.get(f"{BASE}/Patient")).json()
+            merged = await BundlePaginator(client, PageBudget(max_pages=3)).merge(first)
+
+        assert _ids(merged) == ["p0", "p1", "p2"]
+        assert next_link(merged) == f"{BASE}/Patient?cursor=3"
+
+    @pytest.mark.asyncio
+    async def test_single_page_returned_unchanged(self):
+        """Test that a Bundle without a next link is returned as is."""
+        bundle = {"resourceType": "Bundle", "total": 1, "entry": [{"resource": {"id": "1"}}]}
+        async with httpx.AsyncClient() as client:
+            assert await BundlePaginator(client).merge(bundle) is bundle
+
+    def test_budget_is_opt_in(self, monkeypatch):
+        """Test that paging is off unless FHIR_PAGINATE is set."""
+        monkeypatch.delenv("FHIR_PAGINATE", raising=False)
+        assert budget_from_env() is None
+        monkeypatch.setenv("FHIR_PAGINATE", "1")
+        assert budget_from_env() == PageBudget()
@@ -89,6 +89,47 @@ class TestParsePostWithBody:
         assert action.body["name"][0]["family"] == "Doe"
 
 
+class TestParseTransaction:
+    """Test several POST blocks in one response."""
+
+    def test_parse_two_posts(self):
+        """Two POST blocks become a TRANSACTION with both entries in order."""
+        content = '''POST http://localhost:8080/fhir/MedicationRequest
+{"resourceType": "MedicationRequest", "status": "active", "intent": "order"}
+POST http://localhost:8080/fhir/ServiceRequest
+{
+    "resourceType": "ServiceRequest",
+    "status": "active",
+    "intent": "order"
+}'''
+
+        action = parse_action(content)
+
+        assert action.type == ActionType.TRANSACTION
+        assert [e.type for e in action.entries] == [ActionType.POST, ActionType.POST]
+        assert [e.endpoint for e in action.entries] == ["/fhir/MedicationRequest", "/fhir/ServiceRequest"]
+        assert action.entries[1].body["resourceType"] == "ServiceRequest"
+
+    def test_invalid_block_is_unknown(self):
+        """A transaction with an unparseable body is not partially accepted."""
+        content = '''POST http://localhost:8080/fhir/MedicationRequest
+{"resourceType": "MedicationRequest"}
+POST http://localhost:8080/fhir/ServiceRequest
+{not json'''
+
+        action = parse_action(content)
+
+        assert action.type == ActionType.UNKNOWN
+
+    def test_single_post_is_still_post(self):
+        """One POST block keeps the plain POST action type."""
+        action = parse_action('''POST http://localhost:8080/fhir/Observation
+{"resourceType": "Observation"}''')
+
+        assert action.type == ActionType.POST
+        assert action.entries == []
+
+
 class TestParseFinishSimple:
     """Test FINISH actions with simple answers."""
 
@@ -0,0 +1,118 @@
+"""
+Tests for the warm Patient index.
+
+The in-memory FHIR server stands in for HAPI through httpx's ASGI transport.
+"""
+
+import httpx
+import pytest
+
+from src.backend.fhir_memory_server import create_app
+from src.backend.utils.fhir_client import FHIRClient
+from src.backend.utils.fhir_store import FHIRStore
+from src.backend.utils.patient_index import PatientIndex, index_enabled
+
+BASE = "http://fhir.test/fhir"
+
+
+@pytest.fixture
+def upstream():
+    store = FHIRStore(base_url=BASE)
+    store.load_bundle({"resourceType": "Bundle", "type": "collection", "entry": [{"resource": r} for r in [
+        {"resourceType": "Patient", "id": "S6315806",
+         "identifier": [{"system": "http://hospital.smarthealthit.org", "value": "S6315806"}],
+         "name": [{"family": "Stafford", "given": ["Peter"]}], "birthDate": "1932-12-29"},
+        {"resourceType": "Patient", "id": "S2874099", "name": [{"family": "Müller", "given": ["Anna"]}],
+         "birthDate": "1970-05-01"},
+    ]]})
+    return store
+
+
+@pytest.fixture
+def client(upstream):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app(upstream)))
+
+
+def _ids(bundle):
+    return [e["resource"]["id"] for e in bundle.get("entry", [])]
+
+
+class TestPatientIndex:
+    """Tests for syncing and answering Patient searches."""
+
+    @pytest.mark.asyncio
+    async def test_answers_demographic_search_after_sync(self, client):
+        """Test that the synced index answers name, birthdate and identifier searches."""
+        index = PatientIndex(client, BASE)
+        assert index.search({"name": "Peter"}) is None  # not synced yet
+
+        assert await index.sync() == 2
+        bundle = index.search({"name": "Peter", "birthdate": "1932-12-29"})
+        assert _ids(bundle) == ["S6315806"]
+        assert _ids(index.search({"family": "muller"})) == ["S2874099"]
+        assert index.search({"identifier": "S6315806"})["total"] == 1
+        await client.aclose()
+
+    @pytest.mark.asyncio
+    async def test_unsupported_parameters_fall_back(self, client):
+        """Test that searches the index cannot answer return None and are counted."""
+        index = PatientIndex(client, BASE)
+        await index.sync()
+        assert index.search({"name:phonetic": "Peter"}) is None
+        assert index.search({"general-practitioner": "Practitioner/1"}) is None
+        assert index.stats["fallbacks"] == 2
+        await client.aclose()
+
+    @pytest.mark.asyncio
+    async def test_incremental_sync_uses_last_updated(self, client, upstream):
+        """Test that a later sync fetches only Patients changed since the last one."""
+        index = PatientIndex(client, BASE)
+        await index.sync()
+        upstream.create({"resourceType": "Patient", "name": [{"family": "Okafor", "given": ["Ada"]}],
+                         "birthDate": "1988-02-03"})
+
+        requested = []
+        client.event_hooks["request"] = [lambda r: _record(requested, r)]
+        assert await index.sync() == 1
+        assert "_lastUpdated" in requested[0]
+        assert index.search({"family": "Okafor"})["total"] == 1
+        await client.aclose()
+
+    def test_opt_in(self, monkeypatch):
+        """Test that the index is off unless FHIR_PATIENT_INDEX is set."""
+        monkeypatch.delenv("FHIR_PATIENT_INDEX", raising=False)
+        assert index_enabled() is False
+        monkeypatch.setenv("FHIR_PATIENT_INDEX", "1")
+        assert index_enabled() is True
+
+    @pytest.mark.asyncio
+    async def test_stale_index_falls_back(self, client):
+        """Test that an index older than max_staleness answers nothing."""
+        index = PatientIndex(client, BASE, max_staleness=0.0)
+        await index.sync()
+        assert index.search({"name": "Peter"}) is None
+        await client.aclose()
+
+    @pytest.mark.asyncio
+    async def test_fhir_client_uses_index_for_patient_searches_only(self, client, httpx_mock):
+        """Test that FHIRClient answers Patient searches from the index but reads over HTTP."""
+        index = PatientIndex(client, BASE)
+        await index.sync()
+        httpx_mock.add_response(url="http://localhost:8080/fhir/Patient/S6315806",
+                                json={"resourceType": "Patient", "id": "S6315806"})
+
+        fhir = FHIRClient("http://localhost:8080", patient_index=index)
+        try:
+            search = await fhir.get("/fhir/Patient", {"name": "Peter", "birthdate": "1932-12-29"})
+            read = await fhir.get("/fhir/Patient/S6315806", {})
+        finally:
+            await fhir.close()
+            await client.aclose()
+
+        assert _ids(search.data) == ["S6315806"]
+        assert read.data["id"] == "S6315806"
+        assert len(httpx_mock.get_requests()) == 1
+
+
+async def _record(requested, request):
+    requested.append(str(request.url))
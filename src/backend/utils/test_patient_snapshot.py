@@ -0,0 +1,166 @@
+"""
+Tests for per-patient $everything snapshots.
+
+Offline tests use the in-memory FHIR server as upstream. The live comparison
+against HAPI runs only when SARA_LIVE_FHIR_URL points at a MedAgentBench server,
+e.g. SARA_LIVE_FHIR_URL=http://localhost:8080/fhir.
+"""
+
+import os
+
+import httpx
+import pytest
+
+from src.backend.fhir_memory_server import create_app
+from src.backend.utils.fhir_store import FHIRStore
+from src.backend.utils.patient_snapshot import PatientSnapshots, split_fhir_path
+
+BASE = "http://fhir.test/fhir"
+LIVE_FHIR_URL = os.environ.get("SARA_LIVE_FHIR_URL")
+
+
+def _observation(obs_id, patient, code, when, value):
+    return {"resourceType": "Observation", "id": obs_id, "status": "final",
+            "code": {"coding": [{"code": code}]}, "effectiveDateTime": when,
+            "valueQuantity": {"value": value}, "subject": {"reference": f"Patient/{patient}"}}
+
+
+@pytest.fixture
+def upstream():
+    store = FHIRStore(base_url=BASE)
+    store.load_bundle({"resourceType": "Bundle", "type": "collection", "entry": [{"resource": r} for r in [
+        {"resourceType": "Patient", "id": "S1", "name": [{"family": "Lee"}], "birthDate": "1950-01-01"},
+        {"resourceType": "Patient", "id": "S2", "name": [{"family": "Kim"}]},
+        _observation("1", "S1", "MG", "2023-11-12T08:00:00+00:00", 1.8),
+        _observation("2", "S1", "MG", "2023-11-13T08:00:00+00:00", 1.5),
+        _observation("3", "S1", "K", "2023-11-13T09:00:00+00:00", 3.9),
+        _observation("4", "S2", "MG", "2023-11-13T07:00:00+00:00", 2.1),
+    ]]})
+    return store
+
+
+@pytest.fixture
+def recorded_client(upstream):
+    paths = []
+
+    async def record(request):
+        paths.append(request.url.path)
+
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app(upstream)),
+                               event_hooks={"request": [record]})
+    return client, paths
+
+
+def _ids(bundle):
+    return [e["resource"]["id"] for e in bundle.get("entry", [])]
+
+
+class TestPatientSnapshots:
+    """Tests for answering searches from a snapshot."""
+
+    @pytest.mark.asyncio
+    async def test_one_upstream_call_per_patient(self, recorded_client):
+        """Test that one $everything call answers every search for that patient."""
+        client, paths = recorded_client
+        snapshots = PatientSnapshots(client, BASE)
+
+        mg = await snapshots.search("Observation", {"patient": "S1", "code": "MG", "_sort": "-date"})
+        k = await snapshots.search("Observation", {"patient": "Patient/S1", "code": "K"})
+        patient = await snapshots.search("Patient/S1", {})
+        await client.aclose()
+
+        assert _ids(mg) == ["2", "1"]
+        assert _ids(k) == ["3"]
+        assert patient["id"] == "S1"
+        assert paths == ["/fhir/Patient/S1/$everything"]
+        assert snapshots.stats == {"fetches": 1, "hits": 3, "fallbacks": 0}
+
+    @pytest.mark.asyncio
+    async def test_unscoped_or_unsupported_searches_fall_back(self, recorded_client):
+        """Test that searches without a patient or with unsupported parameters return None."""
+        client, paths = recorded_client
+        snapshots = PatientSnapshots(client, BASE)
+
+        assert await snapshots.search("Patient", {"family": "Lee"}) is None
+        assert await snapshots.search("Observation", {"patient": "S1", "value-quantity": "gt1"}) is None
+        assert await snapshots.search("Observation", {"patient": "S1", "code:text": "MG"}) is None
+        await client.aclose()
+
+    @pytest.mark.asyncio
+    async def test_unknown_patient_falls_back_without_refetching(self, recorded_client):
+        """Test that an unknown patient is remembered and not fetched again."""
+        client, paths = recorded_client
+        snapshots = PatientSnapshots(client, BASE)
+        for _ in range(2):
+            assert await snapshots.search("Observation", {"patient": "missing"}) is None
+        await client.aclose()
+        assert len(paths) == 1
+
+    @pytest.mark.asyncio
+    async def test_write_is_applied_to_snapshot(self, recorded_client, upstream):
+        """Test that a write through the agent shows up in the cached snapshot."""
+        client, paths = recorded_client
+        snapshots = PatientSnapshots(client, BASE)
+        await snapshots.search("Observation", {"patient": "S1"})
+
+        created = upstream.create(_observation(None, "S1", "MG", "2023-11-13T10:00:00+00:00", 1.2))
+        snapshots.apply_write(created)
+
+        bundle = await snapshots.search("Observation", {"patient": "S1", "code": "MG"})
+        await client.aclose()
+        assert created["id"] in _ids(bundle)
+        assert len(paths) == 1
+
+    @pytest.mark.asyncio
+    async def test_malformed_everything_falls_back(self):
+        """Test that a non-JSON $everything response returns None."""
+        client = httpx.AsyncClient(transport=httpx.MockTransport(
+            lambda request: httpx.Response(200, text="<html>upstream timeout</html>")))
+        snapshots = PatientSnapshots(client, BASE)
+        assert await snapshots.search("Observation", {"patient": "S1"}) is None
+        await client.aclose()
+
+
+class TestSplitFhirPath:
+    """Tests for base/endpoint splitting."""
+
+    def test_root_base_with_prefixed_endpoint(self):
+        """Test splitting a server root base and a /fhir endpoint."""
+        assert split_fhir_path("http://h:8080", "/fhir/Observation") == ("http://h:8080/fhir", "Observation")
+
+    def test_fhir_base_with_bare_endpoint(self):
+        """Test splitting a /fhir base and a bare endpoint."""
+        assert split_fhir_path("http://h/fhir/", "/Patient/S1") == ("http://h/fhir", "Patient/S1")
+
+    def test_fhir_base_with_prefixed_endpoint(self):
+        """Test that a /fhir prefix is not doubled when the base has one."""
+        assert split_fhir_path("http://h/fhir", "/fhir/Patient") == ("http://h/fhir", "Patient")
+
+
+@pytest.mark.skipif(not LIVE_FHIR_URL, reason="SARA_LIVE_FHIR_URL not set")
+class TestAgainstLiveHAPI:
+    """Snapshot answers match HAPI's for the agent's searches."""
+
+    SEARCHES = [
+        ("Observation", {"code": "MG"}),
+        ("Observation", {"code": "GLU", "date": "ge2023-11-12T10:15:00+00:00"}),
+        ("Observation", {"category": "vital-signs"}),
+        ("MedicationRequest", {}),
+        ("Condition", {"category": "problem-list-item"}),
+        ("Procedure", {}),
+    ]
+
+    @pytest.mark.asyncio
+    async def test_matches_upstream(self):
+        """Test that snapshot answers list the same resources as live HAPI searches."""
+        async with httpx.AsyncClient(timeout=120.0, headers={"Accept": "application/fhir+json"}) as client:
+            patients = (await client.get(f"{LIVE_FHIR_URL}/Patient", params={"_count": "3"})).json()
+            snapshots = PatientSnapshots(client, LIVE_FHIR_URL)
+            for entry in patients.get("entry", []):
+                patient_id = entry["resource"]["id"]
+                for resource_type, extra in self.SEARCHES:
+                    params = {"patient": patient_id, "_count": "1000", **extra}
+                    live = (await client.get(f"{LIVE_FHIR_URL}/{resource_type}", params=params)).json()
+                    local = await snapshots.search(resource_type, params)
+                    assert local is not None, (resource_type, params)
+                    assert sorted(_ids(local)) == sorted(_ids(live)), (resource_type, params)
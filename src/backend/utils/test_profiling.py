@@ -0,0 +1,137 @@
+"""
+Tests for on-demand request profiling.
+"""
+
+import asyncio
+import cProfile
+import marshal
+import pstats
+
+import pytest
+
+from src.backend.utils.profiling import (ProfileStore, profile_block, profiled_coroutine, requested_profile)
+
+
+def _function_names(artifact):
+    stats = marshal.loads(artifact.content)
+    return {name for (_, _, name) in stats}
+
+
+def profiled_work():
+    return sum(range(1000))
+
+
+def other_work():
+    return sum(range(1000))
+
+
+class TestRequestedProfile:
+    """Tests for the per-request toggle."""
+
+    def test_disabled_without_token(self):
+        """Test that profiling is off when no token is configured."""
+        assert requested_profile({"X-Sara-Profile": "secret"}, {}, None) is None
+
+    def test_token_must_match(self):
+        """Test that a missing or wrong token does not enable profiling."""
+        assert requested_profile({"X-Sara-Profile": "wrong"}, {}, "secret") is None
+        assert requested_profile({}, {}, "secret") is None
+
+    def test_header_query_and_mode(self):
+        """Test that the token works as header or query parameter and the mode header picks torch."""
+        assert requested_profile({"X-Sara-Profile": "secret"}, {}, "secret") == "cprofile"
+        assert requested_profile({}, {"profile": "secret"}, "secret") == "cprofile"
+        headers = {"X-Sara-Profile": "secret", "X-Sara-Profile-Mode": "torch"}
+        assert requested_profile(headers, {}, "secret") == "torch"
+
+
+class TestProfiledCoroutine:
+    """Tests for profiling one coroutine on a shared event loop."""
+
+    @pytest.mark.asyncio
+    async def test_other_tasks_are_not_profiled(self):
+        """Test that only the profiled coroutine's work is recorded."""
+        async def run():
+            for _ in range(3):
+                profiled_work()
+                await asyncio.sleep(0)
+            return "done"
+
+        async def neighbour():
+            for _ in range(3):
+                other_work()
+                await asyncio.sleep(0)
+
+        store = ProfileStore()
+        profile_id = store.reserve()
+        assert store.is_pending(profile_id) and store.get(profile_id) is None
+
+        result, _ = await asyncio.gather(store.capture(profile_id, run(), "run"), neighbour())
+
+        assert result == "done"
+        artifact = store.get(profile_id)
+        assert artifact.filename == "run.prof"
+        names = _function_names(artifact)
+        assert "profiled_work" in names and "other_work" not in names
+        assert "profiled_work" in artifact.summary
+
+    @pytest.mark.asyncio
+    async def test_errors_and_cancellation_reach_the_coroutine(self):
+        """Test that exceptions and cancellation pass through the profiler."""
+        async def failing():
+            await asyncio.sleep(0)
+            raise RuntimeError("boom")
+
+        with pytest.raises(RuntimeError):
+            await profiled_coroutine(failing(), cProfile.Profile())
+
+        cancelled = []
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        task = asyncio.ensure_future(profiled_coroutine(slow(), cProfile.Profile()))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert cancelled == [True]
+
+
+class TestProfileBlock:
+    """Tests for profiling synchronous blocks."""
+
+    def test_cprofile_artifact_loads_with_pstats(self, tmp_path):
+        """Test that the cProfile artifact is a valid pstats file."""
+        with profile_block("cprofile", "chat-1") as captured:
+            profiled_work()
+        path = tmp_path / captured.artifact.filename
+        path.write_bytes(captured.artifact.content)
+        assert pstats.Stats(str(path)).total_calls > 0
+
+    def test_torch_mode_always_produces_an_artifact(self):
+        """Test that torch mode yields a trace, or cProfile without torch."""
+        with profile_block("torch", "chat-2") as captured:
+            profiled_work()
+        # Chrome trace with torch installed, cProfile otherwise
+        assert captured.artifact.filename in ("chat-2.trace.json", "chat-2.prof")
+        assert captured.artifact.content
+
+
+class TestProfileStore:
+    """Tests for artifact retention."""
+
+    def test_bounded_by_count(self):
+        """Test that the oldest artifact is dropped beyond max_items."""
+        store = ProfileStore(max_items=2)
+        ids = [store.reserve() for _ in range(3)]
+        for profile_id in ids:
+            with profile_block("cprofile", profile_id) as captured:
+                pass
+            store.put(profile_id, captured.artifact)
+        assert store.get(ids[0]) is None
+        assert store.get(ids[2]) is not None
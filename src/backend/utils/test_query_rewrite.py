@@ -0,0 +1,65 @@
+"""
+Tests for the FHIR query rewriter.
+"""
+
+from src.backend.utils.fhir_store import FHIRStore
+from src.backend.utils.query_rewrite import DEFAULT_RULES, QueryRewriter, RewriteRule, rewriter_from_env
+
+
+class TestQueryRewriter:
+    """Tests for per-type search rewriting."""
+
+    def test_observation_search_gets_projection_sort_and_count(self):
+        """Test that Observation searches gain _elements, _sort and _count."""
+        params = QueryRewriter().rewrite("/fhir/Observation", {"patient": "S1", "code": "MG"})
+        assert params["patient"] == "S1"
+        assert params["_sort"] == "-date"
+        assert params["_count"] == "200"
+        assert "valueQuantity" in params["_elements"].split(",")
+
+    def test_model_parameters_are_not_overridden(self):
+        """Test that parameters the model sent are kept."""
+        params = QueryRewriter().rewrite("/fhir/Observation", {"patient": "S1", "_count": "5", "_sort": "date"})
+        assert (params["_count"], params["_sort"]) == ("5", "date")
+
+    def test_summary_suppresses_elements(self):
+        """Test that _summary searches get no _elements."""
+        params = QueryRewriter().rewrite("/fhir/Observation", {"patient": "S1", "_summary": "count"})
+        assert "_elements" not in params
+
+    def test_reads_and_unknown_types_untouched(self):
+        """Test that reads, operations and types without a rule are not rewritten."""
+        rewriter = QueryRewriter()
+        assert rewriter.rewrite("/fhir/Patient/S1", {}) == {}
+        assert rewriter.rewrite("/fhir/Patient/S1/$everything", {}) == {}
+        assert rewriter.rewrite("/fhir/Encounter", {"patient": "S1"}) == {"patient": "S1"}
+
+    def test_input_not_mutated(self):
+        """Test that rewrite returns a new dict."""
+        original = {"patient": "S1"}
+        QueryRewriter().rewrite("/fhir/Procedure", original)
+        assert original == {"patient": "S1"}
+
+    def test_disabled(self):
+        """Test that a disabled rewriter returns the parameters as is."""
+        params = {"patient": "S1"}
+        assert QueryRewriter(enabled=False).rewrite("/fhir/Observation", params) is params
+
+    def test_custom_rules(self):
+        """Test that custom rules replace the defaults."""
+        rewriter = QueryRewriter(rules={"Patient": RewriteRule(count=1)})
+        assert rewriter.rewrite("Patient", {"name": "Lee"}) == {"name": "Lee", "_count": "1"}
+
+    def test_env_switch(self, monkeypatch):
+        """Test that FHIR_QUERY_REWRITE turns rewriting on and it is off when unset."""
+        monkeypatch.setenv("FHIR_QUERY_REWRITE", "1")
+        assert rewriter_from_env().enabled is True
+        monkeypatch.delenv("FHIR_QUERY_REWRITE")
+        assert rewriter_from_env().enabled is False
+
+    def test_rewritten_searches_are_valid(self):
+        """Test that every default rule produces a search the FHIR store accepts."""
+        store = FHIRStore()
+        for resource_type in DEFAULT_RULES:
+            params = QueryRewriter().rewrite(f"/fhir/{resource_type}", {})
+            assert store.search(resource_type, params)["total"] == 0
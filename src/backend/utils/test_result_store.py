@@ -0,0 +1,63 @@
+"""
+Tests for the lazy tool result store and summaries.
+"""
+
+from src.backend.utils import result_store
+from src.backend.utils.result_store import ResultStore, summarize
+
+
+class TestResultStore:
+    """Tests for the bounded, TTL'd store."""
+
+    def test_put_and_get(self):
+        """Test that a stored result is returned by id and unknown ids give None."""
+        store = ResultStore()
+        result_id = store.put('{"resourceType": "Patient"}')
+        assert store.get(result_id) == '{"resourceType": "Patient"}'
+        assert store.get("unknown") is None
+
+    def test_expires_after_ttl(self, monkeypatch):
+        """Test that results expire after the TTL."""
+        now = [1000.0]
+        monkeypatch.setattr(result_store.time, "monotonic", lambda: now[0])
+        store = ResultStore(ttl=60)
+        result_id = store.put("{}")
+        now[0] += 59
+        assert store.get(result_id) == "{}"
+        now[0] += 2
+        assert store.get(result_id) is None
+        assert len(store) == 0
+
+    def test_oldest_dropped_over_limits(self):
+        """Test that the oldest results are dropped beyond max_items or max_bytes."""
+        store = ResultStore(max_items=2)
+        first, second, third = store.put("1"), store.put("2"), store.put("3")
+        assert store.get(first) is None
+        assert (store.get(second), store.get(third)) == ("2", "3")
+
+        store = ResultStore(max_bytes=10)
+        first = store.put("x" * 6)
+        second = store.put("y" * 6)
+        assert store.get(first) is None
+        assert store.get(second) == "y" * 6
+
+
+class TestSummarize:
+    """Tests for result summaries."""
+
+    def test_bundle(self):
+        """Test that a Bundle summary has counts, size and the first ten ids."""
+        bundle = {"resourceType": "Bundle", "total": 30, "entry": [
+            {"resource": {"resourceType": "Observation", "id": str(i)}} for i in range(12)
+        ]}
+        summary = summarize(bundle, 4096)
+        assert summary["entries"] == 12
+        assert summary["total"] == 30
+        assert summary["bytes"] == 4096
+        assert summary["ids"][:2] == ["Observation/0", "Observation/1"]
+        assert len(summary["ids"]) == 10
+
+    def test_resource(self):
+        """Test that a single resource summary has its type, id and size."""
+        assert summarize({"resourceType": "Patient", "id": "S1"}, 100) == {
+            "resourceType": "Patient", "bytes": 100, "id": "S1"}
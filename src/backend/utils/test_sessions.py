@@ -0,0 +1,160 @@
+"""
+Tests for resumable run sessions.
+"""
+
+import asyncio
+
+import pytest
+
+from src.backend.utils import sessions as sessions_module
+from src.backend.utils.sessions import (HEARTBEAT_FRAME, RunSession, SessionRegistry, gap_frame, parse_last_event_id,
+                                        sse_frame)
+
+
+async def _collect(session, after_id=0):
+    return [frame async for frame in session.tail(after_id)]
+
+
+class TestRunSession:
+    """Tests for the event log and tailing."""
+
+    def test_frames_carry_ids(self):
+        """Test that frames carry their id line only when given one."""
+        assert sse_frame("status", '{"a": 1}', 7) == 'id: 7\nevent: status\ndata: {"a": 1}\n\n'
+        assert sse_frame("status", "{}") == "event: status\ndata: {}\n\n"
+
+    @pytest.mark.asyncio
+    async def test_replay_after_last_event_id(self):
+        """Test that tailing after an id replays only the later frames."""
+        session = RunSession("s1")
+        for i in range(5):
+            session.append("tool_result", f'{{"n": {i}}}')
+        session.finish()
+
+        frames = await _collect(session, after_id=3)
+        assert [f.split("\n")[0] for f in frames] == ["id: 4", "id: 5"]
+        assert len(await _collect(session)) == 5
+
+    @pytest.mark.asyncio
+    async def test_tail_follows_live_run(self):
+        """Test that a reader receives frames appended while it waits."""
+        session = RunSession("s1")
+        session.append("status", '{"phase": "starting"}')
+
+        async def produce():
+            for i in range(3):
+                await asyncio.sleep(0)
+                session.append("tool_result", f'{{"n": {i}}}')
+            session.finish()
+
+        reader = asyncio.create_task(_collect(session))
+        await produce()
+        frames = await asyncio.wait_for(reader, timeout=1)
+        assert len(frames) == 4
+
+    @pytest.mark.asyncio
+    async def test_log_is_bounded(self):
+        """Test that the log keeps the newest frames and readers get a gap event."""
+        session = RunSession("s1", max_events=3)
+        for i in range(10):
+            session.append("tool_result", "{}")
+        session.finish()
+        frames = await _collect(session)
+        assert frames[0] == gap_frame(0, 8)
+        assert [f.split("\n")[0] for f in frames[1:]] == ["id: 8", "id: 9", "id: 10"]
+
+    @pytest.mark.asyncio
+    async def test_resume_behind_the_log_gets_gap_event(self):
+        """Test that resuming behind the log gets a gap event naming the dropped frames."""
+        session = RunSession("s1", max_events=3)
+        for i in range(6):
+            session.append("tool_result", "{}")
+        session.finish()
+        frames = await _collect(session, after_id=2)
+        assert frames[0].startswith("event: gap\n")
+        assert '"dropped": 1' in frames[0]
+        assert [f.split("\n")[0] for f in frames[1:]] == ["id: 4", "id: 5", "id: 6"]
+        assert (await _collect(session, after_id=3))[0] == "id: 4\nevent: tool_result\ndata: {}\n\n"
+
+    @pytest.mark.asyncio
+    async def test_backlog_coalesces_consecutive_thinking(self):
+        """Test that a replayed backlog keeps only the last of consecutive thinking frames."""
+        session = RunSession("s1")
+        for event_type in ("status", "thinking", "thinking", "thinking", "tool_call", "thinking"):
+            session.append(event_type, "{}")
+        session.finish()
+
+        frames = await _collect(session)
+        assert [f.split("\n")[0] for f in frames] == ["id: 1", "id: 4", "id: 5", "id: 6"]
+        # The full log is still there for readers that want every frame
+        assert len([f async for f in session.tail(coalesce=())]) == 6
+
+    @pytest.mark.asyncio
+    async def test_producer_does_not_wait_for_reader(self):
+        """Test that appending never blocks on a missing or slow reader."""
+        session = RunSession("s1")
+        for i in range(100):
+            session.append("thinking", f'{{"n": {i}}}')  # no reader yet: never blocks
+        session.append("complete", "{}")
+        session.finish()
+        frames = await _collect(session)
+        assert [f.split("\n")[0] for f in frames] == ["id: 100", "id: 101"]
+
+    @pytest.mark.asyncio
+    async def test_idle_stream_sends_heartbeats(self):
+        """Test that an idle tail sends heartbeat comments."""
+        session = RunSession("s1")
+        tail = session.tail(heartbeat=0.01)
+        assert await asyncio.wait_for(tail.__anext__(), timeout=1) == HEARTBEAT_FRAME
+        session.append("status", "{}")
+        session.finish()
+        assert (await tail.__anext__()).startswith("id: 1\n")
+
+
+class TestSessionRegistry:
+    """Tests for session lookup and expiry."""
+
+    def test_finished_sessions_expire(self, monkeypatch):
+        """Test that finished sessions expire after the TTL and running ones stay."""
+        now = [100.0]
+        monkeypatch.setattr(sessions_module.time, "monotonic", lambda: now[0])
+        registry = SessionRegistry(ttl=60)
+        running, done = registry.create(), registry.create()
+        done.finish()
+
+        now[0] += 61
+        assert registry.get(done.id) is None
+        assert registry.get(running.id) is running
+
+    def test_running_sessions_are_not_evicted(self):
+        """Test that only finished sessions are evicted over max_sessions."""
+        registry = SessionRegistry(max_sessions=1)
+        first, second = registry.create(), registry.create()
+        assert registry.get(first.id) is first
+        first.finish()
+        registry.create()
+        assert registry.get(first.id) is None
+        assert registry.get(second.id) is second
+
+    def test_total_bytes_are_bounded(self):
+        """Test that the total byte cap drops finished sessions first, then trims running logs."""
+        frame_size = len(sse_frame("tool_result", "x" * 100, 1))
+        registry = SessionRegistry(max_total_bytes=10 * frame_size)
+        done = registry.create()
+        for _ in range(4):
+            done.append("tool_result", "x" * 100)
+        done.finish()
+        running = registry.create()
+        for _ in range(8):
+            running.append("tool_result", "x" * 100)
+        assert registry.get(done.id) is None  # finished sessions are dropped first
+        for _ in range(4):
+            running.append("tool_result", "x" * 100)
+        assert registry.get(running.id) is running
+        assert running.size <= 10 * frame_size  # then the running log is trimmed
+
+    def test_parse_last_event_id(self):
+        """Test that invalid or missing Last-Event-ID headers give 0."""
+        assert parse_last_event_id("12") == 12
+        assert parse_last_event_id(None) == 0
+        assert parse_last_event_id("x") == 0
@@ -0,0 +1,113 @@
+"""
+Tests for spans, traceparent propagation and JSONL export.
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from src.backend.utils.fhir_client import FHIRClient
+from src.backend.utils.parser import Action, ActionType
+from src.backend.utils.tracing import (JsonlExporter, Span, Tracer, activate, current_span, parse_traceparent,
+                                       span, traceparent_headers)
+
+
+def _read(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+class TestSpans:
+    """Tests for span nesting and export."""
+
+    def test_children_share_the_trace_and_export_as_jsonl(self, tmp_path):
+        """Test that nested spans share the trace and are exported as they end."""
+        path = tmp_path / "trace.jsonl"
+        tracer = Tracer(JsonlExporter(str(path)))
+        root = tracer.start("http.run", task="task1")
+        activate(root)
+        with span("model.call", round=0) as model_span:
+            with span("fhir.get") as fhir_span:
+                assert current_span() is fhir_span
+            assert current_span() is model_span
+        assert current_span() is root
+        root.end()
+        activate(None)
+
+        records = {r["name"]: r for r in _read(path)}
+        assert list(records) == ["fhir.get", "model.call", "http.run"]  # exported as they end
+        assert {r["traceId"] for r in records.values()} == {root.trace_id}
+        assert records["fhir.get"]["parentId"] == records["model.call"]["spanId"]
+        assert records["model.call"]["parentId"] == root.span_id
+        assert records["model.call"]["attributes"] == {"round": 0}
+        assert records["http.run"]["durationMs"] >= records["model.call"]["durationMs"]
+
+    def test_failed_block_is_marked(self):
+        """Test that an exception marks the span as failed."""
+        parent = Span("run")
+        with pytest.raises(RuntimeError):
+            with span("model.call", parent=parent) as failed:
+                raise RuntimeError("boom")
+        assert failed.status == "error"
+        assert failed.attributes["error"] == "RuntimeError: boom"
+
+    def test_span_without_trace_is_still_timed(self):
+        """Test that a span outside any trace is timed but not propagated."""
+        with span("agent.parse") as detached:
+            pass
+        assert detached.parent_id is None
+        assert detached.duration_ms >= 0
+        assert traceparent_headers() == {}
+
+    @pytest.mark.asyncio
+    async def test_tasks_keep_their_own_current_span(self):
+        """Test that concurrent tasks each keep their own current span."""
+        tracer = Tracer()
+
+        async def job(name):
+            root = tracer.start(name)
+            activate(root)
+            await asyncio.sleep(0)
+            with span("child") as child:
+                await asyncio.sleep(0)
+            return root, child
+
+        (root_a, child_a), (root_b, child_b) = await asyncio.gather(job("a"), job("b"))
+        assert child_a.parent_id == root_a.span_id
+        assert child_b.parent_id == root_b.span_id
+        assert current_span() is None
+
+
+class TestTraceparent:
+    """Tests for W3C traceparent handling."""
+
+    def test_continue_incoming_trace(self):
+        """Test that a valid traceparent continues the caller's trace."""
+        header = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+        root = Tracer().start("http.run", traceparent=header)
+        assert root.trace_id == "4bf92f3577b34da6a3ce929d0e0e4736"
+        assert root.parent_id == "00f067aa0ba902b7"
+        assert root.traceparent == f"00-{root.trace_id}-{root.span_id}-01"
+
+    @pytest.mark.parametrize("value", [None, "", "garbage", "00-" + "0" * 32 + "-00f067aa0ba902b7-01"])
+    def test_invalid_headers_start_a_new_trace(self, value):
+        """Test that invalid traceparent values are ignored."""
+        assert parse_traceparent(value) == (None, None)
+
+    @pytest.mark.asyncio
+    async def test_fhir_requests_carry_traceparent(self, httpx_mock):
+        """Test that FHIR requests send the traceparent of their own span."""
+        httpx_mock.add_response(url="http://localhost:8080/fhir/Patient/S1",
+                                json={"resourceType": "Patient", "id": "S1"})
+        root = Tracer().start("http.run")
+        activate(root)
+        try:
+            async with FHIRClient("http://localhost:8080") as client:
+                result = await client.execute(Action(type=ActionType.GET, endpoint="/fhir/Patient/S1", params={}))
+        finally:
+            activate(None)
+
+        assert result.success is True
+        trace_id, parent_id = parse_traceparent(httpx_mock.get_request().headers["traceparent"])
+        assert trace_id == root.trace_id
+        assert parent_id != root.span_id  # the fhir.get span is the parent
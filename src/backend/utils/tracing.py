@@ -0,0 +1,215 @@
+"""
+Lightweight Tracing for Sara
+
+Spans time each phase of an agent run (model call, parse, FHIR request,
+formatting, SSE frame buffering) so a slow run can be attributed. Span ids follow W3C Trace
+Context: the current span travels to the model server and the FHIR server in a
+traceparent header, and a run can continue a trace started by the caller.
+
+The current span is kept in a context variable, so code deep in the call stack
+(FHIRClient) can open child spans without a tracer being passed around. Finished
+spans are exported as JSON lines when SARA_TRACE_FILE is set; durations are
+measured either way and also go into the SSE stream.
+
+Usage:
+    tracer = tracer_from_env()
+    root = tracer.start("http.run", traceparent=headers.get("traceparent"))
+    activate(root)                     # in the task that runs the agent
+    with span("model.call") as s:      # child of the current span
+        ...
+    root.end()
+"""
+
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+_current: ContextVar[Optional["Span"]] = ContextVar("sara_current_span", default=None)
+
+
+class Span:
+    """One timed operation of a trace."""
+
+    def __init__(self, name: str, tracer: Optional["Tracer"] = None, trace_id: Optional[str] = None,
+                 parent_id: Optional[str] = None, attributes: Optional[Dict[str, Any]] = None):
+        """
+        Start a span.
+
+        Args:
+            name: Operation name (e.g. "model.call")
+            tracer: Tracer exporting the span when it ends (None for timing only)
+            trace_id: 32 hex digit trace id (new trace when None)
+            parent_id: 16 hex digit id of the parent span
+            attributes: Initial attributes
+        """
+        self.name = name
+        self.tracer = tracer
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status = "ok"
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self._end: Optional[float] = None
+
+    @property
+    def duration_ms(self) -> float:
+        """Milliseconds from start to end (or to now while running)."""
+        end = self._end if self._end is not None else time.perf_counter()
+        return round((end - self._start) * 1000, 3)
+
+    @property
+    def traceparent(self) -> str:
+        """W3C traceparent header value naming this span as the parent."""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def child(self, name: str, **attributes: Any) -> "Span":
+        """Start a span under this one."""
+        return Span(name, self.tracer, self.trace_id, self.span_id, attributes)
+
+    def set(self, **attributes: Any) -> None:
+        """Add or replace attributes."""
+        self.attributes.update(attributes)
+
+    def fail(self, error: BaseException) -> None:
+        """Mark the span as failed."""
+        self.status = "error"
+        self.attributes["error"] = f"{type(error).__name__}: {error}"
+
+    def end(self) -> None:
+        """Stop the clock and export the span (once)."""
+        if self._end is None:
+            self._end = time.perf_counter()
+            if self.tracer is not None:
+                self.tracer.export(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentId": self.parent_id,
+            "name": self.name,
+            "start": self.start_time,
+            "durationMs": self.duration_ms,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class JsonlExporter:
+    """Appends finished spans to a file, one JSON object per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", buffering=1, encoding="utf-8")
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class Tracer:
+    """Starts root spans and exports finished ones."""
+
+    def __init__(self, exporter: Optional[JsonlExporter] = None):
+        """
+        Initialize the tracer.
+
+        Args:
+            exporter: Where finished spans go (None measures without exporting)
+        """
+        self.exporters: List[Any] = [exporter] if exporter is not None else []
+
+    def add_exporter(self, exporter: Any) -> None:
+        """Also send finished spans to exporter (any object with export(span))."""
+        self.exporters.append(exporter)
+
+    def start(self, name: str, traceparent: Optional[str] = None, **attributes: Any) -> Span:
+        """
+        Start a root span.
+
+        Args:
+            name: Operation name
+            traceparent: Incoming W3C traceparent header; the span joins that trace
+            **attributes: Initial attributes
+        """
+        trace_id, parent_id = parse_traceparent(traceparent)
+        return Span(name, self, trace_id, parent_id, attributes)
+
+    def export(self, span: Span) -> None:
+        for exporter in self.exporters:
+            exporter.export(span)
+
+
+def current_span() -> Optional[Span]:
+    """The span active in this context, if any."""
+    return _current.get()
+
+
+def activate(span_: Optional[Span]) -> Token:
+    """Make a span current for this context (e.g. a task's root span)."""
+    return _current.set(span_)
+
+
+@contextmanager
+def span(name: str, parent: Optional[Span] = None, **attributes: Any) -> Iterator[Span]:
+    """
+    Time a block as a child of parent (default: the current span) and make it current.
+
+    Without any parent the span is still timed but belongs to no exported trace.
+    The block must not cross a yield of an async generator; start a span with
+    Span.child and end it explicitly for that.
+    """
+    parent = parent or _current.get()
+    current = parent.child(name, **attributes) if parent is not None else Span(name, attributes=attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.fail(e)
+        raise
+    finally:
+        _current.reset(token)
+        current.end()
+
+
+def traceparent_headers() -> Dict[str, str]:
+    """traceparent header for the current span (empty outside a trace)."""
+    current = _current.get()
+    return {"traceparent": current.traceparent} if current is not None else {}
+
+
+async def inject_traceparent(request: Any) -> None:
+    """httpx request event hook adding the current span's traceparent."""
+    current = _current.get()
+    if current is not None and "traceparent" not in request.headers:
+        request.headers["traceparent"] = current.traceparent
+
+
+def parse_traceparent(value: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """(trace id, parent span id) from a traceparent header, or (None, None) if invalid."""
+    match = _TRACEPARENT.match((value or "").strip().lower())
+    if not match or match.group(1) == "0" * 32:
+        return None, None
+    return match.group(1), match.group(2)
+
+
+def tracer_from_env(var: str = "SARA_TRACE_FILE") -> Tracer:
+    """Tracer exporting to the JSONL file named by the variable (measuring only when unset)."""
+    path = os.environ.get(var)
+    return Tracer(JsonlExporter(path) if path else None)
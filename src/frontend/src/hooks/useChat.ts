@@ -3,6 +3,7 @@
 import { useState, useCallback, useEffect, useRef } from 'react';
 import { useStreaming } from './useStreaming';
 import { TASKS } from '@/lib/tasks';
+import { fetchResult } from '@/lib/api';
 import type { SSEEvent } from '@/lib/api';
 import { WorkflowStep, parseActionToDescription, generateStepId } from '@/lib/workflow';
 
@@ -40,6 +41,91 @@ function generateId(): string {
   return `${Date.now()}-${Math.random().toString(36).substring(2, 11)}`;
 }
 
+// Apply a finished tool call to the chat state: mark its message and workflow step
+// complete and add the FHIR result as an artifact (unless addArtifact is false)
+function applyToolResult(
+  prev: ChatState, toolId: string, result: unknown, status: string, addArtifact = true
+): ChatState {
+  // Only mark as complete if it's a successful result
+  // For errors, keep it as running - the agent will retry or continue
+  const isSuccess = status !== 'error';
+
+  // Update the tool call message
+  const updatedMessages = prev.messages.map(m => {
+    if (m.type === 'tool_call' && m.toolCall?.id === toolId) {
+      return {
+        ...m,
+        content: isSuccess ? `${m.toolCall.tool} completed` : `Calling ${m.toolCall.tool}...`,
+        toolCall: {
+          ...m.toolCall,
+          status: isSuccess ? 'complete' as const : 'running' as const,
+          result: isSuccess ? result : m.toolCall.result,
+        },
+      };
+    }
+    return m;
+  });
+
+  // Update workflow step status - only mark complete on success
+  const updatedSteps = prev.workflowSteps.map(step => {
+    if (step.id === toolId) {
+      return {
+        ...step,
+        status: isSuccess ? 'complete' as const : 'running' as const,
+      };
+    }
+    return step;
+  });
+
+  // Add artifact if present (only for SUCCESSFUL results with meaningful FHIR data)
+  const newArtifacts = [...prev.artifacts];
+  if (addArtifact && result && typeof result === 'object' && status !== 'error') {
+    const resultObj = result as Record<string, unknown>;
+
+    // Skip error responses
+    if (resultObj.error || resultObj.status_code === 0) {
+      // Don't add error results as artifacts
+      return {
+        ...prev,
+        messages: updatedMessages,
+        workflowSteps: updatedSteps,
+      };
+    }
+
+    // Skip empty bundles (total: 0 or no entries)
+    if (resultObj.resourceType === 'Bundle') {
+      const entries = resultObj.entry as Array<unknown> | undefined;
+      const total = resultObj.total as number | undefined;
+      if (!entries || entries.length === 0 || total === 0) {
+        // Don't add empty bundles as artifacts
+        return {
+          ...prev,
+          messages: updatedMessages,
+          workflowSteps: updatedSteps,
+        };
+      }
+    }
+
+    // Determine the FHIR resource type from the result
+    const resourceType = resultObj.resourceType as string ||
+      (resultObj.entry ? 'Bundle' : 'FHIR');
+
+    newArtifacts.push({
+      id: generateId(),
+      type: resourceType,
+      data: result,
+      timestamp: Date.now(),
+    });
+  }
+
+  return {
+    ...prev,
+    messages: updatedMessages,
+    artifacts: newArtifacts,
+    workflowSteps: updatedSteps,
+  };
+}
+
 export function useChat(taskId: string) {
   const [state, setState] = useState<ChatState>({
     messages: [],
@@ -151,93 +237,23 @@ export function useChat(taskId: string) {
         });
         break;
 
-      case 'tool_result':
+      case 'tool_result': {
         // Tool completed
-        setState(prev => {
-          const toolId = event.data.id as string;
-          const result = event.data.result;
-          const status = event.data.status as string; // Keep for artifact filtering
-
-          // Only mark as complete if it's a successful result
-          // For errors, keep it as running - the agent will retry or continue
-          const isSuccess = status !== 'error';
-
-          // Update the tool call message
-          const updatedMessages = prev.messages.map(m => {
-            if (m.type === 'tool_call' && m.toolCall?.id === toolId) {
-              return {
-                ...m,
-                content: isSuccess ? `${m.toolCall.tool} completed` : `Calling ${m.toolCall.tool}...`,
-                toolCall: {
-                  ...m.toolCall,
-                  status: isSuccess ? 'complete' as const : 'running' as const,
-                  result: isSuccess ? result : m.toolCall.result,
-                },
-              };
-            }
-            return m;
-          });
-
-          // Update workflow step status - only mark complete on success
-          const updatedSteps = prev.workflowSteps.map(step => {
-            if (step.id === toolId) {
-              return {
-                ...step,
-                status: isSuccess ? 'complete' as const : 'running' as const,
-              };
-            }
-            return step;
-          });
-
-          // Add artifact if present (only for SUCCESSFUL results with meaningful FHIR data)
-          const newArtifacts = [...prev.artifacts];
-          if (result && typeof result === 'object' && status !== 'error') {
-            const resultObj = result as Record<string, unknown>;
-
-            // Skip error responses
-            if (resultObj.error || resultObj.status_code === 0) {
-              // Don't add error results as artifacts
-              return {
-                ...prev,
-                messages: updatedMessages,
-                workflowSteps: updatedSteps,
-              };
-            }
-
-            // Skip empty bundles (total: 0 or no entries)
-            if (resultObj.resourceType === 'Bundle') {
-              const entries = resultObj.entry as Array<unknown> | undefined;
-              const total = resultObj.total as number | undefined;
-              if (!entries || entries.length === 0 || total === 0) {
-                // Don't add empty bundles as artifacts
-                return {
-                  ...prev,
-                  messages: updatedMessages,
-                  workflowSteps: updatedSteps,
-                };
-              }
-            }
-
-            // Determine the FHIR resource type from the result
-            const resourceType = resultObj.resourceType as string ||
-              (resultObj.entry ? 'Bundle' : 'FHIR');
-
-            newArtifacts.push({
-              id: generateId(),
-              type: resourceType,
-              data: result,
-              timestamp: Date.now(),
-            });
-          }
-
-          return {
-            ...prev,
-            messages: updatedMessages,
-            artifacts: newArtifacts,
-            workflowSteps: updatedSteps,
-          };
-        });
+        const toolId = event.data.id as string;
+        const status = event.data.status as string; // Keep for artifact filtering
+        const resultUrl = event.data.resultUrl as string | undefined;
+
+        if (resultUrl && event.data.result === undefined) {
+          // lazyResults mode: large payloads arrive as a summary; fetch the full result for the artifact
+          fetchResult(resultUrl)
+            .then(result => setState(prev => applyToolResult(prev, toolId, result, status)))
+            // Result expired or unreachable: complete the step with the summary, without an artifact
+            .catch(() => setState(prev => applyToolResult(prev, toolId, event.data.summary, status, false)));
+          break;
+        }
+        setState(prev => applyToolResult(prev, toolId, event.data.result, status));
         break;
+      }
 
       case 'complete':
         // Final response
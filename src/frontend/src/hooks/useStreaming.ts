@@ -8,6 +8,8 @@ import { API_URL, type SSEEvent } from '@/lib/api';
 const REQUEST_TIMEOUT_MS = 180000; // 3 minutes
 const MAX_RETRIES = 2;
 const RETRY_DELAY_MS = 2000;
+// Reconnects to a run that keeps going server-side after the connection drops
+const MAX_RESUMES = 3;
 
 export interface StreamingState {
   isConnected: boolean;
@@ -110,8 +112,14 @@ export function useStreaming(options: StreamingOptions) {
         throw new Error('No response body');
       }
 
+      const sessionId = response.headers.get('X-Session-Id');
+      let lastEventId = '';
+
       const parser = createParser({
         onEvent: (event: EventSourceMessage) => {
+          if (event.id) {
+            lastEventId = event.id;
+          }
           const data = event.data;
           if (data === '[DONE]') {
             setState(prev => ({ ...prev, isLoading: false }));
@@ -132,21 +140,49 @@ export function useStreaming(options: StreamingOptions) {
         },
       });
 
-      const reader = response.body.getReader();
-      const decoder = new TextDecoder();
+      const readStream = async (body: ReadableStream<Uint8Array>) => {
+        const reader = body.getReader();
+        const decoder = new TextDecoder();
 
-      while (true) {
-        const { done, value } = await reader.read();
+        while (true) {
+          const { done, value } = await reader.read();
 
-        if (done) {
-          setState(prev => ({ ...prev, isLoading: false, isConnected: false }));
-          onComplete?.();
-          break;
+          if (done) {
+            return;
+          }
+
+          const text = decoder.decode(value, { stream: true });
+          parser.feed(text);
         }
+      };
 
-        const text = decoder.decode(value, { stream: true });
-        parser.feed(text);
+      let body: ReadableStream<Uint8Array> = response.body;
+      for (let resumeAttempt = 0; ; resumeAttempt++) {
+        try {
+          await readStream(body);
+          break;
+        } catch (streamError) {
+          const aborted = streamError instanceof Error && streamError.name === 'AbortError';
+          if (aborted || !sessionId || resumeAttempt >= MAX_RESUMES) {
+            throw streamError;
+          }
+          // The run continues server-side: replay the missed events instead of rerunning the task
+          console.log(`Stream dropped, resuming session (attempt ${resumeAttempt + 1}/${MAX_RESUMES})...`);
+          parser.reset();
+          await new Promise(resolve => setTimeout(resolve, RETRY_DELAY_MS));
+          const resumed = await fetch(`${API_URL}/api/sessions/${sessionId}/events`, {
+            headers: lastEventId ? { 'Last-Event-ID': lastEventId } : {},
+            signal: abortControllerRef.current?.signal,
+          });
+          if (!resumed.ok || !resumed.body) {
+            throw streamError;
+          }
+          body = resumed.body;
+        }
       }
+
+      setState(prev => ({ ...prev, isLoading: false, isConnected: false }));
+      onComplete?.();
     } catch (error) {
       clearTimeouts();
 
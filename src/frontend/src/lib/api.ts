@@ -4,10 +4,11 @@ export interface RunRequest {
   taskId: string;
   prompt: string;
   context: string;
+  lazyResults?: boolean;
 }
 
 export interface SSEEvent {
-  type: 'status' | 'thinking' | 'tool_call' | 'tool_result' | 'complete' | 'error';
+  type: 'status' | 'thinking' | 'tool_call' | 'tool_result' | 'complete' | 'error' | 'gap';
   data: Record<string, unknown>;
 }
 
@@ -59,3 +60,12 @@ export async function* streamRun(request: RunRequest): AsyncGenerator<SSEEvent>
     }
   }
 }
+
+// Full payload of a tool result streamed as a summary (lazyResults mode)
+export async function fetchResult(resultUrl: string): Promise<unknown> {
+  const response = await fetch(`${API_URL}${resultUrl}`);
+  if (!response.ok) {
+    throw new Error(`Result request failed: ${response.status}`);
+  }
+  return response.json();
+}